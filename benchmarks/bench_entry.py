@@ -0,0 +1,116 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+"""
+Benchmark the startup cost of entrypoint discovery.  Each measurement
+runs in a fresh interpreter, which resolves the timid action, modifier
+and extension namespaces.  The entrypoint index is measured both cold
+(no index file) and warm (fresh index file), and compared with a scan
+using ``pkg_resources``.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Import the modules timid needs regardless of entrypoint discovery
+BASE_SCRIPT = """
+from timid import utils
+"""
+
+# Resolve the namespaces using timid.entry
+TIMID_SCRIPT = BASE_SCRIPT + """
+from timid import entry
+for ns in entry.NAMESPACES:
+    entry.points[ns]
+"""
+
+# Resolve the namespaces using pkg_resources
+PKG_RESOURCES_SCRIPT = BASE_SCRIPT + """
+import pkg_resources
+for ns in ('timid.actions', 'timid.extensions', 'timid.modifiers'):
+    list(pkg_resources.iter_entry_points(ns))
+"""
+
+
+def run(script, env, setup=None):
+    """
+    Time the execution of a script in a fresh interpreter.
+
+    :param script: The text of the Python script to run.
+    :param env: The environment to run the script with.
+    :param setup: An optional callable to invoke before starting the
+                  interpreter.
+
+    :returns: The elapsed wall-clock time, in seconds.
+    """
+
+    if setup:
+        setup()
+
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', script], env=env)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='Number of times to repeat each measurement.')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, TIMID_CACHE_DIR=cache_dir)
+        index_dir = os.path.join(cache_dir, 'entrypoints')
+
+        def clear():
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+        # The base imports alone, for reference
+        cases = [
+            ('base imports', BASE_SCRIPT, None),
+            ('pkg_resources', PKG_RESOURCES_SCRIPT, None),
+            ('timid.entry (cold index)', TIMID_SCRIPT, clear),
+            ('timid.entry (warm index)', TIMID_SCRIPT, None),
+        ]
+
+        # Time each case, keeping the best of the repetitions
+        results = {}
+        for name, script, setup in cases:
+            try:
+                results[name] = min(run(script, env, setup)
+                                    for _i in range(args.repeat))
+            except subprocess.CalledProcessError:
+                print('  %-30s     failed' % name)
+                continue
+
+            # Report the cost over the base imports as well
+            print('  %-30s %8.3f s  (%+.3f s)' % (
+                name, results[name],
+                results[name] - results[cases[0][0]]))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
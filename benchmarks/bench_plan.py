@@ -0,0 +1,521 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+"""
+Benchmark timid's own overhead in reading and executing a test.
+Synthetic test descriptions are generated for several scenarios--many
+steps, deeply nested includes, template-heavy steps, steps with many
+modifiers, and large variable files--using a "noop" action, so that
+the cost of parsing steps, dispatching to the extensions, and
+rendering templates is measured apart from the cost of running
+processes.  The time and peak memory of each phase are reported, and
+may be saved as a JSON baseline for comparison with other commits.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from timid import cache
+from timid import context
+from timid import entry
+from timid import extensions
+from timid import steps
+from timid import utils
+
+
+# The version of the JSON baseline format
+VERSION = 1
+
+# The phases measured, in order
+PHASES = ('parse', 'read_steps', 'execute')
+
+
+class NoOpAction(steps.Action):
+    """
+    An action which does nothing, apart from rendering the templates
+    in its configuration.  The configuration may be a string or a list
+    of strings.
+    """
+
+    schema = {
+        'oneOf': [
+            {'type': 'string'},
+            {'type': 'array', 'items': {'type': 'string'}},
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``NoOpAction`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the action.
+        :param config: The configuration for the action.
+        :param step_addr: The address of the step in the test
+                          configuration.
+        """
+
+        super(NoOpAction, self).__init__(ctxt, name, config, step_addr)
+
+        if not isinstance(config, list):
+            config = [config]
+        self.templates = [ctxt.template(value) for value in config]
+
+    def __call__(self, ctxt):
+        """
+        Invoke the action.
+
+        :param ctxt: The context object.
+
+        :returns: A ``StepResult`` object.
+        """
+
+        for tmpl in self.templates:
+            tmpl(ctxt)
+
+        return steps.StepResult(state=steps.SUCCESS)
+
+
+class NoOpExtension(extensions.Extension):
+    """
+    An extension implementing every hook, and doing nothing, for
+    measuring the cost of dispatching to the extensions.
+    """
+
+    priority = 500
+
+    @classmethod
+    def activate(cls, ctxt, args):
+        return cls()
+
+    def read_steps(self, ctxt, steps):
+        pass
+
+    def pre_step(self, ctxt, step, idx):
+        return None
+
+    def post_step(self, ctxt, step, idx, result):
+        pass
+
+
+class BenchIndex(entry.EntryIndex):
+    """
+    An entrypoint index which adds the "noop" action to the installed
+    actions.
+    """
+
+    def get(self, namespace):
+        """
+        Retrieve the entrypoints for a namespace.
+
+        :param namespace: The entrypoint namespace.
+
+        :returns: A list of ``EntryPoint`` objects.
+        """
+
+        result = super(BenchIndex, self).get(namespace)
+        if namespace == steps.NAMESPACE_ACTION:
+            result = result + [entry.EntryPoint(
+                'noop', '%s:NoOpAction' % NoOpAction.__module__)]
+
+        return result
+
+
+def write_yaml(dirname, fname, lines):
+    """
+    Write a YAML file.
+
+    :param dirname: The directory to write the file in.
+    :param fname: The name of the file.
+    :param lines: A list of the lines of the file.
+
+    :returns: The path of the file.
+    """
+
+    path = os.path.join(dirname, fname)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return path
+
+
+def noop_steps(count, template=None, modifiers=None):
+    """
+    Generate the lines of a list of "noop" steps.
+
+    :param count: The number of steps.
+    :param template: An optional list of template strings for the
+                     action.
+    :param modifiers: An optional list of the lines of the modifiers
+                      to apply to each step.  Any "STEP" in a line is
+                      replaced by the index of the step.
+
+    :returns: A list of lines.
+    """
+
+    lines = []
+    for i in range(count):
+        lines.append('- name: Step %d' % i)
+        if template:
+            lines.append('  noop:')
+            lines += ['  - "%s"' % t for t in template]
+        else:
+            lines.append('  noop: step %d' % i)
+        lines += ['  %s' % line.replace('STEP', str(i))
+                  for line in modifiers or []]
+
+    return lines
+
+
+def plan_steps(dirname, args):
+    """
+    Generate a test with many steps.
+
+    :param dirname: The directory to write the files in.
+    :param args: The command line arguments.
+
+    :returns: The path of the test description file.
+    """
+
+    return write_yaml(dirname, 'steps.yaml', noop_steps(args.steps))
+
+
+def plan_include(dirname, args):
+    """
+    Generate a test with deeply nested includes.  Each level has one
+    step, and includes the next; the innermost level has all the other
+    steps.
+
+    :param dirname: The directory to write the files in.
+    :param args: The command line arguments.
+
+    :returns: The path of the test description file.
+    """
+
+    depth = args.depth
+    write_yaml(dirname, 'level%d.yaml' % depth,
+               noop_steps(max(args.steps - depth, 1)))
+    for level in range(depth - 1, -1, -1):
+        path = write_yaml(dirname, 'level%d.yaml' % level, noop_steps(1) + [
+            '- include:',
+            '    path: level%d.yaml' % (level + 1),
+        ])
+
+    return path
+
+
+def plan_templates(dirname, args):
+    """
+    Generate a test whose steps are dominated by template rendering.
+
+    :param dirname: The directory to write the files in.
+    :param args: The command line arguments.
+
+    :returns: The path of the test description file.
+    """
+
+    lines = ['- var:', '    set:']
+    lines += ['      var_%d: value %d' % (i, i) for i in range(10)]
+    lines += noop_steps(args.steps - 1, template=[
+        '{{ var_%d }}' % i if i % 2 else
+        '{%% for i in range(3) %%}{{ var_%d | upper }}-{{ i }}{%% endfor %%}'
+        % i for i in range(10)
+    ])
+
+    return write_yaml(dirname, 'templates.yaml', lines)
+
+
+def plan_modifiers(dirname, args):
+    """
+    Generate a test whose steps each have several modifiers.
+
+    :param dirname: The directory to write the files in.
+    :param args: The command line arguments.
+
+    :returns: The path of the test description file.
+    """
+
+    return write_yaml(dirname, 'modifiers.yaml', noop_steps(
+        args.steps, modifiers=[
+            'when: "skip_STEP is not defined"',
+            'ignore-errors: true',
+            'retry: 2',
+            'timeout: 60',
+        ]))
+
+
+def plan_variables(dirname, args):
+    """
+    Generate a test which reads a large variable file.
+
+    :param dirname: The directory to write the files in.
+    :param args: The command line arguments.
+
+    :returns: The path of the test description file.
+    """
+
+    write_yaml(dirname, 'vars.yaml', [
+        'var_%d: {name: "variable %d", items: [%d, %d, %d]}' %
+        (i, i, i, i + 1, i + 2) for i in range(args.variables)
+    ])
+
+    lines = ['- var:', '    files:', '    - vars.yaml']
+    lines += noop_steps(args.steps - 1, template=[
+        '{{ var_%d.name }}' % (i * 997 % args.variables) for i in range(3)
+    ])
+
+    return write_yaml(dirname, 'variables.yaml', lines)
+
+
+# The scenarios, in order
+SCENARIOS = [
+    ('steps', plan_steps),
+    ('include', plan_include),
+    ('templates', plan_templates),
+    ('modifiers', plan_modifiers),
+    ('variables', plan_variables),
+]
+
+
+def run_plan(path, extension_count):
+    """
+    Read and execute a test, in the same manner as
+    ``timid.main.timid()``, but without checkpoints or messages.
+
+    :param path: The path of the test description file.
+    :param extension_count: The number of no-op extensions to
+                            activate.
+
+    :returns: A generator which performs one phase each time it is
+              advanced, yielding the name of the phase completed.
+    """
+
+    # Templates are compiled while reading the steps, so start from
+    # an empty template cache
+    cache.templates.clear()
+    ctxt = context.Context(verbose=0)
+    exts = extensions.ExtensionSet(
+        [NoOpExtension() for _i in range(extension_count)])
+    ctxt.extensions = exts
+    yield None
+
+    step_list = steps.Step.parse_file(ctxt, path)
+    yield 'parse'
+
+    ctxt.steps += exts.read_steps(ctxt, step_list)
+    yield 'read_steps'
+
+    for idx, step in enumerate(ctxt.steps):
+        if exts.pre_step(ctxt, step, idx):
+            continue
+        result = step(ctxt)
+        exts.post_step(ctxt, step, idx, result)
+        if not result:
+            raise RuntimeError('Step %s failed: %s' % (idx, result.msg))
+    yield 'execute'
+
+
+def measure(path, args):
+    """
+    Measure the time and peak memory of each phase of reading and
+    executing a test.  The time is the best of several repetitions;
+    the peak memory is measured in a separate run, as tracing memory
+    allocations slows execution, and counts only the memory allocated
+    above that in use when the phase started.
+
+    :param path: The path of the test description file.
+    :param args: The command line arguments.
+
+    :returns: A dictionary mapping the name of each phase to a
+              dictionary with the keys "time", in seconds, and
+              "peak_memory", in bytes.
+    """
+
+    results = dict((phase, {'time': None, 'peak_memory': None})
+                   for phase in PHASES)
+
+    for _i in range(args.repeat):
+        gc.collect()
+        runner = run_plan(path, args.extensions)
+        next(runner)
+        start = utils.monotonic()
+        for phase in runner:
+            end = utils.monotonic()
+            best = results[phase]['time']
+            if best is None or end - start < best:
+                results[phase]['time'] = end - start
+            start = utils.monotonic()
+
+    if tracemalloc is not None:
+        gc.collect()
+        runner = run_plan(path, args.extensions)
+        tracemalloc.start()
+        try:
+            next(runner)
+            base = tracemalloc.get_traced_memory()[0]
+            for phase in runner:
+                current, peak = tracemalloc.get_traced_memory()
+                results[phase]['peak_memory'] = peak - base
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+                    base = current
+                else:
+                    # Before Python 3.9, the peak can only be reset by
+                    # discarding the traces, after which the memory in
+                    # use is counted from zero again
+                    tracemalloc.stop()
+                    tracemalloc.start()
+                    base = 0
+        finally:
+            tracemalloc.stop()
+
+    return results
+
+
+def revision():
+    """
+    Determine the revision of the source tree being measured.
+
+    :returns: The abbreviated git commit ID, or ``None`` if it cannot
+              be determined.
+    """
+
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.decode('ascii').strip()
+
+
+def compare(results, baseline):
+    """
+    Print the change in time and peak memory of each phase relative to
+    a baseline.
+
+    :param results: The results of this run, as saved to JSON.
+    :param baseline: The results of an earlier run.
+    """
+
+    print('Compared with %s:' % (baseline.get('revision') or 'baseline'))
+    if baseline.get('params') != results['params']:
+        print('  (warning: the baseline was run with different parameters: '
+              '%s)' % json.dumps(baseline.get('params'), sort_keys=True))
+    for name, _plan in SCENARIOS:
+        old = baseline['scenarios'].get(name)
+        new = results['scenarios'].get(name)
+        if not old or not new:
+            continue
+
+        for phase in PHASES:
+            line = '  %-10s %-10s' % (name, phase)
+            for key, unit in (('time', 's'), ('peak_memory', 'B')):
+                before = old['phases'][phase][key]
+                after = new['phases'][phase][key]
+                if before and after is not None:
+                    line += '  %s %+7.1f%%' % (
+                        key, (after - before) * 100.0 / before)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--steps', '-s', type=int, default=1000,
+                        help='Number of steps to generate.')
+    parser.add_argument('--depth', '-d', type=int, default=20,
+                        help='Depth of nested includes to generate.')
+    parser.add_argument('--variables', '-v', type=int, default=10000,
+                        help='Number of variables to generate.')
+    parser.add_argument('--extensions', '-e', type=int, default=4,
+                        help='Number of no-op extensions to activate.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='Number of times to repeat each measurement.')
+    parser.add_argument('--scenario', '-S', action='append',
+                        choices=[name for name, _plan in SCENARIOS],
+                        help='Scenario to run.  May be given more than '
+                        'once; defaults to all scenarios.')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='Save the results to the designated file as '
+                        'JSON, for use as a baseline.')
+    parser.add_argument('--compare', '-c', metavar='FILE',
+                        help='Compare the results with a baseline saved '
+                        'by --output.')
+    args = parser.parse_args()
+
+    # Make the "noop" action available
+    entry.points = entry.EntrypointCache(BenchIndex())
+
+    results = {
+        'version': VERSION,
+        'revision': revision(),
+        'python': platform.python_version(),
+        'params': {
+            'steps': args.steps,
+            'depth': args.depth,
+            'variables': args.variables,
+            'extensions': args.extensions,
+            'repeat': args.repeat,
+        },
+        'scenarios': {},
+    }
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name, plan in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+
+            dirname = os.path.join(tmpdir, name)
+            os.mkdir(dirname)
+            path = plan(dirname, args)
+
+            phases = measure(path, args)
+            results['scenarios'][name] = {'phases': phases}
+            for phase in PHASES:
+                peak = phases[phase]['peak_memory']
+                print('  %-10s %-10s %8.3f s  %8s KiB' % (
+                    name, phase, phases[phase]['time'],
+                    '-' if peak is None else '%.0f' % (peak / 1024.0)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+"""
+Benchmark YAML loading of test description files.  Compares the pure
+Python safe loader with the loader selected by ``timid.utils``, which
+uses libyaml when it is available.
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import yaml
+
+from timid import utils
+
+
+def make_steps(count):
+    """
+    Generate the text of a test description file.
+
+    :param count: The number of steps to generate.
+
+    :returns: A byte string containing the YAML text.
+    """
+
+    lines = []
+    for i in range(count):
+        lines += [
+            '- name: Step %d' % i,
+            '  when: "stage == \'unit\' and idx_%d is not defined"' % i,
+            '  run:',
+            '  - ./run_tests.sh',
+            '  - --shard={{ shard }}',
+            '  - test_%d' % i,
+        ]
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--steps', '-s', type=int, default=10000,
+                        help='Number of steps to generate.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='Number of times to repeat each measurement.')
+    args = parser.parse_args()
+
+    content = make_steps(args.steps)
+    print('Loading %d steps (%d bytes)' % (args.steps, len(content)))
+
+    # Time each loader, keeping the best of the repetitions
+    results = {}
+    loaders = [
+        ('SafeLoader', yaml.SafeLoader),
+        ('timid.utils (%s)' % utils._YAMLLoader.__name__, utils._YAMLLoader),
+    ]
+    for name, loader in loaders:
+        results[name] = min(timeit.repeat(
+            lambda: yaml.load(content, Loader=loader),
+            repeat=args.repeat, number=1))
+        print('  %-30s %8.3f s' % (name, results[name]))
+
+    # Report the speedup
+    base = results[loaders[0][0]]
+    fast = results[loaders[1][0]]
+    print('Speedup: %.1fx' % (base / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -85,18 +85,27 @@ setuptools.setup(
     tests_require=readreq('test-requirements.txt'),
     entry_points={
         'console_scripts': [
-            'timid = timid.main:timid.console',
+            'timid = timid.main:run.console',
         ],
         'timid.actions': [
             'chdir = timid.environment:DirectoryAction',
             'env = timid.environment:EnvironmentAction',
             'include = timid.steps:IncludeAction',
+            'parallel = timid.parallel:ParallelAction',
             'run = timid.environment:RunAction',
             'var = timid.context:VariableAction',
         ],
         'timid.modifiers': [
+            'cache = timid.modifiers:CacheModifier',
+            'matrix = timid.modifiers:MatrixModifier',
+            'retry = timid.modifiers:RetryModifier',
+            'timeout = timid.modifiers:TimeoutModifier',
             'when = timid.modifiers:ConditionalModifier',
-            'ignore-errors = timid.modifiers:IgnoreErrorModifier',
+            'ignore-errors = timid.modifiers:IgnoreErrorsModifier',
+        ],
+        'timid.extensions': [
+            'report = timid.report:ReportExtension',
+            'timing = timid.timing:TimingExtension',
         ],
     },
 )
@@ -12,3 +12,15 @@
 #    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
+
+import atexit
+import os
+import shutil
+import tempfile
+
+
+# Keep the persistent caches, such as the entrypoint index, out of
+# the user's cache directory while the tests run
+_cache_dir = tempfile.mkdtemp(prefix='timid-tests-')
+os.environ['TIMID_CACHE_DIR'] = _cache_dir
+atexit.register(shutil.rmtree, _cache_dir, True)
@@ -0,0 +1,747 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+import mock
+
+from timid import extensions
+from timid import main
+from timid import output
+from timid import parallel
+from timid import steps
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest('the asyncio engine requires Python 3.5')
+
+import asyncio  # noqa
+
+from timid import aio  # noqa
+
+
+def coro(result=None):
+    return asyncio.sleep(0, result=result)
+
+
+class Sync(object):
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = []
+
+    def __call__(self, *args):
+        self.calls.append(('__call__',) + args)
+        return self.result
+
+    def method(self, *args):
+        self.calls.append(('method',) + args)
+        return self.result
+
+
+class Async(Sync):
+    def call_async(self, *args):
+        self.calls.append(('call_async',) + args)
+        return coro(self.result)
+
+    def method_async(self, *args):
+        self.calls.append(('method_async',) + args)
+        return coro(self.result)
+
+
+class Plain(Sync):
+    def method_async(self, *args):
+        self.calls.append(('method_async',) + args)
+        return self.result
+
+
+class SyncExt(object):
+    def __init__(self, skip=False):
+        self.skip = skip
+        self.calls = []
+
+    def read_steps(self, ctxt, step_list):
+        self.calls.append(('read_steps', ctxt, step_list))
+
+    def pre_step(self, ctxt, step, idx):
+        self.calls.append(('pre_step', ctxt, step, idx))
+        return self.skip
+
+    def post_step(self, ctxt, step, idx, result):
+        self.calls.append(('post_step', ctxt, step, idx, result))
+
+
+class AsyncExt(SyncExt):
+    def read_steps_async(self, ctxt, step_list):
+        self.calls.append(('read_steps_async', ctxt, step_list))
+        return coro()
+
+    def pre_step_async(self, ctxt, step, idx):
+        self.calls.append(('pre_step_async', ctxt, step, idx))
+        return coro(self.skip)
+
+    def post_step_async(self, ctxt, step, idx, result):
+        self.calls.append(('post_step_async', ctxt, step, idx, result))
+        return coro()
+
+
+class FakeModifier(object):
+    def __init__(self, name, log, pre_result=None):
+        self.name = name
+        self.log = log
+        self.pre_result = pre_result
+
+    def pre_call(self, ctxt, pre_mod, post_mod, action):
+        self.log.append(('pre', self.name))
+        return self.pre_result
+
+    def post_call_async(self, ctxt, result, action, post_mod, pre_mod):
+        self.log.append(('post', self.name))
+        return coro(result)
+
+
+class DelayStep(object):
+    def __init__(self, name, result, delay=0.0):
+        self.name = name
+        self.result = result
+        self.delay = delay
+        self.called = False
+
+    def call(self, ctxt):
+        self.called = True
+        return asyncio.sleep(self.delay, result=self.result)
+
+
+class VariantTest(unittest.TestCase):
+    def test_sync(self):
+        self.assertEqual(aio.variant(Sync(), 'method'), None)
+        self.assertEqual(aio.variant(Sync(), '__call__'), None)
+
+    def test_async(self):
+        obj = Async()
+
+        self.assertEqual(aio.variant(obj, 'method'), obj.method_async)
+        self.assertEqual(aio.variant(obj, '__call__'), obj.call_async)
+
+
+class InvokeTest(unittest.TestCase):
+    def test_sync(self):
+        obj = Sync('result')
+
+        result = aio.run(aio.invoke(obj, 'method', 1, 2))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(obj.calls, [('method', 1, 2)])
+
+    def test_sync_call(self):
+        obj = Sync('result')
+
+        result = aio.run(aio.invoke(obj, '__call__', 1))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(obj.calls, [('__call__', 1)])
+
+    def test_sync_blocking(self):
+        obj = Sync('result')
+        threads = []
+
+        with mock.patch.object(
+                obj, 'method',
+                side_effect=lambda *a: threads.append(
+                    threading.current_thread()) or a):
+            result = aio.run(aio.invoke(obj, 'method', 1, blocking=True))
+
+        self.assertEqual(result, (1,))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+    def test_async(self):
+        obj = Async('result')
+
+        result = aio.run(aio.invoke(obj, 'method', 1, 2, blocking=True))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(obj.calls, [('method_async', 1, 2)])
+
+    def test_async_call(self):
+        obj = Async('result')
+
+        result = aio.run(aio.invoke(obj, '__call__', 1))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(obj.calls, [('call_async', 1)])
+
+    def test_async_plain(self):
+        obj = Plain('result')
+
+        result = aio.run(aio.invoke(obj, 'method', 1))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(obj.calls, [('method_async', 1)])
+
+
+class HooksTest(unittest.TestCase):
+    def test_read_steps_sync(self):
+        exts = mock.Mock(exts=[SyncExt()])
+
+        result = aio.run(aio.read_steps(exts, 'ctxt', ['step']))
+
+        self.assertEqual(result, exts.read_steps.return_value)
+        exts.read_steps.assert_called_once_with('ctxt', ['step'])
+
+    def test_read_steps_async(self):
+        ext0, ext1 = SyncExt(), AsyncExt()
+        exts = extensions.ExtensionSet([ext0, ext1])
+        step_list = ['step']
+
+        result = aio.run(aio.read_steps(exts, 'ctxt', step_list))
+
+        self.assertEqual(id(result), id(step_list))
+        self.assertEqual(ext0.calls, [('read_steps', 'ctxt', step_list)])
+        self.assertEqual(ext1.calls, [
+            ('read_steps_async', 'ctxt', step_list),
+        ])
+
+    def test_pre_step_sync(self):
+        exts = mock.Mock(exts=[SyncExt()])
+
+        result = aio.run(aio.pre_step(exts, 'ctxt', 'step', 3))
+
+        self.assertEqual(result, exts.pre_step.return_value)
+        exts.pre_step.assert_called_once_with('ctxt', 'step', 3)
+
+    def test_pre_step_async(self):
+        ext0, ext1 = SyncExt(), AsyncExt()
+        exts = extensions.ExtensionSet([ext0, ext1])
+
+        result = aio.run(aio.pre_step(exts, 'ctxt', 'step', 3))
+
+        self.assertEqual(result, False)
+        self.assertEqual(ext0.calls, [('pre_step', 'ctxt', 'step', 3)])
+        self.assertEqual(ext1.calls, [('pre_step_async', 'ctxt', 'step', 3)])
+
+    def test_pre_step_async_skip(self):
+        ext0, ext1 = AsyncExt(skip=True), SyncExt()
+        exts = extensions.ExtensionSet([ext0, ext1])
+
+        result = aio.run(aio.pre_step(exts, 'ctxt', 'step', 3))
+
+        self.assertEqual(result, True)
+        self.assertEqual(ext0.calls, [('pre_step_async', 'ctxt', 'step', 3)])
+        self.assertEqual(ext1.calls, [])
+
+    def test_post_step_sync(self):
+        exts = mock.Mock(exts=[SyncExt()])
+
+        result = aio.run(aio.post_step(exts, 'ctxt', 'step', 3, 'result'))
+
+        self.assertEqual(result, exts.post_step.return_value)
+        exts.post_step.assert_called_once_with('ctxt', 'step', 3, 'result')
+
+    def test_post_step_async(self):
+        ext0, ext1 = SyncExt(), AsyncExt()
+        exts = extensions.ExtensionSet([ext0, ext1])
+
+        result = aio.run(aio.post_step(exts, 'ctxt', 'step', 3, 'result'))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(ext0.calls, [
+            ('post_step', 'ctxt', 'step', 3, 'result'),
+        ])
+        self.assertEqual(ext1.calls, [
+            ('post_step_async', 'ctxt', 'step', 3, 'result'),
+        ])
+
+
+class CallStepTest(unittest.TestCase):
+    def test_no_modifiers(self):
+        result = steps.StepResult(state=steps.SUCCESS)
+        action = Async(result)
+        step = steps.Step('addr', action)
+
+        self.assertEqual(aio.run(aio.call_step(step, 'ctxt')), result)
+        self.assertEqual(action.calls, [('call_async', 'ctxt')])
+
+    def test_sync_action(self):
+        result = steps.StepResult(state=steps.SUCCESS)
+        action = Sync(result)
+        step = steps.Step('addr', action)
+
+        self.assertEqual(aio.run(aio.call_step(step, 'ctxt')), result)
+        self.assertEqual(action.calls, [('__call__', 'ctxt')])
+
+    def test_none_result(self):
+        step = steps.Step('addr', Async())
+
+        result = aio.run(aio.call_step(step, 'ctxt'))
+
+        self.assertEqual(result.state, steps.ERROR)
+
+    def test_exception(self):
+        action = mock.Mock(spec=[], side_effect=TypeError('bad'))
+        step = steps.Step('addr', action)
+
+        result = aio.run(aio.call_step(step, 'ctxt'))
+
+        self.assertEqual(result.state, steps.ERROR)
+        self.assertEqual(result.exc_info[0], TypeError)
+
+    def test_modifiers(self):
+        log = []
+        result = steps.StepResult(state=steps.SUCCESS)
+        action = Async(result)
+        mods = [FakeModifier('mod%d' % i, log) for i in range(3)]
+        step = steps.Step('addr', action, mods)
+
+        self.assertEqual(aio.run(aio.call_step(step, 'ctxt')), result)
+        self.assertEqual(log, [
+            ('pre', 'mod0'), ('pre', 'mod1'), ('pre', 'mod2'),
+            ('post', 'mod2'), ('post', 'mod1'), ('post', 'mod0'),
+        ])
+        self.assertEqual(action.calls, [('call_async', 'ctxt')])
+
+    def test_modifiers_takeover(self):
+        log = []
+        result = steps.StepResult(state=steps.SKIPPED)
+        action = Async('unused')
+        mods = [
+            FakeModifier('mod0', log),
+            FakeModifier('mod1', log, result),
+            FakeModifier('mod2', log),
+        ]
+        step = steps.Step('addr', action, mods)
+
+        self.assertEqual(aio.run(aio.call_step(step, 'ctxt')), result)
+        self.assertEqual(log, [
+            ('pre', 'mod0'), ('pre', 'mod1'),
+            ('post', 'mod1'), ('post', 'mod0'),
+        ])
+        self.assertEqual(action.calls, [])
+
+    def test_invoke_step_start(self):
+        log = []
+        result = steps.StepResult(state=steps.SUCCESS)
+        action = Async(result)
+        mods = [FakeModifier('mod%d' % i, log) for i in range(3)]
+
+        self.assertEqual(
+            aio.run(aio.invoke_step('ctxt', action, mods, 2)), result)
+        self.assertEqual(log, [('pre', 'mod2'), ('post', 'mod2')])
+
+
+class RetryTest(unittest.TestCase):
+    def test_retry(self):
+        from timid import context
+        from timid import modifiers
+
+        ctxt = mock.Mock()
+        mod = modifiers.RetryModifier(
+            context.Context(), 'retry', {'attempts': 3, 'delay': 0},
+            steps.StepAddress('test.yaml', 0))
+        results = [
+            steps.StepResult(state=steps.FAILURE),
+            steps.StepResult(state=steps.SUCCESS),
+        ]
+        action = mock.Mock(spec=[], side_effect=results)
+
+        result = aio.run(aio.invoke_step(ctxt, action, [mod]))
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(result.results, results)
+        self.assertEqual(action.call_count, 2)
+        ctxt.emit.assert_called_once_with(
+            '    Attempt 1 of 3 failed: FAILURE; retrying in 0.00s')
+
+
+class TimeoutTest(unittest.TestCase):
+    def test_timeout(self):
+        from timid import context
+        from timid import modifiers
+
+        ctxt = context.Context()
+        mod = modifiers.TimeoutModifier(
+            context.Context(), 'timeout', {'seconds': 0.01, 'grace': 0},
+            steps.StepAddress('test.yaml', 0))
+        trackers = []
+
+        async def action(actxt):
+            trackers.extend(actxt.environment._trackers)
+            while trackers[0].signalled is None:
+                await asyncio.sleep(0.01)
+            return steps.StepResult(returncode=-15)
+        action = mock.Mock(spec=['call_async'], call_async=action)
+
+        result = aio.run(aio.invoke_step(ctxt, action, [mod]))
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.msg, 'Timed out after 0.01 seconds')
+        self.assertEqual(len(trackers), 1)
+        self.assertEqual(ctxt.environment._trackers, [])
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_bounded(self):
+        running = []
+        maximum = []
+
+        async def func(idx):
+            running.append(idx)
+            maximum.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(idx)
+            return steps.StepResult(state=steps.SUCCESS)
+
+        result = aio.run(aio.schedule(func, 5, 2, True))
+
+        self.assertEqual([r.state for r in result], [steps.SUCCESS] * 5)
+        self.assertEqual(max(maximum), 2)
+
+    def test_fail_fast(self):
+        calls = []
+
+        async def func(idx):
+            calls.append(idx)
+            return steps.StepResult(state=steps.FAILURE)
+
+        result = aio.run(aio.schedule(func, 3, 1, True))
+
+        self.assertEqual(calls, [0])
+        self.assertEqual(result[1:], [None, None])
+
+
+class RunMatrixTest(unittest.TestCase):
+    def get_modifier(self, config):
+        from timid import context
+        from timid import modifiers
+
+        ctxt = context.Context()
+        ctxt.emit = mock.Mock()
+        return ctxt, modifiers.MatrixModifier(
+            ctxt, 'matrix', config, steps.StepAddress('test.yaml', 0))
+
+    def test_base(self):
+        ctxt, mod = self.get_modifier({'x': [1, 2, 3]})
+        seen = []
+
+        def action(vctxt):
+            seen.append(vctxt.variables['x'])
+            return coro(steps.StepResult(
+                state=steps.FAILURE if vctxt.variables['x'] == 2
+                else steps.SUCCESS))
+
+        result = aio.run(aio.invoke_step(
+            ctxt, mock.Mock(spec=['call_async'], call_async=action), [mod]))
+
+        self.assertEqual(sorted(seen), [1, 2, 3])
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.msg, '1 of 3 variants failed (x=2: FAILURE)')
+        self.assertEqual([r.state for r in result.results],
+                         [steps.SUCCESS, steps.FAILURE, steps.SUCCESS])
+
+    def test_fail_fast(self):
+        ctxt, mod = self.get_modifier({
+            'vars': {'x': [1, 2, 3]},
+            'max-workers': 1,
+            'mode': 'fail-fast',
+        })
+        calls = []
+
+        def action(vctxt):
+            calls.append(vctxt.variables['x'])
+            return coro(steps.StepResult(state=steps.FAILURE))
+
+        result = aio.run(aio.invoke_step(
+            ctxt, mock.Mock(spec=['call_async'], call_async=action), [mod]))
+
+        self.assertEqual(calls, [1])
+        self.assertEqual([r.state for r in result.results],
+                         [steps.FAILURE, steps.SKIPPED, steps.SKIPPED])
+
+
+class TimidTest(unittest.TestCase):
+    def make_steps(self, *results):
+        return [
+            mock.Mock(step_name='step%d' % i, spec=['name', 'action',
+                                                    'modifiers'],
+                      action=Async(result), modifiers=[])
+            for i, result in enumerate(results)
+        ]
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_base(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(state=steps.SUCCESS),
+                                    steps.StepResult(state=steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        ctxt = mock.Mock(steps=[], timings={})
+        ext = AsyncExt()
+        exts = extensions.ExtensionSet([ext])
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml', 'key', False, exts))
+
+        self.assertEqual(result, None)
+        self.assertEqual(ctxt.extensions, exts)
+        self.assertEqual(ctxt.steps, step_list)
+        mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', 'key')
+        self.assertEqual(set(ctxt.timings), set(['parse', 'read_steps']))
+        self.assertEqual([c[0] for c in ext.calls], [
+            'read_steps_async',
+            'pre_step_async', 'post_step_async',
+            'pre_step_async', 'post_step_async',
+        ])
+        for step in step_list:
+            self.assertEqual(step.action.calls, [('call_async', ctxt)])
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(state=steps.SUCCESS),
+                                    steps.StepResult(state=steps.SUCCESS),
+                                    steps.StepResult(state=steps.FAILURE))
+        mock_parse_file.return_value = step_list
+        ctxt = mock.Mock(steps=[], timings={})
+        ckpt = mock.Mock(**{'start.return_value': 1})
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml', ckpt=ckpt))
+
+        self.assertEqual(result, 'Test step failure')
+        self.assertEqual(step_list[0].action.calls, [])
+        ckpt.save.assert_called_once_with(ctxt, 2)
+        self.assertFalse(ckpt.clear.called)
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint_refused(self, mock_parse_file):
+        mock_parse_file.return_value = self.make_steps(
+            steps.StepResult(state=steps.SUCCESS))
+        ctxt = mock.Mock(steps=[], timings={})
+        ckpt = mock.Mock(**{
+            'start.side_effect': main.checkpoint.CheckpointError('changed'),
+        })
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml', ckpt=ckpt))
+
+        self.assertEqual(result, 'Unable to resume: changed')
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_check(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(state=steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        ctxt = mock.Mock(steps=[], timings={})
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml', check=True))
+
+        self.assertEqual(result, None)
+        self.assertEqual(ctxt.steps, step_list)
+        self.assertEqual(step_list[0].action.calls, [])
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_skip(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(state=steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        ctxt = mock.Mock(steps=[], timings={})
+        exts = extensions.ExtensionSet([AsyncExt(skip=True)])
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml', exts=exts))
+
+        self.assertEqual(result, None)
+        self.assertEqual(step_list[0].action.calls, [])
+        ctxt.emit.assert_any_call('[Step 0]: `- Step SKIPPED',
+                                  idx=0, step=step_list[0])
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_failure(self, mock_parse_file):
+        step_list = self.make_steps(
+            steps.StepResult(state=steps.FAILURE, msg='oops'),
+            steps.StepResult(state=steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        ctxt = mock.Mock(steps=[], timings={})
+
+        result = aio.run(aio.timid(ctxt, 'test.yaml'))
+
+        self.assertEqual(result, 'Test step failure: oops')
+        self.assertEqual(step_list[1].action.calls, [])
+
+
+class RunTargetsTest(unittest.TestCase):
+    @mock.patch('traceback.print_exc')
+    def test_base(self, mock_print_exc):
+        running = [0, 0]
+        results = {
+            't1.yaml': None,
+            't2.yaml': 'failed',
+            't3.yaml': TypeError('bad'),
+        }
+
+        def fake_timid(ctxt, test, key, check, exts, ckpt):
+            running[0] += 1
+            running[1] = max(running)
+            loop = aio._running_loop()
+            fut = loop.create_future()
+
+            def done():
+                running[0] -= 1
+                if isinstance(results[test], Exception):
+                    fut.set_exception(results[test])
+                else:
+                    fut.set_result(results[test])
+
+            loop.call_later(0.01, done)
+            return fut
+
+        targets = []
+        for test, debug in (('t1.yaml', False), ('t2.yaml', False),
+                            ('t3.yaml', True)):
+            target = main.Target(test)
+            target.ctxt = mock.Mock(debug=debug)
+            targets.append(target)
+
+        with mock.patch.object(aio, 'timid',
+                               mock.Mock(side_effect=fake_timid)):
+            aio.run(aio.run_targets(targets, False, 'exts', 2))
+
+        self.assertEqual(targets[0].result, None)
+        self.assertEqual(targets[1].result, 'failed')
+        self.assertTrue(isinstance(targets[2].result, TypeError))
+        self.assertEqual(running[1], 2)
+        mock_print_exc.assert_called_once_with(file=sys.stderr)
+
+
+class RunParallelTest(unittest.TestCase):
+    def make_action(self, step_list, max_workers=4, fail_fast=True):
+        action = mock.Mock(steps=step_list, max_workers=max_workers,
+                           fail_fast=fail_fast)
+        action._summarize.side_effect = lambda r: r
+        action._report.side_effect = (
+            lambda *args: parallel.ParallelAction._report(action, *args))
+        return action
+
+    def make_step(self, name, result, delay=0.0):
+        fake = DelayStep(name, result, delay)
+        step = mock.Mock(spec=['name', 'action', 'modifiers', 'fake'],
+                         action=mock.Mock(spec=['call_async'],
+                                          call_async=fake.call),
+                         modifiers=[], fake=fake)
+        step.name = name
+        return step
+
+    def test_success(self):
+        ctxt = mock.Mock(extensions=extensions.ExtensionSet())
+        step_list = [
+            self.make_step('step%d' % i,
+                           steps.StepResult(state=steps.SUCCESS), 0.05)
+            for i in range(4)
+        ]
+        action = self.make_action(step_list)
+
+        start = time.time()
+        result = aio.run(aio.run_parallel(ctxt, action))
+        elapsed = time.time() - start
+
+        self.assertEqual([r.state for r in result], [steps.SUCCESS] * 4)
+        self.assertTrue(elapsed < 0.15)
+        action._summarize.assert_called_once_with(result)
+
+    def test_fail_fast(self):
+        ctxt = mock.Mock(extensions=extensions.ExtensionSet())
+        step_list = [
+            self.make_step('step0', steps.StepResult(state=steps.FAILURE)),
+            self.make_step('step1', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        action = self.make_action(step_list, max_workers=1)
+
+        result = aio.run(aio.run_parallel(ctxt, action))
+
+        self.assertEqual(result[0].state, steps.FAILURE)
+        self.assertEqual(result[1], None)
+
+    def test_complete_all(self):
+        ctxt = mock.Mock(extensions=extensions.ExtensionSet())
+        step_list = [
+            self.make_step('step0', steps.StepResult(state=steps.FAILURE)),
+            self.make_step('step1', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        action = self.make_action(step_list, max_workers=1, fail_fast=False)
+
+        result = aio.run(aio.run_parallel(ctxt, action))
+
+        self.assertEqual([r.state for r in result],
+                         [steps.FAILURE, steps.SUCCESS])
+
+    def test_skip(self):
+        ctxt = mock.Mock(extensions=extensions.ExtensionSet([
+            AsyncExt(skip=True),
+        ]))
+        step_list = [
+            self.make_step('step0', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        action = self.make_action(step_list)
+
+        result = aio.run(aio.run_parallel(ctxt, action))
+
+        self.assertEqual(result[0].state, steps.SKIPPED)
+        self.assertFalse(step_list[0].fake.called)
+        ctxt.emit.assert_has_calls([
+            mock.call('[Sub-step 0]: step0 . . .',
+                      idx=0, step=step_list[0]),
+            mock.call('[Sub-step 0]: `- Step SKIPPED',
+                      idx=0, step=step_list[0]),
+        ])
+
+
+class TrackProcessTest(unittest.TestCase):
+    def test_base(self):
+        trackers = [mock.Mock(), mock.Mock()]
+
+        result = aio.run(aio.track_process(coro('process'), trackers))
+
+        self.assertEqual(result, 'process')
+        for tracker in trackers:
+            tracker.add.assert_called_once_with('process')
+
+
+class WaitProcessTest(unittest.TestCase):
+    def test_base(self):
+        process = mock.Mock(**{'wait.return_value': coro(5)})
+
+        result = aio.run(aio.wait_process(coro(process)))
+
+        self.assertTrue(isinstance(result, steps.StepResult))
+        self.assertEqual(result.returncode, 5)
+        self.assertEqual(result.state, steps.FAILURE)
+
+    def test_real_process(self):
+        env = mock.Mock(**{
+            'call_async.side_effect': lambda args: asyncio.
+            create_subprocess_exec(*args),
+        })
+
+        result = aio.run(aio.wait_process(
+            env.call_async([sys.executable, '-c', 'import sys; sys.exit(3)'])))
+
+        self.assertEqual(result.returncode, 3)
+
+    def test_capture(self):
+        capture = output.Capture(16, False)
+        script = 'import sys; print("x" * 100); sys.stderr.write("oops")'
+
+        result = aio.run(aio.wait_process(asyncio.create_subprocess_exec(
+            sys.executable, '-c', script, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE), capture))
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.output, {
+            'stdout': b'x' * 15 + b'\n',
+            'stderr': b'oops',
+        })
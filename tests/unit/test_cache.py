@@ -0,0 +1,668 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import jinja2
+import mock
+from six.moves import builtins
+
+from timid import cache
+from timid import entry
+
+
+class PlanCacheTest(unittest.TestCase):
+    def test_init_base(self):
+        result = cache.PlanCache()
+
+        self.assertEqual(result.directory, None)
+        self.assertEqual(result._signature, None)
+
+    def test_init_alt(self):
+        result = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(result.directory, '/cache/dir')
+        self.assertEqual(result._signature, None)
+
+    def test_signature_cached(self):
+        obj = cache.PlanCache('/cache/dir')
+        obj._signature = 'cached'
+
+        self.assertEqual(obj.signature, 'cached')
+
+    @mock.patch.object(entry, 'points', {
+        'timid.actions': mock.Mock(**{'signature.return_value': ['a']}),
+        'timid.modifiers': mock.Mock(**{'signature.return_value': ['m']}),
+    })
+    def test_signature_uncached(self):
+        obj = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(obj.signature, "[['a'], ['m']]")
+        self.assertEqual(obj._signature, "[['a'], ['m']]")
+
+    def test_digest_disabled(self):
+        obj = cache.PlanCache()
+        obj._signature = 'signature'
+
+        self.assertEqual(obj.digest(b'content', 'key'), None)
+
+    def test_digest(self):
+        obj = cache.PlanCache('/cache/dir')
+        obj._signature = 'signature'
+        expected = hashlib.sha256(
+            b"2\0signature\0'key'\0content").hexdigest()
+
+        self.assertEqual(obj.digest(b'content', 'key'), expected)
+
+    def test_digest_varies(self):
+        obj = cache.PlanCache('/cache/dir')
+        obj._signature = 'signature'
+        base = obj.digest(b'content', 'key')
+
+        self.assertNotEqual(obj.digest(b'content', None), base)
+        self.assertNotEqual(obj.digest(b'other', 'key'), base)
+        obj._signature = 'other'
+        self.assertNotEqual(obj.digest(b'content', 'key'), base)
+
+    def test_path(self):
+        obj = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(obj._path('abcdef'), '/cache/dir/ab/abcdef.json')
+
+    @mock.patch.object(builtins, 'open')
+    def test_get_disabled(self, mock_open):
+        obj = cache.PlanCache()
+
+        self.assertEqual(obj.get(None), None)
+        self.assertFalse(mock_open.called)
+
+    @mock.patch.object(builtins, 'open', side_effect=IOError('missing'))
+    def test_get_missing(self, mock_open):
+        obj = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(obj.get('abcdef'), None)
+        mock_open.assert_called_once_with('/cache/dir/ab/abcdef.json', 'rb')
+
+    @mock.patch.object(builtins, 'open')
+    def test_get(self, mock_open):
+        filemock = mock.MagicMock()
+        filemock.__enter__.return_value = filemock
+        filemock.read.return_value = b'["step", {"a": 1}]'
+        mock_open.return_value = filemock
+        obj = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(obj.get('abcdef'), ['step', {'a': 1}])
+        mock_open.assert_called_once_with('/cache/dir/ab/abcdef.json', 'rb')
+
+    @mock.patch.object(builtins, 'open')
+    def test_get_corrupt(self, mock_open):
+        filemock = mock.MagicMock()
+        filemock.__enter__.return_value = filemock
+        filemock.read.return_value = b'garbage'
+        mock_open.return_value = filemock
+        obj = cache.PlanCache('/cache/dir')
+
+        self.assertEqual(obj.get('abcdef'), None)
+
+    @mock.patch('timid.utils.atomic_write')
+    def test_put_disabled(self, mock_atomic_write):
+        obj = cache.PlanCache()
+
+        obj.put(None, ['step'])
+
+        self.assertFalse(mock_atomic_write.called)
+
+    @mock.patch('timid.utils.atomic_write')
+    def test_put(self, mock_atomic_write):
+        obj = cache.PlanCache('/cache/dir')
+
+        obj.put('abcdef', ['step'])
+
+        mock_atomic_write.assert_called_once_with(
+            '/cache/dir/ab/abcdef.json', b'["step"]')
+
+    @mock.patch('timid.utils.atomic_write')
+    def test_put_unrepresentable(self, mock_atomic_write):
+        obj = cache.PlanCache('/cache/dir')
+
+        obj.put('abcdef', [{'matrix': {1: 'one'}}])
+        obj.put('abcdef', [{'when': datetime.date(2015, 1, 1)}])
+
+        self.assertFalse(mock_atomic_write.called)
+
+    @mock.patch('timid.utils.atomic_write', side_effect=OSError('failed'))
+    def test_put_failure(self, mock_atomic_write):
+        obj = cache.PlanCache('/cache/dir')
+
+        obj.put('abcdef', ['step'])
+
+        self.assertTrue(mock_atomic_write.called)
+
+
+class ParseCacheTest(unittest.TestCase):
+    def test_init(self):
+        result = cache.ParseCache()
+
+        self.assertEqual(result._steps, {})
+        self.assertEqual(len(result), 0)
+
+    @mock.patch('os.stat', return_value=mock.Mock(
+        st_dev=1, st_ino=2, st_size=3, st_mtime_ns=4))
+    def test_identity(self, mock_stat):
+        result = cache.ParseCache.identity('fname')
+
+        self.assertEqual(result, (1, 2, 3, 4))
+        mock_stat.assert_called_once_with('fname')
+
+    @mock.patch('os.stat', side_effect=OSError('missing'))
+    def test_identity_missing(self, mock_stat):
+        result = cache.ParseCache.identity('fname')
+
+        self.assertEqual(result, None)
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value='ident')
+    def test_get_missing(self, mock_identity, mock_abspath):
+        obj = cache.ParseCache()
+
+        self.assertEqual(obj.get('fname', 'key'), None)
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value='ident')
+    def test_get_present(self, mock_identity, mock_abspath):
+        steps = ['step0', 'step1']
+        obj = cache.ParseCache()
+        obj._steps[('/abs/fname', 'key')] = ('ident', steps)
+
+        result = obj.get('fname', 'key')
+
+        self.assertEqual(result, steps)
+        self.assertEqual(obj.get('fname'), None)
+        mock_identity.assert_called_once_with('fname')
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value='changed')
+    def test_get_changed(self, mock_identity, mock_abspath):
+        obj = cache.ParseCache()
+        obj._steps[('/abs/fname', 'key')] = ('ident', ['step0'])
+
+        self.assertEqual(obj.get('fname', 'key'), None)
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value=None)
+    def test_get_unidentified(self, mock_identity, mock_abspath):
+        obj = cache.ParseCache()
+        obj._steps[('/abs/fname', 'key')] = (None, ['step0'])
+
+        self.assertEqual(obj.get('fname', 'key'), None)
+        self.assertFalse(mock_identity.called)
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value='ident')
+    def test_put(self, mock_identity, mock_abspath):
+        steps = ['step0', 'step1']
+        obj = cache.ParseCache()
+
+        obj.put('fname', None, steps)
+
+        self.assertEqual(obj._steps, {
+            ('/abs/fname', None): ('ident', ['step0', 'step1']),
+        })
+        self.assertEqual(len(obj), 1)
+        self.assertEqual(obj.get('fname'), ['step0', 'step1'])
+
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(cache.ParseCache, 'identity', return_value='ident')
+    def test_put_ident(self, mock_identity, mock_abspath):
+        obj = cache.ParseCache()
+
+        obj.put('fname', 'key', ['step0'], 'earlier')
+
+        self.assertEqual(obj._steps, {
+            ('/abs/fname', 'key'): ('earlier', ['step0']),
+        })
+        self.assertFalse(mock_identity.called)
+
+    def test_enter_leave(self):
+        obj = cache.ParseCache()
+
+        self.assertEqual(obj.enter('a.yaml'), None)
+        self.assertEqual(obj.enter('a.yaml', 'key'), None)
+        self.assertEqual(obj.enter('b.yaml'), None)
+        obj.leave('b.yaml')
+        self.assertEqual(obj.enter('c.yaml'), None)
+
+        self.assertEqual(obj.enter('a.yaml', 'key'),
+                         ['a.yaml[key]', 'c.yaml', 'a.yaml[key]'])
+        obj.leave('c.yaml')
+        obj.leave('a.yaml', 'key')
+        obj.leave('a.yaml')
+        self.assertEqual(obj._local.stack, [])
+        self.assertEqual(obj.enter('a.yaml'), None)
+
+    def test_enter_threads(self):
+        obj = cache.ParseCache()
+        obj.enter('a.yaml')
+        results = []
+
+        thread = threading.Thread(
+            target=lambda: results.append(obj.enter('a.yaml')))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(results, [None])
+        self.assertEqual(obj.enter('a.yaml'), ['a.yaml', 'a.yaml'])
+
+    def test_leave_unbalanced(self):
+        obj = cache.ParseCache()
+        obj.enter('a.yaml')
+
+        obj.leave('b.yaml')
+
+        self.assertEqual(obj.enter('a.yaml'), ['a.yaml', 'a.yaml'])
+
+
+class StatCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, fname, content, age=60):
+        path = os.path.join(self.tmpdir, fname)
+        with open(path, 'wb') as f:
+            f.write(content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_init(self):
+        result = cache.StatCache()
+
+        self.assertEqual(result.path, None)
+        self.assertEqual(result._entries, None)
+        self.assertEqual(result._updated, {})
+
+    def test_digest(self):
+        path = self.write('file', b'contents')
+        obj = cache.StatCache()
+
+        result = obj.digest(path)
+
+        self.assertEqual(result, hashlib.sha256(b'contents').hexdigest())
+        self.assertEqual(list(obj._entries), [path])
+        self.assertEqual(list(obj._updated), [path])
+
+    def test_digest_cached(self):
+        path = self.write('file', b'contents')
+        obj = cache.StatCache()
+        obj.digest(path)
+
+        with mock.patch.object(builtins, 'open') as mock_open:
+            result = obj.digest(path)
+
+        self.assertEqual(result, hashlib.sha256(b'contents').hexdigest())
+        self.assertFalse(mock_open.called)
+
+    def test_digest_changed(self):
+        path = self.write('file', b'contents')
+        obj = cache.StatCache()
+        obj.digest(path)
+        self.write('file', b'changed', 30)
+
+        result = obj.digest(path)
+
+        self.assertEqual(result, hashlib.sha256(b'changed').hexdigest())
+
+    def test_digest_racy(self):
+        path = self.write('file', b'contents', 0)
+        obj = cache.StatCache()
+
+        result = obj.digest(path)
+
+        self.assertEqual(result, hashlib.sha256(b'contents').hexdigest())
+        self.assertEqual(obj._entries, {})
+        self.assertEqual(obj._updated, {})
+
+    def test_digest_missing(self):
+        obj = cache.StatCache()
+
+        self.assertRaises(OSError, obj.digest,
+                          os.path.join(self.tmpdir, 'missing'))
+
+    def test_save(self):
+        path = self.write('file', b'contents')
+        cache_file = os.path.join(self.tmpdir, 'sub', 'stat-cache.json')
+        obj = cache.StatCache(cache_file)
+        obj.digest(path)
+
+        obj.save()
+
+        self.assertEqual(obj._updated, {})
+        new = cache.StatCache(cache_file)
+        with mock.patch.object(builtins, 'open',
+                               wraps=builtins.open) as mock_open:
+            result = new.digest(path)
+        self.assertEqual(result, hashlib.sha256(b'contents').hexdigest())
+        mock_open.assert_called_once_with(cache_file, 'rb')
+
+    def test_save_merge(self):
+        path1 = self.write('file1', b'one')
+        path2 = self.write('file2', b'two')
+        cache_file = os.path.join(self.tmpdir, 'stat-cache.json')
+        obj1 = cache.StatCache(cache_file)
+        obj2 = cache.StatCache(cache_file)
+        obj1.digest(path1)
+        obj2.digest(path2)
+
+        obj1.save()
+        obj2.save()
+
+        self.assertEqual(set(cache.StatCache(cache_file)._load()),
+                         set([path1, path2]))
+
+    def test_save_json(self):
+        path = self.write('file', b'contents')
+        cache_file = os.path.join(self.tmpdir, 'stat-cache.json')
+        obj = cache.StatCache(cache_file)
+        obj.digest(path)
+
+        obj.save()
+
+        with open(cache_file, 'rb') as f:
+            data = json.loads(f.read().decode('utf-8'))
+        self.assertEqual(data['version'], obj.version)
+        self.assertEqual(data['entries'][path][1],
+                         hashlib.sha256(b'contents').hexdigest())
+
+    def test_save_unchanged(self):
+        cache_file = os.path.join(self.tmpdir, 'stat-cache.json')
+        obj = cache.StatCache(cache_file)
+
+        obj.save()
+
+        self.assertFalse(os.path.exists(cache_file))
+
+    def test_load_version(self):
+        cache_file = os.path.join(self.tmpdir, 'stat-cache.json')
+        with open(cache_file, 'wb') as f:
+            f.write(b'{"version": 0, "entries": {"/file": [[], "digest"]}}')
+        obj = cache.StatCache(cache_file)
+
+        self.assertEqual(obj._load(), {})
+
+    def test_load_corrupt(self):
+        cache_file = self.write('stat-cache.json', b'garbage')
+        obj = cache.StatCache(cache_file)
+
+        self.assertEqual(obj._load(), {})
+
+
+class StepCachesTest(unittest.TestCase):
+    @mock.patch.object(cache.utils, 'default_cache_dir',
+                       return_value='/default')
+    def test_init(self, mock_default_cache_dir):
+        result = cache.StepCaches()
+
+        self.assertEqual(result.cache_dir, None)
+        self.assertEqual(result._result_cache, None)
+        self.assertEqual(result._stat_cache, None)
+        self.assertFalse(mock_default_cache_dir.called)
+
+    @mock.patch.object(cache.utils, 'default_cache_dir',
+                       return_value='/default')
+    def test_default(self, mock_default_cache_dir):
+        obj = cache.StepCaches()
+
+        result = obj.result_cache
+
+        self.assertTrue(isinstance(result, cache.ResultCache))
+        self.assertEqual(result.directory, '/default/steps/results')
+        self.assertEqual(obj.stat_cache.path,
+                         '/default/steps/stat-cache.json')
+        self.assertEqual(id(obj.result_cache), id(result))
+        mock_default_cache_dir.assert_called_once_with()
+
+    @mock.patch.object(cache.utils, 'default_cache_dir')
+    def test_cache_dir(self, mock_default_cache_dir):
+        obj = cache.StepCaches('/cache')
+
+        result = obj.stat_cache
+
+        self.assertTrue(isinstance(result, cache.StatCache))
+        self.assertEqual(result.path, '/cache/steps/stat-cache.json')
+        self.assertEqual(obj.result_cache.directory, '/cache/steps/results')
+        self.assertFalse(mock_default_cache_dir.called)
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_fingerprint(self):
+        obj = cache.ResultCache()
+
+        result1 = obj.fingerprint({'a': 1, 'b': [2, 3]})
+        result2 = obj.fingerprint({'b': [2, 3], 'a': 1})
+        result3 = obj.fingerprint({'a': 1, 'b': [3, 2]})
+
+        self.assertEqual(len(result1), 64)
+        self.assertEqual(result1, result2)
+        self.assertNotEqual(result1, result3)
+
+    def test_disabled(self):
+        obj = cache.ResultCache()
+
+        obj.put('0123')
+
+        self.assertEqual(obj.get('0123'), None)
+
+    @mock.patch.object(time, 'time', return_value=1234.5)
+    def test_put_get(self, mock_time):
+        obj = cache.ResultCache(self.tmpdir)
+
+        self.assertEqual(obj.get('0123'), None)
+        obj.put('0123', step='test.yaml step 1')
+
+        self.assertEqual(obj.get('0123'), {
+            'step': 'test.yaml step 1',
+            'time': 1234.5,
+        })
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmpdir, '01', '0123.json')))
+
+    def test_get_corrupt(self):
+        os.mkdir(os.path.join(self.tmpdir, '01'))
+        with open(os.path.join(self.tmpdir, '01', '0123.json'), 'w') as f:
+            f.write('{')
+        obj = cache.ResultCache(self.tmpdir)
+
+        self.assertEqual(obj.get('0123'), None)
+
+    @mock.patch.object(cache.utils, 'atomic_write',
+                       side_effect=OSError('read-only'))
+    def test_put_failure(self, mock_atomic_write):
+        obj = cache.ResultCache(self.tmpdir)
+
+        obj.put('0123')
+
+        self.assertTrue(mock_atomic_write.called)
+
+
+class TemplateCacheTest(unittest.TestCase):
+    def test_init_base(self):
+        result = cache.TemplateCache()
+
+        self.assertEqual(result.size, 1000)
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.stats, {
+            'hits': 0,
+            'misses': 0,
+            'size': 0,
+        })
+
+    def test_init_alt(self):
+        result = cache.TemplateCache(5)
+
+        self.assertEqual(result.size, 5)
+
+    def test_str(self):
+        obj = cache.TemplateCache()
+        obj.hits = 5
+        obj.misses = 3
+
+        self.assertEqual(str(obj), '5 hits, 3 misses, 0 entries')
+
+    def test_template(self):
+        env = jinja2.Environment()
+        env.globals['glob'] = 'global'
+        obj = cache.TemplateCache()
+
+        result = obj.template(env, '{{ glob }} {{ spam }}')
+
+        self.assertTrue(isinstance(result, jinja2.Template))
+        self.assertEqual(result.render(spam='eggs'), 'global eggs')
+        self.assertEqual(obj.stats, {
+            'hits': 0,
+            'misses': 1,
+            'size': 1,
+        })
+
+    def test_template_hit(self):
+        env1 = jinja2.Environment()
+        env1.globals['glob'] = 'one'
+        env2 = jinja2.Environment()
+        env2.globals['glob'] = 'two'
+        obj = cache.TemplateCache()
+
+        result1 = obj.template(env1, '{{ glob }} {{ spam }}')
+        with mock.patch.object(env2, 'from_string') as mock_from_string:
+            result2 = obj.template(env2, '{{ glob }} {{ spam }}')
+
+        self.assertFalse(mock_from_string.called)
+        self.assertEqual(id(result2), id(result1))
+        self.assertEqual(result2.render(env2.globals, spam='eggs'),
+                         'two eggs')
+        self.assertEqual(obj.stats, {
+            'hits': 1,
+            'misses': 1,
+            'size': 1,
+        })
+
+    def test_template_config(self):
+        env1 = jinja2.Environment()
+        env2 = jinja2.Environment(variable_start_string='<<',
+                                  variable_end_string='>>')
+        obj = cache.TemplateCache()
+
+        result1 = obj.template(env1, '<< spam >>{{ spam }}')
+        result2 = obj.template(env2, '<< spam >>{{ spam }}')
+
+        self.assertEqual(result1.render(spam='eggs'), '<< spam >>eggs')
+        self.assertEqual(result2.render(spam='eggs'), 'eggs{{ spam }}')
+        self.assertEqual(obj.stats['misses'], 2)
+
+    def test_template_lru(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache(2)
+
+        obj.template(env, 'one')
+        obj.template(env, 'two')
+        obj.template(env, 'one')
+        obj.template(env, 'three')
+        obj.template(env, 'one')
+        obj.template(env, 'two')
+
+        self.assertEqual(obj.stats, {
+            'hits': 2,
+            'misses': 4,
+            'size': 2,
+        })
+
+    def test_template_syntax_error(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache()
+
+        self.assertRaises(jinja2.TemplateSyntaxError,
+                          obj.template, env, '{{ spam')
+        self.assertEqual(len(obj), 0)
+
+    def test_expression(self):
+        env = jinja2.Environment()
+        env.globals['glob'] = 3
+        obj = cache.TemplateCache()
+
+        result = obj.expression(env, 'spam + glob')
+
+        self.assertEqual(result(spam=2), 5)
+        self.assertEqual(result({'spam': 4}), 7)
+        self.assertEqual(obj.stats['misses'], 1)
+
+    def test_expression_hit(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache()
+
+        result1 = obj.expression(env, 'spam')
+        result2 = obj.expression(env, 'spam')
+
+        self.assertEqual(result1(spam=1), 1)
+        self.assertEqual(result2(), None)
+        self.assertEqual(obj.stats['hits'], 1)
+        self.assertEqual(obj.stats['misses'], 1)
+
+    def test_expression_distinct(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache()
+
+        tmpl = obj.template(env, 'spam')
+        expr = obj.expression(env, 'spam')
+
+        self.assertEqual(tmpl.render(spam=1), 'spam')
+        self.assertEqual(expr(spam=1), 1)
+        self.assertEqual(obj.stats['misses'], 2)
+
+    def test_expression_syntax_error(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache()
+
+        self.assertRaises(jinja2.TemplateSyntaxError,
+                          obj.expression, env, 'spam eggs')
+        self.assertRaises(jinja2.TemplateSyntaxError,
+                          obj.expression, env, 'spam +')
+
+    def test_clear(self):
+        env = jinja2.Environment()
+        obj = cache.TemplateCache()
+        obj.template(env, 'one')
+        obj.template(env, 'one')
+
+        obj.clear()
+
+        self.assertEqual(obj.stats, {
+            'hits': 0,
+            'misses': 0,
+            'size': 0,
+        })
+
+    def test_templates(self):
+        self.assertTrue(isinstance(cache.templates, cache.TemplateCache))
@@ -0,0 +1,282 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import datetime
+import json
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+
+from timid import checkpoint
+from timid import context
+from timid import entry
+from timid import environment
+from timid import main
+
+
+def make_step(addr, name, config, mods=()):
+    step = mock.Mock(step_addr=addr, action=mock.Mock(config=config),
+                     modifiers=[])
+    step.name = name
+    step.action.name = 'run'
+    for mod_name, mod_config in mods:
+        mod = mock.Mock(config=mod_config)
+        mod.name = mod_name
+        step.modifiers.append(mod)
+    return step
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'ckpt', 'test.json')
+
+    def make_ctxt(self, step_list=None):
+        ctxt = context.Context(verbose=0, cwd=self.tmpdir)
+        ctxt.environment = environment.Environment(
+            {'PATH': '/bin', 'HOME': '/home/user'}, cwd=self.tmpdir)
+        ctxt.steps = step_list or [
+            make_step('test.yaml step 1', 'one', 'echo one'),
+            make_step('test.yaml step 2', 'two', 'echo two'),
+        ]
+        return ctxt
+
+    def test_init(self):
+        result = checkpoint.Checkpoint('path')
+
+        self.assertEqual(result.path, 'path')
+        self.assertEqual(result.resume, False)
+        self.assertEqual(result.plan_hash, None)
+
+    def test_for_test(self):
+        ctxt = self.make_ctxt()
+        ctxt.cache_dir = '/cache'
+
+        result = checkpoint.Checkpoint.for_test(ctxt, 'test.yaml', 'key',
+                                                True)
+        other_key = checkpoint.Checkpoint.for_test(ctxt, 'test.yaml')
+        ctxt.environment.cwd = '/'
+        other_cwd = checkpoint.Checkpoint.for_test(ctxt, 'test.yaml', 'key')
+
+        self.assertEqual(os.path.dirname(result.path), '/cache/checkpoints')
+        self.assertTrue(result.path.endswith('.json'))
+        self.assertEqual(result.resume, True)
+        self.assertEqual(len(set([result.path, other_key.path,
+                                  other_cwd.path])), 3)
+
+    @mock.patch.object(checkpoint.utils, 'default_cache_dir',
+                       return_value='/default')
+    def test_for_test_default(self, mock_default_cache_dir):
+        ctxt = self.make_ctxt()
+
+        result = checkpoint.Checkpoint.for_test(ctxt, 'test.yaml')
+
+        self.assertEqual(os.path.dirname(result.path),
+                         '/default/checkpoints')
+
+    def test_hash_steps(self):
+        base = [make_step('a step 1', 'one', {'command': 'x'},
+                          [('when', 'true')])]
+        same = [make_step('a step 1', 'one', {'command': 'x'},
+                          [('when', 'true')])]
+        variants = [
+            [make_step('a step 2', 'one', {'command': 'x'},
+                       [('when', 'true')])],
+            [make_step('a step 1', 'two', {'command': 'x'},
+                       [('when', 'true')])],
+            [make_step('a step 1', 'one', {'command': 'y'},
+                       [('when', 'true')])],
+            [make_step('a step 1', 'one', {'command': 'x'},
+                       [('when', 'false')])],
+            base + base,
+        ]
+        hash_steps = checkpoint.Checkpoint.hash_steps
+
+        self.assertEqual(hash_steps(base), hash_steps(same))
+        hashes = set(hash_steps(v) for v in variants)
+        self.assertEqual(len(hashes), len(variants))
+        self.assertFalse(hash_steps(base) in hashes)
+
+    def test_start_no_resume(self):
+        ctxt = self.make_ctxt()
+        obj = checkpoint.Checkpoint(self.path)
+
+        with mock.patch.object(obj, 'load') as mock_load:
+            result = obj.start(ctxt)
+
+        self.assertEqual(result, 0)
+        self.assertEqual(obj.plan_hash,
+                         checkpoint.Checkpoint.hash_steps(ctxt.steps))
+        self.assertFalse(mock_load.called)
+
+    def test_start_missing(self):
+        ctxt = self.make_ctxt()
+        obj = checkpoint.Checkpoint(self.path, True)
+
+        self.assertEqual(obj.start(ctxt), 0)
+
+    def test_save_start(self):
+        ctxt = self.make_ctxt()
+        ctxt.variables['plain'] = 'value'
+        ctxt.variables['secret'] = 'password'
+        ctxt.variables.declare_sensitive('secret')
+        ctxt.variables.declare_sensitive('unset_secret')
+        ctxt.environment['TOKEN'] = 'token'
+        ctxt.environment.declare_sensitive('TOKEN')
+        ctxt.environment['EXTRA'] = 'a:b'
+        ctxt.environment.declare_list('EXTRA')
+        ctxt.environment.cwd = 'sub'
+        obj = checkpoint.Checkpoint(self.path)
+        obj.start(ctxt)
+
+        obj.save(ctxt, 1)
+
+        # The checkpoint must be private, and must not contain the
+        # sensitive values
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        self.assertFalse(b'password' in content)
+        self.assertFalse(b'token' in content)
+        state = json.loads(content.decode('utf-8'))
+        self.assertEqual(state['version'], obj.version)
+        self.assertEqual(state['variables'][1], ['secret', 'unset_secret'])
+
+        # Resume in a new context, supplying one of the sensitive
+        # values
+        new = self.make_ctxt()
+        new.variables['secret'] = 'new password'
+        new.variables['stale'] = 'stale'
+        new.environment['STALE'] = 'stale'
+        new.verbose = 1
+        resumed = checkpoint.Checkpoint(self.path, True)
+        with mock.patch.object(new, 'emit') as mock_emit:
+            result = resumed.start(new)
+
+        self.assertEqual(result, 1)
+        self.assertEqual(dict(new.variables), {
+            'plain': 'value',
+            'secret': 'new password',
+        })
+        self.assertEqual(new.variables.sensitive,
+                         frozenset(['secret', 'unset_secret']))
+        self.assertFalse('STALE' in new.environment)
+        self.assertFalse('TOKEN' in new.environment)
+        self.assertTrue('TOKEN' in new.environment.sensitive)
+        self.assertEqual(new.environment['HOME'], '/home/user')
+        self.assertEqual(list(new.environment['EXTRA']), ['a', 'b'])
+        self.assertEqual(new.environment.cwd,
+                         os.path.join(self.tmpdir, 'sub'))
+        mock_emit.assert_has_calls([
+            mock.call('Resuming from step 1'),
+            mock.call('Warning: the values of these sensitive variables '
+                      'were not saved and have not been supplied: TOKEN'),
+        ])
+
+    def test_start_changed(self):
+        ctxt = self.make_ctxt()
+        obj = checkpoint.Checkpoint(self.path)
+        obj.start(ctxt)
+        obj.save(ctxt, 1)
+        new = self.make_ctxt([make_step('test.yaml step 1', 'one',
+                                        'echo changed')])
+        resumed = checkpoint.Checkpoint(self.path, True)
+
+        self.assertRaises(checkpoint.CheckpointError, resumed.start, new)
+
+    def test_load_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        obj = checkpoint.Checkpoint(self.path, True)
+
+        self.assertEqual(obj.load(), None)
+
+    def test_load_version(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'{"version": 0}')
+        obj = checkpoint.Checkpoint(self.path, True)
+
+        self.assertEqual(obj.load(), None)
+
+    def test_save_unrepresentable(self):
+        ctxt = self.make_ctxt()
+        obj = checkpoint.Checkpoint(self.path)
+        obj.start(ctxt)
+        obj.save(ctxt, 1)
+        ctxt.variables['when'] = datetime.date(2015, 1, 1)
+
+        obj.save(ctxt, 2)
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_clear(self):
+        ctxt = self.make_ctxt()
+        obj = checkpoint.Checkpoint(self.path)
+        obj.start(ctxt)
+        obj.save(ctxt, 1)
+
+        obj.clear()
+        obj.clear()
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        # Use a private entrypoint cache, leaving the global one pristine
+        patcher = mock.patch.object(entry, 'points', entry.EntrypointCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resume(self):
+        test = os.path.join(self.tmpdir, 'test.yaml')
+        marker = os.path.join(self.tmpdir, 'marker')
+        with open(test, 'w') as f:
+            f.write('- var:\n'
+                    '    set:\n'
+                    '      greeting: hello\n'
+                    '- run: touch first\n'
+                    '- run: test -e marker\n'
+                    '- run: sh -c "echo {{ greeting }} > second"\n')
+
+        def run(resume):
+            ctxt = context.Context(verbose=0, cwd=self.tmpdir,
+                                   cache_dir=self.tmpdir)
+            ckpt = checkpoint.Checkpoint.for_test(ctxt, test, None, resume)
+            return main.timid(ctxt, test, ckpt=ckpt), ckpt
+
+        result, ckpt = run(False)
+        self.assertEqual(result, 'Test step failure')
+        self.assertEqual(ckpt.load()['index'], 2)
+        os.remove(os.path.join(self.tmpdir, 'first'))
+        open(marker, 'w').close()
+
+        result, ckpt = run(True)
+
+        self.assertEqual(result, None)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'first')))
+        with open(os.path.join(self.tmpdir, 'second')) as f:
+            self.assertEqual(f.read(), 'hello\n')
+        self.assertFalse(os.path.exists(ckpt.path))
@@ -21,14 +21,17 @@ import jinja2
 import mock
 import six
 
+from timid import cache
 from timid import context
 from timid import environment
+from timid import output
 from timid import utils
 
 
 class ContextTest(unittest.TestCase):
     @mock.patch.object(environment, 'Environment')
-    def test_init_base(self, mock_Environment):
+    @mock.patch.object(utils, 'default_cache_dir', return_value='/default')
+    def test_init_base(self, mock_default_cache_dir, mock_Environment):
         result = context.Context()
 
         self.assertEqual(result.verbose, 1)
@@ -37,14 +40,30 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(result.variables, {})
         self.assertEqual(result.environment, mock_Environment.return_value)
         self.assertEqual(result.steps, [])
+        self.assertEqual(result.timings, {})
+        self.assertEqual(result.extensions, None)
+        self.assertEqual(result.cache_dir, None)
+        self.assertEqual(result.plan_cache.directory, None)
+        self.assertTrue(isinstance(result.parse_cache, cache.ParseCache))
+        self.assertTrue(isinstance(result.step_caches, cache.StepCaches))
+        self.assertEqual(result.step_caches.cache_dir, None)
+        self.assertFalse(mock_default_cache_dir.called)
+        self.assertEqual(result.result_cache.directory,
+                         '/default/steps/results')
+        self.assertEqual(result.stat_cache.path,
+                         '/default/steps/stat-cache.json')
+        self.assertEqual(result.label, None)
+        self.assertEqual(id(result.templates), id(cache.templates))
         self.assertTrue(isinstance(result._jinja, jinja2.Environment))
+        self.assertEqual(result._jinja.bytecode_cache, None)
         self.assertEqual(id(result._jinja.globals['env']),
                          id(result.environment))
         mock_Environment.assert_called_once_with(cwd=None)
 
     @mock.patch.object(environment, 'Environment')
-    def test_init_alt(self, mock_Environment):
-        result = context.Context(5, True, 'some/dir/ectory')
+    @mock.patch.object(utils, 'ensure_dir')
+    def test_init_alt(self, mock_ensure_dir, mock_Environment):
+        result = context.Context(5, True, 'some/dir/ectory', '/cache')
 
         self.assertEqual(result.verbose, 5)
         self.assertEqual(result.debug, True)
@@ -52,11 +71,132 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(result.variables, {})
         self.assertEqual(result.environment, mock_Environment.return_value)
         self.assertEqual(result.steps, [])
+        self.assertEqual(result.timings, {})
+        self.assertEqual(result.extensions, None)
+        self.assertEqual(result.cache_dir, '/cache')
+        self.assertEqual(result.plan_cache.directory, '/cache/plans')
+        self.assertTrue(isinstance(result.parse_cache, cache.ParseCache))
+        self.assertEqual(result.result_cache.directory,
+                         '/cache/steps/results')
+        self.assertEqual(result.stat_cache.path,
+                         '/cache/steps/stat-cache.json')
+        self.assertEqual(result.label, None)
+        self.assertEqual(id(result.templates), id(cache.templates))
         self.assertTrue(isinstance(result._jinja, jinja2.Environment))
+        self.assertEqual(result._jinja.bytecode_cache, None)
+        self.assertFalse(mock_ensure_dir.called)
         self.assertEqual(id(result._jinja.globals['env']),
                          id(result.environment))
         mock_Environment.assert_called_once_with(cwd='some/dir/ectory')
 
+    def test_scrubber(self):
+        obj = context.Context()
+        obj.variables['pw'] = 'hunter2'
+        obj.variables.declare_sensitive('pw')
+        obj.environment['TOKEN'] = 'tok-123'
+        obj.environment.declare_sensitive('TOKEN')
+
+        result = obj.scrubber
+
+        self.assertTrue(isinstance(result, output.Scrubber))
+        self.assertEqual(result.scrub(b'hunter2 tok-123'),
+                         b'<masked pw> <masked TOKEN>')
+        self.assertEqual(id(obj.scrubber), id(result))
+        self.assertEqual(result.builds, 1)
+
+    def test_fork(self):
+        obj = context.Context(5, True, '/some/dir', '/cache')
+        obj.variables['var'] = 'value'
+        obj.variables.declare_sensitive('secret')
+        obj.environment['ENVVAR'] = 'value'
+        obj.steps = ['step1', 'step2']
+        obj.extensions = 'exts'
+
+        result = obj.fork('label')
+
+        self.assertNotEqual(id(result), id(obj))
+        self.assertEqual(result.verbose, 5)
+        self.assertEqual(result.debug, True)
+        self.assertEqual(result.label, 'label')
+        self.assertEqual(result.cache_dir, '/cache')
+        self.assertEqual(id(result.plan_cache), id(obj.plan_cache))
+        self.assertEqual(id(result.parse_cache), id(obj.parse_cache))
+        self.assertEqual(id(result.step_caches), id(obj.step_caches))
+        self.assertEqual(id(result.result_cache), id(obj.result_cache))
+        self.assertEqual(id(result.stat_cache), id(obj.stat_cache))
+        self.assertEqual(id(result.events), id(obj.events))
+        self.assertEqual(result.variables, {'var': 'value'})
+        self.assertNotEqual(id(result.variables), id(obj.variables))
+        self.assertEqual(result.variables.sensitive, set(['secret']))
+        self.assertEqual(result.environment['ENVVAR'], 'value')
+        self.assertEqual(result.environment.cwd, '/some/dir')
+        self.assertNotEqual(id(result.environment), id(obj.environment))
+        self.assertEqual(id(result._jinja.globals['env']),
+                         id(result.environment))
+        self.assertEqual(result.steps, ['step1', 'step2'])
+        self.assertNotEqual(id(result.steps), id(obj.steps))
+        self.assertEqual(result.extensions, 'exts')
+
+        result.variables['var'] = 'other'
+        result.environment['ENVVAR'] = 'other'
+
+        self.assertEqual(obj.variables['var'], 'value')
+        self.assertEqual(obj.environment['ENVVAR'], 'value')
+
+    def test_fork_state(self):
+        obj = context.Context()
+        obj.environment['ENVVAR'] = 'value'
+        obj.timings['parse'] = 1.0
+        obj.label = 'parent'
+
+        with mock.patch.object(environment, 'Environment') as mock_Env:
+            with mock.patch.object(jinja2, 'Environment') as mock_Jinja:
+                result = obj.fork()
+
+        self.assertFalse(mock_Env.called)
+        self.assertFalse(mock_Jinja.called)
+        self.assertEqual(result.timings, {})
+        self.assertEqual(result.label, None)
+        self.assertNotEqual(id(result._scrubber), id(obj._scrubber))
+        self.assertEqual(result.template('{{ env.ENVVAR }}')(result),
+                         'value')
+        result.environment['ENVVAR'] = 'other'
+        self.assertEqual(result.template('{{ env.ENVVAR }}')(result),
+                         'other')
+        self.assertEqual(obj.template('{{ env.ENVVAR }}')(obj), 'value')
+
+    def test_tracking(self):
+        obj = context.Context()
+        obj.environment['ENVVAR'] = 'value'
+
+        result = obj.tracking('tracker')
+
+        self.assertNotEqual(id(result), id(obj))
+        self.assertTrue(isinstance(result.environment,
+                                   environment.TrackedEnvironment))
+        self.assertEqual(result.environment._trackers, ['tracker'])
+        self.assertEqual(obj.environment._trackers, [])
+        self.assertEqual(id(result.variables), id(obj.variables))
+        self.assertEqual(id(result.events), id(obj.events))
+
+        result.environment['ENVVAR'] = 'other'
+
+        self.assertEqual(obj.environment['ENVVAR'], 'other')
+
+    @mock.patch.object(environment, 'Environment')
+    @mock.patch.object(sys, 'stdout', six.StringIO())
+    @mock.patch.object(sys, 'stderr', six.StringIO())
+    def test_emit_label(self, mock_Environment):
+        obj = context.Context(5, True, 'some/dir/ectory')
+        obj.label = 'label'
+
+        obj.emit('test message', level=3)
+        obj.emit('debug message', debug=True)
+        obj.flush()
+
+        self.assertEqual(sys.stdout.getvalue(), 'label: test message\n')
+        self.assertEqual(sys.stderr.getvalue(), 'label: debug message\n')
+
     @mock.patch.object(environment, 'Environment')
     @mock.patch.object(sys, 'stdout', six.StringIO())
     @mock.patch.object(sys, 'stderr', six.StringIO())
@@ -64,6 +204,7 @@ class ContextTest(unittest.TestCase):
         obj = context.Context(5, True, 'some/dir/ectory')
 
         obj.emit('test message', level=10, debug=True)
+        obj.flush()
 
         self.assertEqual(sys.stdout.getvalue(), '')
         self.assertEqual(sys.stderr.getvalue(), 'test message\n')
@@ -75,6 +216,7 @@ class ContextTest(unittest.TestCase):
         obj = context.Context(5, False, 'some/dir/ectory')
 
         obj.emit('test message', level=10, debug=True)
+        obj.flush()
 
         self.assertEqual(sys.stdout.getvalue(), '')
         self.assertEqual(sys.stderr.getvalue(), '')
@@ -86,6 +228,7 @@ class ContextTest(unittest.TestCase):
         obj = context.Context(1, False, 'some/dir/ectory')
 
         obj.emit('test message', level=3)
+        obj.flush()
 
         self.assertEqual(sys.stdout.getvalue(), '')
         self.assertEqual(sys.stderr.getvalue(), '')
@@ -97,25 +240,53 @@ class ContextTest(unittest.TestCase):
         obj = context.Context(5, False, 'some/dir/ectory')
 
         obj.emit('test message', level=3)
+        obj.flush()
 
         self.assertEqual(sys.stdout.getvalue(), 'test message\n')
         self.assertEqual(sys.stderr.getvalue(), '')
 
-    @mock.patch.object(jinja2, 'Environment', return_value=mock.Mock(**{
-        'globals': {},
-        'from_string.return_value': mock.Mock(**{
-            'render.return_value': 'rendered',
-        }),
-    }))
-    def test_template_nonstr(self, mock_Environment):
-        jinja_env = mock_Environment.return_value
-        tmpl = jinja_env.from_string.return_value
+    @mock.patch.object(environment, 'Environment')
+    def test_emit_event(self, mock_Environment):
+        obj = context.Context(5, False, 'some/dir/ectory')
+        obj.label = 'label'
+        obj.events = mock.Mock()
+        step = mock.Mock(step_addr='address')
+
+        obj.emit('test message', level=3, idx=2, step=step)
+        obj.emit('other message')
+
+        self.assertEqual(obj.events.put.call_count, 2)
+        event = obj.events.put.call_args_list[0][0][0]
+        self.assertEqual(event.to_dict(), {
+            'time': event.timestamp,
+            'level': 3,
+            'debug': False,
+            'test': 'label',
+            'index': 2,
+            'address': 'address',
+            'message': 'test message',
+        })
+        event = obj.events.put.call_args_list[1][0][0]
+        self.assertEqual((event.idx, event.step_addr), (None, None))
+
+    @mock.patch.object(environment, 'Environment')
+    def test_flush(self, mock_Environment):
+        obj = context.Context()
+        obj.events = mock.Mock()
+
+        obj.flush()
+
+        obj.events.flush.assert_called_once_with()
+
+    @mock.patch.object(cache, 'templates')
+    def test_template_nonstr(self, mock_templates):
+        tmpl = mock_templates.template.return_value
         obj = context.Context()
 
         result = obj.template(1234)
 
         self.assertTrue(callable(result))
-        self.assertFalse(jinja_env.from_string.called)
+        self.assertFalse(mock_templates.template.called)
         self.assertFalse(tmpl.render.called)
 
         rendered = result(obj)
@@ -123,68 +294,165 @@ class ContextTest(unittest.TestCase):
         self.assertEqual(rendered, 1234)
         self.assertFalse(tmpl.render.called)
 
-    @mock.patch.object(jinja2, 'Environment', return_value=mock.Mock(**{
-        'globals': {},
-        'from_string.return_value': mock.Mock(**{
-            'render.return_value': 'rendered',
-        }),
-    }))
-    def test_template_str(self, mock_Environment):
-        jinja_env = mock_Environment.return_value
-        tmpl = jinja_env.from_string.return_value
+    @mock.patch.object(cache, 'templates')
+    @mock.patch.object(context.Context, '_render', return_value='rendered')
+    def test_template_str(self, mock_render, mock_templates):
+        tmpl = mock_templates.template.return_value
         obj = context.Context()
 
         result = obj.template('spam')
 
         self.assertTrue(callable(result))
-        jinja_env.from_string.assert_called_once_with('spam')
-        self.assertFalse(tmpl.render.called)
+        mock_templates.template.assert_called_once_with(obj._jinja, 'spam')
+        self.assertFalse(mock_render.called)
 
         rendered = result(obj)
 
         self.assertEqual(rendered, 'rendered')
-        tmpl.render.assert_called_once_with(obj.variables)
+        mock_render.assert_called_once_with(tmpl)
 
-    @mock.patch.object(jinja2, 'Environment', return_value=mock.Mock(**{
-        'globals': {},
-        'compile_expression.return_value': mock.Mock(**{
-            'return_value': 'rendered',
-        }),
-    }))
-    def test_expression_nonstr(self, mock_Environment):
-        jinja_env = mock_Environment.return_value
-        expr = jinja_env.compile_expression.return_value
+    @mock.patch.object(cache, 'templates')
+    def test_expression_nonstr(self, mock_templates):
         obj = context.Context()
 
         result = obj.expression(1234)
 
         self.assertTrue(callable(result))
-        self.assertFalse(jinja_env.compile_expression.called)
-        self.assertFalse(expr.called)
+        self.assertFalse(mock_templates.expression.called)
 
         rendered = result(obj)
 
         self.assertEqual(rendered, 1234)
-        self.assertFalse(expr.called)
 
-    @mock.patch.object(jinja2, 'Environment', return_value=mock.Mock(**{
-        'globals': {},
-        'compile_expression.return_value': mock.Mock(**{
-            'return_value': 'rendered',
-        }),
-    }))
-    def test_expression_str(self, mock_Environment):
-        jinja_env = mock_Environment.return_value
-        expr = jinja_env.compile_expression.return_value
+    @mock.patch.object(cache, 'templates')
+    @mock.patch.object(context.Context, '_evaluate', return_value='value')
+    def test_expression_str(self, mock_evaluate, mock_templates):
+        tmpl = mock_templates.expression.return_value
         obj = context.Context()
 
         result = obj.expression('spam')
 
         self.assertTrue(callable(result))
-        jinja_env.compile_expression.assert_called_once_with('spam')
-        self.assertFalse(expr.called)
+        mock_templates.expression.assert_called_once_with(
+            obj._jinja, 'spam')
+        self.assertFalse(mock_evaluate.called)
 
         rendered = result(obj)
 
-        self.assertEqual(rendered, 'rendered')
-        expr.assert_called_once_with(obj.variables)
+        self.assertEqual(rendered, 'value')
+        mock_evaluate.assert_called_once_with(tmpl, {})
+
+    def test_render_vars(self):
+        obj = context.Context()
+        obj.variables['spam'] = 'eggs'
+        obj.variables['env'] = 'shadowed'
+
+        result = obj._render_vars()
+
+        self.assertEqual(result['spam'], 'eggs')
+        self.assertEqual(result['env'], 'shadowed')
+        self.assertEqual(id(result['range']), id(obj._jinja.globals['range']))
+        self.assertEqual(obj._render_cache,
+                         (obj.variables, obj.variables.version, result))
+
+    def test_render_vars_cached(self):
+        obj = context.Context()
+        obj.variables['spam'] = 'eggs'
+        first = obj._render_vars()
+
+        result = obj._render_vars()
+
+        self.assertEqual(id(result), id(first))
+
+    def test_render_vars_changed(self):
+        obj = context.Context()
+        obj.variables['spam'] = 'eggs'
+        first = obj._render_vars()
+        obj.variables['spam'] = 'spam'
+
+        result = obj._render_vars()
+
+        self.assertNotEqual(id(result), id(first))
+        self.assertEqual(result['spam'], 'spam')
+
+    def test_render_vars_replaced(self):
+        obj = context.Context()
+        obj.variables['spam'] = 'eggs'
+        first = obj._render_vars()
+        obj.variables = utils.SensitiveDict({'spam': 'spam'})
+
+        result = obj._render_vars()
+
+        self.assertNotEqual(id(result), id(first))
+        self.assertEqual(result['spam'], 'spam')
+
+    def test_render(self):
+        obj = context.Context()
+        obj.variables.update(spam='eggs', count=3)
+        tmpl = cache.templates.template(
+            obj._jinja,
+            '{% set x = count * 2 %}{{ spam }}{{ x }}{{ missing }}')
+
+        self.assertEqual(obj._render(tmpl), 'eggs6')
+        self.assertEqual(obj._render(tmpl), tmpl.render(obj.variables))
+        self.assertEqual(dict(obj._render_vars()),
+                         dict(obj._jinja.globals, spam='eggs', count=3))
+
+    def test_render_error(self):
+        obj = context.Context()
+        tmpl = cache.templates.template(obj._jinja, '{{ 1 / 0 }}')
+
+        self.assertRaises(ZeroDivisionError, obj._render, tmpl)
+
+    def test_evaluate(self):
+        obj = context.Context()
+        obj.variables.update(spam=5)
+        expr = cache.templates.expression(obj._jinja, 'spam * 2')
+
+        self.assertEqual(obj._evaluate(expr), 10)
+        self.assertEqual(obj._evaluate(expr, {'spam': 1}), 2)
+
+    def test_evaluate_undefined(self):
+        obj = context.Context()
+        expr = cache.templates.expression(obj._jinja, 'missing')
+
+        self.assertEqual(obj._evaluate(expr), None)
+
+    def test_template_shared(self):
+        obj = context.Context()
+        obj.environment['ENVVAR'] = 'one'
+        other = context.Context()
+        other.environment['ENVVAR'] = 'two'
+
+        first = obj.template('{{ env.ENVVAR }}')
+        second = other.template('{{ env.ENVVAR }}')
+
+        self.assertEqual(first(obj), 'one')
+        self.assertEqual(second(other), 'two')
+
+    def test_template_real(self):
+        obj = context.Context()
+        obj.variables['spam'] = 'eggs'
+
+        result = obj.template('{{ spam }} and {{ env.cwd }}')
+
+        self.assertEqual(result(obj), 'eggs and %s' % obj.environment.cwd)
+
+    def test_expression_real(self):
+        obj = context.Context()
+        obj.variables['spam'] = 5
+
+        result = obj.expression('spam > 3 and env.cwd')
+
+        self.assertEqual(result(obj), obj.environment.cwd)
+
+    def test_expression_extra(self):
+        obj = context.Context()
+        obj.variables['spam'] = 5
+        obj.variables['eggs'] = 1
+
+        result = obj.expression('spam + eggs')
+
+        self.assertEqual(result(obj, eggs=10), 15)
+        self.assertEqual(result(obj), 6)
+        self.assertEqual(obj.variables['eggs'], 1)
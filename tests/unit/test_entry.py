@@ -13,18 +13,342 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
+import json
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
 import mock
-import pkg_resources
 import six
 
 from timid import entry
+from timid import utils
+
+
+class MtimeTest(unittest.TestCase):
+    @mock.patch.object(os, 'stat', return_value=mock.Mock(st_mtime=1234.5))
+    def test_exists(self, mock_stat):
+        self.assertEqual(entry._mtime('/some/path'), 1234.5)
+        mock_stat.assert_called_once_with('/some/path')
+
+    @mock.patch.object(os, 'stat', return_value=mock.Mock(st_mtime=1234.5))
+    def test_empty(self, mock_stat):
+        self.assertEqual(entry._mtime(''), 1234.5)
+        mock_stat.assert_called_once_with(os.curdir)
+
+    @mock.patch.object(os, 'stat', side_effect=OSError())
+    def test_missing(self, mock_stat):
+        self.assertEqual(entry._mtime('/some/path'), None)
+
+
+class EntryPointTest(unittest.TestCase):
+    def test_init_base(self):
+        result = entry.EntryPoint('name', 'mod:attr')
+
+        self.assertEqual(result.name, 'name')
+        self.assertEqual(result.value, 'mod:attr')
+        self.assertEqual(result.dist_name, None)
+        self.assertEqual(result.dist_version, None)
+
+    def test_init_alt(self):
+        result = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+
+        self.assertEqual(result.name, 'name')
+        self.assertEqual(result.value, 'mod:attr')
+        self.assertEqual(result.dist_name, 'dist')
+        self.assertEqual(result.dist_version, '1.0')
+
+    def test_str(self):
+        obj = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+
+        self.assertEqual(str(obj), 'name = mod:attr')
+
+    def test_repr(self):
+        obj = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+
+        self.assertEqual(repr(obj), '<EntryPoint name = mod:attr (dist 1.0)>')
+
+    def test_eq(self):
+        obj1 = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+        obj2 = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+        obj3 = entry.EntryPoint('name', 'mod:attr', 'dist', '2.0')
+
+        self.assertTrue(obj1 == obj2)
+        self.assertFalse(obj1 != obj2)
+        self.assertFalse(obj1 == obj3)
+        self.assertTrue(obj1 != obj3)
+        self.assertFalse(obj1 == 'name = mod:attr')
+
+    def test_to_list(self):
+        obj = entry.EntryPoint('name', 'mod:attr', 'dist', '1.0')
+
+        self.assertEqual(obj.to_list(), ['name', 'mod:attr', 'dist', '1.0'])
+
+    @mock.patch('importlib.import_module')
+    def test_load_module(self, mock_import_module):
+        obj = entry.EntryPoint('name', 'pkg.mod')
+
+        result = obj.load()
+
+        self.assertEqual(result, mock_import_module.return_value)
+        mock_import_module.assert_called_once_with('pkg.mod')
+
+    @mock.patch('importlib.import_module')
+    def test_load_attr(self, mock_import_module):
+        obj = entry.EntryPoint('name', 'pkg.mod : cls.attr [extra]')
+
+        result = obj.load()
+
+        self.assertEqual(result, mock_import_module.return_value.cls.attr)
+        mock_import_module.assert_called_once_with('pkg.mod')
+
+    def test_load_real(self):
+        obj = entry.EntryPoint('name', 'timid.entry:EntryPoint.load')
+
+        self.assertEqual(obj.load(), entry.EntryPoint.load)
+
+    def test_load_missing(self):
+        obj = entry.EntryPoint('name', 'timid.entry:NoSuchThing')
+
+        self.assertRaises(AttributeError, obj.load)
+
+
+class ScanTest(unittest.TestCase):
+    def make_dist(self, name, version, path, eps):
+        dist = mock.Mock(metadata={'Name': name}, version=version,
+                         _path=path, entry_points=[])
+        for group, ep_name, value in eps:
+            ep = mock.Mock(group=group, value=value)
+            ep.name = ep_name
+            dist.entry_points.append(ep)
+        return dist
+
+    @mock.patch.object(entry, '_metadata')
+    def test_scan(self, mock_metadata):
+        mock_metadata.return_value.distributions.return_value = [
+            self.make_dist('dist1', '1.0', '/path/dist1', [
+                ('ns1', 'ep1', 'mod1:one'),
+                ('other', 'ep2', 'mod1:two'),
+                ('ns2', 'ep3', 'mod1:three'),
+            ]),
+            self.make_dist('dist2', '2.0', '/path/dist2', [
+                ('other', 'ep4', 'mod2:four'),
+            ]),
+            self.make_dist('Dist1', '0.9', '/path/dist1_old', [
+                ('ns1', 'ep5', 'mod1:five'),
+            ]),
+            self.make_dist('dist3', '3.0', None, [
+                ('ns1', 'ep1', 'mod3:one'),
+            ]),
+        ]
+
+        result = entry.scan(['ns1', 'ns2', 'ns3'])
+
+        self.assertEqual(result, ({
+            'ns1': [
+                entry.EntryPoint('ep1', 'mod1:one', 'dist1', '1.0'),
+                entry.EntryPoint('ep1', 'mod3:one', 'dist3', '3.0'),
+            ],
+            'ns2': [
+                entry.EntryPoint('ep3', 'mod1:three', 'dist1', '1.0'),
+            ],
+            'ns3': [],
+        }, [
+            os.path.join('/path/dist1', 'entry_points.txt'),
+        ]))
+
+    def test_real(self):
+        result = entry.scan(['timid.actions'])
+
+        self.assertTrue('run' in
+                        [ep.name for ep in result[0]['timid.actions']])
+
+
+class EntryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_init_base(self):
+        result = entry.EntryIndex()
+
+        self.assertEqual(result._path, utils.unset)
+        self.assertEqual(result.namespaces, entry.NAMESPACES)
+        self.assertEqual(result._entrypoints, None)
+
+    def test_init_alt(self):
+        result = entry.EntryIndex('path', ['ns1', 'ns2'])
+
+        self.assertEqual(result._path, 'path')
+        self.assertEqual(result.namespaces, ('ns1', 'ns2'))
+        self.assertEqual(result._entrypoints, None)
+
+    def test_path_set(self):
+        obj = entry.EntryIndex('path')
+
+        self.assertEqual(obj.path, 'path')
+
+    @mock.patch.dict(os.environ, clear=True)
+    @mock.patch.object(utils, 'default_cache_dir', return_value='/cache')
+    def test_path_default(self, mock_default_cache_dir):
+        obj = entry.EntryIndex()
+
+        result = obj.path
+
+        self.assertEqual(os.path.dirname(result), '/cache/entrypoints')
+        self.assertTrue(result.endswith('.json'))
+        self.assertEqual(obj._path, result)
+
+    @mock.patch.dict(os.environ, TIMID_ENTRY_INDEX='0')
+    def test_path_disabled(self):
+        obj = entry.EntryIndex()
+
+        self.assertEqual(obj.path, None)
+
+    @mock.patch.object(sys, 'path', ['/path1', '/path2'])
+    @mock.patch.object(entry, '_mtime', side_effect=lambda x: len(x))
+    def test_stamp(self, mock_mtime):
+        obj = entry.EntryIndex(self.path)
+
+        result = obj.stamp(['/path/to/source'])
+
+        self.assertEqual(result, [
+            ['/path1', 6],
+            ['/path2', 6],
+            ['/path/to/source', 15],
+        ])
+
+    @mock.patch.object(entry, 'scan')
+    def test_roundtrip(self, mock_scan):
+        eps = {
+            'ns1': [entry.EntryPoint('ep1', 'mod:one', 'dist', '1.0')],
+            'ns2': [],
+        }
+        obj = entry.EntryIndex(self.path, ['ns1', 'ns2'])
+
+        source = os.path.join(self.tmpdir, 'entry_points.txt')
+        with open(source, 'w') as f:
+            f.write('[ns1]\n')
+
+        obj._write(eps, [source])
+
+        self.assertEqual(obj._read(), eps)
+
+    def test_read_missing(self):
+        obj = entry.EntryIndex(self.path)
+
+        self.assertEqual(obj._read(), None)
+
+    def test_read_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        obj = entry.EntryIndex(self.path)
+
+        self.assertEqual(obj._read(), None)
+
+    def test_read_stale(self):
+        obj = entry.EntryIndex(self.path, ['ns1'])
+        obj._write({'ns1': []}, [])
+
+        with mock.patch.object(sys, 'path', sys.path + [self.tmpdir]):
+            self.assertEqual(obj._read(), None)
+
+    def test_read_namespaces(self):
+        entry.EntryIndex(self.path, ['ns1'])._write({'ns1': []}, [])
+        obj = entry.EntryIndex(self.path, ['ns1', 'ns2'])
+
+        self.assertEqual(obj._read(), None)
+
+    @mock.patch.object(utils, 'atomic_write', side_effect=OSError())
+    def test_write_failure(self, mock_atomic_write):
+        obj = entry.EntryIndex(self.path, ['ns1'])
+
+        obj._write({'ns1': []}, [])
+
+        self.assertTrue(mock_atomic_write.called)
+
+    def test_write_format(self):
+        obj = entry.EntryIndex(self.path, ['ns1'])
+
+        obj._write({
+            'ns1': [entry.EntryPoint('ep1', 'mod:one', 'dist', '1.0')],
+        }, [])
+
+        with open(self.path) as f:
+            data = json.load(f)
+        self.assertEqual(data['version'], entry.EntryIndex.version)
+        self.assertEqual(data['namespaces'], ['ns1'])
+        self.assertEqual(data['sources'], [])
+        self.assertEqual(data['stamp'], obj.stamp())
+        self.assertEqual(data['entrypoints'], {
+            'ns1': [['ep1', 'mod:one', 'dist', '1.0']],
+        })
+
+    def test_load_cached(self):
+        obj = entry.EntryIndex(self.path)
+        obj._entrypoints = 'cached'
+
+        self.assertEqual(obj.load(), 'cached')
+
+    @mock.patch.object(entry.EntryIndex, '_read', return_value='index')
+    @mock.patch.object(entry.EntryIndex, '_write')
+    @mock.patch.object(entry, 'scan')
+    def test_load_fresh(self, mock_scan, mock_write, mock_read):
+        obj = entry.EntryIndex(self.path)
+
+        self.assertEqual(obj.load(), 'index')
+        self.assertEqual(obj._entrypoints, 'index')
+        self.assertFalse(mock_scan.called)
+        self.assertFalse(mock_write.called)
+
+    @mock.patch.object(entry.EntryIndex, '_read', return_value=None)
+    @mock.patch.object(entry.EntryIndex, '_write')
+    @mock.patch.object(entry, 'scan', return_value=('scanned', 'sources'))
+    def test_load_stale(self, mock_scan, mock_write, mock_read):
+        obj = entry.EntryIndex(self.path, ['ns1'])
+
+        self.assertEqual(obj.load(), 'scanned')
+        self.assertEqual(obj._entrypoints, 'scanned')
+        mock_scan.assert_called_once_with(('ns1',))
+        mock_write.assert_called_once_with('scanned', 'sources')
+
+    @mock.patch.object(entry.EntryIndex, '_read', return_value='index')
+    @mock.patch.object(entry.EntryIndex, '_write')
+    @mock.patch.object(entry, 'scan', return_value=('scanned', 'sources'))
+    def test_load_unpersisted(self, mock_scan, mock_write, mock_read):
+        obj = entry.EntryIndex(None, ['ns1'])
+
+        self.assertEqual(obj.load(), 'scanned')
+        self.assertFalse(mock_read.called)
+        self.assertFalse(mock_write.called)
+
+    @mock.patch.object(entry.EntryIndex, 'load',
+                       return_value={'ns1': ['ep1']})
+    @mock.patch.object(entry, 'scan')
+    def test_get_indexed(self, mock_scan, mock_load):
+        obj = entry.EntryIndex(self.path, ['ns1', 'ns2'])
+
+        self.assertEqual(obj.get('ns1'), ['ep1'])
+        self.assertEqual(obj.get('ns2'), [])
+        self.assertFalse(mock_scan.called)
+
+    @mock.patch.object(entry.EntryIndex, 'load')
+    @mock.patch.object(entry, 'scan', return_value=({'ns3': ['ep3']}, []))
+    def test_get_unindexed(self, mock_scan, mock_load):
+        obj = entry.EntryIndex(self.path, ['ns1', 'ns2'])
+
+        self.assertEqual(obj.get('ns3'), ['ep3'])
+        self.assertFalse(mock_load.called)
+        mock_scan.assert_called_once_with(['ns3'])
 
 
 class NamespaceCacheTest(unittest.TestCase):
-    @mock.patch.object(pkg_resources, 'iter_entry_points')
-    def test_init(self, mock_iter_entry_points):
+    def test_init(self):
         eps = [
             mock.Mock(ep_name='ep1', inst='ep1.1'),
             mock.Mock(ep_name='ep2', inst='ep2.1'),
@@ -32,9 +356,8 @@ class NamespaceCacheTest(unittest.TestCase):
         ]
         for ep in eps:
             ep.name = ep.ep_name
-        mock_iter_entry_points.return_value = eps
 
-        result = entry.NamespaceCache('namespace')
+        result = entry.NamespaceCache('namespace', eps)
 
         self.assertEqual(result.namespace, 'namespace')
         self.assertEqual(result._entrypoints, {
@@ -44,6 +367,17 @@ class NamespaceCacheTest(unittest.TestCase):
         self.assertEqual(result._epcache, {})
         self.assertEqual(result._eplist, None)
 
+    @mock.patch.object(entry, 'scan')
+    def test_init_scan(self, mock_scan):
+        ep = mock.Mock()
+        ep.name = 'ep1'
+        mock_scan.return_value = ({'namespace': [ep]}, [])
+
+        result = entry.NamespaceCache('namespace')
+
+        self.assertEqual(result._entrypoints, {'ep1': [ep]})
+        mock_scan.assert_called_once_with(['namespace'])
+
     def make_obj(self, namespace='namespace', entrypoints=None, epcache=None,
                  eplist=None):
         with mock.patch.object(entry.NamespaceCache, '__init__',
@@ -71,9 +405,7 @@ class NamespaceCacheTest(unittest.TestCase):
             'ep1': [
                 mock.Mock(**{'load.side_effect': ImportError('spam')}),
                 mock.Mock(**{'load.side_effect': AttributeError('spam')}),
-                mock.Mock(**{
-                    'load.side_effect': pkg_resources.UnknownExtra('spam'),
-                }),
+                mock.Mock(**{'load.side_effect': ImportError('eggs')}),
             ],
             'ep2': [
                 mock.Mock(**{'load.return_value': 'obj0'}),
@@ -154,9 +486,7 @@ class NamespaceCacheTest(unittest.TestCase):
         eps = [
             mock.Mock(**{'load.side_effect': ImportError('spam')}),
             mock.Mock(**{'load.side_effect': AttributeError('spam')}),
-            mock.Mock(**{
-                'load.side_effect': pkg_resources.UnknownExtra('spam'),
-            }),
+            mock.Mock(**{'load.side_effect': ImportError('eggs')}),
         ]
         obj = self.make_obj(entrypoints={'spam': eps})
 
@@ -176,7 +506,7 @@ class NamespaceCacheTest(unittest.TestCase):
                 'load_expected': True,
             }),
             mock.Mock(**{
-                'load.side_effect': pkg_resources.UnknownExtra('spam'),
+                'load.side_effect': ImportError('eggs'),
                 'load_expected': True,
             }),
             mock.Mock(**{
@@ -198,12 +528,36 @@ class NamespaceCacheTest(unittest.TestCase):
             else:
                 self.assertFalse(ep.load.called)
 
+    def test_signature(self):
+        ep1 = entry.EntryPoint('ep1', 'mod:one', 'dist1', '1.0')
+        ep2 = entry.EntryPoint('ep2', 'mod:two')
+        ep3 = entry.EntryPoint('ep1', 'mod:three', 'dist2', '2.0')
+        obj = self.make_obj(entrypoints={
+            'ep2': [ep2],
+            'ep1': [ep1, ep3],
+        })
+
+        result = obj.signature()
+
+        self.assertEqual(result, [
+            'ep1 = mod:one (dist1 1.0)',
+            'ep1 = mod:three (dist2 2.0)',
+            'ep2 = mod:two (None None)',
+        ])
+
 
 class EntrypointCacheTest(unittest.TestCase):
-    def test_init(self):
+    def test_init_base(self):
         result = entry.EntrypointCache()
 
         self.assertEqual(result._namespaces, {})
+        self.assertTrue(isinstance(result._index, entry.EntryIndex))
+
+    def test_init_alt(self):
+        result = entry.EntrypointCache('index')
+
+        self.assertEqual(result._namespaces, {})
+        self.assertEqual(result._index, 'index')
 
     @mock.patch.object(entry, 'NamespaceCache', return_value='ns_cache')
     def test_getitem_cached(self, mock_NamespaceCache):
@@ -216,11 +570,13 @@ class EntrypointCacheTest(unittest.TestCase):
 
     @mock.patch.object(entry, 'NamespaceCache', return_value='ns_cache')
     def test_getitem_uncached(self, mock_NamespaceCache):
-        obj = entry.EntrypointCache()
+        index = mock.Mock(**{'get.return_value': 'eps'})
+        obj = entry.EntrypointCache(index)
 
         self.assertEqual(obj['spam'], 'ns_cache')
         self.assertEqual(obj._namespaces, {'spam': 'ns_cache'})
-        mock_NamespaceCache.assert_called_once_with('spam')
+        index.get.assert_called_once_with('spam')
+        mock_NamespaceCache.assert_called_once_with('spam', 'eps')
 
     def test_points(self):
         self.assertTrue(isinstance(entry.points, entry.EntrypointCache))
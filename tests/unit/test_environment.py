@@ -15,12 +15,17 @@
 
 import collections
 import os
+import signal
+import subprocess
+import sys
+import threading
 import unittest
 
 import mock
 import six
 
 from timid import environment
+from timid import output
 from timid import steps
 from timid import utils
 
@@ -112,12 +117,23 @@ class SpecialVariableTest(BaseVariableTest):
         self.assertEqual(len(obj), 3)
 
     def test_rebuild(self):
-        env = mock.Mock(_data={'a': 'one', 'b': 'two'})
+        env = mock.Mock(_vars={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['a', 'b', 'c'])
 
         obj._rebuild()
 
-        self.assertEqual(env._data, {'a': 'a,b,c', 'b': 'two'})
+        self.assertEqual(env._vars, {'a': 'a,b,c', 'b': 'two'})
+
+    def test_changed(self):
+        env = mock.Mock(_data={'a': 'one', 'b': 'two'}, _dirty={},
+                        _version=0)
+        obj = self.get_var(env, 'a', ['a', 'b', 'c'])
+
+        obj._changed()
+
+        self.assertEqual(env._data, {'a': 'one', 'b': 'two'})
+        self.assertEqual(env._dirty, {'a': obj})
+        self.assertEqual(env._version, 1)
 
     def test_update_none(self):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
@@ -164,55 +180,75 @@ class ListVariableTest(BaseVariableTest):
         self.assertEqual(obj[2], '3')
         self.assertEqual(obj[:], ['1', '2', '3'])
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_setitem_single(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_setitem_single(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['1', '2', '3'])
 
         obj[1] = 'b'
 
         self.assertEqual(obj._value, ['1', 'b', '3'])
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_setitem_multiple(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_setitem_multiple(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['1', '2', '3'])
 
         obj[1:] = ['b']
 
         self.assertEqual(obj._value, ['1', 'b'])
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_delitem_single(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_delitem_single(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['1', '2', '3'])
 
         del obj[1]
 
         self.assertEqual(obj._value, ['1', '3'])
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_delitem_multiple(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_delitem_multiple(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['1', '2', '3'])
 
         del obj[1:]
 
         self.assertEqual(obj._value, ['1'])
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_insert(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_insert(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', ['1', '2', '3'])
 
         obj.insert(1, 'a')
 
         self.assertEqual(obj._value, ['1', 'a', '2', '3'])
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
+
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_prepend_absent(self, mock_changed):
+        env = mock.Mock(_data={'a': 'one', 'b': 'two'})
+        obj = self.get_var(env, 'a', ['1', '2', '3'])
+
+        obj.prepend('a')
+
+        self.assertEqual(obj._value, ['a', '1', '2', '3'])
+        mock_changed.assert_called_once_with()
+
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_prepend_present(self, mock_changed):
+        env = mock.Mock(_data={'a': 'one', 'b': 'two'})
+        obj = self.get_var(env, 'a', ['1', '2', '3', '2'])
+
+        obj.prepend('2')
+
+        self.assertEqual(obj._value, ['2', '1', '3'])
+        mock_changed.assert_called_once_with()
 
 
 class SetVariableTest(BaseVariableTest):
@@ -231,35 +267,139 @@ class SetVariableTest(BaseVariableTest):
 
         self.assertEqual(set(iter(obj)), set(['a', 'b']))
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_add(self, mock_rebuild):
+    def test_ordered(self):
+        data = {'a': 'c,a,c,b'}
+        env = mock.Mock(_data=data, _vars=data, _dirty={}, _version=0)
+        obj = environment.SetVariable(env, 'a', ',')
+
+        obj.add('d')
+        obj.discard('a')
+        obj.add('a')
+        obj._rebuild()
+
+        self.assertTrue(isinstance(obj._value, utils.OrderedSet))
+        self.assertEqual(env._data, {'a': 'c,b,d,a'})
+
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_add(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', set(['a', 'b']))
 
         obj.add('c')
 
         self.assertEqual(obj._value, set(['a', 'b', 'c']))
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_discard_present(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_discard_present(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', set(['a', 'b']))
 
         obj.discard('b')
 
         self.assertEqual(obj._value, set(['a']))
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
 
-    @mock.patch.object(environment.SpecialVariable, '_rebuild')
-    def test_discard_absent(self, mock_rebuild):
+    @mock.patch.object(environment.SpecialVariable, '_changed')
+    def test_discard_absent(self, mock_changed):
         env = mock.Mock(_data={'a': 'one', 'b': 'two'})
         obj = self.get_var(env, 'a', set(['a', 'b']))
 
         obj.discard('c')
 
         self.assertEqual(obj._value, set(['a', 'b']))
-        mock_rebuild.assert_called_once_with()
+        mock_changed.assert_called_once_with()
+
+
+class ProcessTrackerTest(unittest.TestCase):
+    @mock.patch.object(environment.ProcessTracker, '_signal')
+    def test_add(self, mock_signal):
+        tracker = environment.ProcessTracker()
+
+        tracker.add('proc')
+
+        self.assertEqual(tracker._procs, ['proc'])
+        self.assertFalse(mock_signal.called)
+
+    @mock.patch.object(environment.ProcessTracker, '_signal')
+    def test_add_signalled(self, mock_signal):
+        tracker = environment.ProcessTracker()
+        tracker.signalled = 15
+
+        tracker.add('proc')
+
+        self.assertEqual(tracker._procs, ['proc'])
+        mock_signal.assert_called_once_with('proc', 15)
+
+    @mock.patch.object(environment.ProcessTracker, '_signal')
+    def test_signal(self, mock_signal):
+        tracker = environment.ProcessTracker()
+        tracker._procs = ['proc1', 'proc2']
+
+        tracker.signal(15)
+
+        self.assertEqual(tracker.signalled, 15)
+        mock_signal.assert_has_calls([
+            mock.call('proc1', 15),
+            mock.call('proc2', 15),
+        ])
+
+    @mock.patch.object(environment.ProcessTracker, '_alive',
+                       side_effect=lambda p: p == 'proc2')
+    def test_alive(self, mock_alive):
+        tracker = environment.ProcessTracker()
+
+        self.assertFalse(tracker.alive())
+
+        tracker._procs = ['proc1', 'proc2']
+
+        self.assertTrue(tracker.alive())
+
+    @mock.patch.object(environment.ProcessTracker, 'alive',
+                       side_effect=[True, False])
+    @mock.patch.object(environment.ProcessTracker, 'signal')
+    @mock.patch('time.sleep')
+    def test_terminate_exited(self, mock_sleep, mock_signal, mock_alive):
+        tracker = environment.ProcessTracker()
+
+        tracker.terminate(5)
+
+        mock_signal.assert_called_once_with(signal.SIGTERM)
+        mock_sleep.assert_called_once_with(tracker.poll_interval)
+
+    @mock.patch.object(environment.ProcessTracker, 'alive',
+                       return_value=True)
+    @mock.patch.object(environment.ProcessTracker, 'signal')
+    @mock.patch.object(utils, 'monotonic', side_effect=[10.0, 12.0, 15.0])
+    @mock.patch('time.sleep')
+    def test_terminate_killed(self, mock_sleep, mock_monotonic, mock_signal,
+                              mock_alive):
+        tracker = environment.ProcessTracker()
+
+        tracker.terminate(5)
+
+        self.assertEqual(mock_signal.call_args_list, [
+            mock.call(signal.SIGTERM),
+            mock.call(getattr(signal, 'SIGKILL', signal.SIGTERM)),
+        ])
+        mock_sleep.assert_called_once_with(tracker.poll_interval)
+
+    @unittest.skipUnless(hasattr(os, 'setsid'), 'requires sessions')
+    def test_terminate_group(self):
+        env = environment.Environment()
+        tracker = environment.ProcessTracker()
+        env.track(tracker)
+        proc = env.call([sys.executable, '-c', 'import subprocess, sys; '
+                         'subprocess.call([sys.executable, "-c", '
+                         '"import time; time.sleep(60)"])'])
+        waiter = threading.Thread(target=proc.wait)
+        waiter.start()
+
+        tracker.terminate(5)
+        waiter.join()
+
+        self.assertNotEqual(proc.returncode, 0)
+        self.assertFalse(tracker.alive())
 
 
 class EnvironmentTest(unittest.TestCase):
@@ -280,6 +420,7 @@ class EnvironmentTest(unittest.TestCase):
             'TIMID_SENSITIVE': set(['TIMID_SENSITIVE']),
         })
         self.assertEqual(result._cwd, '/canon/path')
+        self.assertEqual(result._trackers, [])
         mock_SetVariable.assert_called_once_with(
             result, 'TIMID_SENSITIVE', value=None)
         mock_init.assert_called_once_with(
@@ -291,6 +432,32 @@ class EnvironmentTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with(
             '/current', os.curdir)
 
+    @mock.patch.dict(os.environ, clear=True, a='one')
+    def test_init_snapshot(self):
+        result = environment.Environment()
+        result['b'] = 'two'
+        result._data.flatten()
+        copy = result.copy()
+
+        os.environ['c'] = 'three'
+
+        self.assertFalse('c' in result)
+        self.assertFalse('c' in copy)
+        self.assertEqual(result._data.flatten(), {'a': 'one', 'b': 'two'})
+        self.assertEqual(len(result), len(list(result)))
+
+    def test_init_sensitive(self):
+        result = environment.Environment(
+            {'TIMID_SENSITIVE': 'a', 'a': 'one', 'b': 'two', 'c': 'three'},
+            sensitive=set(['b']))
+
+        self.assertEqual(set(result['TIMID_SENSITIVE']), set(['a', 'b']))
+        self.assertEqual(
+            set(result._data['TIMID_SENSITIVE'].split(os.pathsep)),
+            set(['a', 'b']))
+        self.assertEqual(result.sensitive, set(['a', 'b']))
+        self.assertEqual(result._version, 0)
+
     @mock.patch.dict(os.environ, clear=True, a='one', b='two')
     @mock.patch.object(os, 'getcwd', return_value='/current')
     @mock.patch.object(utils, 'canonicalize_path', return_value='/canon/path')
@@ -327,9 +494,13 @@ class EnvironmentTest(unittest.TestCase):
                                return_value=None):
             obj = environment.Environment()
 
-        obj._data = environ or {}
+        obj._dirty = {}
+        obj._flush_lock = threading.Lock()
+        obj._version = 0
+        obj._data = utils.LayeredDict(data=environ or {})
         obj._special = special or {}
         obj._cwd = cwd
+        obj._trackers = []
 
         return obj
 
@@ -382,6 +553,85 @@ class EnvironmentTest(unittest.TestCase):
         special._update.assert_called_once_with('two')
         self.assertFalse(special._rebuild.called)
 
+    def test_setitem_str_special_empty(self):
+        env = environment.Environment({'PATH': '/bin'})
+        env.declare_list('a')
+
+        env['a'] = os.pathsep.join(['one', 'two'])
+
+        self.assertEqual(list(env['a']), ['one', 'two'])
+
+    def test_special_lazy(self):
+        env = environment.Environment({'PATH': '/bin'})
+
+        for i in range(3):
+            env['PATH'].insert(0, '/opt/%d' % i)
+
+        self.assertEqual(env._vars, {'PATH': '/bin'})
+        self.assertEqual(env._dirty, {'PATH': env._special['PATH']})
+        self.assertEqual(env._data, {
+            'PATH': os.pathsep.join(['/opt/2', '/opt/1', '/opt/0', '/bin']),
+        })
+        self.assertEqual(env._dirty, {})
+
+    def test_special_lazy_rebuild_first(self):
+        env = environment.Environment({'PATH': '/bin'})
+        special = env._special['PATH']
+        seen = []
+        rebuild = special._rebuild
+
+        def fake_rebuild():
+            seen.append((dict(env._dirty), env._flush_lock.locked()))
+            rebuild()
+
+        env['PATH'].insert(0, '/opt')
+        with mock.patch.object(special, '_rebuild', side_effect=fake_rebuild):
+            result = env._data
+
+        self.assertEqual(seen, [({'PATH': special}, True)])
+        self.assertEqual(result['PATH'], os.pathsep.join(['/opt', '/bin']))
+        self.assertEqual(env._dirty, {})
+
+    def test_special_lazy_new(self):
+        env = environment.Environment({'PATH': '/bin'})
+        env.declare_list('a')
+
+        env._special['a'].append('one')
+
+        self.assertEqual(env._vars, {'PATH': '/bin'})
+        self.assertEqual(list(env['a']), ['one'])
+        self.assertEqual(six.text_type(env['a']), 'one')
+
+    def test_special_lazy_superseded(self):
+        env = environment.Environment({'PATH': '/bin'})
+
+        env['PATH'].append('/usr/bin')
+        env['PATH'] = '/sbin'
+
+        self.assertEqual(env._data, {'PATH': '/sbin'})
+        self.assertEqual(list(env['PATH']), ['/sbin'])
+
+        env['PATH'].append('/usr/bin')
+        del env['PATH']
+
+        self.assertEqual(env._data, {})
+        self.assertEqual(list(env._special['PATH']), [])
+
+    def test_version(self):
+        env = environment.Environment({'PATH': '/bin', 'a': 'one'})
+        versions = [env.version]
+
+        env['a'] = 'two'
+        versions.append(env.version)
+        env['PATH'].append('/usr/bin')
+        versions.append(env.version)
+        env.declare_sensitive('a')
+        versions.append(env.version)
+        del env['a']
+        versions.append(env.version)
+
+        self.assertEqual(versions, sorted(set(versions)))
+
     def test_setitem_iterable_special(self):
         value = mock.MagicMock()  # collections.Iterable
         special = mock.Mock(_type=collections.Sequence)
@@ -466,17 +716,78 @@ class EnvironmentTest(unittest.TestCase):
     def test_copy(self):
         env = self.get_env({'a': 'one'})
         env._sensitive = set(['b'])
-
-        with mock.patch.object(environment.Environment, '__init__',
-                               return_value=None) as mock_init:
-            result = env.copy()
-
-            self.assertTrue(isinstance(result, environment.Environment))
-            mock_init.assert_called_once_with(
-                {'a': 'one'}, set(['b']), '/current')
-            self.assertNotEqual(id(mock_init.call_args[0][0]), id(env._data))
-            self.assertNotEqual(id(mock_init.call_args[0][1]),
-                                id(env._sensitive))
+        base = env._data
+
+        result = env.copy()
+
+        self.assertTrue(isinstance(result, environment.Environment))
+        self.assertEqual(result._data, {'a': 'one'})
+        self.assertEqual(id(env._data), id(base))
+        self.assertFalse(base._frozen)
+        self.assertEqual(result._sensitive, set(['b']))
+        self.assertNotEqual(id(result._sensitive), id(env._sensitive))
+        self.assertEqual(result._special, {})
+        self.assertEqual(result._cwd, '/current')
+        self.assertEqual(result._trackers, [])
+
+    def test_copy_concurrent(self):
+        env = environment.Environment({'a': 'one'})
+        errors = []
+        done = threading.Event()
+
+        def writer():
+            try:
+                i = 0
+                while not done.is_set():
+                    env['k%d' % (i % 50)] = 'v%d' % i
+                    i += 1
+            except Exception as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _i in range(2000):
+                env.copy()
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertFalse(env._data._frozen)
+
+    def test_copy_layered(self):
+        env = environment.Environment({
+            'PATH': os.pathsep.join(['/bin', '/usr/bin']),
+            'TIMID_SENSITIVE': 'a',
+            'a': 'one',
+            'b': 'two',
+        })
+        env.declare_list('CP', ',')
+
+        result = env.copy()
+        result['PATH'].insert(0, '/opt/bin')
+        result['CP'] = ['x', 'y']
+        result['TIMID_SENSITIVE'].add('b')
+        del result['a']
+        env['b'] = 'deux'
+
+        self.assertEqual(env._data, {
+            'PATH': os.pathsep.join(['/bin', '/usr/bin']),
+            'TIMID_SENSITIVE': 'a',
+            'a': 'one',
+            'b': 'deux',
+        })
+        self.assertEqual(list(env['PATH']), ['/bin', '/usr/bin'])
+        self.assertEqual(result._data, {
+            'PATH': os.pathsep.join(['/opt/bin', '/bin', '/usr/bin']),
+            'TIMID_SENSITIVE': os.pathsep.join(['a', 'b']),
+            'CP': 'x,y',
+            'b': 'two',
+        })
+        self.assertEqual(list(result['CP']), ['x', 'y'])
+        self.assertEqual(result.sensitive, set(['a', 'b']))
+        self.assertEqual(env.sensitive, set(['a']))
 
     def test_declare_special_base(self):
         klass = mock.Mock()
@@ -586,6 +897,49 @@ class EnvironmentTest(unittest.TestCase):
             ['prog', 'ram'], cwd='/current', env={'a': 'one'}, spam='spam',
             close_fds=False)
 
+    @mock.patch('subprocess.Popen')
+    def test_call_tracked(self, mock_Popen):
+        env = self.get_env({'a': 'one'})
+        tracker = mock.Mock()
+        env.track(tracker)
+
+        result = env.call(['prog', 'ram'])
+
+        self.assertEqual(result, mock_Popen.return_value)
+        tracker.add.assert_called_once_with(mock_Popen.return_value)
+        kwargs = mock_Popen.call_args[1]
+        if hasattr(os, 'setsid'):
+            if six.PY2:
+                self.assertEqual(kwargs['preexec_fn'], os.setsid)
+            else:
+                self.assertEqual(kwargs['start_new_session'], True)
+
+    @mock.patch('subprocess.Popen')
+    def test_call_untracked(self, mock_Popen):
+        env = self.get_env({'a': 'one'})
+        tracker = mock.Mock()
+        env.track(tracker)
+        env.untrack(tracker)
+        env.untrack(tracker)
+
+        env.call(['prog', 'ram'])
+
+        self.assertFalse(tracker.add.called)
+        mock_Popen.assert_called_once_with(
+            ['prog', 'ram'], cwd='/current', env={'a': 'one'}, close_fds=True)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('asyncio.create_subprocess_exec', new_callable=mock.Mock)
+    def test_call_async(self, mock_create_subprocess_exec):
+        env = self.get_env({'a': 'one'})
+
+        result = env.call_async('prog ram', cwd='/other', spam='spam')
+
+        self.assertEqual(result, mock_create_subprocess_exec.return_value)
+        mock_create_subprocess_exec.assert_called_once_with(
+            'prog', 'ram', cwd='/current', env={'a': 'one'}, spam='spam',
+            close_fds=True)
+
     @mock.patch.object(utils, 'canonicalize_path', return_value='/canon/path')
     def test_cwd_get(self, mock_canonicalize_path):
         env = self.get_env()
@@ -605,6 +959,63 @@ class EnvironmentTest(unittest.TestCase):
             '/current', '../other')
 
 
+class TrackedEnvironmentTest(unittest.TestCase):
+    def test_passthrough(self):
+        env = environment.Environment(environ={'a': 'one'}, cwd='/current')
+        obj = env.tracking('tracker')
+
+        obj['b'] = 'two'
+        del obj['a']
+        obj.cwd = '/other'
+
+        self.assertEqual(dict(env), dict(obj))
+        self.assertEqual(obj['b'], 'two')
+        self.assertTrue('b' in obj)
+        self.assertEqual(len(obj), len(env))
+        self.assertFalse('a' in env)
+        self.assertEqual(env.cwd, '/other')
+        self.assertEqual(obj.cwd, '/other')
+        self.assertEqual(obj._trackers, ['tracker'])
+        self.assertEqual(env._trackers, [])
+
+    def test_nested(self):
+        env = environment.Environment(environ={'a': 'one'})
+        env.track('tracker0')
+
+        obj = env.tracking('tracker1').tracking('tracker2')
+
+        self.assertEqual(obj._trackers, ['tracker0', 'tracker1', 'tracker2'])
+        self.assertEqual(env._trackers, ['tracker0'])
+
+    @mock.patch('subprocess.Popen')
+    def test_call(self, mock_Popen):
+        env = environment.Environment(environ={'a': 'one'}, cwd='/current')
+        tracker = mock.Mock()
+        obj = env.tracking(tracker)
+
+        result = obj.call(['prog', 'ram'])
+        env.call(['prog', 'other'])
+
+        self.assertEqual(result, mock_Popen.return_value)
+        tracker.add.assert_called_once_with(mock_Popen.return_value)
+        self.assertEqual(mock_Popen.call_args_list[0][0],
+                         (['prog', 'ram'],))
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('timid.aio.track_process', new_callable=mock.Mock)
+    @mock.patch('asyncio.create_subprocess_exec', new_callable=mock.Mock)
+    def test_call_async(self, mock_create_subprocess_exec,
+                        mock_track_process):
+        env = environment.Environment(environ={'a': 'one'}, cwd='/current')
+        obj = env.tracking('tracker')
+
+        result = obj.call_async('prog ram')
+
+        self.assertEqual(result, mock_track_process.return_value)
+        mock_track_process.assert_called_once_with(
+            mock_create_subprocess_exec.return_value, ['tracker'])
+
+
 class DirectoryActionTest(unittest.TestCase):
     @mock.patch.object(steps.Action, '__init__', return_value=None)
     def test_init(self, mock_init):
@@ -662,18 +1073,114 @@ class RunActionTest(unittest.TestCase):
             mock.call('arg3'),
         ])
 
-    def get_action(self, command):
+    @mock.patch.object(steps.Action, '__init__', return_value=None)
+    def test_init_dict_base(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: '%s_tmpl' % x})
+
+        result = environment.RunAction(
+            ctxt, 'run', {'command': 'command'}, 'step_addr')
+
+        self.assertEqual(result.command, 'command_tmpl')
+        self.assertEqual(result.capture, None)
+        self.assertEqual(result.passthrough, True)
+
+    @mock.patch.object(steps.Action, '__init__', return_value=None)
+    def test_init_dict_capture(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: '%s_tmpl' % x})
+
+        result = environment.RunAction(
+            ctxt, 'run', {'command': ['command', 'arg'], 'capture': True},
+            'step_addr')
+
+        self.assertEqual(result.command, ['command_tmpl', 'arg_tmpl'])
+        self.assertEqual(result.capture, output.DEFAULT_SIZE)
+        self.assertEqual(result.passthrough, True)
+
+    @mock.patch.object(steps.Action, '__init__', return_value=None)
+    def test_init_dict_capture_size(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: '%s_tmpl' % x})
+
+        result = environment.RunAction(
+            ctxt, 'run', {'command': 'command', 'capture': 1024,
+                          'passthrough': False}, 'step_addr')
+
+        self.assertEqual(result.capture, 1024)
+        self.assertEqual(result.passthrough, False)
+
+    def test_schema(self):
+        for config in ({'capture': True}, {'command': 'cmd', 'capture': 0},
+                       {'command': 'cmd', 'other': 1},
+                       {'command': 'cmd', 'passthrough': 'yes'}):
+            self.assertRaises(steps.ConfigError, environment.RunAction,
+                              mock.Mock(), 'run', config,
+                              steps.StepAddress('fname', 0))
+
+    def test_schema_compiled(self):
+        func = utils.compile_schema(environment.RunAction.schema)
+
+        self.assertNotEqual(func, None)
+        for config in ('cmd', ['cmd', 'arg'], {'command': 'cmd'},
+                       {'command': ['cmd'], 'capture': 10,
+                        'passthrough': False},
+                       {'command': 'cmd', 'capture': True}):
+            self.assertTrue(func(config))
+        for config in ({'capture': True}, {'command': 'cmd', 'capture': 0},
+                       {'command': 'cmd', 'other': 1}, 5):
+            self.assertFalse(func(config))
+
+    def get_action(self, command, capture=None, passthrough=True):
         with mock.patch.object(environment.RunAction, '__init__',
                                return_value=None):
             action = environment.RunAction()
 
         action.command = command
+        action.capture = capture
+        action.passthrough = passthrough
 
         return action
 
-    def test_call_string(self):
+    @mock.patch.object(output, 'Capture')
+    def test_call_capture(self, mock_Capture):
         subproc = mock.Mock(**{'wait.return_value': 5})
         ctxt = mock.Mock(**{'environment.call.return_value': subproc})
+        command = mock.Mock(return_value='cmd arg1')
+        action = self.get_action(command, 1024, False)
+        capture = mock_Capture.return_value
+
+        result = action(ctxt)
+
+        self.assertEqual(result, capture.result.return_value)
+        capture.result.assert_called_once_with(5)
+        mock_Capture.assert_called_once_with(1024, False, ctxt.scrubber)
+        ctxt.environment.call.assert_called_once_with(
+            ['cmd', 'arg1'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        capture.pump.assert_called_once_with(subproc)
+        subproc.wait.assert_called_once_with()
+
+    @mock.patch.object(output, 'Capture')
+    def test_call_scrubbed(self, mock_Capture):
+        subproc = mock.Mock(**{'wait.return_value': 0})
+        scrubber = mock.MagicMock(**{'__bool__.return_value': True})
+        ctxt = mock.Mock(scrubber=scrubber, **{
+            'environment.call.return_value': subproc,
+        })
+        command = mock.Mock(return_value='cmd arg1')
+        action = self.get_action(command)
+        capture = mock_Capture.return_value
+
+        result = action(ctxt)
+
+        self.assertEqual(result, capture.result.return_value)
+        mock_Capture.assert_called_once_with(0, True, scrubber)
+        ctxt.environment.call.assert_called_once_with(
+            ['cmd', 'arg1'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        capture.pump.assert_called_once_with(subproc)
+
+    def test_call_string(self):
+        subproc = mock.Mock(**{'wait.return_value': 5})
+        ctxt = mock.Mock(scrubber=output.Scrubber(), **{
+            'environment.call.return_value': subproc,
+        })
         command = mock.Mock(return_value='cmd arg1 arg2 arg3')
         action = self.get_action(command)
 
@@ -682,13 +1189,16 @@ class RunActionTest(unittest.TestCase):
         self.assertTrue(isinstance(result, steps.StepResult))
         self.assertEqual(result.returncode, 5)
         command.assert_called_once_with(ctxt)
+        ctxt.flush.assert_called_once_with()
         ctxt.environment.call.assert_called_once_with(
             ['cmd', 'arg1', 'arg2', 'arg3'])
         subproc.wait.assert_called_once_with()
 
     def test_call_list(self):
         subproc = mock.Mock(**{'wait.return_value': 5})
-        ctxt = mock.Mock(**{'environment.call.return_value': subproc})
+        ctxt = mock.Mock(scrubber=output.Scrubber(), **{
+            'environment.call.return_value': subproc,
+        })
         command = [
             mock.Mock(return_value='cmd'),
             mock.Mock(return_value='arg1'),
@@ -706,3 +1216,55 @@ class RunActionTest(unittest.TestCase):
         ctxt.environment.call.assert_called_once_with(
             ['cmd', 'arg1', 'arg2', 'arg3'])
         subproc.wait.assert_called_once_with()
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('timid.aio.wait_process', new_callable=mock.Mock)
+    def test_call_async(self, mock_wait_process):
+        ctxt = mock.Mock(scrubber=output.Scrubber())
+        command = mock.Mock(return_value='cmd arg1 arg2 arg3')
+        action = self.get_action(command)
+
+        result = action.call_async(ctxt)
+
+        self.assertEqual(result, mock_wait_process.return_value)
+        ctxt.environment.call_async.assert_called_once_with(
+            ['cmd', 'arg1', 'arg2', 'arg3'])
+        mock_wait_process.assert_called_once_with(
+            ctxt.environment.call_async.return_value)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('timid.aio.wait_process', new_callable=mock.Mock)
+    @mock.patch.object(output, 'Capture')
+    def test_call_async_capture(self, mock_Capture, mock_wait_process):
+        ctxt = mock.Mock()
+        command = mock.Mock(return_value='cmd arg1')
+        action = self.get_action(command, 1024, True)
+
+        result = action.call_async(ctxt)
+
+        self.assertEqual(result, mock_wait_process.return_value)
+        mock_Capture.assert_called_once_with(1024, True, ctxt.scrubber)
+        ctxt.environment.call_async.assert_called_once_with(
+            ['cmd', 'arg1'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        mock_wait_process.assert_called_once_with(
+            ctxt.environment.call_async.return_value,
+            mock_Capture.return_value)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('timid.aio.wait_process', new_callable=mock.Mock)
+    @mock.patch.object(output, 'Capture')
+    def test_call_async_scrubbed(self, mock_Capture, mock_wait_process):
+        scrubber = mock.MagicMock(**{'__bool__.return_value': True})
+        ctxt = mock.Mock(scrubber=scrubber)
+        command = mock.Mock(return_value='cmd arg1')
+        action = self.get_action(command)
+
+        result = action.call_async(ctxt)
+
+        self.assertEqual(result, mock_wait_process.return_value)
+        mock_Capture.assert_called_once_with(0, True, scrubber)
+        ctxt.environment.call_async.assert_called_once_with(
+            ['cmd', 'arg1'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        mock_wait_process.assert_called_once_with(
+            ctxt.environment.call_async.return_value,
+            mock_Capture.return_value)
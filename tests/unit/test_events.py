@@ -0,0 +1,226 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+import mock
+import six
+
+from timid import events
+from timid import steps
+
+
+class ListSink(events.Sink):
+    def __init__(self):
+        self.batches = []
+        self.flushes = 0
+        self.closed = False
+
+    def write(self, events):
+        self.batches.append([event.msg for event in events])
+
+    def flush(self):
+        self.flushes += 1
+
+    def close(self):
+        self.closed = True
+
+
+class EventTest(unittest.TestCase):
+    @mock.patch('time.time', return_value=1234.5)
+    def test_init_base(self, mock_time):
+        result = events.Event('message')
+
+        self.assertEqual(result.msg, 'message')
+        self.assertEqual(result.level, 1)
+        self.assertEqual(result.debug, False)
+        self.assertEqual(result.label, None)
+        self.assertEqual(result.idx, None)
+        self.assertEqual(result.step_addr, None)
+        self.assertEqual(result.timestamp, 1234.5)
+
+    def test_str_base(self):
+        obj = events.Event('message')
+
+        self.assertEqual(str(obj), 'message')
+
+    def test_str_label(self):
+        obj = events.Event('message', label='label')
+
+        self.assertEqual(str(obj), 'label: message')
+
+    def test_to_dict(self):
+        obj = events.Event('message', 2, True, 'label', 3,
+                           steps.StepAddress('test.yaml', 3), 1234.5)
+
+        self.assertEqual(obj.to_dict(), {
+            'time': 1234.5,
+            'level': 2,
+            'debug': True,
+            'test': 'label',
+            'index': 3,
+            'address': 'test.yaml step 4',
+            'message': 'message',
+        })
+
+
+class ConsoleSinkTest(unittest.TestCase):
+    @mock.patch.object(sys, 'stdout', six.StringIO())
+    @mock.patch.object(sys, 'stderr', six.StringIO())
+    def test_write(self):
+        obj = events.ConsoleSink()
+
+        obj.write([
+            events.Event('one'),
+            events.Event('two', debug=True),
+            events.Event('three', label='label'),
+        ])
+        obj.flush()
+
+        self.assertEqual(sys.stdout.getvalue(), 'one\nlabel: three\n')
+        self.assertEqual(sys.stderr.getvalue(), 'two\n')
+
+
+class JSONLinesSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'events.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write(self):
+        obj = events.JSONLinesSink(self.path)
+
+        obj.write([
+            events.Event('one', timestamp=1.0),
+            events.Event('two', idx=1, timestamp=2.0),
+        ])
+        obj.flush()
+
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([(l['message'], l['index'], l['time'])
+                          for l in lines],
+                         [('one', None, 1.0), ('two', 1, 2.0)])
+
+        obj.close()
+        obj.write([events.Event('three')])
+
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+class EventLogTest(unittest.TestCase):
+    def test_init(self):
+        sink = ListSink()
+
+        result = events.EventLog([sink])
+
+        self.assertEqual(result.sinks, [sink])
+        self.assertEqual(result._thread, None)
+        self.assertEqual(result._closed, False)
+
+    @mock.patch('atexit.register')
+    def test_put_flush(self, mock_register):
+        sink = ListSink()
+        obj = events.EventLog([sink])
+
+        for i in range(5):
+            obj.put(events.Event('event %d' % i))
+        obj.flush()
+
+        self.assertTrue(obj._thread.is_alive())
+        mock_register.assert_called_once_with(obj.close)
+        self.assertEqual(sum(sink.batches, []),
+                         ['event %d' % i for i in range(5)])
+        self.assertEqual(sink.flushes, len(sink.batches))
+
+        obj.close()
+
+        self.assertFalse(obj._thread.is_alive())
+        self.assertTrue(sink.closed)
+
+    @mock.patch('atexit.register')
+    def test_batching(self, mock_register):
+        sink = ListSink()
+        obj = events.EventLog([sink])
+        obj.batch_size = 3
+        blocked = threading.Event()
+        release = threading.Event()
+
+        # Hold up the writer thread while events are queued
+        class Blocker(events.Sink):
+            def write(self, events):
+                if not blocked.is_set():
+                    blocked.set()
+                    release.wait()
+        obj.sinks.insert(0, Blocker())
+
+        obj.put(events.Event('first'))
+        blocked.wait()
+        for i in range(5):
+            obj.put(events.Event('event %d' % i))
+        release.set()
+        obj.close()
+
+        self.assertEqual(sink.batches, [
+            ['first'],
+            ['event 0', 'event 1', 'event 2'],
+            ['event 3', 'event 4'],
+        ])
+
+    def test_put_closed(self):
+        sink = ListSink()
+        obj = events.EventLog([sink])
+        obj.close()
+
+        obj.put(events.Event('late'))
+
+        self.assertEqual(obj._thread, None)
+        self.assertEqual(sink.batches, [['late']])
+
+    @mock.patch('atexit.register')
+    @mock.patch('traceback.print_exc')
+    def test_sink_failure(self, mock_print_exc, mock_register):
+        sink = ListSink()
+        broken = mock.Mock(**{'write.side_effect': IOError('broken')})
+        obj = events.EventLog([broken, sink])
+
+        obj.put(events.Event('event'))
+        obj.close()
+
+        self.assertEqual(sink.batches, [['event']])
+        mock_print_exc.assert_called_once_with(file=sys.__stderr__)
+
+    @mock.patch('atexit.register')
+    def test_add_sink(self, mock_register):
+        first = ListSink()
+        second = ListSink()
+        obj = events.EventLog([first])
+
+        obj.put(events.Event('one'))
+        obj.add_sink(second)
+        obj.put(events.Event('two'))
+        obj.close()
+
+        self.assertEqual(sum(first.batches, []), ['one', 'two'])
+        self.assertEqual(second.batches, [['two']])
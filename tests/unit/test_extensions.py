@@ -71,11 +71,20 @@ class ExtensionDebugger(unittest.TestCase):
         result = extensions.ExtensionDebugger('method')
 
         self.assertEqual(result.method, 'method')
+        self.assertEqual(result.ctxt, None)
         self.assertEqual(result.ext_cls, None)
         self.assertEqual(result._debug, 0)
         mock_debug.assert_called_once_with(
             2, 'Calling extension method "method()"')
 
+    @mock.patch.dict(os.environ, clear=True)
+    @mock.patch.object(extensions.ExtensionDebugger, 'debug')
+    def test_init_ctxt(self, mock_debug):
+        result = extensions.ExtensionDebugger('method', 'ctxt')
+
+        self.assertEqual(result.method, 'method')
+        self.assertEqual(result.ctxt, 'ctxt')
+
     @mock.patch.dict(os.environ, clear=True, TIMID_EXTENSION_DEBUG='')
     @mock.patch.object(extensions.ExtensionDebugger, 'debug')
     def test_init_present(self, mock_debug):
@@ -131,12 +140,13 @@ class ExtensionDebugger(unittest.TestCase):
         mock_debug.assert_called_once_with(
             2, 'Calling extension method "method()"')
 
-    def get_obj(self, ext_cls=None, debug=0):
+    def get_obj(self, ext_cls=None, debug=0, ctxt=None):
         with mock.patch.object(extensions.ExtensionDebugger, '__init__',
                                return_value=None):
             obj = extensions.ExtensionDebugger()
 
         obj.method = 'method'
+        obj.ctxt = ctxt
         obj.ext_cls = ext_cls
         obj._debug = debug
 
@@ -236,6 +246,27 @@ class ExtensionDebugger(unittest.TestCase):
         mock_exit.assert_called_once_with(
             'Extension failure calling "method()" for extension "mod.name"')
 
+    @mock.patch('traceback.print_exception')
+    @mock.patch('sys.exit')
+    def test_exit_exception_debug_flush(self, mock_exit,
+                                        mock_print_exception):
+        exc = TestingException('error')
+        ctxt = mock.Mock()
+        ctxt.flush.side_effect = lambda: self.assertFalse(
+            mock_print_exception.called)
+        obj = self.get_obj(ext_cls=mock.Mock(__module__='mod',
+                                             __name__='name'),
+                           debug=1, ctxt=ctxt)
+
+        result = obj.__exit__(TestingException, exc, 'tb')
+
+        self.assertEqual(result, False)
+        ctxt.flush.assert_called_once_with()
+        mock_print_exception.assert_called_once_with(
+            TestingException, exc, 'tb', file=sys.stderr)
+        mock_exit.assert_called_once_with(
+            'Extension failure calling "method()" for extension "mod.name"')
+
     @mock.patch.object(extensions.ExtensionDebugger, 'debug')
     def test_call_object(self, mock_debug):
         class TestClass(object):
@@ -273,6 +304,17 @@ class ExtensionDebugger(unittest.TestCase):
 
         self.assertEqual(sys.stderr.getvalue(), '')
 
+    @mock.patch('sys.stderr', six.StringIO())
+    def test_debug_flush(self):
+        ctxt = mock.Mock()
+        obj = self.get_obj(debug=3, ctxt=ctxt)
+
+        obj.debug(2, 'test message')
+        obj.debug(4, 'other message')
+
+        self.assertEqual(sys.stderr.getvalue(), 'test message\n')
+        ctxt.flush.assert_called_once_with()
+
     @mock.patch('sys.stderr', six.StringIO())
     def test_debug_high(self):
         obj = self.get_obj(debug=3)
@@ -362,7 +404,7 @@ class ExtensionSetTest(unittest.TestCase):
         result = extensions.ExtensionSet.activate('ctxt', 'args')
 
         self.assertTrue(isinstance(result, extensions.ExtensionSet))
-        mock_ExtensionDebugger.assert_called_once_with('activate')
+        mock_ExtensionDebugger.assert_called_once_with('activate', 'ctxt')
         debugger = mock_ExtensionDebugger.return_value
         mock_get_extension_classes.assert_called_once_with()
         exts = mock_get_extension_classes.return_value
@@ -422,7 +464,7 @@ class ExtensionSetTest(unittest.TestCase):
                             mock_ExtensionDebugger):
         self.assertRaises(TestingException, extensions.ExtensionSet.activate,
                           'ctxt', 'args')
-        mock_ExtensionDebugger.assert_called_once_with('activate')
+        mock_ExtensionDebugger.assert_called_once_with('activate', 'ctxt')
         debugger = mock_ExtensionDebugger.return_value
         mock_get_extension_classes.assert_called_once_with()
         exts = mock_get_extension_classes.return_value
@@ -459,7 +501,7 @@ class ExtensionSetTest(unittest.TestCase):
         result = obj.read_steps('ctxt', 'steps')
 
         self.assertEqual(result, 'steps')
-        mock_ExtensionDebugger.assert_called_once_with('read_steps')
+        mock_ExtensionDebugger.assert_called_once_with('read_steps', 'ctxt')
         for ext in exts:
             ext.read_steps.assert_called_once_with('ctxt', 'steps')
 
@@ -473,7 +515,7 @@ class ExtensionSetTest(unittest.TestCase):
         result = obj.pre_step('ctxt', 'step', 5)
 
         self.assertEqual(result, False)
-        mock_ExtensionDebugger.assert_called_once_with('pre_step')
+        mock_ExtensionDebugger.assert_called_once_with('pre_step', 'ctxt')
         debugger = mock_ExtensionDebugger.return_value
         for ext in exts:
             ext.pre_step.assert_called_once_with('ctxt', 'step', 5)
@@ -509,7 +551,7 @@ class ExtensionSetTest(unittest.TestCase):
         result = obj.pre_step('ctxt', 'step', 5)
 
         self.assertEqual(result, True)
-        mock_ExtensionDebugger.assert_called_once_with('pre_step')
+        mock_ExtensionDebugger.assert_called_once_with('pre_step', 'ctxt')
         debugger = mock_ExtensionDebugger.return_value
         for ext in exts:
             if ext.call_expected:
@@ -528,7 +570,7 @@ class ExtensionSetTest(unittest.TestCase):
         result = obj.post_step('ctxt', 'step', 5, 'result')
 
         self.assertEqual(result, 'result')
-        mock_ExtensionDebugger.assert_called_once_with('post_step')
+        mock_ExtensionDebugger.assert_called_once_with('post_step', 'ctxt')
         for ext in exts:
             ext.post_step.assert_called_once_with('ctxt', 'step', 5, 'result')
 
@@ -542,6 +584,6 @@ class ExtensionSetTest(unittest.TestCase):
         result = obj.finalize('ctxt', 'result0')
 
         self.assertEqual(result, 'result5')
-        mock_ExtensionDebugger.assert_called_once_with('finalize')
+        mock_ExtensionDebugger.assert_called_once_with('finalize', 'ctxt')
         for i, ext in enumerate(exts):
             ext.finalize.assert_called_once_with('ctxt', 'result%d' % i)
@@ -14,6 +14,8 @@
 #    governing permissions and limitations under the License.
 
 import sys
+import threading
+import time
 import unittest
 
 import mock
@@ -110,6 +112,92 @@ class DictActionTest(unittest.TestCase):
         parser.error.assert_called_once_with('Unrecognized value type "unk"')
 
 
+class ExecutionTest(unittest.TestCase):
+    def make_steps(self, count):
+        step_list = []
+        for i in range(count):
+            step = mock.Mock()
+            step.name = 'step%d' % i
+            step_list.append(step)
+        return step_list
+
+    @mock.patch('timid.extensions.ExtensionSet')
+    def test_init(self, mock_ExtensionSet):
+        ctxt = mock.Mock()
+
+        result = main.Execution(ctxt)
+
+        self.assertEqual(result.ctxt, ctxt)
+        self.assertEqual(result.exts, mock_ExtensionSet.return_value)
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
+        self.assertEqual(result.ckpt, None)
+        self.assertEqual(result.msg, None)
+
+    def test_iter(self):
+        ctxt = mock.Mock(steps=self.make_steps(3))
+        ckpt = mock.Mock(**{'start.return_value': 1})
+        execution = main.Execution(ctxt, 'exts', ckpt)
+
+        result = list(execution)
+
+        self.assertEqual(result, [(1, ctxt.steps[1]), (2, ctxt.steps[2])])
+        ckpt.start.assert_called_once_with(ctxt)
+        ckpt.clear.assert_called_once_with()
+        ctxt.emit.assert_has_calls([
+            mock.call('[Step 1]: step1 . . .', idx=1, step=ctxt.steps[1]),
+            mock.call('[Step 2]: step2 . . .', idx=2, step=ctxt.steps[2]),
+        ])
+
+    def test_iter_stopped(self):
+        ctxt = mock.Mock(steps=self.make_steps(3))
+        ckpt = mock.Mock(**{'start.return_value': 0})
+        execution = main.Execution(ctxt, 'exts', ckpt)
+
+        for idx, step in execution:
+            break
+
+        self.assertFalse(ckpt.clear.called)
+
+    def test_iter_refused(self):
+        ctxt = mock.Mock(steps=self.make_steps(3))
+        ckpt = mock.Mock(**{
+            'start.side_effect': main.checkpoint.CheckpointError('changed'),
+        })
+        execution = main.Execution(ctxt, 'exts', ckpt)
+
+        result = list(execution)
+
+        self.assertEqual(result, [])
+        self.assertEqual(execution.msg, 'Unable to resume: changed')
+        self.assertFalse(ckpt.clear.called)
+
+    def test_finished(self):
+        ctxt = mock.Mock()
+        ckpt = mock.Mock()
+        execution = main.Execution(ctxt, 'exts', ckpt)
+
+        result = execution.finished(
+            2, 'step', steps.StepResult(state=steps.SUCCESS))
+
+        self.assertEqual(result, True)
+        self.assertEqual(execution.msg, None)
+        ckpt.save.assert_called_once_with(ctxt, 3)
+        ctxt.emit.assert_called_once_with('[Step 2]: `- Step SUCCESS',
+                                          idx=2, step='step')
+
+    def test_finished_failure(self):
+        ctxt = mock.Mock()
+        ckpt = mock.Mock()
+        execution = main.Execution(ctxt, 'exts', ckpt)
+
+        result = execution.finished(
+            2, 'step', steps.StepResult(state=steps.FAILURE, msg='oops'))
+
+        self.assertEqual(result, False)
+        self.assertEqual(execution.msg, 'Test step failure: oops')
+        self.assertFalse(ckpt.save.called)
+
+
 class TimidTest(unittest.TestCase):
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -143,14 +231,16 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
+        self.assertEqual(set(ctxt.timings), set(['parse', 'read_steps']))
         exts.pre_step.assert_has_calls([
             mock.call(ctxt, step, idx) for idx, step in enumerate(steps)
         ])
@@ -164,18 +254,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps))
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step SUCCESS'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step SUCCESS',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -209,12 +311,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=0, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=0, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -230,18 +333,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps))
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step SUCCESS'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step SUCCESS',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -275,12 +390,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml', key='key')
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', 'key')
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -296,18 +412,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps))
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml[key]...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step SUCCESS'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step SUCCESS',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -345,13 +473,14 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml', exts=exts)
 
         self.assertEqual(result, None)
         self.assertFalse(mock_ExtensionSet.called)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
+        self.assertEqual(ctxt.extensions, exts)
         self.assertFalse(int_exts.read_steps.called)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         self.assertFalse(int_exts.pre_step.called)
@@ -369,18 +498,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps))
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step SUCCESS'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step SUCCESS',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -414,12 +555,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml', check=True)
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         self.assertFalse(exts.pre_step.called)
@@ -428,8 +570,10 @@ class TimidTest(unittest.TestCase):
         self.assertFalse(exts.post_step.called)
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
         ])
-        self.assertEqual(ctxt.emit.call_count, 1)
+        self.assertEqual(ctxt.emit.call_count, 2)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -468,12 +612,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -493,18 +638,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps) - 1)
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step SKIPPED'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step SKIPPED',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -538,12 +695,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, None)
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -559,18 +717,30 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps))
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step FAILURE (ignored)'),
-            mock.call('[Step 3]: step3 . . .'),
-            mock.call('[Step 3]: `- Step SUCCESS (ignored)'),
-            mock.call('[Step 4]: step4 . . .'),
-            mock.call('[Step 4]: `- Step SUCCESS'),
-        ])
-        self.assertEqual(ctxt.emit.call_count, 11)
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step FAILURE (ignored)',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 3]: step3 . . .',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 3]: `- Step SUCCESS (ignored)',
+                      idx=3, step=steps[3]),
+            mock.call('[Step 4]: step4 . . .',
+                      idx=4, step=steps[4]),
+            mock.call('[Step 4]: `- Step SUCCESS',
+                      idx=4, step=steps[4]),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 12)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -609,12 +779,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, 'Test step failure')
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -635,14 +806,22 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps) - 2)
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step FAILURE'),
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step FAILURE',
+                      idx=2, step=steps[2]),
         ])
-        self.assertEqual(ctxt.emit.call_count, 7)
+        self.assertEqual(ctxt.emit.call_count, 8)
 
     @mock.patch('timid.extensions.ExtensionSet', return_value=mock.Mock(**{
         'read_steps.side_effect': lambda c, s: s,
@@ -681,12 +860,13 @@ class TimidTest(unittest.TestCase):
         for step in steps:
             # I hate this one feature of the mock library...
             step.name = step.st_name
-        ctxt = mock.Mock(steps=[], verbose=1, debug=False)
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
 
         result = main.timid(ctxt, 'test.yaml')
 
         self.assertEqual(result, 'Test step failure: eek!')
         mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(ctxt.extensions, mock_ExtensionSet.return_value)
         mock_parse_file.assert_called_once_with(ctxt, 'test.yaml', None)
         exts.read_steps.assert_called_once_with(ctxt, steps)
         exts.pre_step.assert_has_calls([
@@ -707,14 +887,315 @@ class TimidTest(unittest.TestCase):
         self.assertEqual(exts.post_step.call_count, len(steps) - 2)
         ctxt.emit.assert_has_calls([
             mock.call('Reading test steps from test.yaml...', debug=True),
-            mock.call('[Step 0]: step0 . . .'),
-            mock.call('[Step 0]: `- Step SUCCESS'),
-            mock.call('[Step 1]: step1 . . .'),
-            mock.call('[Step 1]: `- Step SUCCESS'),
-            mock.call('[Step 2]: step2 . . .'),
-            mock.call('[Step 2]: `- Step FAILURE'),
+            mock.call('Template cache: %s' % ctxt.templates,
+                      debug=True),
+            mock.call('[Step 0]: step0 . . .',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 0]: `- Step SUCCESS',
+                      idx=0, step=steps[0]),
+            mock.call('[Step 1]: step1 . . .',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 1]: `- Step SUCCESS',
+                      idx=1, step=steps[1]),
+            mock.call('[Step 2]: step2 . . .',
+                      idx=2, step=steps[2]),
+            mock.call('[Step 2]: `- Step FAILURE',
+                      idx=2, step=steps[2]),
         ])
-        self.assertEqual(ctxt.emit.call_count, 7)
+        self.assertEqual(ctxt.emit.call_count, 8)
+
+    def make_steps(self, *results):
+        step_list = []
+        for idx, result in enumerate(results):
+            step = mock.Mock(return_value=result)
+            step.name = 'step%d' % idx
+            step_list.append(step)
+        return step_list
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint(self, mock_parse_file):
+        step_list = self.make_steps(*[steps.StepResult(steps.SUCCESS)] * 4)
+        mock_parse_file.return_value = step_list
+        exts = mock.Mock(**{
+            'read_steps.side_effect': lambda c, s: s,
+            'pre_step.return_value': False,
+        })
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
+        ckpt = mock.Mock(**{'start.return_value': 2})
+
+        result = main.timid(ctxt, 'test.yaml', exts=exts, ckpt=ckpt)
+
+        self.assertEqual(result, None)
+        ckpt.start.assert_called_once_with(ctxt)
+        self.assertFalse(step_list[0].called)
+        self.assertFalse(step_list[1].called)
+        step_list[2].assert_called_once_with(ctxt)
+        step_list[3].assert_called_once_with(ctxt)
+        exts.pre_step.assert_has_calls([
+            mock.call(ctxt, step_list[2], 2),
+            mock.call(ctxt, step_list[3], 3),
+        ])
+        ckpt.save.assert_has_calls([mock.call(ctxt, 3), mock.call(ctxt, 4)])
+        self.assertEqual(ckpt.save.call_count, 2)
+        ckpt.clear.assert_called_once_with()
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint_failure(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(steps.SUCCESS),
+                                    steps.StepResult(steps.FAILURE),
+                                    steps.StepResult(steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        exts = mock.Mock(**{
+            'read_steps.side_effect': lambda c, s: s,
+            'pre_step.return_value': False,
+        })
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
+        ckpt = mock.Mock(**{'start.return_value': 0})
+
+        result = main.timid(ctxt, 'test.yaml', exts=exts, ckpt=ckpt)
+
+        self.assertEqual(result, 'Test step failure')
+        ckpt.save.assert_called_once_with(ctxt, 1)
+        self.assertFalse(ckpt.clear.called)
+        self.assertFalse(step_list[2].called)
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint_refused(self, mock_parse_file):
+        step_list = self.make_steps(steps.StepResult(steps.SUCCESS))
+        mock_parse_file.return_value = step_list
+        exts = mock.Mock(**{'read_steps.side_effect': lambda c, s: s})
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
+        ckpt = mock.Mock(**{
+            'start.side_effect': main.checkpoint.CheckpointError('changed'),
+        })
+
+        result = main.timid(ctxt, 'test.yaml', exts=exts, ckpt=ckpt)
+
+        self.assertEqual(result, 'Unable to resume: changed')
+        self.assertFalse(step_list[0].called)
+        self.assertFalse(ckpt.save.called)
+
+    @mock.patch.object(steps.Step, 'parse_file')
+    def test_checkpoint_check(self, mock_parse_file):
+        mock_parse_file.return_value = self.make_steps(
+            steps.StepResult(steps.SUCCESS))
+        exts = mock.Mock(**{'read_steps.side_effect': lambda c, s: s})
+        ctxt = mock.Mock(steps=[], timings={}, verbose=1, debug=False)
+        ckpt = mock.Mock()
+
+        result = main.timid(ctxt, 'test.yaml', check=True, exts=exts,
+                            ckpt=ckpt)
+
+        self.assertEqual(result, None)
+        self.assertFalse(ckpt.start.called)
+
+
+class TargetTest(unittest.TestCase):
+    @mock.patch('os.path.exists', return_value=False)
+    def test_init_base(self, mock_exists):
+        result = main.Target('test.yaml')
+
+        self.assertEqual(result.label, 'test.yaml')
+        self.assertEqual(result.test, 'test.yaml')
+        self.assertEqual(result.key, None)
+        self.assertEqual(result.ctxt, None)
+        self.assertEqual(result.ckpt, None)
+        self.assertEqual(result.result, None)
+
+    @mock.patch('os.path.exists', return_value=False)
+    def test_init_default_key(self, mock_exists):
+        result = main.Target('test.yaml', 'key')
+
+        self.assertEqual(result.label, 'test.yaml')
+        self.assertEqual(result.test, 'test.yaml')
+        self.assertEqual(result.key, 'key')
+
+    @mock.patch('os.path.exists', return_value=False)
+    def test_init_key(self, mock_exists):
+        result = main.Target('some:test.yaml:other', 'key')
+
+        self.assertEqual(result.label, 'some:test.yaml:other')
+        self.assertEqual(result.test, 'some:test.yaml')
+        self.assertEqual(result.key, 'other')
+
+    @mock.patch('os.path.exists', return_value=False)
+    def test_init_empty_key(self, mock_exists):
+        result = main.Target('test.yaml:', 'key')
+
+        self.assertEqual(result.test, 'test.yaml')
+        self.assertEqual(result.key, 'key')
+
+    @mock.patch('os.path.exists', return_value=True)
+    def test_init_exists(self, mock_exists):
+        result = main.Target('test.yaml:other', 'key')
+
+        self.assertEqual(result.test, 'test.yaml:other')
+        self.assertEqual(result.key, 'key')
+        mock_exists.assert_called_once_with('test.yaml:other')
+
+
+class RunTargetTest(unittest.TestCase):
+    @mock.patch.object(main, 'timid', return_value='result')
+    @mock.patch('traceback.print_exc')
+    def test_base(self, mock_print_exc, mock_timid):
+        target = mock.Mock(test='test.yaml', key='key', result=None)
+
+        result = main._run_target(target, 'check', 'exts')
+
+        self.assertEqual(id(result), id(target))
+        self.assertEqual(target.result, 'result')
+        mock_timid.assert_called_once_with(
+            target.ctxt, 'test.yaml', 'key', 'check', 'exts', target.ckpt)
+        self.assertFalse(mock_print_exc.called)
+
+    @mock.patch.object(main, 'timid',
+                       side_effect=TestingException('test failure'))
+    @mock.patch('traceback.print_exc')
+    def test_exception(self, mock_print_exc, mock_timid):
+        target = main.Target('test.yaml', 'key')
+        target.ctxt = mock.Mock(debug=False)
+
+        result = main._run_target(target, 'check', 'exts')
+
+        self.assertEqual(id(result), id(target))
+        self.assertTrue(isinstance(target.result, TestingException))
+        self.assertFalse(mock_print_exc.called)
+
+    @mock.patch.object(main, 'timid',
+                       side_effect=TestingException('test failure'))
+    @mock.patch('traceback.print_exc')
+    def test_exception_debug(self, mock_print_exc, mock_timid):
+        target = main.Target('test.yaml', 'key')
+        target.ctxt = mock.Mock(debug=True)
+        target.ctxt.flush.side_effect = lambda: self.assertFalse(
+            mock_print_exc.called)
+
+        result = main._run_target(target, 'check', 'exts')
+
+        self.assertEqual(id(result), id(target))
+        self.assertTrue(isinstance(target.result, TestingException))
+        target.ctxt.flush.assert_called_once_with()
+        mock_print_exc.assert_called_once_with(file=sys.stderr)
+
+
+class RunTest(unittest.TestCase):
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('timid.extensions.ExtensionSet')
+    @mock.patch.object(main, '_run_target', side_effect=lambda t, c, e: t)
+    def test_single(self, mock_run_target, mock_ExtensionSet, mock_exists):
+        ctxt = mock.Mock()
+
+        result = main.run(ctxt, ['test.yaml'], 'key')
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].test, 'test.yaml')
+        self.assertEqual(result[0].key, 'key')
+        self.assertEqual(result[0].ctxt, ctxt.fork.return_value)
+        self.assertEqual(result[0].ckpt, None)
+        ctxt.fork.assert_called_once_with(None)
+        mock_run_target.assert_called_once_with(
+            result[0], False, mock_ExtensionSet.return_value)
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch.object(main.checkpoint.Checkpoint, 'for_test')
+    @mock.patch.object(main, '_run_target', side_effect=lambda t, c, e: t)
+    def test_checkpoints(self, mock_run_target, mock_for_test, mock_exists):
+        ctxt = mock.Mock()
+
+        result = main.run(ctxt, ['test.yaml:key'], exts='exts',
+                          checkpoints=True)
+
+        self.assertEqual(result[0].ckpt, mock_for_test.return_value)
+        mock_for_test.assert_called_once_with(
+            ctxt.fork.return_value, 'test.yaml', 'key', False)
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch.object(main.checkpoint.Checkpoint, 'for_test')
+    @mock.patch.object(main, '_run_target', side_effect=lambda t, c, e: t)
+    def test_resume(self, mock_run_target, mock_for_test, mock_exists):
+        ctxt = mock.Mock()
+
+        result = main.run(ctxt, ['test.yaml'], exts='exts', resume=True)
+
+        self.assertEqual(result[0].ckpt, mock_for_test.return_value)
+        mock_for_test.assert_called_once_with(
+            ctxt.fork.return_value, 'test.yaml', None, True)
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch.object(main.checkpoint.Checkpoint, 'for_test')
+    @mock.patch.object(main, '_run_target', side_effect=lambda t, c, e: t)
+    def test_resume_check(self, mock_run_target, mock_for_test,
+                          mock_exists):
+        ctxt = mock.Mock()
+
+        result = main.run(ctxt, ['test.yaml'], check=True, exts='exts',
+                          resume=True)
+
+        self.assertEqual(result[0].ckpt, None)
+        self.assertFalse(mock_for_test.called)
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('timid.extensions.ExtensionSet')
+    @mock.patch.object(main, '_run_target', side_effect=lambda t, c, e: t)
+    def test_multiple(self, mock_run_target, mock_ExtensionSet, mock_exists):
+        ctxt = mock.Mock(**{'fork.side_effect': lambda l: 'ctxt:%s' % l})
+
+        result = main.run(ctxt, ['test1.yaml', 'test2.yaml:other'], 'key',
+                          True, 'exts')
+
+        self.assertEqual([(t.test, t.key, t.ctxt) for t in result], [
+            ('test1.yaml', 'key', 'ctxt:test1.yaml'),
+            ('test2.yaml', 'other', 'ctxt:test2.yaml:other'),
+        ])
+        mock_run_target.assert_has_calls([
+            mock.call(result[0], True, 'exts'),
+            mock.call(result[1], True, 'exts'),
+        ])
+        self.assertEqual(mock_run_target.call_count, 2)
+        self.assertFalse(mock_ExtensionSet.called)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('timid.aio.run')
+    @mock.patch('timid.aio.run_targets', new_callable=mock.Mock)
+    @mock.patch.object(main, '_run_target')
+    def test_asynchronous(self, mock_run_target, mock_run_targets,
+                          mock_run, mock_exists):
+        ctxt = mock.Mock()
+
+        result = main.run(ctxt, ['t1.yaml', 't2.yaml'], exts='exts', jobs=3,
+                          asynchronous=True)
+
+        self.assertEqual([t.test for t in result], ['t1.yaml', 't2.yaml'])
+        mock_run_targets.assert_called_once_with(result, False, 'exts', 3)
+        mock_run.assert_called_once_with(mock_run_targets.return_value)
+        self.assertFalse(mock_run_target.called)
+
+    @mock.patch('os.path.exists', return_value=False)
+    def test_concurrent(self, mock_exists):
+        ctxt = mock.Mock()
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def fake_run_target(target, check, exts):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            target.result = 'result:%s' % target.test
+            return target
+
+        with mock.patch.object(main, '_run_target',
+                               side_effect=fake_run_target):
+            result = main.run(ctxt, ['t1.yaml', 't2.yaml', 't3.yaml'],
+                              exts='exts', jobs=3)
+
+        self.assertEqual([t.result for t in result], [
+            'result:t1.yaml', 'result:t2.yaml', 'result:t3.yaml',
+        ])
+        self.assertTrue(running[1] > 1)
 
 
 class ArgsTest(unittest.TestCase):
@@ -725,7 +1206,23 @@ class ArgsTest(unittest.TestCase):
         mock_prepare.assert_called_once_with('parser')
 
 
+class ConsoleTest(unittest.TestCase):
+    def test_alias(self):
+        self.assertIs(main.timid.console, main.run.console)
+
+
+def make_target(label, result):
+    return mock.Mock(label=label, ctxt='ctxt:%s' % label, result=result)
+
+
 class ProcessorTest(unittest.TestCase):
+    def make_args(self, test=None, debug=False, environment=None,
+                  variables=None, event_log=None, directory=None):
+        return mock.Mock(test=test or ['test.yaml'], debug=debug,
+                         environment=environment or {},
+                         variables=variables or {}, event_log=event_log,
+                         directory=directory)
+
     @mock.patch('timid.context.Context',
                 return_value=mock.Mock(environment={}, variables={}))
     @mock.patch('timid.extensions.ExtensionSet.activate',
@@ -733,27 +1230,75 @@ class ProcessorTest(unittest.TestCase):
                     'finalize.side_effect': lambda c, r: r,
                 }))
     @mock.patch('traceback.print_exc')
-    def test_base(self, mock_print_exc, mock_activate, mock_Context):
+    def test_base(self, mock_print_exc, mock_activate,
+                  mock_Context):
         ctxt = mock_Context.return_value
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=False,
-                         environment={}, variables={})
+        args = self.make_args()
+        target = make_target('test.yaml', None)
 
         gen = main._processor(args)
         next(gen)
 
         self.assertEqual(args.ctxt, ctxt)
         self.assertEqual(args.exts, exts)
+        self.assertEqual(args.test, ['test.yaml'])
         self.assertEqual(ctxt.environment, {})
         self.assertEqual(ctxt.variables, {})
         self.assertFalse(mock_print_exc.called)
         self.assertFalse(exts.finalize.called)
+        mock_Context.assert_called_once_with(
+            args.verbose, False, None, args.cache_dir)
 
-        result = gen.send(None)
+        result = gen.send([target])
 
         self.assertEqual(result, None)
         self.assertFalse(mock_print_exc.called)
-        exts.finalize.assert_called_once_with(ctxt, None)
+        exts.finalize.assert_called_once_with('ctxt:test.yaml', None)
+
+    @mock.patch('timid.context.Context',
+                return_value=mock.Mock(environment={}, variables={}))
+    @mock.patch('timid.extensions.ExtensionSet.activate',
+                return_value=mock.Mock(**{
+                    'finalize.side_effect': lambda c, r: r,
+                }))
+    @mock.patch('timid.events.JSONLinesSink')
+    def test_event_log(self, mock_JSONLinesSink, mock_activate,
+                       mock_Context):
+        ctxt = mock_Context.return_value
+        args = self.make_args(event_log='events.jsonl')
+        target = make_target('test.yaml', None)
+
+        gen = main._processor(args)
+        next(gen)
+
+        mock_JSONLinesSink.assert_called_once_with('events.jsonl')
+        ctxt.events.add_sink.assert_called_once_with(
+            mock_JSONLinesSink.return_value)
+        self.assertFalse(ctxt.flush.called)
+
+        result = gen.send([target])
+
+        self.assertEqual(result, None)
+        ctxt.flush.assert_called_once_with()
+
+    @mock.patch('timid.context.Context',
+                return_value=mock.Mock(environment={}, variables={}))
+    @mock.patch('timid.extensions.ExtensionSet.activate',
+                return_value=mock.Mock(**{
+                    'finalize.side_effect': lambda c, r: r,
+                }))
+    @mock.patch('traceback.print_exc')
+    def test_directory(self, mock_print_exc, mock_activate, mock_Context):
+        args = self.make_args(['test1.yaml', 'test2.yaml'],
+                              directory='directory')
+
+        gen = main._processor(args)
+        next(gen)
+
+        self.assertEqual(args.test, ['test1.yaml', 'test2.yaml'])
+        mock_Context.assert_called_once_with(
+            args.verbose, False, 'directory', args.cache_dir)
 
     @mock.patch('timid.context.Context',
                 return_value=mock.Mock(
@@ -768,9 +1313,8 @@ class ProcessorTest(unittest.TestCase):
     def test_vars(self, mock_print_exc, mock_activate, mock_Context):
         ctxt = mock_Context.return_value
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=False,
-                         environment={'c': 'z', 'd': 0},
-                         variables={'x': 'c', 'w': 0})
+        args = self.make_args(environment={'c': 'z', 'd': 0},
+                              variables={'x': 'c', 'w': 0})
 
         gen = main._processor(args)
         next(gen)
@@ -779,14 +1323,25 @@ class ProcessorTest(unittest.TestCase):
         self.assertEqual(args.exts, exts)
         self.assertEqual(ctxt.environment, {'a': 1, 'b': 2, 'c': 'z', 'd': 0})
         self.assertEqual(ctxt.variables, {'x': 'c', 'y': 2, 'z': 1, 'w': 0})
-        self.assertFalse(mock_print_exc.called)
-        self.assertFalse(exts.finalize.called)
 
-        result = gen.send(None)
+    @mock.patch('timid.context.Context',
+                return_value=mock.Mock(environment={}, variables={}))
+    @mock.patch('timid.extensions.ExtensionSet.activate',
+                return_value=mock.Mock(**{
+                    'finalize.return_value': 'alt result',
+                }))
+    @mock.patch('traceback.print_exc')
+    def test_change_result(self, mock_print_exc, mock_activate, mock_Context):
+        exts = mock_activate.return_value
+        args = self.make_args()
 
-        self.assertEqual(result, None)
+        gen = main._processor(args)
+        next(gen)
+        result = gen.send([make_target('test.yaml', None)])
+
+        self.assertEqual(result, 'alt result')
         self.assertFalse(mock_print_exc.called)
-        exts.finalize.assert_called_once_with(ctxt, None)
+        exts.finalize.assert_called_once_with('ctxt:test.yaml', None)
 
     @mock.patch('timid.context.Context',
                 return_value=mock.Mock(environment={}, variables={}))
@@ -795,56 +1350,72 @@ class ProcessorTest(unittest.TestCase):
                     'finalize.side_effect': lambda c, r: r,
                 }))
     @mock.patch('traceback.print_exc')
-    def test_debug(self, mock_print_exc, mock_activate, mock_Context):
-        ctxt = mock_Context.return_value
+    def test_target_exception(self, mock_print_exc, mock_activate,
+                              mock_Context):
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=True,
-                         environment={}, variables={})
+        args = self.make_args()
+        exc = TestingException('test failure')
 
         gen = main._processor(args)
         next(gen)
+        result = gen.send([make_target('test.yaml', exc)])
 
-        self.assertEqual(args.ctxt, ctxt)
-        self.assertEqual(args.exts, exts)
-        self.assertEqual(ctxt.environment, {})
-        self.assertEqual(ctxt.variables, {})
-        self.assertFalse(mock_print_exc.called)
-        self.assertFalse(exts.finalize.called)
-
-        result = gen.send(None)
-
-        self.assertEqual(result, None)
+        self.assertEqual(result, 'test failure')
         self.assertFalse(mock_print_exc.called)
-        exts.finalize.assert_called_once_with(ctxt, None)
+        exts.finalize.assert_called_once_with('ctxt:test.yaml', exc)
 
     @mock.patch('timid.context.Context',
                 return_value=mock.Mock(environment={}, variables={}))
     @mock.patch('timid.extensions.ExtensionSet.activate',
                 return_value=mock.Mock(**{
-                    'finalize.return_value': 'alt result',
+                    'finalize.side_effect': lambda c, r: r,
                 }))
     @mock.patch('traceback.print_exc')
-    def test_change_result(self, mock_print_exc, mock_activate, mock_Context):
-        ctxt = mock_Context.return_value
+    def test_multiple_success(self, mock_print_exc, mock_activate,
+                              mock_Context):
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=False,
-                         environment={}, variables={})
+        args = self.make_args(['t1.yaml', 't2.yaml'])
 
         gen = main._processor(args)
         next(gen)
+        result = gen.send([make_target('t1.yaml', None),
+                           make_target('t2.yaml', None)])
 
-        self.assertEqual(args.ctxt, ctxt)
-        self.assertEqual(args.exts, exts)
-        self.assertEqual(ctxt.environment, {})
-        self.assertEqual(ctxt.variables, {})
-        self.assertFalse(mock_print_exc.called)
-        self.assertFalse(exts.finalize.called)
+        self.assertEqual(result, None)
+        exts.finalize.assert_has_calls([
+            mock.call('ctxt:t1.yaml', None),
+            mock.call('ctxt:t2.yaml', None),
+        ])
+        self.assertEqual(exts.finalize.call_count, 2)
 
-        result = gen.send(None)
+    @mock.patch('timid.context.Context',
+                return_value=mock.Mock(environment={}, variables={}))
+    @mock.patch('timid.extensions.ExtensionSet.activate',
+                return_value=mock.Mock(**{
+                    'finalize.side_effect': lambda c, r: r,
+                }))
+    @mock.patch('traceback.print_exc')
+    def test_multiple_failure(self, mock_print_exc, mock_activate,
+                              mock_Context):
+        exts = mock_activate.return_value
+        args = self.make_args(['t1.yaml', 't2.yaml', 't3.yaml'])
+        exc = TestingException('test failure')
 
-        self.assertEqual(result, 'alt result')
-        self.assertFalse(mock_print_exc.called)
-        exts.finalize.assert_called_once_with(ctxt, None)
+        gen = main._processor(args)
+        next(gen)
+        result = gen.send([make_target('t1.yaml', 'Test step failure'),
+                           make_target('t2.yaml', None),
+                           make_target('t3.yaml', exc)])
+
+        self.assertEqual(result, '2 of 3 tests failed:\n'
+                         't1.yaml: Test step failure\n'
+                         't3.yaml: test failure')
+        exts.finalize.assert_has_calls([
+            mock.call('ctxt:t1.yaml', 'Test step failure'),
+            mock.call('ctxt:t2.yaml', None),
+            mock.call('ctxt:t3.yaml', exc),
+        ])
+        self.assertEqual(exts.finalize.call_count, 3)
 
     @mock.patch('timid.context.Context',
                 return_value=mock.Mock(environment={}, variables={}))
@@ -856,19 +1427,11 @@ class ProcessorTest(unittest.TestCase):
     def test_exception(self, mock_print_exc, mock_activate, mock_Context):
         ctxt = mock_Context.return_value
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=False,
-                         environment={}, variables={})
+        args = self.make_args()
 
         gen = main._processor(args)
         next(gen)
 
-        self.assertEqual(args.ctxt, ctxt)
-        self.assertEqual(args.exts, exts)
-        self.assertEqual(ctxt.environment, {})
-        self.assertEqual(ctxt.variables, {})
-        self.assertFalse(mock_print_exc.called)
-        self.assertFalse(exts.finalize.called)
-
         exc = TestingException('test failure')
         result = gen.throw(exc)
 
@@ -887,19 +1450,11 @@ class ProcessorTest(unittest.TestCase):
                              mock_Context):
         ctxt = mock_Context.return_value
         exts = mock_activate.return_value
-        args = mock.Mock(directory='directory', debug=True,
-                         environment={}, variables={})
+        args = self.make_args(debug=True)
 
         gen = main._processor(args)
         next(gen)
 
-        self.assertEqual(args.ctxt, ctxt)
-        self.assertEqual(args.exts, exts)
-        self.assertEqual(ctxt.environment, {})
-        self.assertEqual(ctxt.variables, {})
-        self.assertFalse(mock_print_exc.called)
-        self.assertFalse(exts.finalize.called)
-
         exc = TestingException('test failure')
         result = gen.throw(exc)
 
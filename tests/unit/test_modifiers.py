@@ -13,12 +13,179 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
 import mock
 
+from timid import context
+from timid import environment
 from timid import modifiers
+from timid import parallel
 from timid import steps
+from timid import utils
+
+
+class MatrixModifierTest(unittest.TestCase):
+    def get_modifier(self, config, ctxt=None):
+        return modifiers.MatrixModifier(
+            ctxt or context.Context(), 'matrix', config,
+            steps.StepAddress('test.yaml', 0))
+
+    @mock.patch('multiprocessing.cpu_count', return_value=1)
+    def test_init_simple(self, mock_cpu_count):
+        mod = self.get_modifier({'py': ['2.7', '3.5'], 'db': ['a', 'b']})
+
+        self.assertEqual(mod.max_workers, parallel.MAX_WORKERS)
+        self.assertEqual(mod.fail_fast, False)
+        self.assertEqual([dict(v) for v in mod.variants], [
+            {'db': 'a', 'py': '2.7'},
+            {'db': 'a', 'py': '3.5'},
+            {'db': 'b', 'py': '2.7'},
+            {'db': 'b', 'py': '3.5'},
+        ])
+
+    def test_init_advanced(self):
+        mod = self.get_modifier({
+            'vars': {'x': [1, 2, 3]},
+            'max-workers': 2,
+            'mode': 'fail-fast',
+        })
+
+        self.assertEqual(mod.max_workers, 2)
+        self.assertEqual(mod.fail_fast, True)
+        self.assertEqual([dict(v) for v in mod.variants],
+                         [{'x': 1}, {'x': 2}, {'x': 3}])
+
+    def test_init_var_named_vars(self):
+        mod = self.get_modifier({'vars': [1, 2]})
+
+        self.assertEqual([dict(v) for v in mod.variants],
+                         [{'vars': 1}, {'vars': 2}])
+
+    def test_init_invalid(self):
+        self.assertRaises(steps.ConfigError, self.get_modifier, ['a'])
+        self.assertRaises(steps.ConfigError, self.get_modifier, {})
+        self.assertRaises(steps.ConfigError, self.get_modifier, {'x': []})
+        self.assertRaises(steps.ConfigError, self.get_modifier, {'x': 1})
+        self.assertRaises(steps.ConfigError, self.get_modifier,
+                          {'vars': {'x': [1]}, 'mode': 'other'})
+
+    def test_label(self):
+        mod = self.get_modifier({'py': ['2.7'], 'db': ['a']})
+
+        self.assertEqual(mod.label(mod.variants[0]), 'db=a, py=2.7')
+
+    def test_fork(self):
+        ctxt = context.Context()
+        ctxt.variables['py'] = 'orig'
+        ctxt.label = 'target'
+        mod = self.get_modifier({'py': ['2.7']})
+
+        result = mod.fork(ctxt, mod.variants[0])
+
+        self.assertNotEqual(id(result), id(ctxt))
+        self.assertEqual(result.label, 'target: py=2.7')
+        self.assertEqual(result.variables['py'], '2.7')
+        self.assertEqual(ctxt.variables['py'], 'orig')
+
+    def test_pre_call(self):
+        ctxt = context.Context()
+        ctxt.emit = mock.Mock()
+        addr = steps.StepAddress('test.yaml', 0)
+        tmpl = ctxt.template('{{ x }}-{{ y }}')
+        rendered = []
+
+        def action(vctxt):
+            rendered.append(tmpl(vctxt))
+            return steps.StepResult(
+                state=steps.FAILURE if vctxt.variables['x'] == 2
+                else steps.SUCCESS)
+
+        mod = modifiers.MatrixModifier(
+            ctxt, 'matrix', {'x': [1, 2], 'y': ['a']}, addr)
+
+        result = mod.pre_call(ctxt, [], [], action)
+
+        self.assertEqual(sorted(rendered), ['1-a', '2-a'])
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertFalse(result.ignore)
+        self.assertEqual(result.msg,
+                         '1 of 2 variants failed (x=2, y=a: FAILURE)')
+        self.assertEqual([r.state for r in result.results],
+                         [steps.SUCCESS, steps.FAILURE])
+        self.assertFalse('x' in ctxt.variables)
+        ctxt.emit.assert_has_calls([
+            mock.call('    [x=1, y=a]: `- Variant SUCCESS'),
+            mock.call('    [x=2, y=a]: `- Variant FAILURE'),
+        ], any_order=True)
+
+    def test_pre_call_fail_fast(self):
+        ctxt = context.Context()
+        ctxt.emit = mock.Mock()
+        action = mock.Mock(return_value=steps.StepResult(
+            state=steps.FAILURE))
+        mod = self.get_modifier({
+            'vars': {'x': [1, 2, 3]},
+            'max-workers': 1,
+            'mode': 'fail-fast',
+        }, ctxt)
+
+        result = mod.pre_call(ctxt, [], [], action)
+
+        self.assertEqual(action.call_count, 1)
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual([r.state for r in result.results],
+                         [steps.FAILURE, steps.SKIPPED, steps.SKIPPED])
+        self.assertEqual(result.results[1].msg,
+                         'Skipped due to an earlier failure')
+
+    def test_pre_call_ignore_errors(self):
+        ctxt = context.Context()
+        ctxt.emit = mock.Mock()
+        addr = steps.StepAddress('test.yaml', 0)
+        action = mock.Mock(return_value=steps.StepResult(
+            state=steps.FAILURE))
+        mods = [
+            modifiers.MatrixModifier(ctxt, 'matrix', {'x': [1, 2]}, addr),
+            modifiers.IgnoreErrorsModifier(ctxt, 'ignore-errors', True,
+                                           addr),
+        ]
+
+        result = steps.Step.invoke(ctxt, action, mods)
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertTrue(result.ignore)
+        self.assertEqual(result.msg, None)
+        self.assertEqual(action.call_count, 2)
+
+    def test_pre_call_failure_ignored_later(self):
+        ctxt = context.Context()
+        ctxt.emit = mock.Mock()
+        addr = steps.StepAddress('test.yaml', 0)
+        action = mock.Mock(side_effect=[
+            steps.StepResult(state=steps.FAILURE),
+            steps.StepResult(state=steps.FAILURE, ignore=True),
+        ])
+        mod = modifiers.MatrixModifier(
+            ctxt, 'matrix', {'vars': {'x': [1, 2]}, 'max-workers': 1}, addr)
+        ignore = modifiers.IgnoreErrorsModifier(ctxt, 'ignore-errors', True,
+                                                addr)
+
+        result = mod.pre_call(ctxt, [], [], action)
+
+        self.assertFalse(result.ignore)
+        self.assertFalse(result)
+
+        result = ignore.post_call(ctxt, result, action, [], [])
+
+        self.assertTrue(result.ignore)
+        self.assertTrue(result)
 
 
 class ConditionalModifierTest(unittest.TestCase):
@@ -57,6 +224,183 @@ class ConditionalModifierTest(unittest.TestCase):
         self.assertEqual(result, None)
 
 
+class CacheModifierTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, fname, content):
+        path = os.path.join(self.tmpdir, fname)
+        utils.ensure_dir(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def make_ctxt(self):
+        ctxt = context.Context(cwd=self.tmpdir,
+                               cache_dir=os.path.join(self.tmpdir, 'cache'))
+        ctxt.environment['FOO'] = 'foo'
+        ctxt.variables['spam'] = 'spam'
+        return ctxt
+
+    @mock.patch.object(steps.Modifier, '__init__', return_value=None)
+    def test_init_string(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: 't:%s' % x})
+
+        result = modifiers.CacheModifier(ctxt, 'cache', 'src/*', 'addr')
+
+        self.assertEqual(result.inputs, ['t:src/*'])
+        self.assertEqual(result.env, [])
+        self.assertEqual(result.vars, [])
+        mock_init.assert_called_once_with(ctxt, 'cache', 'src/*', 'addr')
+
+    @mock.patch.object(steps.Modifier, '__init__', return_value=None)
+    def test_init_list(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: 't:%s' % x})
+
+        result = modifiers.CacheModifier(ctxt, 'cache', ['a', 'b'], 'addr')
+
+        self.assertEqual(result.inputs, ['t:a', 't:b'])
+
+    @mock.patch.object(steps.Modifier, '__init__', return_value=None)
+    def test_init_dict(self, mock_init):
+        ctxt = mock.Mock(**{'template.side_effect': lambda x: 't:%s' % x})
+
+        result = modifiers.CacheModifier(ctxt, 'cache', {
+            'inputs': 'a',
+            'env': ['FOO'],
+            'vars': ['spam'],
+        }, 'addr')
+
+        self.assertEqual(result.inputs, ['t:a'])
+        self.assertEqual(result.env, ['FOO'])
+        self.assertEqual(result.vars, ['spam'])
+
+    def test_schema(self):
+        for config in ('a', ['a', 'b'], {'inputs': 'a'},
+                       {'inputs': ['a'], 'env': ['A'], 'vars': ['b']}):
+            modifiers.CacheModifier(self.make_ctxt(), 'cache', config,
+                                    'addr')
+        for config in (5, [5], {'inputs': 5}, {'other': 'a'},
+                       {'env': 'A'}):
+            self.assertRaises(steps.ConfigError, modifiers.CacheModifier,
+                              self.make_ctxt(), 'cache', config, 'addr')
+
+    def fingerprint(self, ctxt, config, action_config='echo {{ spam }}'):
+        mod = modifiers.CacheModifier(ctxt, 'cache', config, 'addr')
+        action = mock.Mock(config=action_config)
+        action.name = 'run'
+        return mod.fingerprint(ctxt, action)
+
+    def test_fingerprint_inputs(self):
+        self.write('src/a.txt', 'a')
+        self.write('src/sub/b.txt', 'b')
+        ctxt = self.make_ctxt()
+        config = {'inputs': ['src/**/*.txt', 'missing/*']}
+
+        first = self.fingerprint(ctxt, config)
+        self.assertEqual(first, self.fingerprint(ctxt, config))
+        self.write('src/sub/b.txt', 'changed')
+        second = self.fingerprint(ctxt, config)
+        self.write('src/c.txt', 'c')
+        third = self.fingerprint(ctxt, config)
+
+        self.assertEqual(len(set([first, second, third])), 3)
+
+    def test_fingerprint_env_vars(self):
+        ctxt = self.make_ctxt()
+        config = {'env': ['FOO'], 'vars': ['eggs']}
+
+        first = self.fingerprint(ctxt, config)
+        ctxt.environment['FOO'] = 'bar'
+        second = self.fingerprint(ctxt, config)
+        ctxt.variables['eggs'] = 'eggs'
+        third = self.fingerprint(ctxt, config)
+        ctxt.environment['OTHER'] = 'other'
+        ctxt.variables['other'] = 'other'
+
+        self.assertEqual(len(set([first, second, third])), 3)
+        self.assertEqual(third, self.fingerprint(ctxt, config))
+
+    def test_fingerprint_action_config(self):
+        ctxt = self.make_ctxt()
+
+        first = self.fingerprint(ctxt, [], {'command': ['{{ spam }}']})
+        ctxt.variables['spam'] = 'eggs'
+        second = self.fingerprint(ctxt, [], {'command': ['{{ spam }}']})
+        third = self.fingerprint(ctxt, [], {'command': ['eggs']})
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, third)
+
+    def test_pre_call_miss(self):
+        ctxt = self.make_ctxt()
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+
+        with mock.patch.object(mod, 'fingerprint', return_value='0123'):
+            result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(result, None)
+        self.assertEqual(mod._pending, {id(ctxt): '0123'})
+
+    def test_pre_call_hit(self):
+        ctxt = self.make_ctxt()
+        ctxt.result_cache.put('0123')
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+
+        with mock.patch.object(mod, 'fingerprint', return_value='0123'):
+            result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(result.state, steps.SKIPPED)
+        self.assertEqual(result.msg,
+                         'Inputs unchanged since the last successful run')
+        self.assertEqual(mod._pending, {})
+
+    def test_pre_call_unreadable(self):
+        ctxt = self.make_ctxt()
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+
+        with mock.patch.object(mod, 'fingerprint',
+                               side_effect=OSError('unreadable')):
+            result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(result, None)
+        self.assertEqual(mod._pending, {})
+
+    def test_post_call_success(self):
+        ctxt = self.make_ctxt()
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+        mod._pending[id(ctxt)] = '0123'
+        orig_result = steps.StepResult(state=steps.SUCCESS)
+
+        result = mod.post_call(ctxt, orig_result, 'action', [], [])
+
+        self.assertEqual(id(result), id(orig_result))
+        self.assertEqual(ctxt.result_cache.get('0123')['step'], 'addr')
+        self.assertEqual(mod._pending, {})
+
+    def test_post_call_failure(self):
+        ctxt = self.make_ctxt()
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+        mod._pending[id(ctxt)] = '0123'
+
+        mod.post_call(ctxt, steps.StepResult(state=steps.FAILURE,
+                                             ignore=True), 'action', [], [])
+
+        self.assertEqual(ctxt.result_cache.get('0123'), None)
+        self.assertEqual(mod._pending, {})
+
+    def test_post_call_skipped(self):
+        ctxt = self.make_ctxt()
+        mod = modifiers.CacheModifier(ctxt, 'cache', [], 'addr')
+
+        result = mod.post_call(ctxt, steps.StepResult(state=steps.SUCCESS),
+                               'action', [], [])
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertFalse(os.path.exists(ctxt.result_cache.directory))
+
+
 class IgnoreErrorsModifierTest(unittest.TestCase):
     def get_modifier(self, config):
         with mock.patch.object(modifiers.IgnoreErrorsModifier, '__init__',
@@ -76,3 +420,310 @@ class IgnoreErrorsModifierTest(unittest.TestCase):
 
         self.assertEqual(id(new_result), id(orig_result))
         self.assertEqual(orig_result.ignore, 'config')
+
+
+class RetryModifierTest(unittest.TestCase):
+    def get_modifier(self, config):
+        return modifiers.RetryModifier(
+            context.Context(), 'retry', config,
+            steps.StepAddress('test.yaml', 0))
+
+    def test_init_simple(self):
+        mod = self.get_modifier(5)
+
+        self.assertEqual(mod.attempts, 5)
+        self.assertEqual(mod.delay, 1.0)
+        self.assertEqual(mod.backoff, 2.0)
+        self.assertEqual(mod.max_delay, 60.0)
+        self.assertEqual(mod.jitter, 0.5)
+        self.assertEqual(mod.retryable, None)
+
+    def test_init_advanced(self):
+        mod = self.get_modifier({
+            'attempts': 4,
+            'delay': 0.5,
+            'backoff': 3,
+            'max-delay': 2,
+            'jitter': 0,
+            'retryable': 'attempt < 2',
+        })
+
+        self.assertEqual(mod.attempts, 4)
+        self.assertEqual(mod.delay, 0.5)
+        self.assertEqual(mod.backoff, 3)
+        self.assertEqual(mod.max_delay, 2)
+        self.assertEqual(mod.jitter, 0)
+        self.assertTrue(callable(mod.retryable))
+
+    def test_init_invalid(self):
+        self.assertRaises(steps.ConfigError, self.get_modifier, 0)
+        self.assertRaises(steps.ConfigError, self.get_modifier,
+                          {'jitter': 2})
+        self.assertRaises(steps.ConfigError, self.get_modifier,
+                          {'other': 1})
+
+    def test_delays(self):
+        mod = self.get_modifier({
+            'attempts': 5,
+            'delay': 1,
+            'backoff': 2,
+            'max-delay': 5,
+            'jitter': 0,
+        })
+
+        self.assertEqual(list(mod.delays()), [1, 2, 4, 5])
+
+    @mock.patch('random.random', return_value=0.5)
+    def test_delays_jitter(self, mock_random):
+        mod = self.get_modifier({
+            'attempts': 3,
+            'delay': 2,
+            'jitter': 0.5,
+        })
+
+        self.assertEqual(list(mod.delays()), [1.5, 3.0])
+
+    def test_should_retry_success(self):
+        mod = self.get_modifier(3)
+
+        self.assertFalse(mod.should_retry(
+            'ctxt', steps.StepResult(state=steps.SUCCESS), 1))
+
+    def test_should_retry_failure(self):
+        mod = self.get_modifier(3)
+
+        self.assertTrue(mod.should_retry(
+            'ctxt', steps.StepResult(state=steps.FAILURE), 1))
+
+    def test_should_retry_expression(self):
+        ctxt = context.Context()
+        mod = modifiers.RetryModifier(
+            ctxt, 'retry', {'retryable': 'state == "FAILURE" and '
+                            'result.returncode == 75 and attempt < 3'},
+            steps.StepAddress('test.yaml', 0))
+        result = steps.StepResult(state=steps.FAILURE, returncode=75)
+
+        self.assertTrue(mod.should_retry(ctxt, result, 1))
+        self.assertFalse(mod.should_retry(ctxt, result, 3))
+        self.assertFalse(mod.should_retry(
+            ctxt, steps.StepResult(state=steps.FAILURE, returncode=1), 1))
+        self.assertFalse(mod.should_retry(
+            ctxt, steps.StepResult(state=steps.ERROR, returncode=75), 1))
+
+    def test_retries(self):
+        ctxt = mock.Mock()
+        mod = self.get_modifier({'attempts': 3, 'delay': 1, 'jitter': 0})
+        attempts = [steps.StepResult(state=steps.FAILURE)]
+        delays = []
+
+        for delay in mod.retries(ctxt, attempts):
+            delays.append(delay)
+            attempts.append(steps.StepResult(state=steps.FAILURE))
+
+        self.assertEqual(delays, [1, 2])
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(ctxt.emit.call_count, 2)
+
+    def test_retries_success(self):
+        ctxt = mock.Mock()
+        mod = self.get_modifier({'attempts': 3, 'delay': 1, 'jitter': 0})
+        attempts = [steps.StepResult(state=steps.FAILURE)]
+        delays = []
+
+        for delay in mod.retries(ctxt, attempts):
+            delays.append(delay)
+            attempts.append(steps.StepResult(state=steps.SUCCESS))
+
+        self.assertEqual(delays, [1])
+        self.assertEqual(ctxt.emit.call_count, 1)
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(steps.Step, 'invoke')
+    def test_pre_call_success(self, mock_invoke, mock_sleep):
+        ctxt = mock.Mock()
+        mod = self.get_modifier(3)
+        result = steps.StepResult(state=steps.SUCCESS)
+        mock_invoke.return_value = result
+
+        new_result = mod.pre_call(ctxt, ['pre'], ['post'], 'action')
+
+        self.assertEqual(new_result.state, steps.SUCCESS)
+        self.assertEqual(new_result.results, [result])
+        mock_invoke.assert_called_once_with(
+            ctxt, 'action', ['pre', mod, 'post'], 2)
+        self.assertFalse(mock_sleep.called)
+        self.assertFalse(ctxt.emit.called)
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(steps.Step, 'invoke')
+    def test_pre_call_eventual_success(self, mock_invoke, mock_sleep):
+        ctxt = mock.Mock()
+        mod = self.get_modifier({'attempts': 3, 'jitter': 0})
+        results = [
+            steps.StepResult(state=steps.FAILURE, msg='nope'),
+            steps.StepResult(state=steps.SUCCESS),
+        ]
+        mock_invoke.side_effect = results
+
+        new_result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(new_result.state, steps.SUCCESS)
+        self.assertEqual(new_result.msg, None)
+        self.assertEqual(new_result.results, results)
+        self.assertEqual(mock_invoke.call_count, 2)
+        mock_invoke.assert_called_with(ctxt, 'action', [mod], 1)
+        mock_sleep.assert_called_once_with(1.0)
+        ctxt.emit.assert_called_once_with(
+            '    Attempt 1 of 3 failed: nope; retrying in 1.00s')
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(steps.Step, 'invoke')
+    def test_pre_call_exhausted(self, mock_invoke, mock_sleep):
+        ctxt = mock.Mock()
+        mod = self.get_modifier({'attempts': 3, 'jitter': 0})
+        mock_invoke.side_effect = lambda *args: steps.StepResult(
+            state=steps.FAILURE, msg='nope')
+
+        new_result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(new_result.state, steps.FAILURE)
+        self.assertEqual(new_result.msg, 'Failed after 3 attempts: nope')
+        self.assertEqual(len(new_result.results), 3)
+        self.assertEqual(new_result.results[-1].msg, 'nope')
+        self.assertEqual(mock_sleep.call_args_list,
+                         [mock.call(1.0), mock.call(2.0)])
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(steps.Step, 'invoke')
+    def test_pre_call_not_retryable(self, mock_invoke, mock_sleep):
+        ctxt = mock.Mock()
+        mod = self.get_modifier(3)
+        mod.retryable = mock.Mock(return_value=False)
+        result = steps.StepResult(state=steps.ERROR)
+        mock_invoke.return_value = result
+
+        new_result = mod.pre_call(ctxt, [], [], 'action')
+
+        self.assertEqual(new_result.state, steps.ERROR)
+        self.assertEqual(new_result.results, [result])
+        mod.retryable.assert_called_once_with(
+            ctxt, result=result, state='ERROR', attempt=1)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('time.sleep')
+    def test_pre_call_ignore_errors(self, mock_sleep):
+        ctxt = context.Context()
+        action = mock.Mock(return_value=steps.StepResult(
+            state=steps.FAILURE))
+        addr = steps.StepAddress('test.yaml', 0)
+        mods = [
+            modifiers.RetryModifier(ctxt, 'retry',
+                                    {'attempts': 2, 'delay': 0}, addr),
+            modifiers.IgnoreErrorsModifier(ctxt, 'ignore-errors', True,
+                                           addr),
+        ]
+        mods.sort(key=lambda x: x.priority)
+
+        result = steps.Step.invoke(ctxt, action, mods)
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertTrue(result.ignore)
+        self.assertEqual(action.call_count, 2)
+
+
+class TimeoutModifierTest(unittest.TestCase):
+    def get_modifier(self, config):
+        return modifiers.TimeoutModifier(
+            context.Context(), 'timeout', config,
+            steps.StepAddress('test.yaml', 0))
+
+    def test_init_simple(self):
+        mod = self.get_modifier(30)
+
+        self.assertEqual(mod.seconds, 30)
+        self.assertEqual(mod.grace, 5.0)
+
+    def test_init_advanced(self):
+        mod = self.get_modifier({'seconds': 1.5, 'grace': 0})
+
+        self.assertEqual(mod.seconds, 1.5)
+        self.assertEqual(mod.grace, 0)
+
+    def test_init_invalid(self):
+        self.assertRaises(steps.ConfigError, self.get_modifier, 'forever')
+        self.assertRaises(steps.ConfigError, self.get_modifier, -1)
+        self.assertRaises(steps.ConfigError, self.get_modifier,
+                          {'grace': 1})
+
+    def test_in_time(self):
+        ctxt = context.Context()
+        mod = self.get_modifier(30)
+        result = steps.StepResult(state=steps.SUCCESS)
+        action = mock.Mock(return_value=result)
+
+        new_result = steps.Step.invoke(ctxt, action, [mod])
+
+        self.assertEqual(id(new_result), id(result))
+        self.assertEqual(ctxt.environment._trackers, [])
+        tracked = action.call_args[0][0]
+        self.assertEqual(len(tracked.environment._trackers), 1)
+
+    def test_timed_out(self):
+        ctxt = context.Context()
+        mod = self.get_modifier({'seconds': 0.01, 'grace': 0})
+
+        def action(ctxt):
+            tracker = ctxt.environment._trackers[0]
+            while tracker.signalled is None:
+                time.sleep(0.01)
+            return steps.StepResult(returncode=-15, output={'stdout': 'x'})
+
+        result = steps.Step.invoke(ctxt, action, [mod])
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.msg, 'Timed out after 0.01 seconds')
+        self.assertEqual(result.returncode, -15)
+        self.assertEqual(result.output, {'stdout': 'x'})
+        self.assertEqual(ctxt.environment._trackers, [])
+
+    @unittest.skipUnless(hasattr(os, 'setsid'), 'requires sessions')
+    def test_run(self):
+        ctxt = context.Context()
+        addr = steps.StepAddress('test.yaml', 0)
+        action = environment.RunAction(
+            ctxt, 'run', [sys.executable, '-c', 'import time; time.sleep(60)'],
+            addr)
+        mod = modifiers.TimeoutModifier(
+            ctxt, 'timeout', {'seconds': 0.1, 'grace': 1}, addr)
+        start = time.time()
+
+        result = steps.Step.invoke(ctxt, action, [mod])
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.msg, 'Timed out after 0.1 seconds')
+        self.assertLess(time.time() - start, 10)
+
+    @unittest.skipUnless(hasattr(os, 'setsid'), 'requires sessions')
+    def test_run_concurrent(self):
+        ctxt = context.Context()
+        addr = steps.StepAddress('test.yaml', 0)
+        timed = environment.RunAction(
+            ctxt, 'run', [sys.executable, '-c', 'import time; time.sleep(60)'],
+            addr)
+        sibling = environment.RunAction(
+            ctxt, 'run', [sys.executable, '-c', 'import time; time.sleep(1)'],
+            addr)
+        mod = modifiers.TimeoutModifier(
+            ctxt, 'timeout', {'seconds': 0.1, 'grace': 1}, addr)
+        results = {}
+
+        def run_sibling():
+            results['sibling'] = steps.Step.invoke(ctxt, sibling, [])
+
+        thread = threading.Thread(target=run_sibling)
+        thread.start()
+        results['timed'] = steps.Step.invoke(ctxt, timed, [mod])
+        thread.join()
+
+        self.assertEqual(results['timed'].state, steps.FAILURE)
+        self.assertEqual(results['sibling'].state, steps.SUCCESS)
@@ -0,0 +1,427 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import random
+import subprocess
+import sys
+import unittest
+
+import mock
+import six
+
+from timid import output
+from timid import steps
+from timid import utils
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_init(self):
+        result = output.RingBuffer(8)
+
+        self.assertEqual(result.size, 8)
+        self.assertEqual(result.total, 0)
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.truncated, False)
+        self.assertEqual(result.getvalue(), b'')
+
+    def test_write_partial(self):
+        obj = output.RingBuffer(8)
+
+        obj.write(b'abc')
+        obj.write(bytearray(b'de'))
+
+        self.assertEqual(obj.total, 5)
+        self.assertEqual(len(obj), 5)
+        self.assertEqual(obj.truncated, False)
+        self.assertEqual(obj.getvalue(), b'abcde')
+
+    def test_write_exact(self):
+        obj = output.RingBuffer(8)
+
+        obj.write(b'abcd')
+        obj.write(b'efgh')
+
+        self.assertEqual(len(obj), 8)
+        self.assertEqual(obj.truncated, False)
+        self.assertEqual(obj.getvalue(), b'abcdefgh')
+
+    def test_write_wrap(self):
+        obj = output.RingBuffer(8)
+
+        obj.write(b'abcdef')
+        obj.write(b'ghijk')
+
+        self.assertEqual(obj.total, 11)
+        self.assertEqual(len(obj), 8)
+        self.assertEqual(obj.truncated, True)
+        self.assertEqual(obj.getvalue(), b'defghijk')
+
+        obj.write(b'lm')
+
+        self.assertEqual(obj.getvalue(), b'fghijklm')
+
+    def test_write_large(self):
+        obj = output.RingBuffer(8)
+
+        obj.write(b'abc')
+        obj.write(b'0123456789')
+
+        self.assertEqual(obj.total, 13)
+        self.assertEqual(obj.getvalue(), b'23456789')
+
+        obj.write(b'x')
+
+        self.assertEqual(obj.getvalue(), b'3456789x')
+
+    def test_write_many(self):
+        obj = output.RingBuffer(10)
+        data = b''.join(six.int2byte(i % 256) for i in range(1000))
+
+        for i in range(0, len(data), 7):
+            obj.write(data[i:i + 7])
+
+        self.assertEqual(obj.getvalue(), data[-10:])
+
+
+class ScrubberTest(unittest.TestCase):
+    def make_scrubber(self, **values):
+        data = utils.SensitiveDict(dict(values), set(values))
+        return output.Scrubber('<{key}>').update(data)
+
+    def test_init(self):
+        result = output.Scrubber()
+
+        self.assertEqual(result.masking, utils.SensitiveDict.masking)
+        self.assertEqual(result.builds, 0)
+        self.assertFalse(result)
+        self.assertEqual(result.scrub(b'some data'), b'some data')
+
+    def test_update(self):
+        variables = utils.SensitiveDict(
+            {'a': 'secret', 'b': 'public', 'c': 1234, 'd': ''},
+            set(['a', 'c', 'd', 'e']))
+        env = utils.SensitiveDict({'TOKEN': 'tok', 'a': 'other'},
+                                  set(['TOKEN']))
+        obj = output.Scrubber()
+
+        result = obj.update(variables, env)
+
+        self.assertEqual(id(result), id(obj))
+        self.assertTrue(obj)
+        self.assertEqual(obj.builds, 1)
+        self.assertEqual(obj._values, frozenset([
+            (b'secret', 'a'), (b'1234', 'c'), (b'tok', 'TOKEN'),
+        ]))
+
+    def test_update_unchanged(self):
+        variables = utils.SensitiveDict({'a': 'secret'}, set(['a']))
+        obj = output.Scrubber()
+
+        obj.update(variables)
+        obj.update(variables)
+        variables['b'] = 'public'
+        obj.update(variables)
+
+        self.assertEqual(obj.builds, 1)
+
+    def test_update_same_version(self):
+        variables = utils.SensitiveDict({'a': 'secret'}, set(['a']))
+        obj = output.Scrubber()
+        obj.update(variables)
+
+        with mock.patch.object(obj, '_build') as mock_build:
+            variables._data['a'] = 'other'
+            obj.update(variables)
+
+            self.assertFalse(mock_build.called)
+
+            obj.update(variables, utils.SensitiveDict())
+
+            mock_build.assert_called_once_with(frozenset([(b'other', 'a')]))
+
+    def test_update_changed(self):
+        variables = utils.SensitiveDict({'a': 'secret'}, set(['a']))
+        obj = output.Scrubber('<{key}>')
+
+        obj.update(variables)
+        variables['a'] = 'other'
+        obj.update(variables)
+
+        self.assertEqual(obj.builds, 2)
+        self.assertEqual(obj.scrub(b'secret other'), b'secret <a>')
+
+        variables.declare_sensitive('b')
+        variables['b'] = 'secret'
+        obj.update(variables)
+
+        self.assertEqual(obj.builds, 3)
+        self.assertEqual(obj.scrub(b'secret other'), b'<b> <a>')
+
+    def test_scrub(self):
+        obj = self.make_scrubber(pw='hunter2', token='tok-123')
+
+        result = obj.scrub(b'pw=hunter2 token=tok-123 hunter tok-12')
+
+        self.assertEqual(result, b'pw=<pw> token=<token> hunter tok-12')
+
+    def test_scrub_adjacent(self):
+        obj = self.make_scrubber(pw='abc')
+
+        self.assertEqual(obj.scrub(b'abcabc abc'), b'<pw> <pw>')
+
+    def test_scrub_overlapping(self):
+        obj = self.make_scrubber(a='abcd', b='cdef', c='bc')
+
+        self.assertEqual(obj.scrub(b'xabcdefx'), b'x<a>x')
+        self.assertEqual(obj.scrub(b'xbcx'), b'x<c>x')
+        self.assertEqual(obj.scrub(b'xabcx'), b'xa<c>x')
+
+    def test_scrub_nested(self):
+        obj = self.make_scrubber(a='she', b='he', c='hers')
+
+        self.assertEqual(obj.scrub(b'ushers'), b'u<a>')
+        self.assertEqual(obj.scrub(b'hehe'), b'<b>')
+
+    def test_stream_boundaries(self):
+        obj = self.make_scrubber(pw='hunter2', token='tok-123')
+        data = b'a hunter2 b tok-123c hunte d hunter2'
+        expected = b'a <pw> b <token>c hunte d <pw>'
+
+        for split in range(len(data) + 1):
+            stream = obj.stream()
+            result = (stream.feed(data[:split]) + stream.feed(data[split:]) +
+                      stream.flush())
+            self.assertEqual(result, expected)
+
+    def test_stream_bytewise(self):
+        obj = self.make_scrubber(pw='hunter2')
+        stream = obj.stream()
+
+        result = [stream.feed(six.int2byte(b))
+                  for b in bytearray(b'xhunter2hunter2y')]
+
+        self.assertEqual(b''.join(result) + stream.flush(), b'x<pw>y')
+        self.assertEqual(result[:2], [b'x', b''])
+
+    def test_stream_holds_prefix(self):
+        obj = self.make_scrubber(pw='hunter2')
+        stream = obj.stream()
+
+        self.assertEqual(stream.feed(b'data hunt'), b'data ')
+        self.assertEqual(stream.flush(), b'hunt')
+
+    def test_random(self):
+        rand = random.Random(42)
+
+        for _i in range(200):
+            values = set(''.join(rand.choice('ab')
+                                 for _j in range(rand.randint(1, 4)))
+                         for _k in range(rand.randint(1, 4)))
+            data = ''.join(rand.choice('abc') for _j in range(30))
+
+            # Mask naively
+            masked = [False] * len(data)
+            for value in values:
+                for i in range(len(data) - len(value) + 1):
+                    if data.startswith(value, i):
+                        masked[i:i + len(value)] = [True] * len(value)
+            expected = ''.join(
+                '*' if m and (i == 0 or not masked[i - 1]) else
+                '' if m else c
+                for i, (c, m) in enumerate(zip(data, masked))
+            ).encode('ascii')
+
+            obj = output.Scrubber('*').update(utils.SensitiveDict(
+                dict(('k%d' % i, v) for i, v in enumerate(values)),
+                set('k%d' % i for i in range(len(values)))))
+            stream = obj.stream()
+            result = b''
+            pos = 0
+            while pos < len(data):
+                size = rand.randint(1, 5)
+                result += stream.feed(data[pos:pos + size].encode('ascii'))
+                pos += size
+            result += stream.flush()
+
+            self.assertEqual(result, expected)
+
+    def test_many_values(self):
+        values = dict(('key%d' % i, 'secret-%04d' % (i * 7919 % 10000))
+                      for i in range(500))
+        obj = self.make_scrubber(**values)
+        data = b' '.join(v.encode('ascii') for v in values.values())
+
+        result = obj.scrub(data)
+
+        self.assertEqual(result.count(b'<key'), 500)
+        self.assertFalse(b'secret' in result)
+
+
+class CaptureTest(unittest.TestCase):
+    def test_init(self):
+        result = output.Capture(16, False)
+
+        self.assertEqual(set(result.buffers), set(['stdout', 'stderr']))
+        self.assertEqual(result.buffers['stdout'].size, 16)
+        self.assertEqual(result.buffers['stderr'].size, 16)
+        self.assertEqual(result.passthrough, False)
+        self.assertEqual(result.output, {'stdout': b'', 'stderr': b''})
+
+    @mock.patch.object(sys, 'stdout')
+    def test_feed_no_passthrough(self, mock_stdout):
+        obj = output.Capture(16, False)
+
+        obj.feed('stdout', b'data')
+
+        self.assertEqual(obj.output, {'stdout': b'data', 'stderr': b''})
+        self.assertFalse(mock_stdout.buffer.write.called)
+
+    @mock.patch.object(sys, 'stderr')
+    def test_feed_passthrough(self, mock_stderr):
+        obj = output.Capture(16)
+
+        obj.feed('stderr', b'data')
+
+        self.assertEqual(obj.output, {'stdout': b'', 'stderr': b'data'})
+        mock_stderr.buffer.write.assert_called_once_with(b'data')
+        mock_stderr.buffer.flush.assert_called_once_with()
+
+    def test_result_success(self):
+        obj = output.Capture(16, False)
+        obj.feed('stderr', b'warning')
+
+        result = obj.result(0)
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.msg, None)
+        self.assertEqual(result.output, {'stdout': b'', 'stderr': b'warning'})
+
+    def test_result_failure_stderr(self):
+        obj = output.Capture(16, False)
+        obj.feed('stdout', b'output')
+        obj.feed('stderr', b'some error\n')
+
+        result = obj.result(2)
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.msg, 'Command exited with status 2; '
+                         'output ends with:\nsome error')
+
+    def test_result_failure_stdout(self):
+        obj = output.Capture(4, False)
+        obj.feed('stdout', b'output')
+
+        result = obj.result(2)
+
+        self.assertEqual(result.msg, 'Command exited with status 2; '
+                         'output ends with:\ntput')
+
+    def test_result_failure_no_output(self):
+        obj = output.Capture(16, False)
+
+        result = obj.result(2)
+
+        self.assertEqual(result.msg, None)
+
+    @mock.patch.object(sys, 'stdout')
+    def test_result_failure_passthrough(self, mock_stdout):
+        obj = output.Capture(16)
+        obj.feed('stdout', b'output')
+
+        result = obj.result(2)
+
+        self.assertEqual(result.msg, None)
+        self.assertEqual(result.output, {'stdout': b'output', 'stderr': b''})
+
+    def test_feed_scrubber(self):
+        data = utils.SensitiveDict({'pw': 'hunter2'}, set(['pw']))
+        obj = output.Capture(64, False, output.Scrubber().update(data))
+
+        obj.feed('stdout', b'pw=hun')
+        obj.feed('stdout', b'ter2\nok')
+        obj.feed('stderr', b'hunter')
+
+        self.assertEqual(obj.output, {
+            'stdout': b'pw=<masked pw>\nok',
+            'stderr': b'',
+        })
+
+        obj.close('stderr')
+
+        self.assertEqual(obj.output['stderr'], b'hunter')
+
+    @mock.patch.object(sys, 'stdout')
+    def test_feed_scrubber_passthrough(self, mock_stdout):
+        data = utils.SensitiveDict({'pw': 'hunter2'}, set(['pw']))
+        obj = output.Capture(64, True, output.Scrubber().update(data))
+
+        obj.feed('stdout', b'hunter2 ')
+
+        mock_stdout.buffer.write.assert_called_once_with(b'<masked pw> ')
+
+    @mock.patch.object(sys, 'stdout')
+    def test_feed_unretained(self, mock_stdout):
+        data = utils.SensitiveDict({'pw': 'hunter2'}, set(['pw']))
+        obj = output.Capture(0, True, output.Scrubber().update(data))
+
+        obj.feed('stdout', b'hunter2 ')
+
+        self.assertEqual(obj.buffers, {})
+        self.assertEqual(obj.output, {})
+        mock_stdout.buffer.write.assert_called_once_with(b'<masked pw> ')
+        self.assertEqual(obj.result(1).output, {})
+
+    def test_close_no_scrubber(self):
+        obj = output.Capture(64, False)
+
+        obj.close('stdout')
+
+        self.assertEqual(obj.output, {'stdout': b'', 'stderr': b''})
+
+    def test_pump(self):
+        obj = output.Capture(1024, False)
+        proc = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys\n'
+             'for i in range(20000):\n'
+             '    sys.stdout.write("line %d\\n" % i)\n'
+             '    sys.stderr.write("err %d\\n" % i)\n'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        obj.pump(proc)
+
+        self.assertEqual(proc.wait(), 0)
+        self.assertTrue(obj.output['stdout'].endswith(b'line 19999\n'))
+        self.assertTrue(obj.output['stderr'].endswith(b'err 19999\n'))
+        self.assertEqual(len(obj.output['stdout']), 1024)
+        self.assertEqual(obj.buffers['stdout'].total,
+                         sum(len('line %d\n' % i) for i in range(20000)))
+
+    def test_pump_scrubber(self):
+        data = utils.SensitiveDict({'pw': 'hunter2'}, set(['pw']))
+        obj = output.Capture(1024, False, output.Scrubber().update(data))
+        proc = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys, time\n'
+             'sys.stdout.write("pw=hun"); sys.stdout.flush()\n'
+             'time.sleep(0.05)\n'
+             'sys.stdout.write("ter2 hunt")\n'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        obj.pump(proc)
+
+        self.assertEqual(proc.wait(), 0)
+        self.assertEqual(obj.output['stdout'], b'pw=<masked pw> hunt')
@@ -0,0 +1,411 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import sys
+import threading
+import time
+import unittest
+
+import mock
+
+from timid import extensions
+from timid import modifiers
+from timid import parallel
+from timid import steps
+
+
+class FakeStep(object):
+    def __init__(self, name, result, delay=0.0, tracker=None):
+        self.name = name
+        self.result = result
+        self.delay = delay
+        self.tracker = tracker
+        self.called = False
+
+    def __call__(self, ctxt):
+        self.called = True
+        if self.tracker:
+            self.tracker.enter()
+        try:
+            time.sleep(self.delay)
+            return self.result
+        finally:
+            if self.tracker:
+                self.tracker.exit()
+
+
+class ConcurrencyTracker(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.maximum = 0
+
+    def enter(self):
+        with self.lock:
+            self.current += 1
+            self.maximum = max(self.maximum, self.current)
+
+    def exit(self):
+        with self.lock:
+            self.current -= 1
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_bounded(self):
+        tracker = ConcurrencyTracker()
+        step_list = [
+            FakeStep('step%d' % i, steps.StepResult(state=steps.SUCCESS),
+                     0.02, tracker)
+            for i in range(5)
+        ]
+
+        result = parallel.schedule(lambda idx: step_list[idx]('ctxt'),
+                                   5, 2, True)
+
+        self.assertEqual(result, [s.result for s in step_list])
+        self.assertEqual(tracker.maximum, 2)
+
+    def test_fail_fast(self):
+        calls = []
+
+        def func(idx):
+            calls.append(idx)
+            return steps.StepResult(state=steps.FAILURE)
+
+        result = parallel.schedule(func, 3, 1, True)
+
+        self.assertEqual(calls, [0])
+        self.assertEqual(result[1:], [None, None])
+
+    def test_complete_all(self):
+        calls = []
+
+        def func(idx):
+            calls.append(idx)
+            return steps.StepResult(state=steps.FAILURE)
+
+        result = parallel.schedule(func, 3, 1, False)
+
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertEqual([r.state for r in result], [steps.FAILURE] * 3)
+
+
+class SummarizeTest(unittest.TestCase):
+    def test_failures(self):
+        results = [
+            steps.StepResult(state=steps.SUCCESS),
+            steps.StepResult(state=steps.FAILURE, msg='failed'),
+            None,
+        ]
+
+        result = parallel.summarize(results, ['a', 'b', 'c'], 'tasks')
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.ignore, False)
+        self.assertEqual(result.msg, '1 of 3 tasks failed (b: failed)')
+        self.assertEqual(result.results, results)
+        self.assertEqual(results[2].state, steps.SKIPPED)
+        self.assertEqual(results[2].msg, 'Skipped due to an earlier failure')
+
+    def test_empty(self):
+        result = parallel.summarize([], [], 'tasks')
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(result.msg, None)
+        self.assertEqual(result.results, [])
+
+
+class ParallelActionTest(unittest.TestCase):
+    @mock.patch.object(steps.Action, '__init__', return_value=None)
+    @mock.patch.object(steps.Step, 'parse_step',
+                       side_effect=lambda c, a, s: ['%s_step' % s])
+    @mock.patch('multiprocessing.cpu_count', return_value=1)
+    def test_init_list(self, mock_cpu_count, mock_parse_step, mock_init):
+        step_addr = steps.StepAddress('fname', 3, 'key')
+
+        result = parallel.ParallelAction('ctxt', 'parallel', ['a', 'b'],
+                                         step_addr)
+
+        self.assertEqual(result.max_workers, parallel.MAX_WORKERS)
+        self.assertEqual(result.fail_fast, True)
+        self.assertEqual(result.steps, ['a_step', 'b_step'])
+        mock_init.assert_called_once_with(
+            'ctxt', 'parallel', {'steps': ['a', 'b']}, step_addr)
+        self.assertEqual(mock_parse_step.call_count, 2)
+        for idx, call in enumerate(mock_parse_step.call_args_list):
+            addr = call[0][1]
+            self.assertEqual(addr.fname, 'fname')
+            self.assertEqual(addr.idx, idx)
+            self.assertEqual(addr.key, 'key')
+            self.assertEqual(addr.parent, step_addr)
+
+    @mock.patch.object(steps.Action, '__init__', return_value=None)
+    @mock.patch.object(steps.Step, 'parse_step',
+                       side_effect=lambda c, a, s: [s, s])
+    def test_init_dict(self, mock_parse_step, mock_init):
+        step_addr = steps.StepAddress('fname', 3)
+        config = {
+            'steps': ['a', 'b'],
+            'max-workers': 3,
+            'mode': 'complete-all',
+        }
+
+        result = parallel.ParallelAction('ctxt', 'parallel', config,
+                                         step_addr)
+
+        self.assertEqual(result.max_workers, 3)
+        self.assertEqual(result.fail_fast, False)
+        self.assertEqual(result.steps, ['a', 'a', 'b', 'b'])
+        mock_init.assert_called_once_with(
+            'ctxt', 'parallel', config, step_addr)
+
+    def test_schema(self):
+        step_addr = steps.StepAddress('fname', 3)
+
+        for config in ({'max-workers': 3}, {'steps': [], 'max-workers': 0},
+                       {'steps': [], 'mode': 'other'},
+                       {'steps': [], 'other': 1}, 'step'):
+            self.assertRaises(steps.ConfigError, parallel.ParallelAction,
+                              'ctxt', 'parallel', config, step_addr)
+
+    def make_obj(self, step_list, max_workers=4, fail_fast=True):
+        with mock.patch.object(parallel.ParallelAction, '__init__',
+                               return_value=None):
+            obj = parallel.ParallelAction()
+
+        obj.steps = step_list
+        obj.max_workers = max_workers
+        obj.fail_fast = fail_fast
+        obj._lock = threading.Lock()
+
+        return obj
+
+    def test_run_step(self):
+        ctxt = mock.Mock()
+        exts = mock.Mock(**{'pre_step.return_value': False})
+        result = steps.StepResult(state=steps.SUCCESS)
+        step = FakeStep('step', result)
+        obj = self.make_obj([step])
+
+        self.assertEqual(obj._run_step(ctxt, exts, 2, step), result)
+        self.assertTrue(step.called)
+        exts.pre_step.assert_called_once_with(ctxt, step, 2)
+        exts.post_step.assert_called_once_with(ctxt, step, 2, result)
+        ctxt.emit.assert_has_calls([
+            mock.call('[Sub-step 2]: step . . .',
+                      idx=2, step=step),
+            mock.call('[Sub-step 2]: `- Step SUCCESS',
+                      idx=2, step=step),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 2)
+
+    def test_run_step_ignored(self):
+        ctxt = mock.Mock()
+        exts = mock.Mock(**{'pre_step.return_value': False})
+        result = steps.StepResult(state=steps.FAILURE, ignore=True)
+        step = FakeStep('step', result)
+        obj = self.make_obj([step])
+
+        self.assertEqual(obj._run_step(ctxt, exts, 2, step), result)
+        ctxt.emit.assert_has_calls([
+            mock.call('[Sub-step 2]: step . . .',
+                      idx=2, step=step),
+            mock.call('[Sub-step 2]: `- Step FAILURE (ignored)',
+                      idx=2, step=step),
+        ])
+
+    def test_run_step_skip(self):
+        ctxt = mock.Mock()
+        exts = mock.Mock(**{'pre_step.return_value': True})
+        step = FakeStep('step', 'result')
+        obj = self.make_obj([step])
+
+        result = obj._run_step(ctxt, exts, 2, step)
+
+        self.assertEqual(result.state, steps.SKIPPED)
+        self.assertFalse(step.called)
+        self.assertFalse(exts.post_step.called)
+        ctxt.emit.assert_has_calls([
+            mock.call('[Sub-step 2]: step . . .',
+                      idx=2, step=step),
+            mock.call('[Sub-step 2]: `- Step SKIPPED',
+                      idx=2, step=step),
+        ])
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+    @mock.patch('timid.aio.run_parallel', new_callable=mock.Mock)
+    def test_call_async(self, mock_run_parallel):
+        obj = self.make_obj([])
+
+        result = obj.call_async('ctxt')
+
+        self.assertEqual(result, mock_run_parallel.return_value)
+        mock_run_parallel.assert_called_once_with('ctxt', obj)
+
+    def test_call_success(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        tracker = ConcurrencyTracker()
+        step_list = [
+            FakeStep('step%d' % i, steps.StepResult(state=steps.SUCCESS),
+                     0.05, tracker)
+            for i in range(4)
+        ]
+        obj = self.make_obj(step_list)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(result.msg, None)
+        self.assertEqual(result.ignore, False)
+        self.assertEqual(result.results, [s.result for s in step_list])
+        self.assertEqual(tracker.maximum, 4)
+        self.assertEqual(ctxt.extensions.pre_step.call_count, 4)
+        self.assertEqual(ctxt.extensions.post_step.call_count, 4)
+
+    @mock.patch.object(extensions, 'ExtensionSet')
+    def test_call_no_extensions(self, mock_ExtensionSet):
+        ctxt = mock.Mock(extensions=None)
+        mock_ExtensionSet.return_value.pre_step.return_value = False
+        step_list = [FakeStep('step', steps.StepResult(state=steps.SUCCESS))]
+        obj = self.make_obj(step_list)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        mock_ExtensionSet.assert_called_once_with()
+        self.assertEqual(
+            mock_ExtensionSet.return_value.post_step.call_count, 1)
+
+    def test_call_bounded(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        tracker = ConcurrencyTracker()
+        step_list = [
+            FakeStep('step%d' % i, steps.StepResult(state=steps.SUCCESS),
+                     0.02, tracker)
+            for i in range(6)
+        ]
+        obj = self.make_obj(step_list, max_workers=2)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(tracker.maximum, 2)
+        self.assertTrue(all(s.called for s in step_list))
+
+    def test_call_empty(self):
+        obj = self.make_obj([])
+
+        result = obj(mock.Mock())
+
+        self.assertEqual(result.state, steps.SUCCESS)
+        self.assertEqual(result.results, [])
+
+    def test_call_fail_fast(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        step_list = [
+            FakeStep('step0', steps.StepResult(state=steps.SUCCESS), 0.1),
+            FakeStep('step1', steps.StepResult(state=steps.FAILURE,
+                                               msg='failed')),
+            FakeStep('step2', steps.StepResult(state=steps.SUCCESS)),
+            FakeStep('step3', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        obj = self.make_obj(step_list, max_workers=2)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.ignore, False)
+        self.assertFalse(result)
+        self.assertEqual(result.msg,
+                         '1 of 4 sub-steps failed (step1: failed)')
+        self.assertEqual(result.results[:2],
+                         [step_list[0].result, step_list[1].result])
+        self.assertEqual([r.state for r in result.results[2:]],
+                         [steps.SKIPPED, steps.SKIPPED])
+        self.assertTrue(step_list[0].called)
+        self.assertFalse(step_list[2].called)
+        self.assertFalse(step_list[3].called)
+
+    def test_call_complete_all(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        step_list = [
+            FakeStep('step0', steps.StepResult(state=steps.SUCCESS), 0.1),
+            FakeStep('step1', steps.StepResult(state=steps.FAILURE)),
+            FakeStep('step2', steps.StepResult(state=steps.ERROR,
+                                               msg='broken')),
+            FakeStep('step3', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        obj = self.make_obj(step_list, max_workers=2, fail_fast=False)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.ERROR)
+        self.assertFalse(result)
+        self.assertEqual(result.msg, '2 of 4 sub-steps failed '
+                         '(step1: FAILURE; step2: broken)')
+        self.assertEqual(result.results, [s.result for s in step_list])
+        self.assertTrue(all(s.called for s in step_list))
+
+    def test_call_ignored(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        step_list = [
+            FakeStep('step0', steps.StepResult(state=steps.SUCCESS)),
+            FakeStep('step1', steps.StepResult(state=steps.FAILURE,
+                                               ignore=True)),
+            FakeStep('step2', steps.StepResult(state=steps.SUCCESS)),
+        ]
+        obj = self.make_obj(step_list, max_workers=1)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.ignore, True)
+        self.assertTrue(result)
+        self.assertEqual(result.msg, None)
+        self.assertTrue(all(s.called for s in step_list))
+
+    def test_call_partly_ignored(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        step_list = [
+            FakeStep('step0', steps.StepResult(state=steps.FAILURE)),
+            FakeStep('step1', steps.StepResult(state=steps.FAILURE,
+                                               ignore=True)),
+        ]
+        obj = self.make_obj(step_list, max_workers=1, fail_fast=False)
+
+        result = obj(ctxt)
+
+        self.assertEqual(result.ignore, False)
+        self.assertFalse(result)
+        self.assertEqual(result.msg, '1 of 2 sub-steps failed '
+                         '(step0: FAILURE)')
+
+    def test_call_ignore_errors(self):
+        ctxt = mock.Mock(**{'extensions.pre_step.return_value': False})
+        step_list = [
+            FakeStep('step0', steps.StepResult(state=steps.SUCCESS)),
+            FakeStep('step1', steps.StepResult(state=steps.FAILURE)),
+        ]
+        obj = self.make_obj(step_list, max_workers=1)
+        mod = modifiers.IgnoreErrorsModifier(
+            ctxt, 'ignore-errors', True, steps.StepAddress('test.yaml', 0))
+
+        result = steps.Step.invoke(ctxt, obj, [mod])
+
+        self.assertEqual(result.state, steps.FAILURE)
+        self.assertEqual(result.ignore, True)
+        self.assertTrue(result)
+        self.assertEqual(result.msg,
+                         '1 of 2 sub-steps failed (step1: FAILURE)')
@@ -0,0 +1,250 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+import mock
+
+from timid import report
+from timid import steps
+
+
+def make_step(name):
+    step = mock.Mock(step_addr=steps.StepAddress('test.yaml', 0))
+    step.name = name
+    return step
+
+
+class TextTest(unittest.TestCase):
+    def test_none(self):
+        self.assertEqual(report._text(None), None)
+
+    def test_bytes(self):
+        self.assertEqual(report._text(b'caf\xc3\xa9 \xff'), u'caf\xe9 \ufffd')
+
+    def test_text(self):
+        self.assertEqual(report._text(u'text'), u'text')
+
+
+class ReportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'report')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read().decode('utf-8')
+
+
+class JUnitReportTest(ReportTestCase):
+    def parse(self):
+        return ElementTree.parse(self.path).getroot()
+
+    def test_empty(self):
+        report.JUnitReport(self.path)
+
+        root = self.parse()
+        self.assertEqual(root.tag, 'testsuite')
+        self.assertEqual(root.get('tests'), '0')
+        self.assertEqual(root.get('failures'), '0')
+        self.assertEqual(list(root), [])
+
+    def test_add(self):
+        obj = report.JUnitReport(self.path)
+
+        obj.add(None, 'test.yaml step 1', 'one',
+                steps.StepResult(state=steps.SUCCESS), 1.0)
+        obj.add('label', 'test.yaml step 2', 'two',
+                steps.StepResult(state=steps.FAILURE, msg='bad <thing>',
+                                 output={'stdout': b'out\x1b[0m'}), 0.5)
+        obj.add(None, 'test.yaml step 3', 'three',
+                steps.StepResult(state=steps.ERROR, msg='broken'), 0.25)
+        obj.add(None, 'test.yaml step 4', 'four',
+                steps.StepResult(state=steps.SKIPPED), 0.0)
+        obj.add(None, 'test.yaml step 5', 'five',
+                steps.StepResult(state=steps.FAILURE, msg='meh',
+                                 ignore=True), 0.0)
+
+        root = self.parse()
+        self.assertEqual(dict(root.attrib), {
+            'name': 'timid',
+            'tests': '5',
+            'failures': '1',
+            'errors': '1',
+            'skipped': '2',
+            'time': '1.750',
+        })
+        cases = list(root)
+        self.assertEqual([(c.get('classname'), c.get('name'), c.get('time'))
+                          for c in cases], [
+            ('timid', 'test.yaml step 1: one', '1.000'),
+            ('label', 'test.yaml step 2: two', '0.500'),
+            ('timid', 'test.yaml step 3: three', '0.250'),
+            ('timid', 'test.yaml step 4: four', '0.000'),
+            ('timid', 'test.yaml step 5: five', '0.000'),
+        ])
+        self.assertEqual([[(e.tag, e.get('message')) for e in c]
+                          for c in cases], [
+            [],
+            [('failure', 'bad <thing>'), ('system-out', None)],
+            [('error', 'broken')],
+            [('skipped', None)],
+            [('skipped', 'ignored: meh')],
+        ])
+        self.assertEqual(cases[1][1].text, 'out?[0m')
+
+    def test_add_closed(self):
+        obj = report.JUnitReport(self.path)
+        obj.close()
+
+        obj.add(None, 'test.yaml step 1', 'one',
+                steps.StepResult(state=steps.SUCCESS), 1.0)
+
+        self.assertEqual(obj.total, 0)
+        self.assertEqual(self.parse().get('tests'), '0')
+
+
+class TAPReportTest(ReportTestCase):
+    def test_empty(self):
+        report.TAPReport(self.path)
+
+        self.assertEqual(self.read(), 'TAP version 13\n1..0\n')
+
+    def test_add(self):
+        obj = report.TAPReport(self.path)
+
+        obj.add(None, 'test.yaml step 1', 'one',
+                steps.StepResult(state=steps.SUCCESS), 1.0)
+        obj.add('label', 'test.yaml step 2', 'two #2\nlines',
+                steps.StepResult(state=steps.FAILURE, msg='bad "thing"'),
+                0.5)
+        obj.add(None, 'test.yaml step 3', 'three',
+                steps.StepResult(state=steps.ERROR, ignore=True), 0.25)
+        obj.add(None, 'test.yaml step 4', 'four',
+                steps.StepResult(state=steps.SKIPPED), 0.0)
+
+        self.assertEqual(self.read(), '\n'.join([
+            'TAP version 13',
+            'ok 1 - test.yaml step 1: one',
+            '  ---',
+            '  duration_ms: 1000.000',
+            '  ...',
+            'not ok 2 - label: test.yaml step 2: two \\#2 lines',
+            '  ---',
+            '  message: "bad \\"thing\\""',
+            '  severity: fail',
+            '  duration_ms: 500.000',
+            '  ...',
+            'not ok 3 - test.yaml step 3: three # TODO ignored',
+            '  ---',
+            '  severity: error',
+            '  duration_ms: 250.000',
+            '  ...',
+            'ok 4 - test.yaml step 4: four # SKIP',
+            '  ---',
+            '  duration_ms: 0.000',
+            '  ...',
+            '1..4',
+            '',
+        ]))
+
+
+class ReportExtensionTest(unittest.TestCase):
+    def parse(self, *argv):
+        parser = argparse.ArgumentParser()
+        report.ReportExtension.prepare(parser)
+        return parser.parse_args(argv)
+
+    def test_prepare(self):
+        args = self.parse()
+        self.assertEqual(args.junit_xml, None)
+        self.assertEqual(args.tap, None)
+
+        args = self.parse('--junit-xml', 'a.xml', '--tap', 'b.tap')
+        self.assertEqual(args.junit_xml, 'a.xml')
+        self.assertEqual(args.tap, 'b.tap')
+
+    def test_activate_inactive(self):
+        result = report.ReportExtension.activate('ctxt', self.parse())
+
+        self.assertEqual(result, None)
+
+    @mock.patch.object(report, 'JUnitReport')
+    @mock.patch.object(report, 'TAPReport')
+    def test_activate_junit(self, mock_TAPReport, mock_JUnitReport):
+        result = report.ReportExtension.activate(
+            'ctxt', self.parse('--junit-xml', 'a.xml'))
+
+        self.assertTrue(isinstance(result, report.ReportExtension))
+        self.assertEqual(result.reports, [mock_JUnitReport.return_value])
+        mock_JUnitReport.assert_called_once_with('a.xml')
+        self.assertFalse(mock_TAPReport.called)
+
+    @mock.patch.object(report, 'JUnitReport')
+    @mock.patch.object(report, 'TAPReport')
+    def test_activate_both(self, mock_TAPReport, mock_JUnitReport):
+        result = report.ReportExtension.activate(
+            'ctxt', self.parse('--junit-xml', 'a.xml', '--tap', 'b.tap'))
+
+        self.assertEqual(result.reports, [
+            mock_JUnitReport.return_value,
+            mock_TAPReport.return_value,
+        ])
+        mock_TAPReport.assert_called_once_with('b.tap')
+
+    @mock.patch.object(report.utils, 'monotonic', side_effect=[2.0, 5.0])
+    def test_pre_post_step(self, mock_monotonic):
+        ctxt = mock.Mock(label='label')
+        step = make_step('step')
+        rep = mock.Mock()
+        result = steps.StepResult(state=steps.SUCCESS)
+        obj = report.ReportExtension([rep])
+
+        self.assertEqual(obj.pre_step(ctxt, step, 0), None)
+        obj.post_step(ctxt, step, 0, result)
+
+        self.assertEqual(obj._running, {})
+        rep.add.assert_called_once_with(
+            'label', 'test.yaml step 1', 'step', result, 3.0)
+
+    @mock.patch.object(report.utils, 'monotonic', return_value=5.0)
+    def test_post_step_unknown(self, mock_monotonic):
+        ctxt = mock.Mock(label=None)
+        rep = mock.Mock()
+        result = steps.StepResult(state=steps.SUCCESS)
+        obj = report.ReportExtension([rep])
+
+        obj.post_step(ctxt, make_step('step'), 0, result)
+
+        rep.add.assert_called_once_with(
+            None, 'test.yaml step 1', 'step', result, 0.0)
+
+    def test_finalize(self):
+        reps = [mock.Mock(), mock.Mock()]
+        obj = report.ReportExtension(reps)
+
+        result = obj.finalize('ctxt', 'result')
+
+        self.assertEqual(result, 'result')
+        for rep in reps:
+            rep.close.assert_called_once_with()
@@ -14,12 +14,16 @@
 #    governing permissions and limitations under the License.
 
 import os
+import shutil
+import sys
+import tempfile
 import unittest
 
 import mock
 import six
 from six.moves import builtins
 
+from timid import context
 from timid import entry
 from timid import steps
 
@@ -49,14 +53,16 @@ class StepAddressTest(unittest.TestCase):
         self.assertEqual(result.fname, 'fname')
         self.assertEqual(result.idx, 3)
         self.assertEqual(result.key, None)
+        self.assertEqual(result.parent, None)
         self.assertEqual(result._str, None)
 
     def test_init_alt(self):
-        result = steps.StepAddress('fname', 3, 'key')
+        result = steps.StepAddress('fname', 3, 'key', 'parent')
 
         self.assertEqual(result.fname, 'fname')
         self.assertEqual(result.idx, 3)
         self.assertEqual(result.key, 'key')
+        self.assertEqual(result.parent, 'parent')
         self.assertEqual(result._str, None)
 
     def test_str_cached(self):
@@ -78,6 +84,21 @@ class StepAddressTest(unittest.TestCase):
         self.assertEqual(six.text_type(addr), 'fname[key] step 4')
         self.assertEqual(addr._str, 'fname[key] step 4')
 
+    def test_str_uncached_parent(self):
+        parent = steps.StepAddress('fname', 3, 'key')
+        addr = steps.StepAddress('fname', 1, 'key', parent)
+
+        self.assertEqual(six.text_type(addr), 'fname[key] step 4 sub-step 2')
+        self.assertEqual(addr._str, 'fname[key] step 4 sub-step 2')
+
+    def test_str_uncached_included(self):
+        parent = steps.StepAddress('fname', 3)
+        addr = steps.StepAddress('other', 1, 'key', parent)
+
+        self.assertEqual(six.text_type(addr),
+                         'fname step 4: other[key] step 2')
+        self.assertEqual(addr._str, 'fname step 4: other[key] step 2')
+
 
 class StepPartForTest(steps.StepPart):
     schema = 'schema'
@@ -162,114 +183,220 @@ class ActionForTest(object):
 
 
 class StepTest(unittest.TestCase):
+    def make_ctxt(self, cached=None, parsed=None):
+        return mock.Mock(plan_cache=mock.Mock(**{
+            'digest.return_value': 'digest',
+            'get.return_value': cached,
+        }), parse_cache=mock.Mock(**{
+            'get.return_value': parsed,
+            'enter.return_value': None,
+            'identity.return_value': 'ident',
+        }))
+
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load', side_effect=TestingException("couldn't read"))
-    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k:
+    @mock.patch('timid.utils.yaml_load',
+                side_effect=TestingException("couldn't read"))
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
                        '%s[%s]:%s' % (f, k or '', i))
     @mock.patch.object(steps.Step, 'parse_step', return_value=[])
     def test_parse_file_unreadable(self, mock_parse_step, mock_StepAddress,
                                    mock_load, mock_open):
-        filemock = mock.MagicMock()
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
         filemock.__enter__.return_value = filemock
         mock_open.return_value = filemock
+        ctxt = self.make_ctxt()
 
         self.assertRaises(steps.ConfigError, steps.Step.parse_file,
-                          'ctxt', 'fname')
-        mock_open.assert_called_once_with('fname')
-        mock_load.assert_called_once_with(filemock)
+                          ctxt, 'fname')
+        mock_open.assert_called_once_with('fname', 'rb')
+        mock_load.assert_called_once_with('content')
         self.assertFalse(mock_StepAddress.called)
         self.assertFalse(mock_parse_step.called)
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load', return_value={})
-    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k:
+    @mock.patch('timid.utils.yaml_load', return_value={})
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
                        '%s[%s]:%s' % (f, k or '', i))
     @mock.patch.object(steps.Step, 'parse_step', return_value=[])
     def test_parse_file_badlist(self, mock_parse_step, mock_StepAddress,
                                 mock_load, mock_open):
-        filemock = mock.MagicMock()
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
         filemock.__enter__.return_value = filemock
         mock_open.return_value = filemock
+        ctxt = self.make_ctxt()
 
         self.assertRaises(steps.ConfigError, steps.Step.parse_file,
-                          'ctxt', 'fname')
-        mock_open.assert_called_once_with('fname')
-        mock_load.assert_called_once_with(filemock)
+                          ctxt, 'fname')
+        mock_open.assert_called_once_with('fname', 'rb')
+        mock_load.assert_called_once_with('content')
         self.assertFalse(mock_StepAddress.called)
         self.assertFalse(mock_parse_step.called)
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load', return_value=[])
-    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k:
+    @mock.patch('timid.utils.yaml_load', return_value=[])
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
                        '%s[%s]:%s' % (f, k or '', i))
     @mock.patch.object(steps.Step, 'parse_step', return_value=[])
     def test_parse_file_baddict(self, mock_parse_step, mock_StepAddress,
                                 mock_load, mock_open):
-        filemock = mock.MagicMock()
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
         filemock.__enter__.return_value = filemock
         mock_open.return_value = filemock
+        ctxt = self.make_ctxt()
 
         self.assertRaises(steps.ConfigError, steps.Step.parse_file,
-                          'ctxt', 'fname', 'key')
-        mock_open.assert_called_once_with('fname')
-        mock_load.assert_called_once_with(filemock)
+                          ctxt, 'fname', 'key')
+        mock_open.assert_called_once_with('fname', 'rb')
+        mock_load.assert_called_once_with('content')
         self.assertFalse(mock_StepAddress.called)
         self.assertFalse(mock_parse_step.called)
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load', return_value=['step0', 'step1', 'step2'])
-    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k:
+    @mock.patch('timid.utils.yaml_load',
+                return_value=['step0', 'step1', 'step2'])
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
                        '%s[%s]:%s' % (f, k or '', i))
     @mock.patch.object(steps.Step, 'parse_step', return_value=['steps'])
     def test_parse_file_list(self, mock_parse_step, mock_StepAddress,
                              mock_load, mock_open):
-        filemock = mock.MagicMock()
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
         filemock.__enter__.return_value = filemock
         mock_open.return_value = filemock
+        ctxt = self.make_ctxt()
 
-        result = steps.Step.parse_file('ctxt', 'fname')
+        result = steps.Step.parse_file(ctxt, 'fname')
 
         self.assertEqual(result, ['steps', 'steps', 'steps'])
-        mock_open.assert_called_once_with('fname')
-        mock_load.assert_called_once_with(filemock)
+        mock_open.assert_called_once_with('fname', 'rb')
+        mock_load.assert_called_once_with('content')
         mock_StepAddress.assert_has_calls([
-            mock.call('fname', i, None) for i in range(3)
+            mock.call('fname', i, None, None) for i in range(3)
         ])
         self.assertEqual(mock_StepAddress.call_count, 3)
         mock_parse_step.assert_has_calls([
-            mock.call('ctxt', 'fname[]:%d' % i, 'step%d' % i)
+            mock.call(ctxt, 'fname[]:%d' % i, 'step%d' % i)
             for i in range(3)
         ])
         self.assertEqual(mock_parse_step.call_count, 3)
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load', return_value={
+    @mock.patch('timid.utils.yaml_load', return_value={
         'key': ['step0', 'step1', 'step2'],
         'bad': ['bad0', 'bad1', 'bad2'],
     })
-    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k:
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
                        '%s[%s]:%s' % (f, k or '', i))
     @mock.patch.object(steps.Step, 'parse_step', return_value=['steps'])
-    def test_parse_file_list(self, mock_parse_step, mock_StepAddress,
-                             mock_load, mock_open):
-        filemock = mock.MagicMock()
+    def test_parse_file_key(self, mock_parse_step, mock_StepAddress,
+                            mock_load, mock_open):
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
         filemock.__enter__.return_value = filemock
         mock_open.return_value = filemock
+        ctxt = self.make_ctxt()
 
-        result = steps.Step.parse_file('ctxt', 'fname', 'key')
+        result = steps.Step.parse_file(ctxt, 'fname', 'key')
 
         self.assertEqual(result, ['steps', 'steps', 'steps'])
-        mock_open.assert_called_once_with('fname')
-        mock_load.assert_called_once_with(filemock)
+        mock_open.assert_called_once_with('fname', 'rb')
+        mock_load.assert_called_once_with('content')
         mock_StepAddress.assert_has_calls([
-            mock.call('fname', i, 'key') for i in range(3)
+            mock.call('fname', i, 'key', None) for i in range(3)
         ])
         self.assertEqual(mock_StepAddress.call_count, 3)
         mock_parse_step.assert_has_calls([
-            mock.call('ctxt', 'fname[key]:%d' % i, 'step%d' % i)
+            mock.call(ctxt, 'fname[key]:%d' % i, 'step%d' % i)
+            for i in range(3)
+        ])
+        self.assertEqual(mock_parse_step.call_count, 3)
+        ctxt.plan_cache.digest.assert_called_once_with('content', 'key')
+        ctxt.plan_cache.get.assert_called_once_with('digest')
+        ctxt.plan_cache.put.assert_called_once_with(
+            'digest', ['step0', 'step1', 'step2'])
+        ctxt.parse_cache.get.assert_called_once_with('fname', 'key')
+        ctxt.parse_cache.put.assert_called_once_with(
+            'fname', 'key', ['step0', 'step1', 'step2'], 'ident')
+
+    @mock.patch.object(builtins, 'open')
+    @mock.patch('timid.utils.yaml_load')
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
+                       '%s[%s]:%s' % (f, k or '', i))
+    @mock.patch.object(steps.Step, 'parse_step', return_value=['steps'])
+    @mock.patch('timid.utils.skip_validation')
+    def test_parse_file_cached(self, mock_skip_validation, mock_parse_step,
+                               mock_StepAddress, mock_load, mock_open):
+        filemock = mock.MagicMock(**{'read.return_value': 'content'})
+        filemock.__enter__.return_value = filemock
+        mock_open.return_value = filemock
+        ctxt = self.make_ctxt(['step0', 'step1', 'step2'])
+
+        result = steps.Step.parse_file(ctxt, 'fname', 'key')
+
+        self.assertEqual(result, ['steps', 'steps', 'steps'])
+        mock_open.assert_called_once_with('fname', 'rb')
+        self.assertFalse(mock_load.called)
+        mock_skip_validation.assert_called_once_with(True)
+        mock_parse_step.assert_has_calls([
+            mock.call(ctxt, 'fname[key]:%d' % i, 'step%d' % i)
             for i in range(3)
         ])
         self.assertEqual(mock_parse_step.call_count, 3)
+        ctxt.plan_cache.digest.assert_called_once_with('content', 'key')
+        ctxt.plan_cache.get.assert_called_once_with('digest')
+        self.assertFalse(ctxt.plan_cache.put.called)
+        ctxt.parse_cache.put.assert_called_once_with(
+            'fname', 'key', ['step0', 'step1', 'step2'], 'ident')
+
+    @mock.patch.object(builtins, 'open')
+    @mock.patch.object(steps, 'StepAddress', side_effect=lambda f, i, k, p:
+                       '%s[%s]:%s' % (f, k or '', i))
+    @mock.patch.object(steps.Step, 'parse_step', return_value=['steps'])
+    @mock.patch('timid.utils.skip_validation')
+    def test_parse_file_parsed(self, mock_skip_validation, mock_parse_step,
+                               mock_StepAddress, mock_open):
+        ctxt = self.make_ctxt(parsed=['step0', 'step1'])
+
+        result = steps.Step.parse_file(ctxt, 'fname', 'key')
+
+        self.assertEqual(result, ['steps', 'steps'])
+        ctxt.parse_cache.get.assert_called_once_with('fname', 'key')
+        mock_skip_validation.assert_called_once_with(True)
+        mock_parse_step.assert_has_calls([
+            mock.call(ctxt, 'fname[key]:%d' % i, 'step%d' % i)
+            for i in range(2)
+        ])
+        self.assertFalse(mock_open.called)
+        self.assertFalse(ctxt.plan_cache.get.called)
+        self.assertFalse(ctxt.parse_cache.put.called)
+        ctxt.parse_cache.enter.assert_called_once_with('fname', 'key')
+        ctxt.parse_cache.leave.assert_called_once_with('fname', 'key')
+
+    @mock.patch.object(builtins, 'open')
+    @mock.patch.object(steps.Step, 'parse_step')
+    def test_parse_file_cycle(self, mock_parse_step, mock_open):
+        ctxt = self.make_ctxt()
+        ctxt.parse_cache.enter.return_value = ['a.yaml', 'b.yaml', 'a.yaml']
+
+        with self.assertRaises(steps.ConfigError) as cm:
+            steps.Step.parse_file(ctxt, 'a.yaml', None, 'step_addr')
+
+        self.assertEqual(
+            cm.exception.args[0],
+            'Include cycle detected: a.yaml -> b.yaml -> a.yaml '
+            '(step_addr)')
+        self.assertEqual(cm.exception.step_addr, 'step_addr')
+        ctxt.parse_cache.enter.assert_called_once_with('a.yaml', None)
+        self.assertFalse(ctxt.parse_cache.leave.called)
+        self.assertFalse(mock_open.called)
+        self.assertFalse(mock_parse_step.called)
+
+    @mock.patch.object(builtins, 'open', side_effect=IOError('gone'))
+    def test_parse_file_leave(self, mock_open):
+        ctxt = self.make_ctxt()
+
+        self.assertRaises(steps.ConfigError, steps.Step.parse_file,
+                          ctxt, 'fname', 'key')
+        ctxt.parse_cache.enter.assert_called_once_with('fname', 'key')
+        ctxt.parse_cache.leave.assert_called_once_with('fname', 'key')
 
     @mock.patch.object(entry, 'points', {
         steps.NAMESPACE_ACTION: {
@@ -738,6 +865,59 @@ class StepTest(unittest.TestCase):
             'address', act.return_value, [mod.return_value for mod in mods])
         mock_call.assert_called_once_with('ctxt')
 
+    @mock.patch.object(entry, 'points', {
+        steps.NAMESPACE_ACTION: {
+            'act': mock.Mock(step_action=True),
+        },
+        steps.NAMESPACE_MODIFIER: {},
+    })
+    @mock.patch.object(steps.Step, '__init__', return_value=None)
+    @mock.patch.object(steps.Step, '__call__')
+    def test_parse_step_step_skipped(self, mock_call, mock_init):
+        mock_call.return_value = steps.StepResult(state=steps.SKIPPED)
+
+        result = steps.Step.parse_step('ctxt', 'address', {'act': 'conf'})
+
+        self.assertEqual(result, [])
+
+    @mock.patch.object(entry, 'points', {
+        steps.NAMESPACE_ACTION: {
+            'act': mock.Mock(step_action=True),
+        },
+        steps.NAMESPACE_MODIFIER: {},
+    })
+    @mock.patch.object(steps.Step, '__init__', return_value=None)
+    @mock.patch.object(steps.Step, '__call__')
+    def test_parse_step_step_failed(self, mock_call, mock_init):
+        mock_call.return_value = steps.StepResult(state=steps.FAILURE,
+                                                  msg='oops')
+
+        with self.assertRaises(steps.ConfigError) as cm:
+            steps.Step.parse_step('ctxt', 'address', {'act': 'conf'})
+
+        self.assertEqual(
+            cm.exception.args[0],
+            'Bad step configuration: step action "act" failed: oops '
+            '(address)')
+
+    @mock.patch.object(entry, 'points', {
+        steps.NAMESPACE_ACTION: {
+            'act': mock.Mock(step_action=True),
+        },
+        steps.NAMESPACE_MODIFIER: {},
+    })
+    @mock.patch.object(steps.Step, '__init__', return_value=None)
+    @mock.patch.object(steps.Step, '__call__')
+    def test_parse_step_step_exception(self, mock_call, mock_init):
+        try:
+            raise steps.ConfigError('bad include')
+        except steps.ConfigError:
+            mock_call.return_value = steps.StepResult(
+                exc_info=sys.exc_info())
+
+        self.assertRaises(steps.ConfigError, steps.Step.parse_step,
+                          'ctxt', 'address', {'act': 'conf'})
+
     def test_init_base(self):
         action = ActionForTest()
 
@@ -863,6 +1043,30 @@ class StepTest(unittest.TestCase):
         action.assert_called_once_with('ctxt')
         self.assertFalse(mock_StepResult.called)
 
+    @mock.patch.object(steps, 'StepResult')
+    def test_invoke_start(self, mock_StepResult):
+        action = mock.Mock(return_value='result')
+        mods = [mock.Mock(**{
+            'pre_call.return_value': None,
+            'post_call.side_effect': lambda x, r, a, m_l, m_e: r,
+        }) for i in range(4)]
+
+        result = steps.Step.invoke('ctxt', action, mods, 2)
+
+        self.assertEqual(result, 'result')
+        action.assert_called_once_with('ctxt')
+        for i, mod in enumerate(mods):
+            if i >= 2:
+                mod.assert_has_calls([
+                    mock.call.pre_call('ctxt', mods[:i], mods[i + 1:], action),
+                    mock.call.post_call(
+                        'ctxt', result, action, mods[i + 1:], mods[:i]),
+                ])
+                self.assertEqual(len(mod.method_calls), 2)
+            else:
+                self.assertEqual(len(mod.method_calls), 0)
+        self.assertFalse(mock_StepResult.called)
+
 
 class StepResultTest(unittest.TestCase):
     def test_init_base(self):
@@ -872,15 +1076,18 @@ class StepResultTest(unittest.TestCase):
         self.assertEqual(result.exc_info, None)
         self.assertEqual(result.returncode, None)
         self.assertEqual(result.results, [])
+        self.assertEqual(result.output, {})
         self.assertEqual(result.state, None)
         self.assertEqual(result._ignore, None)
 
     def test_init_alt(self):
         result = steps.StepResult(
             state='state', msg='msg', ignore='ignore', returncode=1,
-            exc_info=('type', 'val', 'tb'), results=['res1', 'res2', 'res3'])
+            exc_info=('type', 'val', 'tb'), results=['res1', 'res2', 'res3'],
+            output={'stdout': b'out'})
 
         self.assertEqual(result.msg, 'msg')
+        self.assertEqual(result.output, {'stdout': b'out'})
         self.assertEqual(result.exc_info, ('type', 'val', 'tb'))
         self.assertEqual(result.returncode, 1)
         self.assertEqual(result.results, ['res1', 'res2', 'res3'])
@@ -1142,7 +1349,7 @@ class SensitiveDictActionTest(unittest.TestCase):
         mock_dirname.assert_called_once_with('file/name')
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load')
+    @mock.patch('timid.utils.yaml_load')
     @mock.patch('timid.utils.canonicalize_path', side_effect=lambda x, y: y)
     @mock.patch.object(os.path, 'dirname', return_value='/root/dir')
     @mock.patch.object(steps.Action, '__init__', return_value=None)
@@ -1164,7 +1371,7 @@ class SensitiveDictActionTest(unittest.TestCase):
             if not isinstance(fhmock, Exception):
                 fhmock.__enter__.return_value = fhmock
                 fhmock.__exit__.return_value = False
-        mock_open.side_effect = lambda x: files[x]
+        mock_open.side_effect = lambda x, mode: files[x]
         ctxt = mock.Mock(**{
             'template.side_effect': lambda x: (lambda y: x),
             'attr': {'a': 1, 'b': 3, 'c': 5, 'd': 7, 'e': 9},
@@ -1184,7 +1391,7 @@ class SensitiveDictActionTest(unittest.TestCase):
         self.assertEqual(ctxt.attr, {'a': 5, 'b': 7, 'e': 9, 'f': 12, 'g': 13})
 
     @mock.patch.object(builtins, 'open')
-    @mock.patch('yaml.load')
+    @mock.patch('timid.utils.yaml_load')
     @mock.patch('timid.utils.canonicalize_path', side_effect=lambda x, y: y)
     @mock.patch.object(os.path, 'dirname', return_value='/root/dir')
     @mock.patch.object(steps.Action, '__init__', return_value=None)
@@ -1288,7 +1495,7 @@ class IncludeActionTest(unittest.TestCase):
         obj.dirname = 'dirname'
         obj.path = mock.Mock(return_value=path)
         obj.key = mock.Mock(return_value=key)
-        obj.step_addr = 'step_addr'
+        obj.step_addr = steps.StepAddress('test.yaml', 0, parent='parent')
         obj.start = start
         obj.stop = stop
 
@@ -1308,7 +1515,7 @@ class IncludeActionTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with('dirname', 'some/path')
         obj.key.assert_called_once_with('ctxt')
         mock_parse_file.assert_called_once_with(
-            'ctxt', 'dirname/some/path', None, 'step_addr')
+            'ctxt', 'dirname/some/path', None, obj.step_addr, 'parent')
 
     @mock.patch('timid.utils.canonicalize_path',
                 side_effect=lambda x, y: '%s/%s' % (x, y))
@@ -1324,7 +1531,7 @@ class IncludeActionTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with('dirname', 'some/path')
         obj.key.assert_called_once_with('ctxt')
         mock_parse_file.assert_called_once_with(
-            'ctxt', 'dirname/some/path', 'key', 'step_addr')
+            'ctxt', 'dirname/some/path', 'key', obj.step_addr, 'parent')
 
     @mock.patch('timid.utils.canonicalize_path',
                 side_effect=lambda x, y: '%s/%s' % (x, y))
@@ -1340,7 +1547,7 @@ class IncludeActionTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with('dirname', 'some/path')
         obj.key.assert_called_once_with('ctxt')
         mock_parse_file.assert_called_once_with(
-            'ctxt', 'dirname/some/path', None, 'step_addr')
+            'ctxt', 'dirname/some/path', None, obj.step_addr, 'parent')
 
     @mock.patch('timid.utils.canonicalize_path',
                 side_effect=lambda x, y: '%s/%s' % (x, y))
@@ -1356,7 +1563,7 @@ class IncludeActionTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with('dirname', 'some/path')
         obj.key.assert_called_once_with('ctxt')
         mock_parse_file.assert_called_once_with(
-            'ctxt', 'dirname/some/path', None, 'step_addr')
+            'ctxt', 'dirname/some/path', None, obj.step_addr, 'parent')
 
     @mock.patch('timid.utils.canonicalize_path',
                 side_effect=lambda x, y: '%s/%s' % (x, y))
@@ -1372,4 +1579,104 @@ class IncludeActionTest(unittest.TestCase):
         mock_canonicalize_path.assert_called_once_with('dirname', 'some/path')
         obj.key.assert_called_once_with('ctxt')
         mock_parse_file.assert_called_once_with(
-            'ctxt', 'dirname/some/path', None, 'step_addr')
+            'ctxt', 'dirname/some/path', None, obj.step_addr, 'parent')
+
+
+class IncludeFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        # Use a private entrypoint cache, leaving the global one pristine
+        patcher = mock.patch.object(entry, 'points', entry.EntrypointCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, fname, content):
+        path = os.path.join(self.tmpdir, fname)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_diamond(self):
+        self.write('common.yaml', '- run: echo common\n')
+        self.write('left.yaml', '- include: common.yaml\n')
+        self.write('right.yaml', '- include: common.yaml\n')
+        path = self.write('top.yaml', '- include: left.yaml\n'
+                          '- include: right.yaml\n')
+        ctxt = context.Context()
+
+        with mock.patch.object(steps.Step, '_load_steps',
+                               wraps=steps.Step._load_steps) as mock_load:
+            result = steps.Step.parse_file(ctxt, path)
+
+        self.assertEqual(len(result), 2)
+        self.assertNotEqual(id(result[0]), id(result[1]))
+        self.assertNotEqual(id(result[0].step_addr), id(result[1].step_addr))
+        self.assertNotEqual(id(result[0].action), id(result[1].action))
+        self.assertEqual(mock_load.call_count, 4)
+        self.assertEqual(len(ctxt.parse_cache), 4)
+
+    def test_group_include(self):
+        self.write('lib.yaml', '- run: echo one\n'
+                   '- include: nested.yaml\n')
+        self.write('nested.yaml', '- run: echo two\n')
+        path = self.write('top.yaml', '- parallel:\n'
+                          '  - run: echo zero\n'
+                          '  - include: lib.yaml\n')
+        ctxt = context.Context()
+
+        result = steps.Step.parse_file(ctxt, path)
+
+        group = result[0].step_addr
+        sub_steps = result[0].action.steps
+        self.assertEqual(len(sub_steps), 3)
+        for step in sub_steps:
+            self.assertIs(step.step_addr.parent, group)
+        self.assertEqual(
+            [six.text_type(step.step_addr) for step in sub_steps], [
+                '%s sub-step 1' % group,
+                '%s: %s step 1' % (group, os.path.join(self.tmpdir,
+                                                       'lib.yaml')),
+                '%s: %s step 1' % (group, os.path.join(self.tmpdir,
+                                                       'nested.yaml')),
+            ])
+
+    def test_changed(self):
+        path = self.write('test.yaml', '- run: echo one\n')
+        ctxt = context.Context()
+        first = steps.Step.parse_file(ctxt, path)
+        self.write('test.yaml', '- run: echo one\n- run: echo two\n')
+
+        result = steps.Step.parse_file(ctxt, path)
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(result), 2)
+
+    def test_cycle(self):
+        self.write('a.yaml', '- include: b.yaml\n')
+        self.write('b.yaml', '- include: c.yaml\n')
+        self.write('c.yaml', '- include: a.yaml\n')
+        path = os.path.join(self.tmpdir, 'a.yaml')
+        ctxt = context.Context()
+
+        with self.assertRaises(steps.ConfigError) as cm:
+            steps.Step.parse_file(ctxt, path)
+
+        names = [os.path.join(self.tmpdir, n)
+                 for n in ('a.yaml', 'b.yaml', 'c.yaml', 'a.yaml')]
+        self.assertEqual(
+            cm.exception.args[0].split(' (')[0],
+            'Include cycle detected: %s' % ' -> '.join(names))
+        self.assertEqual(ctxt.parse_cache._local.stack, [])
+
+    def test_self_include_other_key(self):
+        path = self.write('test.yaml', 'main:\n'
+                          '- include: {path: test.yaml, key: lib}\n'
+                          'lib:\n'
+                          '- run: echo lib\n')
+        ctxt = context.Context()
+
+        result = steps.Step.parse_file(ctxt, path, 'main')
+
+        self.assertEqual(len(result), 1)
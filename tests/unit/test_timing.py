@@ -0,0 +1,224 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import argparse
+import json
+import unittest
+
+import mock
+
+from timid import steps
+from timid import timing
+
+
+def make_step(name, fname='test.yaml', idx=0, parent=None):
+    step = mock.Mock(step_addr=steps.StepAddress(fname, idx, parent=parent))
+    step.name = name
+    return step
+
+
+class StepTimingTest(unittest.TestCase):
+    def test_init(self):
+        step = make_step('step', idx=2)
+
+        result = timing.StepTiming('label', 2, step, 5.0)
+
+        self.assertEqual(result.label, 'label')
+        self.assertEqual(result.idx, 2)
+        self.assertEqual(result.name, 'step')
+        self.assertEqual(result.address, 'test.yaml step 3')
+        self.assertEqual(result.sub_step, False)
+        self.assertEqual(result.start, 5.0)
+        self.assertEqual(result.duration, None)
+        self.assertEqual(result.state, None)
+
+    def test_init_sub_step(self):
+        parent = steps.StepAddress('test.yaml', 1)
+        step = make_step('step', parent=parent)
+
+        result = timing.StepTiming('label', 0, step, 5.0)
+
+        self.assertEqual(result.address, 'test.yaml step 2 sub-step 1')
+        self.assertEqual(result.sub_step, True)
+
+    def test_to_dict(self):
+        obj = timing.StepTiming('label', 2, make_step('step', idx=2), 5.0)
+        obj.duration = 1.5
+        obj.state = steps.FAILURE
+
+        result = obj.to_dict(3.0)
+
+        self.assertEqual(result, {
+            'test': 'label',
+            'index': 2,
+            'name': 'step',
+            'address': 'test.yaml step 3',
+            'state': 'FAILURE',
+            'start': 2.0,
+            'duration': 1.5,
+        })
+
+
+class TimingExtensionTest(unittest.TestCase):
+    def parse(self, *argv):
+        parser = argparse.ArgumentParser()
+        timing.TimingExtension.prepare(parser)
+        return parser.parse_args(argv)
+
+    def test_prepare(self):
+        self.assertEqual(self.parse().timing, None)
+        self.assertEqual(self.parse('--timing').timing, 10)
+        self.assertEqual(self.parse('--timing', '3').timing, 3)
+        self.assertEqual(self.parse('--timing-json', 'f').timing_json, 'f')
+
+    def test_activate_inactive(self):
+        result = timing.TimingExtension.activate('ctxt', self.parse())
+
+        self.assertEqual(result, None)
+
+    def test_activate_timing(self):
+        result = timing.TimingExtension.activate(
+            'ctxt', self.parse('--timing', '3'))
+
+        self.assertTrue(isinstance(result, timing.TimingExtension))
+        self.assertEqual(result.limit, 3)
+        self.assertEqual(result.json_file, None)
+
+    def test_activate_json(self):
+        result = timing.TimingExtension.activate(
+            'ctxt', self.parse('--timing-json', 'out.json'))
+
+        self.assertTrue(isinstance(result, timing.TimingExtension))
+        self.assertEqual(result.limit, 0)
+        self.assertEqual(result.json_file, 'out.json')
+
+    @mock.patch.object(timing.utils, 'monotonic', side_effect=[1.0, 2.0, 5.0])
+    def test_pre_post_step(self, mock_monotonic):
+        ctxt = mock.Mock(label='label')
+        step = make_step('step')
+        obj = timing.TimingExtension(10)
+
+        self.assertEqual(obj.pre_step(ctxt, step, 0), None)
+        obj.post_step(ctxt, step, 0, steps.StepResult(state=steps.SKIPPED))
+
+        self.assertEqual(obj._running, {})
+        self.assertEqual(len(obj.timings[ctxt]), 1)
+        result = obj.timings[ctxt][0]
+        self.assertEqual(result.label, 'label')
+        self.assertEqual(result.start, 2.0)
+        self.assertEqual(result.duration, 3.0)
+        self.assertEqual(result.state, steps.SKIPPED)
+
+    def test_post_step_unknown(self):
+        obj = timing.TimingExtension(10)
+
+        obj.post_step('ctxt', make_step('step'), 0,
+                      steps.StepResult(state=steps.SUCCESS))
+
+        self.assertEqual(obj.timings, {})
+
+    def add_timing(self, obj, ctxt, name, duration, state=steps.SUCCESS,
+                   parent=None):
+        idx = len(obj.timings.get(ctxt, []))
+        tm = timing.StepTiming(ctxt.label, idx,
+                               make_step(name, idx=idx, parent=parent), 0.0)
+        tm.duration = duration
+        tm.state = state
+        obj.timings.setdefault(ctxt, []).append(tm)
+
+    def test_finalize_table(self):
+        ctxt = mock.Mock(label=None, timings={'parse': 0.5,
+                                              'read_steps': 0.25})
+        obj = timing.TimingExtension(2)
+        self.add_timing(obj, ctxt, 'fast', 1.0)
+        self.add_timing(obj, ctxt, 'slow', 3.0, steps.FAILURE)
+        self.add_timing(obj, ctxt, 'sub', 2.0,
+                        parent=steps.StepAddress('test.yaml', 1))
+        self.add_timing(obj, ctxt, 'running', None)
+
+        result = obj.finalize(ctxt, 'result')
+
+        self.assertEqual(result, 'result')
+        ctxt.emit.assert_has_calls([
+            mock.call('Timing: 2 steps in 4.000s; parse 0.500s, '
+                      'read_steps 0.250s'),
+            mock.call('Slowest 2 steps:'),
+            mock.call('      3.000s  FAILURE  slow (test.yaml step 2)'),
+            mock.call('      2.000s  SUCCESS  sub '
+                      '(test.yaml step 2 sub-step 3)'),
+        ])
+        self.assertEqual(ctxt.emit.call_count, 4)
+
+    def test_finalize_no_steps(self):
+        ctxt = mock.Mock(label=None, timings={})
+        obj = timing.TimingExtension(2)
+
+        obj.finalize(ctxt, 'result')
+
+        ctxt.emit.assert_called_once_with(
+            'Timing: 0 steps in 0.000s; parse 0.000s, read_steps 0.000s')
+
+    @mock.patch.object(timing.utils, 'atomic_write')
+    def test_finalize_json(self, mock_atomic_write):
+        ctxt1 = mock.Mock(label='b', timings={'parse': 0.5,
+                                              'read_steps': 0.25})
+        ctxt2 = mock.Mock(label='a', timings={'parse': 1.5,
+                                              'read_steps': 1.25})
+        obj = timing.TimingExtension(0, 'out.json')
+        obj.origin = 0.0
+        self.add_timing(obj, ctxt1, 'step1', 1.0)
+        self.add_timing(obj, ctxt2, 'step2', 2.0, steps.ERROR)
+
+        obj.finalize(ctxt1, 'result')
+        obj.finalize(ctxt2, 'result')
+
+        self.assertFalse(ctxt1.emit.called)
+        self.assertFalse(ctxt2.emit.called)
+        self.assertEqual(mock_atomic_write.call_count, 2)
+        fname, data = mock_atomic_write.call_args[0]
+        self.assertEqual(fname, 'out.json')
+        self.assertEqual(json.loads(data.decode('utf-8')), {
+            'version': 1,
+            'tests': [
+                {
+                    'test': 'a',
+                    'parse': 1.5,
+                    'read_steps': 1.25,
+                    'steps': [{
+                        'test': 'a',
+                        'index': 0,
+                        'name': 'step2',
+                        'address': 'test.yaml step 1',
+                        'state': 'ERROR',
+                        'start': 0.0,
+                        'duration': 2.0,
+                    }],
+                },
+                {
+                    'test': 'b',
+                    'parse': 0.5,
+                    'read_steps': 0.25,
+                    'steps': [{
+                        'test': 'b',
+                        'index': 0,
+                        'name': 'step1',
+                        'address': 'test.yaml step 1',
+                        'state': 'SUCCESS',
+                        'start': 0.0,
+                        'duration': 1.0,
+                    }],
+                },
+            ],
+        })
@@ -13,11 +13,15 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import jsonschema
 import mock
 import six
+import yaml
 
 from timid import utils
 
@@ -38,12 +42,263 @@ class CanonicalizePathTest(unittest.TestCase):
         mock_abspath.assert_called_once_with('/foo/bar/bar/baz')
 
 
+class YAMLLoadTest(unittest.TestCase):
+    @mock.patch.object(yaml, 'load', return_value='data')
+    def test_loader(self, mock_load):
+        result = utils.yaml_load('stream')
+
+        self.assertEqual(result, 'data')
+        mock_load.assert_called_once_with('stream', Loader=utils._YAMLLoader)
+
+    def test_safe(self):
+        self.assertRaises(yaml.YAMLError, utils.yaml_load,
+                          b'!!python/object/apply:os.system ["true"]')
+
+    def test_error_position(self):
+        try:
+            utils.yaml_load(b'- a\n- b\n- [c\n')
+        except yaml.YAMLError as exc:
+            self.assertTrue('line 4' in six.text_type(exc))
+        else:
+            self.fail('Failed to raise YAMLError')
+
+    def test_data(self):
+        result = utils.yaml_load(b'- run: foo\n- include: {path: bar}\n')
+
+        self.assertEqual(result, [
+            {'run': 'foo'},
+            {'include': {'path': 'bar'}},
+        ])
+
+
+class EnsureDirTest(unittest.TestCase):
+    @mock.patch.object(os.path, 'isdir', return_value=True)
+    @mock.patch.object(os, 'makedirs')
+    def test_exists(self, mock_makedirs, mock_isdir):
+        utils.ensure_dir('/some/dir')
+
+        mock_isdir.assert_called_once_with('/some/dir')
+        self.assertFalse(mock_makedirs.called)
+
+    @mock.patch.object(os.path, 'isdir', return_value=False)
+    @mock.patch.object(os, 'makedirs')
+    def test_create(self, mock_makedirs, mock_isdir):
+        utils.ensure_dir('/some/dir')
+
+        mock_makedirs.assert_called_once_with('/some/dir')
+
+    @mock.patch.object(os.path, 'isdir', side_effect=[False, True])
+    @mock.patch.object(os, 'makedirs', side_effect=OSError())
+    def test_race(self, mock_makedirs, mock_isdir):
+        utils.ensure_dir('/some/dir')
+
+        mock_makedirs.assert_called_once_with('/some/dir')
+        self.assertEqual(mock_isdir.call_count, 2)
+
+    @mock.patch.object(os.path, 'isdir', return_value=False)
+    @mock.patch.object(os, 'makedirs', side_effect=OSError())
+    def test_failure(self, mock_makedirs, mock_isdir):
+        self.assertRaises(OSError, utils.ensure_dir, '/some/dir')
+
+
+class DefaultCacheDirTest(unittest.TestCase):
+    @mock.patch.dict(os.environ, clear=True, TIMID_CACHE_DIR='/cache',
+                     XDG_CACHE_HOME='/xdg')
+    def test_explicit(self):
+        self.assertEqual(utils.default_cache_dir(), '/cache')
+
+    @mock.patch.dict(os.environ, clear=True, XDG_CACHE_HOME='/xdg')
+    def test_xdg(self):
+        self.assertEqual(utils.default_cache_dir(), '/xdg/timid')
+
+    @mock.patch.dict(os.environ, clear=True)
+    @mock.patch.object(os.path, 'expanduser', return_value='/home/user')
+    def test_default(self, mock_expanduser):
+        self.assertEqual(utils.default_cache_dir(), '/home/user/.cache/timid')
+        mock_expanduser.assert_called_once_with('~')
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_new_directory(self):
+        path = os.path.join(self.tmpdir, 'a', 'b', 'file')
+
+        utils.atomic_write(path, b'data')
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['file'])
+
+    def test_replace(self):
+        path = os.path.join(self.tmpdir, 'file')
+        with open(path, 'wb') as f:
+            f.write(b'old data')
+
+        utils.atomic_write(path, b'new data')
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'new data')
+        self.assertEqual(os.listdir(self.tmpdir), ['file'])
+
+    @mock.patch.object(os, 'rename', side_effect=OSError('failed'))
+    def test_failure(self, mock_rename):
+        path = os.path.join(self.tmpdir, 'file')
+
+        self.assertRaises(OSError, utils.atomic_write, path, b'data')
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+class LayeredDictTest(unittest.TestCase):
+    def test_init_base(self):
+        result = utils.LayeredDict()
+
+        self.assertEqual(result._parent, None)
+        self.assertEqual(result._data, {})
+        self.assertEqual(result._deleted, set())
+        self.assertEqual(result._frozen, False)
+        self.assertEqual(result._depth, 1)
+        self.assertEqual(result._flat, None)
+
+    def test_init_alt(self):
+        parent = utils.LayeredDict(data={'a': 'one'})
+        data = {'b': 'two'}
+
+        result = utils.LayeredDict(parent, data)
+
+        self.assertEqual(result._parent, parent)
+        self.assertEqual(id(result._data), id(data))
+        self.assertEqual(result._depth, 2)
+
+    def test_lookup(self):
+        obj = utils.LayeredDict({'a': 'one', 'b': 'two', 'c': 'three'},
+                                {'b': 'deux', 'd': 'quatre'})
+        obj._deleted = set(['c'])
+
+        self.assertEqual(obj['a'], 'one')
+        self.assertEqual(obj['b'], 'deux')
+        self.assertEqual(obj['d'], 'quatre')
+        self.assertRaises(KeyError, lambda: obj['c'])
+        self.assertRaises(KeyError, lambda: obj['e'])
+        self.assertTrue('a' in obj)
+        self.assertFalse('c' in obj)
+        self.assertEqual(sorted(obj), ['a', 'b', 'd'])
+        self.assertEqual(len(obj), 3)
+        self.assertEqual(obj, {'a': 'one', 'b': 'deux', 'd': 'quatre'})
+
+    def test_setitem(self):
+        parent = {'a': 'one'}
+        obj = utils.LayeredDict(parent)
+        obj._deleted = set(['a'])
+        obj._flat = 'cached'
+
+        obj['a'] = 'un'
+
+        self.assertEqual(obj._data, {'a': 'un'})
+        self.assertEqual(obj._deleted, set())
+        self.assertEqual(obj._flat, None)
+        self.assertEqual(parent, {'a': 'one'})
+
+    def test_delitem(self):
+        parent = {'a': 'one', 'b': 'two'}
+        obj = utils.LayeredDict(parent, {'b': 'deux', 'c': 'trois'})
+        obj._flat = 'cached'
+
+        def deleter(key):
+            del obj[key]
+
+        del obj['a']
+        del obj['b']
+        del obj['c']
+
+        self.assertRaises(KeyError, deleter, 'a')
+        self.assertRaises(KeyError, deleter, 'd')
+        self.assertEqual(obj._data, {})
+        self.assertEqual(obj._deleted, set(['a', 'b']))
+        self.assertEqual(obj._flat, None)
+        self.assertEqual(obj, {})
+        self.assertEqual(parent, {'a': 'one', 'b': 'two'})
+
+    def test_frozen(self):
+        obj = utils.LayeredDict(data={'a': 'one'})
+        obj._frozen = True
+
+        def setter():
+            obj['b'] = 'two'
+
+        def deleter():
+            del obj['a']
+
+        self.assertRaises(TypeError, setter)
+        self.assertRaises(TypeError, deleter)
+        self.assertEqual(obj._data, {'a': 'one'})
+
+    def test_flatten(self):
+        parent = utils.LayeredDict(data={'a': 'one', 'b': 'two'})
+        obj = utils.LayeredDict(parent, {'c': 'three'})
+        obj._deleted = set(['b'])
+
+        result = obj.flatten()
+
+        self.assertEqual(result, {'a': 'one', 'c': 'three'})
+        self.assertEqual(id(obj.flatten()), id(result))
+        self.assertEqual(parent._flat, {'a': 'one', 'b': 'two'})
+
+    def test_freeze_base(self):
+        obj = utils.LayeredDict({'a': 'one'}, {'b': 'two'})
+
+        result = obj.freeze()
+
+        self.assertEqual(id(result), id(obj))
+        self.assertTrue(obj._frozen)
+
+    def test_freeze_unchanged(self):
+        parent = {'a': 'one'}
+        obj = utils.LayeredDict(parent)
+
+        result = obj.freeze()
+
+        self.assertEqual(id(result), id(parent))
+        self.assertFalse(obj._frozen)
+
+    def test_copy(self):
+        parent = utils.LayeredDict(data={'a': 'one', 'b': 'two'}).freeze()
+        obj = utils.LayeredDict(parent, {'c': 'three'})
+        del obj['b']
+
+        result = obj.copy()
+        result['d'] = 'four'
+
+        self.assertEqual(result, {'a': 'one', 'c': 'three', 'd': 'four'})
+        self.assertEqual(id(result._parent), id(parent))
+        self.assertEqual(obj, {'a': 'one', 'c': 'three'})
+        self.assertFalse(obj._frozen)
+
+    def test_freeze_deep(self):
+        obj = utils.LayeredDict(data={'a': 'one'})
+        for i in range(utils.LayeredDict.max_depth):
+            obj = utils.LayeredDict(obj.freeze(), {'b%d' % i: 'two'})
+
+        result = obj.freeze()
+
+        self.assertNotEqual(id(result), id(obj))
+        self.assertEqual(result._parent, None)
+        self.assertEqual(result._depth, 1)
+        self.assertTrue(result._frozen)
+        self.assertEqual(result, obj)
+
+
 class SensitiveDictTest(unittest.TestCase):
     def test_init_base(self):
         result = utils.SensitiveDict()
 
         self.assertEqual(result._data, {})
         self.assertEqual(result._sensitive, set())
+        self.assertEqual(result._version, 0)
         self.assertEqual(result._masked, None)
 
     def test_init_alt(self):
@@ -51,6 +306,7 @@ class SensitiveDictTest(unittest.TestCase):
 
         self.assertEqual(result._data, {'a': 'one', 'b': 'two'})
         self.assertEqual(result._sensitive, set(['a', 'c']))
+        self.assertEqual(result._version, 0)
         self.assertEqual(result._masked, None)
 
     def test_str(self):
@@ -81,6 +337,7 @@ class SensitiveDictTest(unittest.TestCase):
 
         self.assertEqual(obj._data, {'a': '1', 'b': '2', 'c': '3', 'd': '4'})
         self.assertEqual(obj._sensitive, set(['a', 'c']))
+        self.assertEqual(obj._version, 4)
 
     def test_delitem(self):
         obj = utils.SensitiveDict({'a': 'one', 'b': 'two', 'e': 'five'},
@@ -96,6 +353,7 @@ class SensitiveDictTest(unittest.TestCase):
         self.assertRaises(KeyError, deleter, 'd')
         self.assertEqual(obj._data, {'e': 'five'})
         self.assertEqual(obj._sensitive, set(['a', 'c']))
+        self.assertEqual(obj._version, 2)
 
     def test_iter(self):
         obj = utils.SensitiveDict({'a': 'one', 'b': 'two'}, set(['a', 'c']))
@@ -126,6 +384,13 @@ class SensitiveDictTest(unittest.TestCase):
         obj.declare_sensitive('d')
 
         self.assertEqual(obj._sensitive, set(['a', 'b', 'c', 'd']))
+        self.assertEqual(obj._version, 3)
+
+    def test_version(self):
+        obj = utils.SensitiveDict({'a': 'one'})
+        obj._version = 5
+
+        self.assertEqual(obj.version, 5)
 
     def test_sensitive(self):
         obj = utils.SensitiveDict(sensitive=set(['a', 'c']))
@@ -158,6 +423,9 @@ class MaskedDictTest(unittest.TestCase):
         result = utils.MaskedDict('parent')
 
         self.assertEqual(result._parent, 'parent')
+        self.assertEqual(result._version, None)
+        self.assertEqual(result._sensitive, frozenset())
+        self.assertEqual(result._snapshot, None)
 
     def test_enter(self):
         obj = utils.MaskedDict('parent')
@@ -240,12 +508,118 @@ class MaskedDictTest(unittest.TestCase):
 
         self.assertEqual(obj.sensitive, set(['a', 'c']))
 
+    def test_sensitive_cached(self):
+        parent = utils.SensitiveDict({'a': 'one', 'b': 'two'}, set(['a']))
+        obj = utils.MaskedDict(parent)
+
+        with mock.patch.object(utils.SensitiveDict, 'sensitive',
+                               new_callable=mock.PropertyMock,
+                               return_value=frozenset(['a'])) as mock_sens:
+            self.assertEqual(obj['a'], '<masked a>')
+            self.assertEqual(obj['b'], 'two')
+            self.assertEqual(obj.sensitive, set(['a']))
+
+            self.assertEqual(mock_sens.call_count, 1)
+
+            parent['b'] = 'deux'
+            mock_sens.return_value = frozenset(['a', 'b'])
+
+            self.assertEqual(obj['b'], '<masked b>')
+            self.assertEqual(mock_sens.call_count, 2)
+
+    def test_version(self):
+        parent = mock.Mock(version=5)
+        obj = utils.MaskedDict(parent)
+
+        self.assertEqual(obj.version, 5)
+
+    def test_snapshot(self):
+        parent = utils.SensitiveDict({'a': 'one', 'b': 'two'}, set(['a']))
+        obj = utils.MaskedDict(parent)
+
+        result = obj.snapshot
+
+        self.assertEqual(result, {'a': '<masked a>', 'b': 'two'})
+        self.assertEqual(id(obj.snapshot), id(result))
+
+        parent.declare_sensitive('b')
+
+        self.assertEqual(obj.snapshot, {
+            'a': '<masked a>',
+            'b': '<masked b>',
+        })
+
     def test_masked(self):
         obj = utils.MaskedDict('parent')
 
         self.assertEqual(id(obj), id(obj.masked))
 
 
+class OrderedSetTest(unittest.TestCase):
+    def test_init_base(self):
+        result = utils.OrderedSet()
+
+        self.assertEqual(list(result), [])
+        self.assertEqual(len(result), 0)
+
+    def test_init_alt(self):
+        result = utils.OrderedSet(['c', 'a', 'c', 'b'])
+
+        self.assertEqual(list(result), ['c', 'a', 'b'])
+        self.assertEqual(len(result), 3)
+
+    def test_repr(self):
+        obj = utils.OrderedSet(['b', 'a'])
+
+        self.assertEqual(repr(obj), "OrderedSet(%r)" % ['b', 'a'])
+
+    def test_contains(self):
+        obj = utils.OrderedSet(['a', 'b'])
+
+        self.assertTrue('a' in obj)
+        self.assertFalse('c' in obj)
+
+    def test_add(self):
+        obj = utils.OrderedSet(['b', 'a'])
+
+        obj.add('c')
+        obj.add('b')
+
+        self.assertEqual(list(obj), ['b', 'a', 'c'])
+
+    def test_discard(self):
+        obj = utils.OrderedSet(['b', 'a', 'c'])
+
+        obj.discard('a')
+        obj.discard('d')
+
+        self.assertEqual(list(obj), ['b', 'c'])
+
+    def test_eq(self):
+        obj = utils.OrderedSet(['b', 'a'])
+
+        self.assertEqual(obj, set(['a', 'b']))
+        self.assertEqual(obj, utils.OrderedSet(['a', 'b']))
+        self.assertNotEqual(obj, set(['a']))
+
+    def test_operators(self):
+        obj = utils.OrderedSet(['c', 'a'])
+
+        obj |= ['b', 'a']
+
+        self.assertEqual(list(obj), ['c', 'a', 'b'])
+        self.assertEqual(list(obj - set(['a'])), ['c', 'b'])
+
+    def test_copy(self):
+        obj = utils.OrderedSet(['b', 'a'])
+
+        result = obj.copy()
+        result.add('c')
+
+        self.assertEqual(list(obj), ['b', 'a'])
+        self.assertEqual(list(result), ['b', 'a', 'c'])
+
+
 class SchemaException(Exception):
     def __init__(self, msg, **kwargs):
         super(SchemaException, self).__init__(msg)
@@ -253,15 +627,229 @@ class SchemaException(Exception):
         self.kwargs = kwargs
 
 
+class CompileSchemaTest(unittest.TestCase):
+    def check(self, schema, valid, invalid):
+        func = utils.compile_schema(schema)
+        validator = jsonschema.validators.validator_for(schema)(schema)
+
+        self.assertNotEqual(func, None)
+        for instance in valid:
+            self.assertTrue(validator.is_valid(instance))
+            self.assertTrue(func(instance))
+        for instance in invalid:
+            self.assertFalse(func(instance))
+
+    def test_types(self):
+        self.check({'type': 'string'}, ['a', ''], [1, None, ['a']])
+        self.check({'type': 'integer'}, [0, 5], [True, 'a', None])
+        self.check({'type': 'number'}, [0, 1.5], [False, 'a'])
+        self.check({'type': 'boolean'}, [True, False], [0, 'a'])
+        self.check({'type': 'null'}, [None], [0, ''])
+        self.check({'type': 'array'}, [[], [1]], [{}, 'a'])
+        self.check({'type': 'object'}, [{}, {'a': 1}], [[], 'a'])
+        self.check({'type': ['string', 'null']}, ['a', None], [1])
+
+    def test_object(self):
+        self.check({
+            'type': 'object',
+            'properties': {
+                'path': {'type': 'string'},
+                'start': {'type': 'integer'},
+            },
+            'required': ['path'],
+            'additionalProperties': False,
+        }, [
+            {'path': 'p'},
+            {'path': 'p', 'start': 2},
+        ], [
+            {},
+            {'start': 2},
+            {'path': 1},
+            {'path': 'p', 'start': 'a'},
+            {'path': 'p', 'other': 1},
+            'p',
+        ])
+
+    def test_additional_schema(self):
+        self.check({
+            'type': 'object',
+            'additionalProperties': {'type': 'string'},
+        }, [{}, {'a': 'b'}], [{'a': 1}])
+
+    def test_items(self):
+        self.check({
+            'type': 'array',
+            'items': {'type': 'string'},
+        }, [[], ['a', 'b']], [['a', 1], 'a'])
+
+    def test_one_of(self):
+        self.check({
+            'oneOf': [
+                {'type': 'string'},
+                {'type': 'array', 'items': {'type': 'string'}},
+            ],
+        }, ['a', ['a', 'b']], [1, ['a', 1]])
+
+    def test_one_of_overlap(self):
+        result = utils.compile_schema({
+            'oneOf': [
+                {'type': 'number'},
+                {'type': 'integer'},
+            ],
+        })
+
+        self.assertEqual(result, None)
+
+    def test_one_of_nested(self):
+        command = {
+            'oneOf': [
+                {'type': 'string'},
+                {'type': 'array', 'items': {'type': 'string'}},
+            ],
+        }
+        self.check({
+            'oneOf': [
+                command,
+                {
+                    'type': 'object',
+                    'properties': {'command': command},
+                    'required': ['command'],
+                },
+            ],
+        }, [
+            'a', ['a'], {'command': 'a'}, {'command': ['a']},
+        ], [
+            1, ['a', 1], {}, {'command': 1},
+        ])
+
+    def test_one_of_nested_overlap(self):
+        result = utils.compile_schema({
+            'oneOf': [
+                {'oneOf': [{'type': 'string'}, {'type': 'number'}]},
+                {'type': 'integer'},
+            ],
+        })
+
+        self.assertEqual(result, None)
+
+    def test_minimum(self):
+        self.check({'type': 'integer', 'minimum': 1, 'maximum': 10},
+                   [1, 10], [0, 11, True, 'a'])
+        self.check({'minimum': 1.5}, [2, 'a', None, False], [1])
+        self.check({
+            'oneOf': [
+                {'type': 'boolean'},
+                {'type': 'integer', 'minimum': 1},
+            ],
+        }, [True, False, 1, 65536], [0, -1, 'a'])
+
+    def test_unsupported(self):
+        self.assertEqual(utils.compile_schema({'pattern': 'a*'}), None)
+        self.assertEqual(utils.compile_schema({'minimum': 'a'}), None)
+        self.assertEqual(utils.compile_schema({'type': 'bool'}), None)
+        self.assertEqual(utils.compile_schema({
+            'type': 'array',
+            'items': {'$ref': '#'},
+        }), None)
+
+    def test_source(self):
+        result = utils.compile_schema({'type': 'string'})
+
+        self.assertEqual(result.source, 'def validate(v0):\n'
+                         '    return isinstance(v0, string_types)\n')
+
+
+class SchemaRegistryTest(unittest.TestCase):
+    schema = {'type': 'array', 'items': {'type': 'string'}}
+
+    def test_init_base(self):
+        result = utils.SchemaRegistry()
+
+        self.assertEqual(result.codegen, True)
+        self.assertEqual(result._validators, {})
+
+    def test_init_alt(self):
+        result = utils.SchemaRegistry(False)
+
+        self.assertEqual(result.codegen, False)
+        self.assertEqual(result._validators, {})
+
+    @mock.patch.object(utils, 'compile_schema', return_value='func')
+    def test_register(self, mock_compile_schema):
+        obj = utils.SchemaRegistry()
+
+        result = obj.register(self.schema)
+
+        self.assertEqual(result[0], self.schema)
+        self.assertTrue(isinstance(
+            result[1], jsonschema.validators.validator_for(self.schema)))
+        self.assertEqual(result[2], 'func')
+        self.assertEqual(obj._validators, {id(self.schema): result})
+        mock_compile_schema.assert_called_once_with(self.schema)
+
+    @mock.patch.object(utils, 'compile_schema', return_value='func')
+    def test_register_cached(self, mock_compile_schema):
+        obj = utils.SchemaRegistry()
+        first = obj.register(self.schema)
+
+        result = obj.register(self.schema)
+
+        self.assertEqual(id(result), id(first))
+        self.assertEqual(mock_compile_schema.call_count, 1)
+
+    @mock.patch.object(utils, 'compile_schema', return_value='func')
+    def test_register_nocodegen(self, mock_compile_schema):
+        obj = utils.SchemaRegistry(False)
+
+        result = obj.register(self.schema)
+
+        self.assertEqual(result[2], None)
+        self.assertFalse(mock_compile_schema.called)
+
+    def test_register_badschema(self):
+        obj = utils.SchemaRegistry()
+
+        self.assertRaises(jsonschema.SchemaError, obj.register,
+                          {'type': 'bool'})
+        self.assertEqual(obj._validators, {})
+
+    def test_validate_fast(self):
+        validator = mock.Mock()
+        obj = utils.SchemaRegistry()
+        obj._validators[id(self.schema)] = (
+            self.schema, validator, lambda x: True)
+
+        obj.validate(['a'], self.schema)
+
+        self.assertFalse(validator.iter_errors.called)
+
+    def test_validate_valid(self):
+        for codegen in (True, False):
+            obj = utils.SchemaRegistry(codegen)
+
+            obj.validate(['a', 'b'], self.schema)
+
+    def test_validate_invalid(self):
+        for codegen in (True, False):
+            obj = utils.SchemaRegistry(codegen)
+
+            try:
+                obj.validate(['a', 5], self.schema)
+            except jsonschema.ValidationError as exc:
+                self.assertEqual(list(exc.path), [1])
+            else:
+                self.fail('Failed to raise ValidationError')
+
+
 class SchemaValidateTest(unittest.TestCase):
-    @mock.patch.object(jsonschema, 'validate')
+    @mock.patch.object(utils.validators, 'validate')
     def test_success(self, mock_validate):
         utils.schema_validate('inst', 'sch', SchemaException, 'foo', 'bar',
                               spam='one', maps='two')
 
         mock_validate.assert_called_once_with('inst', 'sch')
 
-    @mock.patch.object(jsonschema, 'validate',
+    @mock.patch.object(utils.validators, 'validate',
                        side_effect=jsonschema.ValidationError(
                            'validation failed', path=('a', 2, 'b', 3, 'c')))
     def test_failure(self, mock_validate):
@@ -279,6 +867,37 @@ class SchemaValidateTest(unittest.TestCase):
         else:
             self.fail('Failed to raise SchemaException')
 
+    @mock.patch.object(utils.validators, 'validate')
+    def test_skipped(self, mock_validate):
+        with utils.skip_validation():
+            utils.schema_validate('inst', 'sch', SchemaException)
+
+        self.assertFalse(mock_validate.called)
+
+
+class SkipValidationTest(unittest.TestCase):
+    def test_nested(self):
+        self.assertFalse(getattr(utils._validation, 'skip', False))
+
+        with utils.skip_validation():
+            self.assertTrue(utils._validation.skip)
+
+            with utils.skip_validation(False):
+                self.assertFalse(utils._validation.skip)
+
+            self.assertTrue(utils._validation.skip)
+
+        self.assertFalse(utils._validation.skip)
+
+    def test_exception(self):
+        try:
+            with utils.skip_validation():
+                raise SchemaException('failed')
+        except SchemaException:
+            pass
+
+        self.assertFalse(utils._validation.skip)
+
 
 class IterPrioDictTest(unittest.TestCase):
     def test_function(self):
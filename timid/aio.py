@@ -0,0 +1,604 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import asyncio
+import functools
+import inspect
+import sys
+
+from timid import extensions
+from timid import main
+from timid import output
+from timid import steps
+
+
+# The names of the asynchronous variants of methods which do not
+# follow the usual "<name>_async" convention
+_variants = {
+    '__call__': 'call_async',
+}
+
+# Retrieve the event loop running the current coroutine; Python 3.5
+# and 3.6 lack asyncio.get_running_loop()
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def variant(obj, name):
+    """
+    Look up the asynchronous variant of a method.  The asynchronous
+    variant of a method is named for the method, with the suffix
+    "_async"; the asynchronous variant of ``__call__()`` is named
+    ``call_async()``.  The variant may be a coroutine function, or any
+    function returning an awaitable.
+
+    :param obj: The object, such as an action, a modifier, or an
+                extension.
+    :param name: The name of the synchronous method.
+
+    :returns: The asynchronous variant, as a bound method, or ``None``
+              if the object does not provide one.
+    """
+
+    return getattr(obj, _variants.get(name, '%s_async' % name), None)
+
+
+async def invoke(obj, name, *args, blocking=False):
+    """
+    Invoke a method of an object, preferring its asynchronous variant.
+    If the object only provides the synchronous method, it is adapted
+    automatically.
+
+    :param obj: The object, such as an action, a modifier, or an
+                extension.
+    :param name: The name of the synchronous method.
+    :param args: The arguments to pass to the method.
+    :param blocking: If ``True``, the synchronous method may block
+                     for a long period, and will be executed in a
+                     worker thread so that the event loop is not
+                     blocked.  Otherwise, it is called directly.
+
+    :returns: The return value of the method.
+    """
+
+    # Prefer the asynchronous variant
+    func = variant(obj, name)
+    if func is not None:
+        result = func(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    # Adapt the synchronous method
+    func = obj if name == '__call__' else getattr(obj, name)
+    if blocking:
+        return await _running_loop().run_in_executor(
+            None, functools.partial(func, *args))
+
+    return func(*args)
+
+
+def _has_variant(exts, name):
+    """
+    Determine whether any of a set of extensions provides the
+    asynchronous variant of a hook.
+
+    :param exts: An instance of ``timid.extensions.ExtensionSet``.
+    :param name: The name of the hook.
+
+    :returns: A ``True`` value if any extension provides the
+              asynchronous variant, ``False`` otherwise.
+    """
+
+    return any(variant(ext, name) is not None for ext in exts.exts)
+
+
+async def read_steps(exts, ctxt, step_list):
+    """
+    The asynchronous equivalent of ``ExtensionSet.read_steps()``.
+
+    :param exts: An instance of ``timid.extensions.ExtensionSet``.
+    :param ctxt: An instance of ``timid.context.Context``.
+    :param step_list: A list of ``timid.steps.Step`` instances.
+
+    :returns: The ``step_list`` parameter, for convenience.
+    """
+
+    # Use the synchronous implementation if we can
+    if not _has_variant(exts, 'read_steps'):
+        return exts.read_steps(ctxt, step_list)
+
+    debugger = extensions.ExtensionDebugger('read_steps', ctxt)
+
+    for ext in exts.exts:
+        with debugger(ext):
+            await invoke(ext, 'read_steps', ctxt, step_list)
+
+    # Convenience return
+    return step_list
+
+
+async def pre_step(exts, ctxt, step, idx):
+    """
+    The asynchronous equivalent of ``ExtensionSet.pre_step()``.
+
+    :param exts: An instance of ``timid.extensions.ExtensionSet``.
+    :param ctxt: An instance of ``timid.context.Context``.
+    :param step: An instance of ``timid.steps.Step`` describing the
+                 step to be executed.
+    :param idx: The index of the step in the list of steps.
+
+    :returns: A ``True`` value if the step is to be skipped,
+              ``False`` otherwise.
+    """
+
+    # Use the synchronous implementation if we can
+    if not _has_variant(exts, 'pre_step'):
+        return exts.pre_step(ctxt, step, idx)
+
+    debugger = extensions.ExtensionDebugger('pre_step', ctxt)
+
+    for ext in exts.exts:
+        with debugger(ext):
+            if await invoke(ext, 'pre_step', ctxt, step, idx):
+                # Step must be skipped
+                debugger.debug(3, 'Skipping step %d' % idx)
+                return True
+
+    return False
+
+
+async def post_step(exts, ctxt, step, idx, result):
+    """
+    The asynchronous equivalent of ``ExtensionSet.post_step()``.
+
+    :param exts: An instance of ``timid.extensions.ExtensionSet``.
+    :param ctxt: An instance of ``timid.context.Context``.
+    :param step: An instance of ``timid.steps.Step`` describing the
+                 step that was executed.
+    :param idx: The index of the step in the list of steps.
+    :param result: An instance of ``timid.steps.StepResult``
+                   describing the result of executing the step.
+
+    :returns: The ``result`` parameter, for convenience.
+    """
+
+    # Use the synchronous implementation if we can
+    if not _has_variant(exts, 'post_step'):
+        return exts.post_step(ctxt, step, idx, result)
+
+    debugger = extensions.ExtensionDebugger('post_step', ctxt)
+
+    for ext in exts.exts:
+        with debugger(ext):
+            await invoke(ext, 'post_step', ctxt, step, idx, result)
+
+    # Convenience return
+    return result
+
+
+async def call_step(step, ctxt):
+    """
+    The asynchronous equivalent of ``Step.__call__()``.  Modifiers and
+    actions may provide ``pre_call_async()``, ``post_call_async()``,
+    and ``call_async()`` methods; actions which do not are executed in
+    a worker thread.
+
+    :param step: The ``timid.steps.Step`` to invoke.
+    :param ctxt: The context object.
+
+    :returns: A ``StepResult`` object.
+    """
+
+    return await invoke_step(ctxt, step.action, step.modifiers)
+
+
+async def invoke_step(ctxt, action, modifiers, start=0):
+    """
+    The asynchronous equivalent of ``Step.invoke()``.  Invoke an
+    action through a list of modifiers.
+
+    :param ctxt: The context object.
+    :param action: The action to invoke.
+    :param modifiers: The list of modifiers for the action, in
+                      priority order.
+    :param start: The index of the first modifier to call.  Defaults
+                  to 0.
+
+    :returns: A ``StepResult`` object.
+    """
+
+    # Begin by walking the modifiers
+    i = start - 1
+    for i in range(start, len(modifiers)):
+        result = await invoke(modifiers[i], 'pre_call', ctxt, modifiers[:i],
+                              modifiers[i + 1:], action)
+
+        # Did a modifier return a result?
+        if result is not None:
+            break
+    else:
+        # All modifiers have weighed in without returning a result,
+        # so let's call the action
+        try:
+            result = await invoke(action, '__call__', ctxt, blocking=True)
+        except Exception:
+            # Wrap the exception in a StepResult instance
+            result = steps.StepResult(exc_info=sys.exc_info())
+        else:
+            # Convert a None into an error StepResult
+            if result is None:
+                result = steps.StepResult(state=steps.ERROR)
+
+    # Now walk the modifiers in reverse order for result processing
+    for j in range(i, start - 1, -1):
+        result = await invoke(modifiers[j], 'post_call', ctxt, result,
+                              action, modifiers[j + 1:], modifiers[:j])
+
+    return result
+
+
+async def timid(ctxt, test, key=None, check=False, exts=None,
+                ckpt=None):
+    """
+    The asynchronous equivalent of ``timid.main.timid()``.  Execute a
+    test described by a YAML file.
+
+    :param ctxt: A ``timid.context.Context`` object.
+    :param test: The name of a YAML file containing the test
+                 description.
+    :param key: An optional key into the test description file.
+    :param check: If ``True``, only performs a syntax check of the
+                  test steps indicated by ``test`` and ``key``; the
+                  test itself is not run.
+    :param exts: An instance of ``timid.extensions.ExtensionSet``
+                 describing the extensions to be called while
+                 processing the test steps.
+    :param ckpt: An optional ``timid.checkpoint.Checkpoint``.
+
+    :returns: ``None`` if the test succeeded, or a message describing
+              the failure.
+    """
+
+    # Set up the execution, shared with the synchronous engine
+    execution = main.Execution(ctxt, exts, ckpt)
+    exts = execution.exts
+
+    # Read the steps and add them to the list in the context
+    step_list = execution.parse(test, key)
+    execution.read(await read_steps(exts, ctxt, step_list))
+
+    # If all we were supposed to do was check, we're done
+    if check:
+        return None
+
+    # Now we execute each step in turn
+    for idx, step in execution:
+        # Run through extension hooks
+        if await pre_step(exts, ctxt, step, idx):
+            execution.skipped(idx, step)
+            continue
+
+        # Now execute the step
+        result = await call_step(step, ctxt)
+
+        # Let the extensions process the result of the step
+        await post_step(exts, ctxt, step, idx, result)
+
+        # Was the step a success?
+        if not execution.finished(idx, step, result):
+            break
+
+    return execution.msg
+
+
+async def run_targets(targets, check, exts, jobs):
+    """
+    Execute several tests concurrently.  This is the asynchronous
+    equivalent of the test execution performed by
+    ``timid.main.run()``.
+
+    :param targets: A list of ``timid.main.Target`` objects.  The
+                    ``result`` attribute of each is set to the return
+                    value of ``timid()``, or to the exception raised.
+    :param check: If ``True``, only performs a syntax check of the
+                  test steps.
+    :param exts: An instance of ``timid.extensions.ExtensionSet``
+                 describing the extensions to be called while
+                 processing the test steps.
+    :param jobs: The maximum number of tests to execute concurrently.
+    """
+
+    semaphore = asyncio.Semaphore(max(jobs, 1))
+
+    async def run_target(target):
+        async with semaphore:
+            try:
+                target.result = await timid(
+                    target.ctxt, target.test, target.key, check, exts,
+                    target.ckpt)
+            except Exception as exc:
+                target.error(exc)
+
+    await asyncio.gather(*[run_target(target) for target in targets])
+
+
+async def retry(ctxt, modifier, pre_mod, post_mod, action):
+    """
+    The asynchronous equivalent of ``RetryModifier.pre_call()``.
+    Invoke an action, including the modifiers following the "retry"
+    modifier, until it succeeds or the attempts are exhausted.
+
+    :param ctxt: The context object.
+    :param modifier: The ``timid.modifiers.RetryModifier``.
+    :param pre_mod: A list of the modifiers preceding the "retry"
+                    modifier.
+    :param post_mod: A list of the modifiers following the "retry"
+                     modifier.
+    :param action: The action to invoke.
+
+    :returns: A ``StepResult`` object summarizing the attempts.
+    """
+
+    modifiers = list(pre_mod) + [modifier] + list(post_mod)
+    start = len(pre_mod) + 1
+
+    attempts = [await invoke_step(ctxt, action, modifiers, start)]
+    for delay in modifier.retries(ctxt, attempts):
+        await asyncio.sleep(delay)
+        attempts.append(await invoke_step(ctxt, action, modifiers, start))
+
+    return modifier._summarize(attempts)
+
+
+async def timeout(ctxt, modifier, pre_mod, post_mod, action):
+    """
+    The asynchronous equivalent of ``TimeoutModifier.pre_call()``.
+    Invoke an action, including the modifiers following the "timeout"
+    modifier, terminating the processes it starts if the deadline
+    passes.
+
+    :param ctxt: The context object.
+    :param modifier: The ``timid.modifiers.TimeoutModifier``.
+    :param pre_mod: A list of the modifiers preceding the "timeout"
+                    modifier.
+    :param post_mod: A list of the modifiers following the "timeout"
+                     modifier.
+    :param action: The action to invoke.
+
+    :returns: A ``StepResult`` object.
+    """
+
+    modifiers = list(pre_mod) + [modifier] + list(post_mod)
+    start = len(pre_mod) + 1
+
+    tracker, timer = modifier._arm()
+    try:
+        result = await invoke_step(ctxt.tracking(tracker), action,
+                                   modifiers, start)
+    except BaseException:
+        timer.cancel()
+        raise
+
+    # Disarming may wait for the processes to be terminated
+    return await _running_loop().run_in_executor(
+        None, modifier._disarm, tracker, timer, result)
+
+
+async def schedule(func, count, max_workers, fail_fast):
+    """
+    Perform a group of tasks concurrently as tasks on the event loop.
+    This is the asynchronous equivalent of
+    ``timid.parallel.schedule()``.
+
+    :param func: A coroutine function taking the index of a task.  It
+                 must return a ``timid.steps.StepResult`` object.
+    :param count: The number of tasks.
+    :param max_workers: The maximum number of tasks which may
+                        execute at the same time.
+    :param fail_fast: If ``True``, no further tasks are started once
+                      a task fails.
+
+    :returns: A list of the ``StepResult`` objects for the tasks, in
+              order.  Tasks which were never started have a ``None``
+              result.
+    """
+
+    semaphore = asyncio.Semaphore(max_workers)
+    results = [None] * count
+    failed = []
+
+    async def run_task(idx):
+        async with semaphore:
+            # Tasks are not started after a failure
+            if failed and fail_fast:
+                return
+
+            results[idx] = await func(idx)
+            if not results[idx]:
+                failed.append(idx)
+
+    await asyncio.gather(*[run_task(idx) for idx in range(count)])
+
+    return results
+
+
+async def run_matrix(ctxt, modifier, pre_mod, post_mod, action):
+    """
+    Perform the variants of a step with a "matrix" modifier as tasks
+    on the event loop.  This is the asynchronous equivalent of
+    ``MatrixModifier.pre_call()``.
+
+    :param ctxt: The context object.
+    :param modifier: The ``timid.modifiers.MatrixModifier``.
+    :param pre_mod: A list of the modifiers preceding the "matrix"
+                    modifier.
+    :param post_mod: A list of the modifiers following the "matrix"
+                     modifier.
+    :param action: The action to perform.
+
+    :returns: A ``StepResult`` object encapsulating the results of
+              all the variants.
+    """
+
+    modifiers = list(pre_mod) + [modifier] + list(post_mod)
+    start = len(pre_mod) + 1
+
+    async def run_variant(idx):
+        vctxt = modifier.fork(ctxt, modifier.variants[idx])
+        result = await invoke_step(vctxt, action, modifiers, start)
+        modifier._report(ctxt, idx, result)
+
+        return result
+
+    results = await schedule(run_variant, len(modifier.variants),
+                             modifier.max_workers, modifier.fail_fast)
+
+    return modifier._summarize(results)
+
+
+async def run_parallel(ctxt, action):
+    """
+    Execute the sub-steps of a "parallel" action as tasks on the
+    event loop.  This is the asynchronous equivalent of
+    ``ParallelAction.__call__()``.
+
+    :param ctxt: The context object.
+    :param action: The ``timid.parallel.ParallelAction``.
+
+    :returns: A ``StepResult`` object encapsulating the results of
+              all the sub-steps.
+    """
+
+    # Select the extensions to call for each sub-step
+    exts = getattr(ctxt, 'extensions', None)
+    if exts is None:
+        exts = extensions.ExtensionSet()
+
+    async def run_step(idx):
+        step = action.steps[idx]
+
+        # Emit information about what we're doing, and run through
+        # extension hooks
+        action._report(ctxt, idx, step)
+        if await pre_step(exts, ctxt, step, idx):
+            result = steps.StepResult(state=steps.SKIPPED)
+            action._report(ctxt, idx, step, result)
+            return result
+
+        # Now execute the step
+        result = await call_step(step, ctxt)
+
+        # Let the extensions process the result of the step, and emit
+        # the result
+        await post_step(exts, ctxt, step, idx, result)
+        action._report(ctxt, idx, step, result)
+
+        return result
+
+    results = await schedule(run_step, len(action.steps),
+                             action.max_workers, action.fail_fast)
+
+    return action._summarize(results)
+
+
+async def track_process(process, trackers):
+    """
+    Add a process started by ``Environment.call_async()`` to process
+    trackers once it has started.
+
+    :param process: The awaitable returned by
+                    ``asyncio.create_subprocess_exec()``.
+    :param trackers: A list of ``timid.environment.ProcessTracker``
+                     instances.
+
+    :returns: The ``asyncio.subprocess.Process`` instance.
+    """
+
+    process = await process
+    for tracker in trackers:
+        tracker.add(process)
+
+    return process
+
+
+async def wait_process(process, capture=None):
+    """
+    Wait for a process started by ``Environment.call_async()`` to
+    exit.
+
+    :param process: The awaitable returned by
+                    ``Environment.call_async()``.
+    :param capture: An optional ``timid.output.Capture`` instance.
+                    If provided, the process must have been started
+                    with its standard output and standard error
+                    connected to pipes, and its output will be fed to
+                    the capture.
+
+    :returns: A ``StepResult`` object.
+    """
+
+    process = await process
+
+    # Read the output, if we're capturing it
+    if capture is None:
+        return steps.StepResult(returncode=await process.wait())
+
+    await asyncio.gather(*[
+        _pump(getattr(process, name), name, capture)
+        for name in output.STREAMS
+        if getattr(process, name) is not None
+    ])
+
+    return capture.result(await process.wait())
+
+
+async def _pump(stream, name, capture):
+    """
+    Read the output of a process from one of its streams until the
+    stream is closed.
+
+    :param stream: The ``asyncio.StreamReader`` to read from.
+    :param name: The name of the stream.
+    :param capture: A ``timid.output.Capture`` instance to feed the
+                    output to.
+    """
+
+    while True:
+        data = await stream.read(output.CHUNK_SIZE)
+        if not data:
+            break
+        capture.feed(name, data)
+
+    capture.close(name)
+
+
+def run(coro):
+    """
+    Execute a coroutine to completion on a new event loop.
+
+    :param coro: The coroutine to execute.
+
+    :returns: The return value of the coroutine.
+    """
+
+    loop = asyncio.new_event_loop()
+    try:
+        # Subprocess support requires the loop to be the current
+        # event loop
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
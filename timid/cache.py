@@ -0,0 +1,745 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import six
+
+from timid import entry
+from timid import utils
+
+
+# The entrypoint namespaces whose contents affect step parsing
+NAMESPACES = ['timid.actions', 'timid.modifiers']
+
+# Attributes of a Jinja2 environment that affect compiled code
+_JINJA_OPTIONS = (
+    'block_start_string', 'block_end_string', 'variable_start_string',
+    'variable_end_string', 'comment_start_string', 'comment_end_string',
+    'line_statement_prefix', 'line_comment_prefix', 'trim_blocks',
+    'lstrip_blocks', 'newline_sequence', 'keep_trailing_newline',
+    'optimized', 'autoescape',
+)
+
+
+class PlanCache(object):
+    """
+    An on-disk cache of validated step configuration.  Entries are
+    keyed by a digest of the contents of a test description file, the
+    key within that file, and the signatures of the action and
+    modifier entrypoint namespaces; a change to the file or to the
+    installed actions or modifiers thus automatically results in a
+    cache miss.
+
+    Entries are stored as JSON, rather than pickled, so that loading
+    the cache cannot execute code even if others can write to the
+    cache directory.  Step configuration which does not survive the
+    round trip through JSON, such as YAML timestamps or dictionaries
+    with non-string keys, is not cached.
+    """
+
+    # The version of the cache entry format; bump this to invalidate
+    # all existing entries
+    version = 2
+
+    def __init__(self, directory=None):
+        """
+        Initialize a ``PlanCache`` instance.
+
+        :param directory: The directory in which to store the cache
+                          entries.  If ``None`` (the default), the
+                          cache is disabled.
+        """
+
+        self.directory = directory
+
+        # Demand-allocated signature of the entrypoint namespaces
+        self._signature = None
+
+    @property
+    def signature(self):
+        """
+        Retrieve a signature of the action and modifier entrypoint
+        namespaces.  This is computed only once.
+        """
+
+        if self._signature is None:
+            self._signature = six.text_type(
+                [entry.points[ns].signature() for ns in NAMESPACES])
+
+        return self._signature
+
+    def digest(self, content, key=None):
+        """
+        Compute the cache key for a test description file.
+
+        :param content: The contents of the file, as a byte string.
+        :param key: The key within the file, or ``None`` if the file
+                    is expected to contain a simple list of steps.
+
+        :returns: The cache key, as a hex string, or ``None`` if the
+                  cache is disabled.
+        """
+
+        if self.directory is None:
+            return None
+
+        hasher = hashlib.sha256()
+        for part in (six.text_type(self.version), self.signature,
+                     repr(key)):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\0')
+        hasher.update(content)
+
+        return hasher.hexdigest()
+
+    def _path(self, digest):
+        """
+        Compute the path of the file containing a cache entry.
+
+        :param digest: The cache key, as returned by ``digest()``.
+
+        :returns: The path to the cache file.
+        """
+
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    def get(self, digest):
+        """
+        Retrieve validated step configuration from the cache.
+
+        :param digest: The cache key, as returned by ``digest()``.
+
+        :returns: The list of step configurations, or ``None`` if the
+                  cache is disabled or the entry is not present.
+        """
+
+        if digest is None:
+            return None
+
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except Exception:
+            # Missing or corrupt entries are simply cache misses
+            return None
+
+    def put(self, digest, step_data):
+        """
+        Store validated step configuration in the cache.  Failures to
+        write the cache are ignored.
+
+        :param digest: The cache key, as returned by ``digest()``.
+        :param step_data: The list of step configurations.
+        """
+
+        if digest is None:
+            return
+
+        try:
+            text = json.dumps(step_data, sort_keys=True)
+
+            # Only cache data which JSON represents faithfully
+            if json.loads(text) != step_data:
+                return
+
+            utils.atomic_write(self._path(digest), text.encode('utf-8'))
+        except Exception:
+            pass
+
+
+class ParseCache(object):
+    """
+    An in-memory cache of the validated step configurations of test
+    description files.  A single ``ParseCache`` is shared by all the
+    contexts of a run, so that a file--such as a library of steps
+    included by several test files--need only be read and validated
+    once.  The ``Step`` objects themselves are not cached, as each
+    place a file is included needs steps of its own.  Entries are keyed by the
+    absolute path of the file and the key within the file, and are
+    only used while the file's identity--its inode, size, and
+    modification time--is unchanged, so that a file rewritten during
+    the run is read again.
+
+    The cache also tracks the files being parsed by each thread, so
+    that include cycles can be detected.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ``ParseCache`` instance.
+        """
+
+        self._steps = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __len__(self):
+        """
+        Retrieve the number of parsed files in the cache.
+
+        :returns: The number of parsed files.
+        """
+
+        return len(self._steps)
+
+    @staticmethod
+    def _key(fname, key):
+        """
+        Compute the cache key for a test description file.
+
+        :param fname: The name of the file.
+        :param key: The key within the file, or ``None``.
+
+        :returns: The cache key.
+        """
+
+        return (os.path.abspath(fname), key)
+
+    @staticmethod
+    def identity(fname):
+        """
+        Compute the identity of a file.  A file with an unchanged
+        identity is assumed to have unchanged contents.
+
+        :param fname: The name of the file.
+
+        :returns: A tuple of the device, inode, size, and modification
+                  time of the file, or ``None`` if the file cannot be
+                  examined.
+        """
+
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+
+        return (st.st_dev, st.st_ino, st.st_size,
+                getattr(st, 'st_mtime_ns', st.st_mtime))
+
+    def get(self, fname, key=None):
+        """
+        Retrieve the validated step configurations of a test
+        description file.
+
+        :param fname: The name of the file.
+        :param key: The key within the file, or ``None``.
+
+        :returns: The list of step configurations, or ``None`` if the
+                  file has not been parsed or has changed since it was
+                  parsed.
+        """
+
+        with self._lock:
+            entry = self._steps.get(self._key(fname, key))
+
+        if entry is None or entry[0] is None:
+            return None
+
+        # Make sure the file hasn't changed
+        ident, step_data = entry
+        if self.identity(fname) != ident:
+            return None
+
+        return step_data
+
+    def put(self, fname, key, step_data, ident=None):
+        """
+        Store the validated step configurations of a test description
+        file.
+
+        :param fname: The name of the file.
+        :param key: The key within the file, or ``None``.
+        :param step_data: The list of step configurations.
+        :param ident: The identity of the file, as returned by
+                      ``identity()``, at the time it was read.  If not
+                      given, the current identity of the file is
+                      used.
+        """
+
+        if ident is None:
+            ident = self.identity(fname)
+
+        with self._lock:
+            self._steps[self._key(fname, key)] = (ident, step_data)
+
+    def enter(self, fname, key=None):
+        """
+        Note that the current thread is beginning to parse a test
+        description file.  Each successful call must be matched by a
+        call to ``leave()``.
+
+        :param fname: The name of the file.
+        :param key: The key within the file, or ``None``.
+
+        :returns: ``None`` if the file may be parsed.  If the file is
+                  already being parsed by the current thread--that is,
+                  if it includes itself, directly or indirectly--a
+                  list of the names of the files in the include cycle
+                  is returned instead, and the file is not entered.
+        """
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        cache_key = self._key(fname, key)
+        name = fname if key is None else '%s[%s]' % (fname, key)
+        for idx, (entered, _name) in enumerate(stack):
+            if entered == cache_key:
+                return [n for _k, n in stack[idx:]] + [name]
+
+        stack.append((cache_key, name))
+        return None
+
+    def leave(self, fname, key=None):
+        """
+        Note that the current thread has finished parsing a test
+        description file.
+
+        :param fname: The name of the file.
+        :param key: The key within the file, or ``None``.
+        """
+
+        stack = getattr(self._local, 'stack', None)
+        if stack and stack[-1][0] == self._key(fname, key):
+            stack.pop()
+
+
+class StatCache(object):
+    """
+    A persistent cache of the digests of file contents.  Entries are
+    keyed by the absolute path of the file, and are only used while
+    the file's identity--its inode, size, and modification time--is
+    unchanged, so that unchanged files need not be read again to
+    compute their digests.  The cache file is stored as JSON.
+    """
+
+    # The version of the cache file format; bump this to invalidate
+    # all existing entries
+    version = 2
+
+    # Files modified less than this many seconds before they were
+    # read are not cached, as a further modification within the
+    # resolution of the file system timestamps would go unnoticed
+    racy = 2.0
+
+    def __init__(self, path=None):
+        """
+        Initialize a ``StatCache`` instance.
+
+        :param path: The path of the file in which to store the cache.
+                     If ``None`` (the default), the digests are only
+                     cached in memory.
+        """
+
+        self.path = path
+
+        # Demand-loaded cache entries; modified entries are also
+        # tracked, so that they may be merged with entries saved by
+        # concurrent runs
+        self._entries = None
+        self._updated = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Load the cache entries from the cache file.
+
+        :returns: A dictionary mapping absolute paths to lists of the
+                  file identity and the digest.  Missing or corrupt
+                  cache files result in an empty dictionary.
+        """
+
+        if self.path is None:
+            return {}
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+            if data['version'] != self.version:
+                return {}
+            return dict(data['entries'])
+        except Exception:
+            return {}
+
+    def digest(self, fname):
+        """
+        Compute the digest of the contents of a file.
+
+        :param fname: The name of the file.
+
+        :returns: The SHA-256 digest of the file contents, as a hex
+                  string.
+        """
+
+        fname = os.path.abspath(fname)
+        st = os.stat(fname)
+        ident = [st.st_dev, st.st_ino, st.st_size,
+                 getattr(st, 'st_mtime_ns', st.st_mtime)]
+
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(fname)
+        if entry is not None and entry[0] == ident:
+            return entry[1]
+
+        # Compute the digest
+        hasher = hashlib.sha256()
+        with open(fname, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        # Cache it, unless the file was modified too recently to trust
+        # its timestamp
+        if time.time() - st.st_mtime >= self.racy:
+            with self._lock:
+                self._entries[fname] = self._updated[fname] = [ident, digest]
+
+        return digest
+
+    def save(self):
+        """
+        Save the modified cache entries to the cache file.  The entries
+        are merged with those saved by any concurrent runs.  Failures
+        to write the cache are ignored.
+        """
+
+        with self._lock:
+            if self.path is None or not self._updated:
+                return
+            updated, self._updated = self._updated, {}
+
+        entries = self._load()
+        entries.update(updated)
+        try:
+            utils.atomic_write(self.path, json.dumps(
+                {'version': self.version, 'entries': entries},
+                sort_keys=True).encode('utf-8'))
+        except Exception:
+            pass
+
+
+class ResultCache(object):
+    """
+    An on-disk record of the steps which have succeeded.  Entries are
+    keyed by a fingerprint of everything the step depends upon; a
+    step whose fingerprint has been recorded need not be executed
+    again.
+    """
+
+    # The version of the record format; bump this to invalidate all
+    # existing records
+    version = 1
+
+    def __init__(self, directory=None):
+        """
+        Initialize a ``ResultCache`` instance.
+
+        :param directory: The directory in which to store the records.
+                          If ``None`` (the default), the cache is
+                          disabled.
+        """
+
+        self.directory = directory
+
+    def fingerprint(self, parts):
+        """
+        Compute the fingerprint of a step.
+
+        :param parts: A JSON-serializable description of everything
+                      the step depends upon.
+
+        :returns: The fingerprint, as a hex string.
+        """
+
+        return hashlib.sha256(json.dumps(
+            [self.version, parts], sort_keys=True, default=repr,
+        ).encode('utf-8')).hexdigest()
+
+    def _path(self, fingerprint):
+        """
+        Compute the path of the file containing a record.
+
+        :param fingerprint: The fingerprint of the step, as returned
+                            by ``fingerprint()``.
+
+        :returns: The path to the record file.
+        """
+
+        return os.path.join(self.directory, fingerprint[:2],
+                            fingerprint + '.json')
+
+    def get(self, fingerprint):
+        """
+        Retrieve the record of a successful step.
+
+        :param fingerprint: The fingerprint of the step, as returned
+                            by ``fingerprint()``.
+
+        :returns: A dictionary describing the successful execution of
+                  the step, or ``None`` if the cache is disabled or
+                  the step has not succeeded.
+        """
+
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self._path(fingerprint), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except Exception:
+            # Missing or corrupt records are simply cache misses
+            return None
+
+    def put(self, fingerprint, **record):
+        """
+        Record the successful execution of a step.  Failures to write
+        the record are ignored.
+
+        :param fingerprint: The fingerprint of the step, as returned
+                            by ``fingerprint()``.
+        :param record: Additional data to store in the record.
+        """
+
+        if self.directory is None:
+            return
+
+        record['time'] = time.time()
+        try:
+            utils.atomic_write(self._path(fingerprint), json.dumps(
+                record, sort_keys=True).encode('utf-8'))
+        except Exception:
+            pass
+
+
+class StepCaches(object):
+    """
+    The persistent caches used by the "cache" modifier: the records
+    of successful steps and the digests of their input files.  The
+    caches are only created when first used, so that test runs that
+    do not use the "cache" modifier never touch the default cache
+    directory.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Initialize a ``StepCaches`` instance.
+
+        :param cache_dir: The directory in which to store persistent
+                          caches.  If ``None`` (the default), the
+                          default cache directory is used.
+        """
+
+        self.cache_dir = cache_dir
+
+        self._result_cache = None
+        self._stat_cache = None
+        self._lock = threading.Lock()
+
+    def _create(self):
+        """
+        Create the caches, if they have not been created already.
+        """
+
+        with self._lock:
+            if self._result_cache is not None:
+                return
+
+            steps_dir = os.path.join(
+                self.cache_dir or utils.default_cache_dir(), 'steps')
+            self._stat_cache = StatCache(
+                os.path.join(steps_dir, 'stat-cache.json'))
+            self._result_cache = ResultCache(
+                os.path.join(steps_dir, 'results'))
+
+    @property
+    def result_cache(self):
+        """
+        Retrieve the ``ResultCache`` recording successful steps.
+        """
+
+        self._create()
+        return self._result_cache
+
+    @property
+    def stat_cache(self):
+        """
+        Retrieve the ``StatCache`` of the digests of input files.
+        """
+
+        self._create()
+        return self._stat_cache
+
+
+class TemplateCache(object):
+    """
+    A process-wide cache of compiled Jinja2 templates and expressions.
+    Compiled templates are keyed by the source string and by the
+    configuration of the Jinja2 environment, so they may be shared
+    between contexts; the least recently used entries are discarded
+    once the cache is full.  As a shared template may have been
+    compiled by a different environment with the same configuration,
+    the environment's globals must be passed to it as variables when
+    it is rendered.
+
+    Compiled code is not cached on disk: Jinja2's bytecode caches
+    store marshalled code objects, and loading those from a cache
+    directory would execute whatever code was placed there.
+    """
+
+    def __init__(self, size=1000):
+        """
+        Initialize a ``TemplateCache`` instance.
+
+        :param size: The maximum number of compiled sources to retain.
+                     Defaults to 1000.
+        """
+
+        self.size = size
+        self._compiled = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters for debugging
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """
+        Retrieve the number of compiled sources in the cache.
+
+        :returns: The number of compiled sources.
+        """
+
+        return len(self._compiled)
+
+    def __str__(self):
+        """
+        Return a string describing the state of the cache.
+
+        :returns: A string describing the cache counters.
+        """
+
+        return '%(hits)d hits, %(misses)d misses, %(size)d entries' % (
+            self.stats)
+
+    @property
+    def stats(self):
+        """
+        Retrieve a dictionary of the cache counters.  The "hits" key
+        counts sources found in the cache, and "misses" counts sources
+        that had to be compiled.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self),
+        }
+
+    def clear(self):
+        """
+        Clear the cache and reset the counters.
+        """
+
+        with self._lock:
+            self._compiled.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _get(self, env, kind, source, compile_):
+        """
+        Retrieve a compiled source string, compiling it if necessary.
+
+        :param env: The Jinja2 environment.
+        :param kind: The kind of source; either "template" or
+                     "expression".
+        :param source: The source string.
+        :param compile_: A callable of no arguments which compiles
+                         the source string.
+
+        :returns: The compiled source.
+        """
+
+        # Compiled code depends on the environment configuration
+        key = (kind, source,
+               tuple(getattr(env, attr, None) for attr in _JINJA_OPTIONS),
+               tuple(sorted(env.extensions)))
+
+        with self._lock:
+            compiled = self._compiled.pop(key, None)
+            if compiled is not None:
+                self.hits += 1
+
+                # Mark it as the most recently used
+                self._compiled[key] = compiled
+                return compiled
+
+            self.misses += 1
+
+        # Compile the source outside the lock; syntax errors propagate
+        compiled = compile_()
+
+        with self._lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.size:
+                self._compiled.popitem(last=False)
+
+        return compiled
+
+    def template(self, env, source):
+        """
+        Retrieve a template for a template source string.  This is
+        equivalent to ``env.from_string(source)``, except that the
+        template may have been compiled by another environment with
+        the same configuration.
+
+        :param env: The Jinja2 environment.
+        :param source: The template source string.
+
+        :returns: An instance of ``jinja2.Template``.
+        """
+
+        return self._get(env, 'template', source,
+                         lambda: env.from_string(source))
+
+    def expression(self, env, source):
+        """
+        Retrieve a callable for an expression source string.  This is
+        equivalent to ``env.compile_expression(source)``, except that
+        an undefined value is returned as ``None``, and that the
+        expression may have been compiled by another environment with
+        the same configuration.
+
+        :param env: The Jinja2 environment.
+        :param source: The expression source string.
+
+        :returns: A callable which evaluates the expression given the
+                  template variables.
+        """
+
+        return self._get(env, 'expression', source,
+                         lambda: env.compile_expression(source, True))
+
+
+# The process-wide template cache
+templates = TemplateCache()
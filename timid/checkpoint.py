@@ -0,0 +1,293 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import hashlib
+import json
+import os
+
+import six
+
+from timid import environment
+from timid import utils
+
+
+class CheckpointError(Exception):
+    """
+    Report that a checkpoint cannot be used to resume a test.
+    """
+
+    pass
+
+
+class Checkpoint(object):
+    """
+    Save and restore the state of a test between steps, so that a
+    failed test may be resumed from the step that failed.  The
+    checkpoint records the index of the first step which has not
+    completed, the template variables, the environment variables, the
+    working directory, and a hash of the test steps.  The values of
+    sensitive variables are never saved; on resume, any values for
+    them supplied to the new run are used instead.  Checkpoints are
+    stored as JSON, so that loading one cannot execute code.
+    """
+
+    # The version of the checkpoint format; bump this to invalidate
+    # all existing checkpoints
+    version = 2
+
+    # The special environment variable classes, and the names of the
+    # ``Environment`` methods used to declare them
+    _specials = {
+        environment.ListVariable: 'declare_list',
+        environment.SetVariable: 'declare_set',
+    }
+
+    def __init__(self, path, resume=False):
+        """
+        Initialize a ``Checkpoint`` instance.
+
+        :param path: The path of the checkpoint file.
+        :param resume: If ``True``, the test is resumed from the
+                       checkpoint, if it exists.  Defaults to
+                       ``False``.
+        """
+
+        self.path = path
+        self.resume = resume
+
+        # The hash of the test steps; set by start()
+        self.plan_hash = None
+
+    @classmethod
+    def for_test(cls, ctxt, test, key=None, resume=False):
+        """
+        Construct the checkpoint for a test.  Checkpoints are stored
+        in the "checkpoints" subdirectory of the cache directory, and
+        are keyed on the test file, the key within it, and the working
+        directory.
+
+        :param ctxt: A ``timid.context.Context`` object.
+        :param test: The name of the YAML file containing the test
+                     description.
+        :param key: An optional key into the test description file.
+        :param resume: If ``True``, the test is resumed from the
+                       checkpoint, if it exists.  Defaults to
+                       ``False``.
+
+        :returns: A new ``Checkpoint`` instance.
+        """
+
+        digest = hashlib.sha256(json.dumps(
+            [os.path.abspath(test), key, ctxt.environment.cwd],
+        ).encode('utf-8')).hexdigest()
+
+        return cls(os.path.join(ctxt.cache_dir or utils.default_cache_dir(),
+                                'checkpoints', digest + '.json'), resume)
+
+    @staticmethod
+    def hash_steps(step_list):
+        """
+        Compute a hash of a list of test steps.  The hash covers the
+        address, name, and configuration of each step, so any change
+        to the test description--including the files it
+        includes--changes the hash.
+
+        :param step_list: A list of ``timid.steps.Step`` objects.
+
+        :returns: The hash, as a hex string.
+        """
+
+        hasher = hashlib.sha256()
+        for step in step_list:
+            hasher.update(json.dumps([
+                six.text_type(step.step_addr), step.name,
+                step.action.name, step.action.config,
+                [[mod.name, mod.config] for mod in step.modifiers],
+            ], sort_keys=True, default=repr).encode('utf-8'))
+            hasher.update(b'\0')
+
+        return hasher.hexdigest()
+
+    def start(self, ctxt):
+        """
+        Prepare to execute the test steps in ``ctxt.steps``.  If the
+        test is being resumed and a checkpoint exists, the state of
+        the context is restored from it.
+
+        :param ctxt: A ``timid.context.Context`` object.
+
+        :returns: The index of the first step to execute.
+
+        :raises CheckpointError: The checkpoint cannot be used, because
+                                 the test steps have changed.
+        """
+
+        self.plan_hash = self.hash_steps(ctxt.steps)
+
+        if not self.resume:
+            return 0
+
+        state = self.load()
+        if state is None:
+            return 0
+
+        # Refuse to resume a different test
+        if state['plan_hash'] != self.plan_hash:
+            raise CheckpointError(
+                'The test steps have changed since the checkpoint was '
+                'saved; run without "--resume" to start over')
+
+        self.restore(ctxt, state)
+
+        return state['index']
+
+    def load(self):
+        """
+        Load the checkpoint.
+
+        :returns: A dictionary of the saved state, or ``None`` if
+                  there is no usable checkpoint.
+        """
+
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.loads(f.read().decode('utf-8'))
+        except Exception:
+            # Missing or corrupt checkpoints are ignored
+            return None
+
+        if not isinstance(state, dict) or state.get('version') != self.version:
+            return None
+
+        return state
+
+    def save(self, ctxt, index):
+        """
+        Save the checkpoint.  The values of sensitive template and
+        environment variables are omitted.  The checkpoint file is
+        created readable only by its owner.  If the state cannot be
+        represented in JSON, any existing checkpoint is removed
+        instead, so that a resumed test starts over.
+
+        :param ctxt: A ``timid.context.Context`` object.
+        :param index: The index of the next step to execute.
+        """
+
+        env = ctxt.environment
+        state = {
+            'version': self.version,
+            'plan_hash': self.plan_hash,
+            'index': index,
+            'variables': self._capture(ctxt.variables),
+            'environment': self._capture(env),
+            'specials': dict(
+                (name, [self._specials[special.__class__], special._sep])
+                for name, special in env._special.items()
+                if special.__class__ in self._specials
+            ),
+            'cwd': env.cwd,
+        }
+
+        # Only save state that survives the round trip unchanged
+        try:
+            text = json.dumps(state, sort_keys=True)
+            if json.loads(text) != state:
+                raise ValueError('state changed in round trip')
+        except (TypeError, ValueError):
+            self.clear()
+            return
+
+        utils.atomic_write(self.path, text.encode('utf-8'))
+
+    def clear(self):
+        """
+        Remove the checkpoint.  This is called when the test
+        completes.
+        """
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _capture(sdict):
+        """
+        Capture the contents of a ``timid.utils.SensitiveDict``.
+
+        :param sdict: The ``timid.utils.SensitiveDict``.
+
+        :returns: A list of a dictionary of the values of the
+                  non-sensitive keys, the sorted list of sensitive
+                  keys, and the sorted list of sensitive keys whose
+                  values were omitted.
+        """
+
+        sensitive = sdict.sensitive
+        data = dict((k, v) for k, v in sdict._data.items()
+                    if k not in sensitive)
+
+        return [data, sorted(sensitive),
+                sorted(k for k in sdict if k in sensitive)]
+
+    def restore(self, ctxt, state):
+        """
+        Restore the state of a context from a checkpoint.  Sensitive
+        variables take the values supplied to the current run, if
+        any; a warning is emitted for those which are missing.
+
+        :param ctxt: A ``timid.context.Context`` object.
+        :param state: A dictionary of the saved state, as returned by
+                      ``load()``.
+        """
+
+        env = ctxt.environment
+        for name, (method, sep) in state['specials'].items():
+            getattr(env, method)(name, sep)
+
+        missing = (self._restore(ctxt.variables, state['variables']) +
+                   self._restore(env, state['environment']))
+        env.cwd = state['cwd']
+
+        ctxt.emit('Resuming from step %d' % state['index'])
+        if missing:
+            ctxt.emit('Warning: the values of these sensitive variables '
+                      'were not saved and have not been supplied: %s' %
+                      ', '.join(sorted(missing)))
+
+    @staticmethod
+    def _restore(sdict, saved):
+        """
+        Restore the contents of a ``timid.utils.SensitiveDict``.
+
+        :param sdict: The ``timid.utils.SensitiveDict``.
+        :param saved: The list returned by ``_capture()``.
+
+        :returns: A list of the sensitive keys whose values were
+                  omitted from the checkpoint and are not present in
+                  ``sdict``.
+        """
+
+        data, sensitive, omitted = saved
+
+        # Sensitive values come from the current run
+        for key in list(sdict):
+            if key not in data and key not in sensitive:
+                del sdict[key]
+        sdict.update(data)
+        for key in sensitive:
+            sdict.declare_sensitive(key)
+
+        return [key for key in omitted if key not in sdict]
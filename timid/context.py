@@ -13,14 +13,16 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
-from __future__ import print_function
-
-import sys
+import copy
+import os
 
 import jinja2
 import six
 
+from timid import cache
 from timid import environment
+from timid import events
+from timid import output
 from timid import steps
 from timid import utils
 
@@ -32,15 +34,37 @@ class Context(object):
     data required to execute a test sequence.
     """
 
-    def __init__(self, verbose=1, debug=False, cwd=None):
+    def __init__(self, verbose=1, debug=False, cwd=None, cache_dir=None):
         """
         Initialize a new ``Context`` instance.
+
+        :param verbose: The verbosity level.  Defaults to 1.
+        :param debug: A boolean indicating whether debugging is
+                      enabled.  Defaults to ``False``.
+        :param cwd: The working directory processes should be executed
+                    in.  Defaults to the current working directory.
+        :param cache_dir: An optional directory in which to store
+                          persistent caches, such as the cache of
+                          validated test steps.  If not given, no
+                          persistent caching is performed.
         """
 
         # Save the verbosity and debugging settings
         self.verbose = verbose
         self.debug = debug
 
+        # Set up the caches
+        self.cache_dir = cache_dir
+        self.plan_cache = cache.PlanCache(
+            os.path.join(cache_dir, 'plans') if cache_dir else None)
+        self.parse_cache = cache.ParseCache()
+
+        # The records of successful steps and the digests of their
+        # input files, used by the "cache" modifier; these are always
+        # persistent, in the default cache directory if necessary, but
+        # are only created if the "cache" modifier is used
+        self.step_caches = cache.StepCaches(cache_dir)
+
         # Set up the basic variables
         self.variables = utils.SensitiveDict()
         self.environment = environment.Environment(cwd=cwd)
@@ -48,13 +72,126 @@ class Context(object):
         # The list of test steps
         self.steps = []
 
-        # Set up a Jinja2 environment for substitutions
+        # The time taken by each phase of reading the test steps, in
+        # seconds; set by ``timid()``
+        self.timings = {}
+
+        # The activated extensions, an instance of
+        # ``timid.extensions.ExtensionSet``; set by ``timid()``
+        self.extensions = None
+
+        # Set up a Jinja2 environment for substitutions; compiled
+        # templates are shared through the process-wide cache
+        self.templates = cache.templates
         self._jinja = jinja2.Environment()
         self._jinja.globals['env'] = self.environment
 
-    def emit(self, msg, level=1, debug=False):
+        # An optional label to prefix messages with; used to
+        # distinguish the output of concurrently executing tests
+        self.label = None
+
+        # The pipeline delivering emitted messages to the console and
+        # any other sinks
+        self.events = events.EventLog([events.ConsoleSink()])
+
+        # Cache of the variables used to render templates
+        self._render_cache = None
+
+        # Masks sensitive values in the output of processes
+        self._scrubber = output.Scrubber()
+
+    def fork(self, label=None):
+        """
+        Create a new context for executing another test.  The new
+        context starts with copies of the environment and the
+        template variables, so the tests executed in each context do
+        not affect each other, but shares the caches of validated and
+        parsed test steps and the activated extensions.
+
+        :param label: An optional label to prefix the messages emitted
+                      through the new context with.
+
+        :returns: A new ``Context`` instance.
+        """
+
+        # Start from a shallow copy, which shares the caches, the
+        # event pipeline (so messages stay in order), and the
+        # extensions, rather than building and discarding a fresh
+        # context
+        new = copy.copy(self)
+
+        # Copy the variables and the environment
+        new.variables = self.variables.copy()
+        new.environment = self.environment.copy()
+
+        # The Jinja2 environment must refer to the new environment; an
+        # overlay shares the configuration
+        new._jinja = self._jinja.overlay()
+        new._jinja.globals = dict(self._jinja.globals)
+        new._jinja.globals['env'] = new.environment
+
+        # Copy the steps, and reset the state of the test
+        new.steps = list(self.steps)
+        new.timings = {}
+        new.label = label
+        new._render_cache = None
+        new._scrubber = output.Scrubber()
+
+        return new
+
+    def tracking(self, tracker):
+        """
+        Create a view of the context for invoking an action whose
+        processes must be tracked, such as by the "timeout" modifier.
+        The view shares all the state of the context, but its
+        environment adds the processes started through it to the
+        tracker; see ``timid.environment.Environment.tracking()``.
+
+        :param tracker: An instance of
+                        ``timid.environment.ProcessTracker``.
+
+        :returns: A new ``Context`` instance.
+        """
+
+        new = copy.copy(self)
+        new.environment = self.environment.tracking(tracker)
+
+        return new
+
+    @property
+    def result_cache(self):
+        """
+        Retrieve the ``timid.cache.ResultCache`` recording the steps
+        which have succeeded.
+        """
+
+        return self.step_caches.result_cache
+
+    @property
+    def stat_cache(self):
         """
-        Emit a message to the user.
+        Retrieve the ``timid.cache.StatCache`` caching the digests of
+        the input files of steps.
+        """
+
+        return self.step_caches.stat_cache
+
+    @property
+    def scrubber(self):
+        """
+        Retrieve a ``timid.output.Scrubber`` for masking the values of
+        the sensitive template variables and environment variables in
+        output.  The scrubber is updated with the current values each
+        time it is retrieved.
+        """
+
+        return self._scrubber.update(self.variables, self.environment)
+
+    def emit(self, msg, level=1, debug=False, idx=None, step=None):
+        """
+        Emit a message to the user.  The message is delivered to the
+        sinks of the ``events`` pipeline, which writes it
+        asynchronously; use ``flush()`` to wait for it to be written.
 
         :param msg: The message to emit.  If ``debug`` is ``True``,
                     the message will be emitted to ``stderr`` only if
@@ -69,6 +206,10 @@ class Context(object):
         :param debug: If ``True``, marks the message as a debugging
                       message.  The message will only be emitted if
                       the ``debug`` attribute is ``True``.
+        :param idx: The index of the step the message concerns, if
+                    any.
+        :param step: The ``timid.steps.Step`` the message concerns,
+                     if any.
         """
 
         # Is it a debug message?
@@ -76,16 +217,73 @@ class Context(object):
             if not self.debug:
                 # Debugging not enabled, don't emit the message
                 return
-            stream = sys.stderr
         else:
             # Not a debugging message; is verbose high enough?
             if self.verbose < level:
                 return
-            stream = sys.stdout
 
         # Emit the message
-        print(msg, file=stream)
-        stream.flush()
+        self.events.put(events.Event(
+            msg, level, debug, self.label, idx,
+            None if step is None else step.step_addr))
+
+    def flush(self):
+        """
+        Wait until all the messages emitted so far have been written.
+        This must be done before anything else writes to the console,
+        so that the output stays in order.
+        """
+
+        self.events.flush()
+
+    def _render_vars(self):
+        """
+        Retrieve the variables for rendering templates.  This is the
+        Jinja2 globals overlaid with the template variables.  The
+        dictionary is only rebuilt when the template variables change;
+        it must not be modified.
+
+        :returns: A dictionary of the variables.
+        """
+
+        variables = self.variables
+        cached = self._render_cache
+        if (cached is None or cached[0] is not variables or
+                cached[1] != variables.version):
+            render_vars = dict(self._jinja.globals)
+            render_vars.update(variables)
+            cached = (variables, variables.version, render_vars)
+            self._render_cache = cached
+
+        return cached[2]
+
+    def _render(self, tmpl):
+        """
+        Render a template using the template variables.
+
+        :param tmpl: The ``jinja2.Template`` to render, as returned by
+                     ``TemplateCache.template()``.
+
+        :returns: The rendered string.
+        """
+
+        return tmpl.render(self._render_vars())
+
+    def _evaluate(self, expr, extra=None):
+        """
+        Evaluate an expression using the template variables.
+
+        :param expr: The compiled expression, as returned by
+                     ``TemplateCache.expression()``.
+        :param extra: An optional dictionary of additional variables
+                      to make available to the expression.  These
+                      take precedence over the template variables.
+
+        :returns: The value of the expression.  An undefined value is
+                  returned as ``None``.
+        """
+
+        return expr(self._render_vars(), **(extra or {}))
 
     def template(self, string):
         """
@@ -105,14 +303,16 @@ class Context(object):
             return lambda ctxt: string
 
         # Create the template and return the callable
-        tmpl = self._jinja.from_string(string)
-        return lambda ctxt: tmpl.render(ctxt.variables)
+        tmpl = self.templates.template(self._jinja, string)
+        return lambda ctxt: ctxt._render(tmpl)
 
     def expression(self, string):
         """
         Interpret an expression string.  This returns a callable taking
         one argument--this context--and returning the result of
-        evaluating the expression.
+        evaluating the expression.  Additional variables for the
+        expression may be passed to the callable as keyword
+        arguments.
 
         :param string: The expression.
 
@@ -123,11 +323,11 @@ class Context(object):
         # Short-circuit if the expression "string" isn't actually a
         # string
         if not isinstance(string, six.string_types):
-            return lambda ctxt: string
+            return lambda ctxt, **extra: string
 
         # Create the expression and return the callable
-        expr = self._jinja.compile_expression(string)
-        return lambda ctxt: expr(ctxt.variables)
+        expr = self.templates.expression(self._jinja, string)
+        return lambda ctxt, **extra: ctxt._evaluate(expr, extra)
 
 
 class VariableAction(steps.SensitiveDictAction):
@@ -13,15 +13,359 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
+import hashlib
+import importlib
+import json
+import os
 import sys
 
-import pkg_resources
 import six
 
+from timid import utils
+
 
 # Indicate that the entrypoint cannot be loaded
 _unavailable = object()
 
+# The entrypoint namespaces recorded in the persistent index
+NAMESPACES = ('timid.actions', 'timid.extensions', 'timid.modifiers')
+
+
+def _metadata():
+    """
+    Import the ``importlib.metadata`` module.  This is deferred until
+    a scan of the installed distributions is actually required, so
+    that its import cost is not paid when the index is fresh.
+
+    :returns: The ``importlib.metadata`` module, or its
+              ``importlib_metadata`` backport on older Pythons.
+    """
+
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        import importlib_metadata as metadata
+
+    return metadata
+
+
+def _mtime(path):
+    """
+    Retrieve the modification time of a path.
+
+    :param path: The path to examine.
+
+    :returns: The modification time, or ``None`` if the path does not
+              exist.
+    """
+
+    try:
+        return os.stat(path or os.curdir).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+class EntryPoint(object):
+    """
+    Describe a single entrypoint.  This is a lightweight equivalent
+    of the entrypoint objects provided by ``importlib.metadata``,
+    which can be reconstructed from the persistent index without
+    consulting the installed distributions.
+    """
+
+    def __init__(self, name, value, dist_name=None, dist_version=None):
+        """
+        Initialize an ``EntryPoint`` object.
+
+        :param name: The name of the entrypoint.
+        :param value: The object reference, in "module:attr" form.
+                      Any trailing extras specification is ignored.
+        :param dist_name: The name of the distribution providing the
+                          entrypoint.
+        :param dist_version: The version of the distribution
+                             providing the entrypoint.
+        """
+
+        self.name = name
+        self.value = value
+        self.dist_name = dist_name
+        self.dist_version = dist_version
+
+    def __str__(self):
+        """
+        Return a string representation of the entrypoint.
+
+        :returns: The entrypoint in "name = value" form.
+        """
+
+        return '%s = %s' % (self.name, self.value)
+
+    def __repr__(self):
+        """
+        Return a representation of the entrypoint.
+
+        :returns: A string representation of the entrypoint,
+                  including the distribution providing it.
+        """
+
+        return '<EntryPoint %s (%s %s)>' % (
+            self, self.dist_name, self.dist_version)
+
+    def __eq__(self, other):
+        """
+        Compare two entrypoints for equality.
+
+        :param other: The other entrypoint.
+
+        :returns: A ``True`` value if the two entrypoints are equal,
+                  ``False`` otherwise.
+        """
+
+        if not isinstance(other, EntryPoint):
+            return NotImplemented
+
+        return self.to_list() == other.to_list()
+
+    def __ne__(self, other):
+        """
+        Compare two entrypoints for inequality.
+
+        :param other: The other entrypoint.
+
+        :returns: A ``True`` value if the two entrypoints are not
+                  equal, ``False`` otherwise.
+        """
+
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def to_list(self):
+        """
+        Convert the entrypoint into a form suitable for serialization.
+
+        :returns: A list of the name, value, distribution name, and
+                  distribution version.
+        """
+
+        return [self.name, self.value, self.dist_name, self.dist_version]
+
+    def load(self):
+        """
+        Load the object referenced by the entrypoint.
+
+        :returns: The referenced object.
+        """
+
+        # Split up the object reference, discarding any extras
+        module, _sep, attrs = self.value.split('[', 1)[0].partition(':')
+
+        # Import the module and walk down to the object
+        obj = importlib.import_module(module.strip())
+        for attr in attrs.strip().split('.') if attrs.strip() else []:
+            obj = getattr(obj, attr)
+
+        return obj
+
+
+def scan(namespaces):
+    """
+    Scan the installed distributions for the entrypoints in the
+    designated namespaces.  As with ``pkg_resources``, only the first
+    distribution of a given name found on ``sys.path`` is considered.
+
+    :param namespaces: A list of the entrypoint namespaces to scan
+                       for.
+
+    :returns: A tuple of a dictionary and a list.  The dictionary
+              maps each namespace to a list of ``EntryPoint``
+              objects.  The list contains the paths of the
+              "entry_points.txt" files from which entrypoints were
+              read.
+    """
+
+    result = dict((ns, []) for ns in namespaces)
+    sources = []
+    seen = set()
+    for dist in _metadata().distributions():
+        # Skip shadowed distributions
+        name = dist.metadata['Name']
+        key = (name or '').lower().replace('_', '-')
+        if key in seen:
+            continue
+        seen.add(key)
+
+        found = False
+        for ep in dist.entry_points:
+            if ep.group in result:
+                result[ep.group].append(
+                    EntryPoint(ep.name, ep.value, name, dist.version))
+                found = True
+
+        # Remember where the entrypoints came from
+        path = getattr(dist, '_path', None)
+        if found and path is not None:
+            sources.append(os.path.join(str(path), 'entry_points.txt'))
+
+    return result, sources
+
+
+class EntryIndex(object):
+    """
+    A persistent index of the entrypoints in the timid namespaces.
+    Scanning all the installed distributions is expensive, so the
+    results of the scan are saved to a file and reused until the
+    modification time of any directory on ``sys.path``, or of any
+    file the entrypoints were read from, changes.
+    """
+
+    # The version of the index format; bump this to invalidate all
+    # existing indexes
+    version = 1
+
+    def __init__(self, path=utils.unset, namespaces=NAMESPACES):
+        """
+        Initialize an ``EntryIndex`` instance.
+
+        :param path: The path of the index file.  If not provided,
+                     a file in the default cache directory specific
+                     to the running Python environment is used,
+                     unless the ``TIMID_ENTRY_INDEX`` environment
+                     variable is set to "0".  If ``None``, the index
+                     is not persisted.
+        :param namespaces: A list of the entrypoint namespaces to
+                           index.
+        """
+
+        self._path = path
+        self.namespaces = tuple(namespaces)
+
+        # Demand-loaded index contents
+        self._entrypoints = None
+
+    @property
+    def path(self):
+        """
+        Retrieve the path of the index file.  This may be ``None`` if
+        the index is not persisted.
+        """
+
+        if self._path is utils.unset:
+            if os.environ.get('TIMID_ENTRY_INDEX', '1') == '0':
+                self._path = None
+            else:
+                # Distinguish between Python environments
+                env = hashlib.sha1(six.text_type([
+                    sys.executable, sys.prefix, sys.version,
+                ]).encode('utf-8')).hexdigest()
+                self._path = os.path.join(
+                    utils.default_cache_dir(), 'entrypoints',
+                    '%s.json' % env)
+
+        return self._path
+
+    def stamp(self, sources=()):
+        """
+        Compute a stamp identifying the state of the installed
+        distributions.
+
+        :param sources: A list of additional paths whose modification
+                        times should be included.
+
+        :returns: A list of lists, each containing a path and its
+                  modification time.
+        """
+
+        paths = list(sys.path) + list(sources)
+        return [[path, _mtime(path)] for path in paths]
+
+    def _read(self):
+        """
+        Read the index file.
+
+        :returns: A dictionary mapping each namespace to a list of
+                  ``EntryPoint`` objects, or ``None`` if the index
+                  file is missing, unreadable, or out of date.
+        """
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except Exception:
+            return None
+
+        # Verify that the index is fresh
+        if (not isinstance(data, dict) or
+                data.get('version') != self.version or
+                data.get('namespaces') != list(self.namespaces) or
+                data.get('stamp') != self.stamp(data.get('sources', []))):
+            return None
+
+        return dict(
+            (ns, [EntryPoint(*ep) for ep in eps])
+            for ns, eps in data['entrypoints'].items()
+        )
+
+    def _write(self, entrypoints, sources):
+        """
+        Write the index file.  Errors are ignored.
+
+        :param entrypoints: A dictionary mapping each namespace to a
+                            list of ``EntryPoint`` objects.
+        :param sources: A list of the paths of the files the
+                        entrypoints were read from.
+        """
+
+        data = {
+            'version': self.version,
+            'namespaces': list(self.namespaces),
+            'sources': sources,
+            'stamp': self.stamp(sources),
+            'entrypoints': dict(
+                (ns, [ep.to_list() for ep in eps])
+                for ns, eps in entrypoints.items()
+            ),
+        }
+
+        try:
+            utils.atomic_write(
+                self.path, json.dumps(data, sort_keys=True).encode('utf-8'))
+        except Exception:
+            pass
+
+    def load(self):
+        """
+        Load the index, rescanning the installed distributions if the
+        index file is missing or out of date.
+
+        :returns: A dictionary mapping each namespace to a list of
+                  ``EntryPoint`` objects.
+        """
+
+        if self._entrypoints is None:
+            entrypoints = self._read() if self.path else None
+            if entrypoints is None:
+                entrypoints, sources = scan(self.namespaces)
+                if self.path:
+                    self._write(entrypoints, sources)
+            self._entrypoints = entrypoints
+
+        return self._entrypoints
+
+    def get(self, namespace):
+        """
+        Retrieve the entrypoints defined for a namespace.  Namespaces
+        not covered by the index are scanned directly.
+
+        :param namespace: The entrypoint namespace.
+
+        :returns: A list of ``EntryPoint`` objects.
+        """
+
+        if namespace in self.namespaces:
+            return self.load().get(namespace, [])
+
+        return scan([namespace])[0][namespace]
+
 
 class NamespaceCache(object):
     """
@@ -29,19 +373,27 @@ class NamespaceCache(object):
     entrypoint may be accessed using item notation.
     """
 
-    def __init__(self, namespace):
+    def __init__(self, namespace, entrypoints=None):
         """
         Initialize a ``NamespaceCache``.
 
         :param namespace: The namespace to cache.
+        :param entrypoints: A list of the ``EntryPoint`` objects
+                            defined for the namespace.  If not
+                            provided, the installed distributions are
+                            scanned.
         """
 
         # Save the namespace
         self.namespace = namespace
 
+        # Scan for the entrypoints if needed
+        if entrypoints is None:
+            entrypoints = scan([namespace])[0][namespace]
+
         # Formulate the entrypoints so we only iterate once
         self._entrypoints = {}
-        for ep in pkg_resources.iter_entry_points(namespace):
+        for ep in entrypoints:
             self._entrypoints.setdefault(ep.name, [])
             self._entrypoints[ep.name].append(ep)
 
@@ -75,8 +427,7 @@ class NamespaceCache(object):
                 # Load the entrypoint
                 try:
                     ep_obj = ep.load()
-                except (ImportError, AttributeError,
-                        pkg_resources.UnknownExtra):
+                except (ImportError, AttributeError):
                     continue
 
                 # If it's the first for that entrypoint, cache it
@@ -128,8 +479,7 @@ class NamespaceCache(object):
             for ep in self._entrypoints[name]:
                 try:
                     self._epcache[name] = ep.load()
-                except (ImportError, AttributeError,
-                        pkg_resources.UnknownExtra):
+                except (ImportError, AttributeError):
                     # Save the error for later re-raise
                     if error is None:
                         error = sys.exc_info()
@@ -145,6 +495,25 @@ class NamespaceCache(object):
 
         return self._epcache[name]
 
+    def signature(self):
+        """
+        Retrieve a signature describing the entrypoints defined for the
+        namespace.  The signature identifies each entrypoint and the
+        distribution (and version) providing it, and may be used to
+        detect when the set of installed entrypoints has changed.
+        Note that no attempt is made to load the entrypoints.
+
+        :returns: A sorted list of strings.
+        """
+
+        result = []
+        for eps in self._entrypoints.values():
+            for ep in eps:
+                result.append('%s (%s %s)' % (
+                    ep, ep.dist_name, ep.dist_version))
+
+        return sorted(result)
+
 
 class EntrypointCache(object):
     """
@@ -152,12 +521,17 @@ class EntrypointCache(object):
     using item notation.
     """
 
-    def __init__(self):
+    def __init__(self, index=None):
         """
         Initialize an ``EntrypointCache``.
+
+        :param index: An instance of ``EntryIndex`` to consult for the
+                      entrypoints.  If not provided, a default
+                      ``EntryIndex`` is used.
         """
 
         self._namespaces = {}
+        self._index = index or EntryIndex()
 
     def __getitem__(self, name):
         """
@@ -171,7 +545,8 @@ class EntrypointCache(object):
 
         # Look up the namespace
         if name not in self._namespaces:
-            self._namespaces[name] = NamespaceCache(name)
+            self._namespaces[name] = NamespaceCache(
+                name, self._index.get(name))
 
         return self._namespaces[name]
 
@@ -15,12 +15,17 @@
 
 import abc
 import collections
+import errno
 import os
 import shlex
+import signal
 import subprocess
+import threading
+import time
 
 import six
 
+from timid import output
 from timid import steps
 from timid import utils
 
@@ -84,11 +89,25 @@ class SpecialVariable(object):
     def _rebuild(self):
         """
         Helper method used to alter the variable's value in a linked
-        ``Environment`` instance when a change is made to the
-        ``SpecialVariable`` instance.
+        ``Environment`` instance after a change has been made to the
+        ``SpecialVariable`` instance.  The value is stored directly
+        in the underlying variables, bypassing the rebuild of any
+        other changed special variables.
         """
 
-        self._env._data[self._var] = self._sep.join(self._value)
+        self._env._vars[self._var] = self._sep.join(self._value)
+
+    def _changed(self):
+        """
+        Helper method used to alert the linked ``Environment`` instance
+        when a change is made to the ``SpecialVariable`` instance.  The
+        variable's value in the ``Environment`` is rebuilt only when
+        it is next read, so a series of changes costs a single
+        rebuild.
+        """
+
+        self._env._dirty[self._var] = self
+        self._env._version += 1
 
     def _update(self, value):
         """
@@ -163,7 +182,7 @@ class ListVariable(SpecialVariable, collections.MutableSequence):
         """
 
         self._value[idx] = value
-        self._rebuild()
+        self._changed()
 
     def __delitem__(self, idx):
         """
@@ -174,7 +193,7 @@ class ListVariable(SpecialVariable, collections.MutableSequence):
         """
 
         del self._value[idx]
-        self._rebuild()
+        self._changed()
 
     def insert(self, idx, value):
         """
@@ -185,7 +204,19 @@ class ListVariable(SpecialVariable, collections.MutableSequence):
         """
 
         self._value.insert(idx, value)
-        self._rebuild()
+        self._changed()
+
+    def prepend(self, value):
+        """
+        Insert a value at the beginning of the ``ListVariable``,
+        removing any other occurrences of it.  This is the usual way
+        of giving a directory precedence in a search path like PATH.
+
+        :param value: The value to prepend.
+        """
+
+        self._value[:] = [value] + [v for v in self._value if v != value]
+        self._changed()
 
 
 class SetVariable(SpecialVariable, collections.MutableSet):
@@ -193,10 +224,12 @@ class SetVariable(SpecialVariable, collections.MutableSet):
     Represent the value of an environment variable which is set form.
     This is used for representing the TIMID_SENSITIVE environment
     variable, and may be used for other similar variables as well.
+    The elements are kept in the order in which they were added, so
+    the value of the environment variable is deterministic.
     """
 
     _type = collections.Set
-    _coerce = set
+    _coerce = utils.OrderedSet
 
     def __contains__(self, item):
         """
@@ -227,7 +260,7 @@ class SetVariable(SpecialVariable, collections.MutableSet):
         """
 
         self._value.add(item)
-        self._rebuild()
+        self._changed()
 
     def discard(self, item):
         """
@@ -237,7 +270,139 @@ class SetVariable(SpecialVariable, collections.MutableSet):
         """
 
         self._value.discard(item)
-        self._rebuild()
+        self._changed()
+
+
+class ProcessTracker(object):
+    """
+    Track the processes started through an ``Environment``, so that
+    they may be terminated.  While a tracker is registered with an
+    ``Environment`` using ``Environment.track()``, each process is
+    started in a new session, on systems which support it, so that
+    the process and any processes it starts may be signalled as a
+    group.
+    """
+
+    # How often to check whether the processes have exited while
+    # waiting to escalate, in seconds
+    poll_interval = 0.05
+
+    def __init__(self):
+        """
+        Initialize a ``ProcessTracker`` instance.
+        """
+
+        self._procs = []
+        self._lock = threading.Lock()
+
+        # The last signal sent to the processes
+        self.signalled = None
+
+    def add(self, proc):
+        """
+        Add a process to the tracker.  If the tracked processes have
+        already been signalled, the new process receives the same
+        signal immediately.
+
+        :param proc: The process, either a ``subprocess.Popen`` or an
+                     ``asyncio.subprocess.Process`` instance.
+        """
+
+        with self._lock:
+            self._procs.append(proc)
+            sig = self.signalled
+
+        if sig is not None:
+            self._signal(proc, sig)
+
+    @staticmethod
+    def _signal(proc, sig):
+        """
+        Send a signal to the process group of a process.
+
+        :param proc: The process.
+        :param sig: The signal to send.
+        """
+
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(proc.pid, sig)
+            elif proc.returncode is None:
+                proc.send_signal(sig)
+        except OSError:
+            # The process has already exited
+            pass
+
+    @staticmethod
+    def _alive(proc):
+        """
+        Determine whether any member of the process group of a process
+        is still running.
+
+        :param proc: The process.
+
+        :returns: A ``True`` value if the process group is still
+                  running, ``False`` otherwise.
+        """
+
+        if hasattr(os, 'killpg'):
+            try:
+                os.killpg(proc.pid, 0)
+            except OSError as exc:
+                return exc.errno != errno.ESRCH
+            return True
+
+        poll = getattr(proc, 'poll', None)
+        if poll is not None:
+            poll()
+        return proc.returncode is None
+
+    def signal(self, sig):
+        """
+        Send a signal to all the tracked process groups.
+
+        :param sig: The signal to send.
+        """
+
+        with self._lock:
+            self.signalled = sig
+            procs = list(self._procs)
+
+        for proc in procs:
+            self._signal(proc, sig)
+
+    def alive(self):
+        """
+        Determine whether any of the tracked process groups is still
+        running.
+
+        :returns: A ``True`` value if any of the process groups is
+                  still running, ``False`` otherwise.
+        """
+
+        with self._lock:
+            procs = list(self._procs)
+
+        return any(self._alive(proc) for proc in procs)
+
+    def terminate(self, grace):
+        """
+        Terminate all the tracked process groups.  The process groups
+        are first sent ``SIGTERM``; any still running after the grace
+        period are sent ``SIGKILL``.
+
+        :param grace: The grace period, in seconds.
+        """
+
+        self.signal(signal.SIGTERM)
+
+        # Wait for the processes to exit
+        deadline = utils.monotonic() + grace
+        while self.alive():
+            if utils.monotonic() >= deadline:
+                self.signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+                break
+            time.sleep(self.poll_interval)
 
 
 class Environment(utils.SensitiveDict):
@@ -253,7 +418,7 @@ class Environment(utils.SensitiveDict):
 
         :param environ: An optional dictionary containing the initial
                         set of environment variables.  If omitted,
-                        ``os.environ`` will be used.
+                        a snapshot of ``os.environ`` will be used.
         :param sensitive: An optional set of "sensitive" variables,
                           environment variables whose values should
                           not be printed out.
@@ -264,8 +429,23 @@ class Environment(utils.SensitiveDict):
                     directory.
         """
 
-        # Select the starting environment
-        environ = environ or os.environ.copy()
+        # Special variables changed since their values in the
+        # environment were last rebuilt, and the lock serializing
+        # their rebuilds; the version is needed here because adding
+        # to the 'sensitive' set below counts as a change
+        self._dirty = {}
+        self._flush_lock = threading.Lock()
+        self._version = 0
+
+        # Select the starting environment; the process environment is
+        # snapshotted into a frozen base layer, which copies of the
+        # environment then share
+        if not environ:
+            environ = utils.LayeredDict(
+                utils.LayeredDict(data=dict(os.environ)).freeze())
+        elif not isinstance(environ, utils.LayeredDict):
+            environ = utils.LayeredDict(
+                utils.LayeredDict(data=dict(environ)).freeze())
 
         # Build the 'sensitive' set
         sensitive_var = SetVariable(self, 'TIMID_SENSITIVE',
@@ -285,6 +465,39 @@ class Environment(utils.SensitiveDict):
         # Initialize the working directory
         self._cwd = utils.canonicalize_path(os.getcwd(), cwd or os.curdir)
 
+        # The trackers of the processes started through the
+        # environment
+        self._trackers = []
+
+    @property
+    def _data(self):
+        """
+        The variables of the environment.  The values of any special
+        variables changed since they were last read are rebuilt
+        first.
+        """
+
+        if self._dirty:
+            # Each variable is rebuilt before it is cleared, so a
+            # concurrent reader never sees a stale value
+            with self._flush_lock:
+                for name, special in list(self._dirty.items()):
+                    special._rebuild()
+                    self._dirty.pop(name, None)
+
+        return self._vars
+
+    @_data.setter
+    def _data(self, value):
+        """
+        Set the variables of the environment.
+
+        :param value: A ``timid.utils.LayeredDict`` containing the
+                      variables.
+        """
+
+        self._vars = value
+
     def __getitem__(self, name):
         """
         Retrieve the value of a variable from the environment.  If the
@@ -297,8 +510,9 @@ class Environment(utils.SensitiveDict):
         :returns: The value of the designated variable.
         """
 
-        # Raise a KeyError if needed
-        if name not in self._data:
+        # Raise a KeyError if needed; a changed special variable is
+        # always present
+        if name not in self._dirty and name not in self._vars:
             raise KeyError(name)
 
         # If it's special, return the special instance
@@ -319,23 +533,25 @@ class Environment(utils.SensitiveDict):
                       value is interpreted as a delete.
         """
 
-        # Get the special variable, if any
+        # Get the special variable, if any; its pending changes are
+        # superseded
         special = self._special.get(name)
+        self._dirty.pop(name, None)
 
         # Handle the delete case first
         if value is None:
             self._data.pop(name, None)
-            if special:
+            if special is not None:
                 special._update(None)
 
         # Is the value a string type?
         elif isinstance(value, six.string_types):
             self._data[name] = value
-            if special:
+            if special is not None:
                 special._update(value)
 
         # Is the value a type compatible with a special variable?
-        elif (special and
+        elif (special is not None and
               (isinstance(value, collections.Iterable) or
                isinstance(value, special._type))):
             # Let the special variable handle the change directly
@@ -348,6 +564,8 @@ class Environment(utils.SensitiveDict):
         else:
             raise ValueError('invalid value %r' % value)
 
+        self._version += 1
+
     def __delitem__(self, name):
         """
         Delete the value of a variable from the environment.
@@ -357,19 +575,45 @@ class Environment(utils.SensitiveDict):
 
         # Will raise the KeyError if the variable doesn't exist
         del self._data[name]
+        self._dirty.pop(name, None)
 
         # Notify special variables
         if name in self._special:
             self._special[name]._update(None)
 
+        self._version += 1
+
     def copy(self):
         """
         Retrieve a copy of the Environment.  Note that this is a shallow
-        copy.
+        copy.  The variables are not copied wholesale; the copy shares
+        the frozen base layer of the variables, and copies only the
+        changes made on top of it.  The original environment is left
+        untouched, so it may be copied while other threads modify it.
         """
 
-        return self.__class__(self._data.copy(), self._sensitive.copy(),
-                              self._cwd)
+        # Set up the copy without re-reading the variables
+        new = self.__class__.__new__(self.__class__)
+        new._dirty = {}
+        new._flush_lock = threading.Lock()
+        if self._sensitive is self._special.get('TIMID_SENSITIVE'):
+            sensitive = None
+        else:
+            sensitive = set(self._sensitive)
+        utils.SensitiveDict.__init__(new, self._data.copy(), sensitive)
+
+        # Bind views of the special variables to the copy
+        new._special = dict(
+            (name, special.__class__(new, name, special._sep))
+            for name, special in self._special.items()
+        )
+        if sensitive is None:
+            new._sensitive = new._special['TIMID_SENSITIVE']
+
+        new._cwd = self._cwd
+        new._trackers = []
+
+        return new
 
     def _declare_special(self, name, sep, klass):
         """
@@ -434,18 +678,141 @@ class Environment(utils.SensitiveDict):
         using the ``shlex.split()`` function.
         """
 
+        return self._call(args, kwargs, self._trackers)
+
+    def _call(self, args, kwargs, trackers):
+        """
+        Implement ``call()``.
+
+        :param args: The command to execute.
+        :param kwargs: The keyword arguments to pass to
+                       ``subprocess.Popen``.
+        :param trackers: A list of the ``ProcessTracker`` instances to
+                         add the process to.
+
+        :returns: The ``subprocess.Popen`` instance.
+        """
+
+        args = self._call_args(args, kwargs, trackers)
+
+        proc = subprocess.Popen(args, **kwargs)
+        for tracker in list(trackers):
+            tracker.add(proc)
+
+        return proc
+
+    def call_async(self, args, **kwargs):
+        """
+        A thin wrapper around ``asyncio.create_subprocess_exec()``.
+        Takes the same options as ``call()``, and returns a coroutine
+        which, when awaited, returns an ``asyncio.subprocess.Process``
+        instance.  Requires Python 3.5 or later.
+        """
+
+        return self._call_async(args, kwargs, self._trackers)
+
+    def _call_async(self, args, kwargs, trackers):
+        """
+        Implement ``call_async()``.
+
+        :param args: The command to execute.
+        :param kwargs: The keyword arguments to pass to
+                       ``asyncio.create_subprocess_exec()``.
+        :param trackers: A list of the ``ProcessTracker`` instances to
+                         add the process to.
+
+        :returns: A coroutine returning the
+                  ``asyncio.subprocess.Process`` instance.
+        """
+
+        # Imported here, as asyncio is not available on Python 2
+        import asyncio
+
+        args = self._call_args(args, kwargs, trackers)
+
+        process = asyncio.create_subprocess_exec(*args, **kwargs)
+        if not trackers:
+            return process
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        return aio.track_process(process, list(trackers))
+
+    def _call_args(self, args, kwargs, trackers):
+        """
+        Prepare the arguments for ``call()`` or ``call_async()``.
+
+        :param args: The command to execute.  If a string, it will be
+                     converted into a sequence using the
+                     ``shlex.split()`` function.
+        :param kwargs: The keyword arguments to pass to the process
+                       creation function.  This dictionary is updated
+                       in place.
+        :param trackers: A list of the ``ProcessTracker`` instances the
+                         process will be added to.
+
+        :returns: The command to execute, as a sequence.
+        """
+
         # Convert string args into a sequence
         if isinstance(args, six.string_types):
             args = shlex.split(args)
 
         # Substitute cwd and env
         kwargs['cwd'] = self._cwd
-        kwargs['env'] = self._data
+        kwargs['env'] = self._data.flatten()
 
         # Set a default for close_fds
         kwargs.setdefault('close_fds', True)
 
-        return subprocess.Popen(args, **kwargs)
+        # Start tracked processes in a new session, so that they can
+        # be signalled as a group
+        if trackers and hasattr(os, 'setsid'):
+            if six.PY2:
+                kwargs.setdefault('preexec_fn', os.setsid)
+            else:
+                kwargs.setdefault('start_new_session', True)
+
+        return args
+
+    def track(self, tracker):
+        """
+        Register a process tracker.  All processes subsequently started
+        through the environment are added to the tracker, until it is
+        unregistered using ``untrack()``.
+
+        :param tracker: An instance of ``ProcessTracker``.
+        """
+
+        self._trackers.append(tracker)
+
+    def untrack(self, tracker):
+        """
+        Unregister a process tracker.
+
+        :param tracker: An instance of ``ProcessTracker`` previously
+                        registered with ``track()``.
+        """
+
+        try:
+            self._trackers.remove(tracker)
+        except ValueError:
+            pass
+
+    def tracking(self, tracker):
+        """
+        Create a view of the environment which adds the processes
+        started through it to a process tracker.  Unlike ``track()``,
+        this does not affect processes started through the environment
+        itself, such as by concurrently executing steps.
+
+        :param tracker: An instance of ``ProcessTracker``.
+
+        :returns: An instance of ``TrackedEnvironment``.
+        """
+
+        return TrackedEnvironment(self, tracker)
 
     @property
     def cwd(self):
@@ -469,6 +836,149 @@ class Environment(utils.SensitiveDict):
         self._cwd = utils.canonicalize_path(self._cwd, value)
 
 
+class TrackedEnvironment(object):
+    """
+    A view of an ``Environment`` which adds the processes started
+    through it to a process tracker, in addition to the trackers
+    registered with the environment.  All other operations, including
+    changes to the environment variables and the working directory,
+    are passed through to the underlying environment.  Views may be
+    nested.
+    """
+
+    def __init__(self, env, tracker):
+        """
+        Initialize a ``TrackedEnvironment`` instance.
+
+        :param env: The ``Environment`` or ``TrackedEnvironment`` to
+                    provide a view of.
+        :param tracker: An instance of ``ProcessTracker``.
+        """
+
+        # Bypass __setattr__(), which passes attributes through
+        object.__setattr__(self, '_env', env)
+        object.__setattr__(self, '_tracker', tracker)
+
+    def __getattr__(self, name):
+        """
+        Retrieve an attribute of the underlying environment.
+
+        :param name: The name of the attribute.
+
+        :returns: The value of the attribute.
+        """
+
+        return getattr(self._env, name)
+
+    def __setattr__(self, name, value):
+        """
+        Set an attribute, such as ``cwd``, of the underlying
+        environment.
+
+        :param name: The name of the attribute.
+        :param value: The new value of the attribute.
+        """
+
+        setattr(self._env, name, value)
+
+    def __len__(self):
+        """
+        Obtain the number of environment variables.
+
+        :returns: The number of environment variables.
+        """
+
+        return len(self._env)
+
+    def __iter__(self):
+        """
+        Iterate over the environment variable names.
+
+        :returns: An iterator over the environment variable names.
+        """
+
+        return iter(self._env)
+
+    def __contains__(self, name):
+        """
+        Determine whether an environment variable is set.
+
+        :param name: The name of the environment variable.
+
+        :returns: A ``True`` value if the environment variable is set,
+                  ``False`` otherwise.
+        """
+
+        return name in self._env
+
+    def __getitem__(self, name):
+        """
+        Retrieve the value of an environment variable.
+
+        :param name: The name of the environment variable.
+
+        :returns: The value of the environment variable.
+        """
+
+        return self._env[name]
+
+    def __setitem__(self, name, value):
+        """
+        Set the value of an environment variable.
+
+        :param name: The name of the environment variable.
+        :param value: The new value of the environment variable.
+        """
+
+        self._env[name] = value
+
+    def __delitem__(self, name):
+        """
+        Delete an environment variable.
+
+        :param name: The name of the environment variable.
+        """
+
+        del self._env[name]
+
+    @property
+    def _trackers(self):
+        """
+        Retrieve the list of process trackers processes started
+        through the view are added to.
+        """
+
+        return self._env._trackers + [self._tracker]
+
+    def call(self, args, **kwargs):
+        """
+        A thin wrapper around ``subprocess.Popen``.  See
+        ``Environment.call()``.
+        """
+
+        return self._env._call(args, kwargs, self._trackers)
+
+    def call_async(self, args, **kwargs):
+        """
+        A thin wrapper around ``asyncio.create_subprocess_exec()``.  See
+        ``Environment.call_async()``.
+        """
+
+        return self._env._call_async(args, kwargs, self._trackers)
+
+    def tracking(self, tracker):
+        """
+        Create a nested view of the environment which adds the
+        processes started through it to another process tracker.
+
+        :param tracker: An instance of ``ProcessTracker``.
+
+        :returns: An instance of ``TrackedEnvironment``.
+        """
+
+        return TrackedEnvironment(self, tracker)
+
+
 class EnvironmentAction(steps.SensitiveDictAction):
     """
     An action for updating and otherwise modifying the execution
@@ -600,10 +1110,29 @@ class RunAction(steps.Action):
           - arg3
 
     In this form, no shell syntax quoting is honored.
+
+    The output of the command may also be captured, making it
+    available to extensions as the ``output`` attribute of the
+    ``StepResult``::
+
+        - run:
+            command: ./command.py arg1 arg2 arg3
+            capture: 65536
+            passthrough: false
+
+    The "command" element may be either of the above forms.  The
+    "capture" element may be ``true``, or the number of bytes of each
+    of the standard output and standard error streams to retain; only
+    the last bytes written are kept, so memory use is bounded no
+    matter how much output the command produces.  By default, the
+    output is still written to the terminal as it arrives; setting
+    "passthrough" to ``false`` suppresses this.  Whether or not the
+    output is captured, the values of any sensitive variables are
+    masked in it.
     """
 
-    # Schema for validating the configuration
-    schema = {
+    # Schema for the command
+    _command_schema = {
         'oneOf': [
             {'type': 'string'},
             {
@@ -613,6 +1142,28 @@ class RunAction(steps.Action):
         ],
     }
 
+    # Schema for validating the configuration
+    schema = {
+        'oneOf': [
+            _command_schema,
+            {
+                'type': 'object',
+                'properties': {
+                    'command': _command_schema,
+                    'capture': {
+                        'oneOf': [
+                            {'type': 'boolean'},
+                            {'type': 'integer', 'minimum': 1},
+                        ],
+                    },
+                    'passthrough': {'type': 'boolean'},
+                },
+                'required': ['command'],
+                'additionalProperties': False,
+            },
+        ],
+    }
+
     def __init__(self, ctxt, name, config, step_addr):
         """
         Initialize a ``RunAction`` instance.
@@ -632,6 +1183,18 @@ class RunAction(steps.Action):
         # Perform superclass initialization
         super(RunAction, self).__init__(ctxt, name, config, step_addr)
 
+        # Select the output capture settings
+        self.capture = None
+        self.passthrough = True
+        if isinstance(config, dict):
+            capture = config.get('capture', False)
+            if capture is True:
+                self.capture = output.DEFAULT_SIZE
+            elif capture is not False:
+                self.capture = capture
+            self.passthrough = config.get('passthrough', True)
+            config = config['command']
+
         # Build up the correct command
         if isinstance(config, six.string_types):
             self.command = ctxt.template(config)
@@ -648,14 +1211,88 @@ class RunAction(steps.Action):
         :returns: A ``StepResult`` object.
         """
 
-        # First, do the correct splitting/rendering
-        if isinstance(self.command, list):
-            args = [arg(ctxt) for arg in self.command]
-        else:
-            args = shlex.split(self.command(ctxt))
+        # The command may write to the console, so the messages
+        # emitted so far must be written first
+        ctxt.flush()
 
         # Invoke the command
-        subproc = ctxt.environment.call(args)
+        capture = self._capture(ctxt)
+        if capture is None:
+            subproc = ctxt.environment.call(self._args(ctxt))
+
+            # All done...
+            return steps.StepResult(returncode=subproc.wait())
+
+        # Invoke the command, reading its output
+        subproc = ctxt.environment.call(
+            self._args(ctxt), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        capture.pump(subproc)
+
+        return capture.result(subproc.wait())
+
+    def call_async(self, ctxt):
+        """
+        Invoke the action using the asyncio engine.  This executes the
+        command specified in the configuration without blocking the
+        event loop.
+
+        :param ctxt: The context object.
+
+        :returns: A coroutine returning a ``StepResult`` object.
+        """
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        # The command may write to the console, so the messages
+        # emitted so far must be written first
+        ctxt.flush()
+
+        # Invoke the command
+        capture = self._capture(ctxt)
+        if capture is None:
+            return aio.wait_process(
+                ctxt.environment.call_async(self._args(ctxt)))
+
+        # Invoke the command, reading its output
+        return aio.wait_process(
+            ctxt.environment.call_async(
+                self._args(ctxt), stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE),
+            capture)
+
+    def _capture(self, ctxt):
+        """
+        Set up the processing of the output of the command.  The output
+        is read if it is to be captured, or if the values of any
+        sensitive variables must be masked in it.
+
+        :param ctxt: The context object.
+
+        :returns: A ``timid.output.Capture`` instance, or ``None`` if
+                  the command may write to the terminal directly.
+        """
+
+        scrubber = ctxt.scrubber
+        if self.capture:
+            return output.Capture(self.capture, self.passthrough, scrubber)
+        elif scrubber:
+            # Retain nothing, but mask the output on its way through
+            return output.Capture(0, True, scrubber)
+
+        return None
+
+    def _args(self, ctxt):
+        """
+        Render the command to execute.
+
+        :param ctxt: The context object.
+
+        :returns: The command, as a list of arguments.
+        """
+
+        # Do the correct splitting/rendering
+        if isinstance(self.command, list):
+            return [arg(ctxt) for arg in self.command]
 
-        # All done...
-        return steps.StepResult(returncode=subproc.wait())
+        return shlex.split(self.command(ctxt))
@@ -0,0 +1,355 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+from __future__ import print_function
+
+import abc
+import atexit
+import io
+import json
+import sys
+import threading
+import time
+import traceback
+
+import six
+from six.moves import queue
+
+
+# A marker placed on the queue to stop the writer thread
+_stop = object()
+
+
+class Event(object):
+    """
+    Describe a message emitted through ``timid.context.Context.emit()``.
+    """
+
+    def __init__(self, msg, level=1, debug=False, label=None, idx=None,
+                 step_addr=None, timestamp=None):
+        """
+        Initialize an ``Event`` instance.
+
+        :param msg: The message.
+        :param level: The verbosity level of the message.
+        :param debug: A boolean indicating whether the message is a
+                      debugging message.
+        :param label: The label of the test the message concerns, or
+                      ``None``.
+        :param idx: The index of the step the message concerns, or
+                    ``None``.
+        :param step_addr: The ``timid.steps.StepAddress`` of the step
+                          the message concerns, or ``None``.
+        :param timestamp: The time the message was emitted, in seconds
+                          since the epoch.  Defaults to the current
+                          time.
+        """
+
+        self.msg = msg
+        self.level = level
+        self.debug = debug
+        self.label = label
+        self.idx = idx
+        self.step_addr = step_addr
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def __str__(self):
+        """
+        Obtain the human-readable form of the event.
+
+        :returns: The message, prefixed by the label if there is one.
+        """
+
+        if self.label:
+            return '%s: %s' % (self.label, self.msg)
+
+        return self.msg
+
+    def to_dict(self):
+        """
+        Convert the event into a form suitable for serializing to JSON.
+
+        :returns: A dictionary describing the event.
+        """
+
+        return {
+            'time': self.timestamp,
+            'level': self.level,
+            'debug': self.debug,
+            'test': self.label,
+            'index': self.idx,
+            'address': (None if self.step_addr is None
+                        else str(self.step_addr)),
+            'message': self.msg,
+        }
+
+
+@six.add_metaclass(abc.ABCMeta)
+class Sink(object):
+    """
+    A destination for events.  Sinks are called from the writer thread
+    of an ``EventLog`` with batches of events, and are flushed after
+    each batch.
+    """
+
+    @abc.abstractmethod
+    def write(self, events):
+        """
+        Write a batch of events.
+
+        :param events: A list of ``Event`` instances, in the order they
+                       were emitted.
+        """
+
+        pass  # pragma: no cover
+
+    def flush(self):
+        """
+        Flush the events written so far.
+        """
+
+        pass
+
+    def close(self):
+        """
+        Release any resources held by the sink.  Called once no more
+        events will be written.
+        """
+
+        pass
+
+
+class ConsoleSink(Sink):
+    """
+    Write events to the console in the human-readable format.  Debugging
+    messages are written to ``sys.stderr``, and other messages to
+    ``sys.stdout``.
+    """
+
+    def write(self, events):
+        """
+        Write a batch of events.
+
+        :param events: A list of ``Event`` instances, in the order they
+                       were emitted.
+        """
+
+        last = None
+        for event in events:
+            stream = sys.stderr if event.debug else sys.stdout
+
+            # Keep the two streams in order
+            if last is not None and stream is not last:
+                last.flush()
+            last = stream
+
+            print(str(event), file=stream)
+
+    def flush(self):
+        """
+        Flush the events written so far.
+        """
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+class JSONLinesSink(Sink):
+    """
+    Write events to a file in JSON Lines format: one JSON object per
+    line, as returned by ``Event.to_dict()``.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize a ``JSONLinesSink`` instance.  The file is truncated.
+
+        :param path: The path of the file to write.
+        """
+
+        self.path = path
+        self._file = io.open(path, 'w', encoding='utf-8')
+
+    def write(self, events):
+        """
+        Write a batch of events.
+
+        :param events: A list of ``Event`` instances, in the order they
+                       were emitted.
+        """
+
+        # Events emitted after the log is closed are dropped
+        if self._file.closed:
+            return
+
+        for event in events:
+            self._file.write(six.text_type(
+                json.dumps(event.to_dict(), sort_keys=True)) + u'\n')
+
+    def flush(self):
+        """
+        Flush the events written so far.
+        """
+
+        self._file.flush()
+
+    def close(self):
+        """
+        Close the file.
+        """
+
+        self._file.close()
+
+
+class EventLog(object):
+    """
+    An asynchronous pipeline delivering events to a set of sinks.
+    Events are queued by ``put()`` and written by a background thread,
+    which writes each batch of queued events to every sink before
+    flushing them once, so a chatty test does not wait on the console
+    for every message.  The thread is started on the first event; any
+    events still queued are written when ``flush()`` or ``close()`` is
+    called, or when the interpreter exits.
+    """
+
+    # The maximum number of events to write before flushing
+    batch_size = 256
+
+    def __init__(self, sinks=None):
+        """
+        Initialize an ``EventLog`` instance.
+
+        :param sinks: An optional list of ``Sink`` instances.
+        """
+
+        self.sinks = list(sinks or [])
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """
+        Add a sink.  It receives the events put after it is added.
+
+        :param sink: The ``Sink`` instance.
+        """
+
+        self.flush()
+        self.sinks.append(sink)
+
+    def put(self, event):
+        """
+        Queue an event for writing.
+
+        :param event: The ``Event`` instance.
+        """
+
+        with self._lock:
+            if not self._closed:
+                if self._thread is None:
+                    self._start()
+                self._queue.put(event)
+                return
+
+        # The log has been closed; write the event directly
+        self._write([event])
+
+    def _start(self):
+        """
+        Start the writer thread.  Must be called with the lock held.
+        """
+
+        self._thread = threading.Thread(target=self._writer,
+                                        name='timid-events')
+        self._thread.daemon = True
+        self._thread.start()
+
+        # Make sure the queued events are written at exit
+        atexit.register(self.close)
+
+    def _writer(self):
+        """
+        The body of the writer thread.  Writes batches of events until
+        stopped by ``close()``.
+        """
+
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write([event for event in batch if event is not _stop])
+            finally:
+                for _event in batch:
+                    self._queue.task_done()
+
+            if batch[-1] is _stop:
+                return
+
+    def _write(self, events):
+        """
+        Write a batch of events to every sink and flush them.  A sink
+        which fails does not prevent the others from receiving the
+        events.
+
+        :param events: A list of ``Event`` instances.
+        """
+
+        if not events:
+            return
+
+        for sink in self.sinks:
+            try:
+                sink.write(events)
+                sink.flush()
+            except Exception:
+                traceback.print_exc(file=sys.__stderr__)
+
+    def flush(self):
+        """
+        Wait until all the events queued so far have been written.
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """
+        Write any queued events, stop the writer thread, and close the
+        sinks.  Events put after the log is closed are written
+        directly.
+        """
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            self._queue.put(_stop)
+            thread.join()
+
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                traceback.print_exc(file=sys.__stderr__)
@@ -19,6 +19,7 @@ import abc
 import inspect
 import os
 import sys
+import threading
 import traceback
 
 import six
@@ -37,6 +38,12 @@ class Extension(object):
     beyond that provided by actions or modifiers, in that it is able
     to add arguments to the CLI interface, provide alternate
     reporters, insert steps, etc.
+
+    When tests are executed by the asyncio engine (``--async``), an
+    extension may provide ``read_steps_async()``,
+    ``pre_step_async()``, and ``post_step_async()`` methods, taking
+    the same arguments as the corresponding hooks and returning
+    awaitables; the synchronous hooks are used otherwise.
     """
 
     @classmethod
@@ -164,16 +171,21 @@ class ExtensionDebugger(object):
     debugging information for each extension method call.
     """
 
-    def __init__(self, method):
+    def __init__(self, method, ctxt=None):
         """
         Initialize an ``ExtensionDebugger`` instance.
 
         :param where: A string indicating the name of the extension
                       method that will be called.
+        :param ctxt: An optional ``timid.context.Context`` object.  If
+                     given, the messages it has emitted are written
+                     before any debugging output.
         """
 
-        # Save the method and initialize the ext_cls tracker
+        # Save the method and context and initialize the ext_cls
+        # tracker
         self.method = method
+        self.ctxt = ctxt
         self.ext_cls = None
 
         # Are we enabling debugging?
@@ -220,7 +232,8 @@ class ExtensionDebugger(object):
 
         # Are we in debugging mode?  Was there an exception?
         if self._debug >= 1 and exc_type is not None:
-            # Emit a traceback
+            # Emit a traceback, after the messages already emitted
+            self._flush()
             traceback.print_exception(exc_type, exc_value, exc_tb,
                                       file=sys.stderr)
 
@@ -268,8 +281,18 @@ class ExtensionDebugger(object):
         """
 
         if self._debug >= level:
+            self._flush()
             print(message, file=sys.stderr)
 
+    def _flush(self):
+        """
+        Wait until the messages emitted by the context, if any, have
+        been written, so that the debugging output stays in order.
+        """
+
+        if self.ctxt is not None:
+            self.ctxt.flush()
+
 
 class ExtensionSet(object):
     """
@@ -335,7 +358,7 @@ class ExtensionSet(object):
         :returns: An instance of ``ExtensionSet``.
         """
 
-        debugger = ExtensionDebugger('activate')
+        debugger = ExtensionDebugger('activate', ctxt)
 
         exts = []
         for ext in cls._get_extension_classes():
@@ -372,6 +395,10 @@ class ExtensionSet(object):
 
         self.exts = exts or []
 
+        # Serializes the calls to the extensions, which may be made
+        # by tests executing concurrently
+        self._lock = threading.RLock()
+
     def read_steps(self, ctxt, steps):
         """
         Called after reading steps, prior to adding them to the list of
@@ -383,11 +410,12 @@ class ExtensionSet(object):
         :returns: The ``steps`` parameter, for convenience.
         """
 
-        debugger = ExtensionDebugger('read_steps')
+        debugger = ExtensionDebugger('read_steps', ctxt)
 
-        for ext in self.exts:
-            with debugger(ext):
-                ext.read_steps(ctxt, steps)
+        with self._lock:
+            for ext in self.exts:
+                with debugger(ext):
+                    ext.read_steps(ctxt, steps)
 
         # Convenience return
         return steps
@@ -405,14 +433,15 @@ class ExtensionSet(object):
                   ``False`` otherwise.
         """
 
-        debugger = ExtensionDebugger('pre_step')
+        debugger = ExtensionDebugger('pre_step', ctxt)
 
-        for ext in self.exts:
-            with debugger(ext):
-                if ext.pre_step(ctxt, step, idx):
-                    # Step must be skipped
-                    debugger.debug(3, 'Skipping step %d' % idx)
-                    return True
+        with self._lock:
+            for ext in self.exts:
+                with debugger(ext):
+                    if ext.pre_step(ctxt, step, idx):
+                        # Step must be skipped
+                        debugger.debug(3, 'Skipping step %d' % idx)
+                        return True
 
         return False
 
@@ -432,11 +461,12 @@ class ExtensionSet(object):
         :returns: The ``result`` parameter, for convenience.
         """
 
-        debugger = ExtensionDebugger('post_step')
+        debugger = ExtensionDebugger('post_step', ctxt)
 
-        for ext in self.exts:
-            with debugger(ext):
-                ext.post_step(ctxt, step, idx, result)
+        with self._lock:
+            for ext in self.exts:
+                with debugger(ext):
+                    ext.post_step(ctxt, step, idx, result)
 
         # Convenience return
         return result
@@ -456,10 +486,11 @@ class ExtensionSet(object):
         :returns: The final result.
         """
 
-        debugger = ExtensionDebugger('finalize')
+        debugger = ExtensionDebugger('finalize', ctxt)
 
-        for ext in self.exts:
-            with debugger(ext):
-                result = ext.finalize(ctxt, result)
+        with self._lock:
+            for ext in self.exts:
+                with debugger(ext):
+                    result = ext.finalize(ctxt, result)
 
         return result
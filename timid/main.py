@@ -20,12 +20,16 @@ import os
 import sys
 import traceback
 
+from concurrent import futures
 import cli_tools
 import six
 
+from timid import checkpoint
 from timid import context
+from timid import events
 from timid import extensions
 from timid import steps
+from timid import utils
 
 
 class DictAction(argparse.Action):
@@ -95,23 +99,352 @@ class DictAction(argparse.Action):
         argdict[key] = type_(value)
 
 
+class Execution(object):
+    """
+    Track the execution of the steps of a test.  This implements the
+    handling of the test state--the messages, timings, and
+    checkpoint--shared by ``timid()`` and the asyncio engine; the
+    caller is responsible for calling the extension hooks and the
+    steps themselves.
+    """
+
+    def __init__(self, ctxt, exts=None, ckpt=None):
+        """
+        Initialize an ``Execution`` object.
+
+        :param ctxt: A ``timid.context.Context`` object.
+        :param exts: An instance of ``timid.extensions.ExtensionSet``
+                     describing the extensions to be called while
+                     processing the test steps.  It is made available
+                     to actions as the ``extensions`` attribute of
+                     the context.
+        :param ckpt: An optional ``timid.checkpoint.Checkpoint``.
+        """
+
+        # Normalize the extension set
+        if exts is None:
+            exts = extensions.ExtensionSet()
+        ctxt.extensions = exts
+
+        self.ctxt = ctxt
+        self.exts = exts
+        self.ckpt = ckpt
+
+        # The message describing the failure of the test, if any
+        self.msg = None
+
+        # When the steps were parsed
+        self._parsed = None
+
+    def parse(self, test, key=None):
+        """
+        Parse the steps of a test.
+
+        :param test: The name of a YAML file containing the test
+                     description.
+        :param key: An optional key into the test description file.
+
+        :returns: A list of ``timid.steps.Step`` objects, to be passed
+                  to the ``read_steps()`` extension hook.
+        """
+
+        self.ctxt.emit('Reading test steps from %s%s...' %
+                       (test, '[%s]' % key if key else ''), debug=True)
+        start = utils.monotonic()
+        step_list = steps.Step.parse_file(self.ctxt, test, key)
+        self._parsed = utils.monotonic()
+        self.ctxt.timings['parse'] = self._parsed - start
+
+        return step_list
+
+    def read(self, step_list):
+        """
+        Add the steps of the test to the list in the context.
+
+        :param step_list: The list of ``timid.steps.Step`` objects
+                          returned by the ``read_steps()`` extension
+                          hook.
+        """
+
+        self.ctxt.steps += step_list
+        self.ctxt.timings['read_steps'] = utils.monotonic() - self._parsed
+        self.ctxt.emit('Template cache: %s' % self.ctxt.templates,
+                       debug=True)
+
+    def __iter__(self):
+        """
+        Iterate over the steps to execute.  If a checkpoint was
+        given, the state is restored from it if the test is being
+        resumed, and it is removed once the last step has been
+        finished.  If the test cannot be resumed, no steps are
+        executed, and ``msg`` is set.
+
+        :returns: An iterator over tuples of the index and the
+                  ``timid.steps.Step`` object of each step.
+        """
+
+        # Prepare the checkpoint, restoring the state from it if the
+        # test is being resumed
+        first = 0
+        if self.ckpt is not None:
+            try:
+                first = self.ckpt.start(self.ctxt)
+            except checkpoint.CheckpointError as exc:
+                self.msg = 'Unable to resume: %s' % exc
+                return
+
+        for idx, step in enumerate(self.ctxt.steps[first:], first):
+            # Emit information about what we're doing
+            self.ctxt.emit('[Step %d]: %s . . .' % (idx, step.name),
+                           idx=idx, step=step)
+
+            yield idx, step
+
+        # All done!  And a success, to boot...
+        if self.ckpt is not None:
+            self.ckpt.clear()
+
+    def skipped(self, idx, step):
+        """
+        Record that a step was skipped by the extensions.
+
+        :param idx: The index of the step.
+        :param step: The ``timid.steps.Step`` object.
+        """
+
+        self.ctxt.emit('[Step %d]: `- Step %s' %
+                       (idx, steps.states[steps.SKIPPED]),
+                       idx=idx, step=step)
+
+    def finished(self, idx, step, result):
+        """
+        Record the result of a step.
+
+        :param idx: The index of the step.
+        :param step: The ``timid.steps.Step`` object.
+        :param result: The ``timid.steps.StepResult`` of the step.
+
+        :returns: A ``True`` value if the test should continue, or
+                  ``False`` if the step failed, in which case ``msg``
+                  is set.
+        """
+
+        # Emit the result
+        self.ctxt.emit('[Step %d]: `- Step %s%s' %
+                       (idx, steps.states[result.state],
+                        ' (ignored)' if result.ignore else ''),
+                       idx=idx, step=step)
+
+        # Was the step a success?
+        if not result:
+            self.msg = 'Test step failure'
+            if result.msg:
+                self.msg += ': %s' % result.msg
+
+            return False
+
+        # Save the checkpoint
+        if self.ckpt is not None:
+            self.ckpt.save(self.ctxt, idx + 1)
+
+        return True
+
+
+def timid(ctxt, test, key=None, check=False, exts=None, ckpt=None):
+    """
+    Execute a test described by a YAML file.
+
+    :param ctxt: A ``timid.context.Context`` object.
+    :param test: The name of a YAML file containing the test
+                 description.  Note that the current working directory
+                 set up in ``ctxt.environment`` does not affect the
+                 resolution of this file.
+    :param key: An optional key into the test description file.  If
+                not ``None``, the file named by ``test`` must be a
+                YAML dictionary of lists of steps; otherwise, it must
+                be a simple list of steps.
+    :param check: If ``True``, only performs a syntax check of the
+                  test steps indicated by ``test`` and ``key``; the
+                  test itself is not run.
+    :param exts: An instance of ``timid.extensions.ExtensionSet``
+                 describing the extensions to be called while
+                 processing the test steps.
+    :param ckpt: An optional ``timid.checkpoint.Checkpoint``.  If
+                 given, it is saved after each successful step, and
+                 removed if the test succeeds; if it was created for
+                 resuming the test, the test is resumed from it.
+    """
+
+    # Set up the execution; this also makes the extension set
+    # available to actions, such as step groups, which execute their
+    # own steps
+    execution = Execution(ctxt, exts, ckpt)
+    exts = execution.exts
+
+    # Begin by reading the steps and adding them to the list in the
+    # context (which may already have elements thanks to the
+    # extensions)
+    step_list = execution.parse(test, key)
+    execution.read(exts.read_steps(ctxt, step_list))
+
+    # If all we were supposed to do was check, well, we've
+    # accomplished that...
+    if check:
+        return None
+
+    # Now we execute each step in turn
+    for idx, step in execution:
+        # Run through extension hooks
+        if exts.pre_step(ctxt, step, idx):
+            execution.skipped(idx, step)
+            continue
+
+        # Now execute the step
+        result = step(ctxt)
+
+        # Let the extensions process the result of the step
+        exts.post_step(ctxt, step, idx, result)
+
+        # Was the step a success?
+        if not execution.finished(idx, step, result):
+            break
+
+    return execution.msg
+
+
+class Target(object):
+    """
+    Describe one test to be executed by ``run()``, along with the
+    context it is executed in and its result.
+    """
+
+    def __init__(self, target, key=None):
+        """
+        Initialize a ``Target`` object.
+
+        :param target: The description of the test.  This is the path
+                       to a YAML file, optionally followed by a ":" and
+                       a key into the file.  If the whole string names
+                       an existing file, it is not split.
+        :param key: The key to use if ``target`` does not specify
+                    one.
+        """
+
+        self.label = target
+        self.test = target
+        self.key = key
+
+        # Split off the key, if any
+        if not os.path.exists(target):
+            test, sep, target_key = target.rpartition(':')
+            if sep and test:
+                self.test = test
+                self.key = target_key or key
+
+        # Set by run()
+        self.ctxt = None
+        self.ckpt = None
+        self.result = None
+
+    def error(self, exc):
+        """
+        Record an exception raised while executing the test.  This
+        must be called from the exception handler.
+
+        :param exc: The exception.
+        """
+
+        if self.ctxt.debug:
+            # Make sure we emit a proper traceback, after the messages
+            # already emitted
+            self.ctxt.flush()
+            traceback.print_exc(file=sys.stderr)
+
+        # The exception is the result, from the point of view of the
+        # extensions
+        self.result = exc
+
+
+def _run_target(target, check, exts):
+    """
+    Execute a single test.  This may be called in a worker thread.
+
+    :param target: The ``Target`` to execute.  Its ``result``
+                   attribute is set to the return value of ``timid()``,
+                   or to the exception raised.
+    :param check: If ``True``, only performs a syntax check of the
+                  test steps.
+    :param exts: An instance of ``timid.extensions.ExtensionSet``
+                 describing the extensions to be called while
+                 processing the test steps.
+
+    :returns: The ``target`` parameter, for convenience.
+    """
+
+    try:
+        target.result = timid(target.ctxt, target.test, target.key, check,
+                              exts, target.ckpt)
+    except Exception as exc:
+        target.error(exc)
+
+    return target
+
+
 @cli_tools.argument(
     'test',
+    nargs='+',
     help='Description of the test to run.  This should be the path to a '
-    'YAML file, e.g. "test1.yaml".',
+    'YAML file, e.g. "test1.yaml", optionally followed by a ":" and a key '
+    'within the file, e.g. "tests.yaml:unit".  Several tests may be given; '
+    'each is executed with its own copy of the environment and the '
+    'variables.',
 )
 @cli_tools.argument(
-    'directory',
-    nargs='?',
-    help='The directory to execute the tests from.  Defaults to '
-    '"%(default)s".  Note that this does *not* affect the interpretation '
-    'of the location of the test file.',
+    '--directory', '-C',
+    default=None,
+    help='The directory to execute the tests from.  Defaults to the current '
+    'directory.  Note that this does *not* affect the interpretation of the '
+    'location of the test files.',
 )
 @cli_tools.argument(
     '--key', '-k',
     help='An optional key within the test file.  When provided, the test '
     'file is expected to contain a dictionary of lists of steps, instead '
-    'of a flat list of steps.',
+    'of a flat list of steps.  This is the default for tests which do not '
+    'specify a key.',
+)
+@cli_tools.argument(
+    '--jobs', '-j',
+    type=int,
+    default=1,
+    help='The number of tests to execute concurrently.  Defaults to '
+    '%(default)s.',
+)
+@cli_tools.argument(
+    '--async',
+    dest='asynchronous',
+    default=False,
+    action='store_true',
+    help='Execute the tests using the asyncio engine, which runs '
+    'commands and concurrent steps on an event loop instead of in '
+    'threads.  Requires Python 3.5 or later.',
+)
+@cli_tools.argument(
+    '--checkpoint',
+    dest='checkpoints',
+    default=False,
+    action='store_true',
+    help='Save a checkpoint after each successful step of each test, so '
+    'that a failed test may be resumed using "--resume".  The values of '
+    'sensitive variables are not saved.',
+)
+@cli_tools.argument(
+    '--resume',
+    default=False,
+    action='store_true',
+    help='Resume each test from its checkpoint, if any, instead of '
+    'starting over.  Implies "--checkpoint".  A checkpoint is refused if '
+    'the test steps have changed since it was saved.',
 )
 @cli_tools.argument(
     '--check', '-K',
@@ -139,6 +472,21 @@ class DictAction(argparse.Action):
     help='Specify the value of an environment variable.  This overrides any '
     'variable of the same name present in the current environment.',
 )
+@cli_tools.argument(
+    '--cache-dir',
+    default=os.environ.get('TIMID_CACHE_DIR'),
+    help='A directory in which to cache validated test steps, allowing '
+    'subsequent runs to skip reading and validating unchanged test files.  '
+    'Defaults to the value of the TIMID_CACHE_DIR environment variable; if '
+    'that is not set, no caching is performed.',
+)
+@cli_tools.argument(
+    '--event-log',
+    default=None,
+    metavar='FILE',
+    help='Write every message emitted to FILE in JSON Lines format, with '
+    'the time, level, test, step index and step address of each message.',
+)
 @cli_tools.argument(
     '--verbose', '-v',
     action='count',
@@ -158,78 +506,75 @@ class DictAction(argparse.Action):
     default=False,
     help='Enable debugging.',
 )
-def timid(ctxt, test, key=None, check=False, exts=None):
+def run(ctxt, test, key=None, check=False, exts=None, jobs=1,
+        asynchronous=False, checkpoints=False, resume=False):
     """
-    Execute a test described by a YAML file.
-
-    :param ctxt: A ``timid.context.Context`` object.
-    :param test: The name of a YAML file containing the test
-                 description.  Note that the current working directory
-                 set up in ``ctxt.environment`` does not affect the
-                 resolution of this file.
-    :param key: An optional key into the test description file.  If
-                not ``None``, the file named by ``test`` must be a
-                YAML dictionary of lists of steps; otherwise, it must
-                be a simple list of steps.
+    Execute one or more tests described by YAML files.  Each test is
+    executed with its own copy of the environment and the variables;
+    the tests share the caches of parsed test steps and compiled
+    templates.
+
+    :param ctxt: A ``timid.context.Context`` object.  Each test is
+                 executed in a context forked from it.
+    :param test: A list of the tests to execute.  Each is the name of
+                 a YAML file containing the test description,
+                 optionally followed by a ":" and a key into the file.
+    :param key: An optional default key into the test description
+                files.
     :param check: If ``True``, only performs a syntax check of the
-                  test steps indicated by ``test`` and ``key``; the
-                  test itself is not run.
+                  test steps; the tests themselves are not run.
     :param exts: An instance of ``timid.extensions.ExtensionSet``
                  describing the extensions to be called while
                  processing the test steps.
+    :param jobs: The maximum number of tests to execute concurrently.
+                 Defaults to 1.
+    :param asynchronous: If ``True``, the tests are executed using the
+                         asyncio engine in ``timid.aio``.  Defaults to
+                         ``False``.
+    :param checkpoints: If ``True``, a checkpoint is saved after each
+                        successful step of each test.  Defaults to
+                        ``False``.
+    :param resume: If ``True``, each test is resumed from its
+                   checkpoint, if any.  Implies ``checkpoints``.
+                   Defaults to ``False``.
+
+    :returns: A list of ``Target`` objects, in the order the tests
+              were given, with the ``result`` attribute set to the
+              result of executing each test.
     """
 
     # Normalize the extension set
     if exts is None:
         exts = extensions.ExtensionSet()
 
-    # Begin by reading the steps and adding them to the list in the
-    # context (which may already have elements thanks to the
-    # extensions)
-    ctxt.emit('Reading test steps from %s%s...' %
-              (test, '[%s]' % key if key else ''), debug=True)
-    ctxt.steps += exts.read_steps(ctxt, steps.Step.parse_file(ctxt, test, key))
-
-    # If all we were supposed to do was check, well, we've
-    # accomplished that...
-    if check:
-        return None
-
-    # Now we execute each step in turn
-    for idx, step in enumerate(ctxt.steps):
-        # Emit information about what we're doing
-        ctxt.emit('[Step %d]: %s . . .' % (idx, step.name))
-
-        # Run through extension hooks
-        if exts.pre_step(ctxt, step, idx):
-            ctxt.emit('[Step %d]: `- Step %s' %
-                      (idx, steps.states[steps.SKIPPED]))
-            continue
-
-        # Now execute the step
-        result = step(ctxt)
-
-        # Let the extensions process the result of the step
-        exts.post_step(ctxt, step, idx, result)
-
-        # Emit the result
-        ctxt.emit('[Step %d]: `- Step %s%s' %
-                  (idx, steps.states[result.state],
-                   ' (ignored)' if result.ignore else ''))
-
-        # Was the step a success?
-        if not result:
-            msg = 'Test step failure'
-            if result.msg:
-                msg += ': %s' % result.msg
-
-            return msg
-
-    # All done!  And a success, to boot...
-    return None
-
-
-@timid.args_hook
+    # Set up the targets; messages are labeled only if there's more
+    # than one
+    targets = [Target(target, key) for target in test]
+    for target in targets:
+        target.ctxt = ctxt.fork(target.label if len(targets) > 1 else None)
+        if (checkpoints or resume) and not check:
+            target.ckpt = checkpoint.Checkpoint.for_test(
+                target.ctxt, target.test, target.key, resume)
+
+    # Execute the tests
+    if asynchronous:
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        aio.run(aio.run_targets(targets, check, exts, jobs))
+    elif jobs <= 1 or len(targets) <= 1:
+        for target in targets:
+            _run_target(target, check, exts)
+    else:
+        with futures.ThreadPoolExecutor(jobs) as executor:
+            for _target in executor.map(lambda t: _run_target(t, check, exts),
+                                        targets):
+                pass
+
+    return targets
+
+
+@run.args_hook
 def _args(parser):
     """
     A ``cli_tools`` argument hook function that allows extensions to
@@ -244,21 +589,24 @@ def _args(parser):
     extensions.ExtensionSet.prepare(parser)
 
 
-@timid.processor
+@run.processor
 def _processor(args):
     """
     A ``cli_tools`` processor function that interfaces between the
-    command line and the ``timid()`` function.  This function is
+    command line and the ``run()`` function.  This function is
     responsible for allocating a ``timid.context.Context`` object and
     initializing the activated extensions, and for calling those
-    extensions' ``finalize()`` method.
+    extensions' ``finalize()`` method with the result of each test.
 
     :param args: The ``argparse.Namespace`` object containing the
                  results of argument processing.
     """
 
     # Begin by initializing a context
-    args.ctxt = context.Context(args.verbose, args.debug, args.directory)
+    args.ctxt = context.Context(args.verbose, args.debug, args.directory,
+                                args.cache_dir)
+    if args.event_log:
+        args.ctxt.events.add_sink(events.JSONLinesSink(args.event_log))
 
     # Now set up the extension set
     args.exts = extensions.ExtensionSet.activate(args.ctxt, args)
@@ -267,29 +615,54 @@ def _processor(args):
     args.ctxt.environment.update(args.environment)
     args.ctxt.variables.update(args.variables)
 
-    # Call the actual timid() function
+    # Call the actual run() function
     try:
-        result = yield
+        targets = yield
 
     # If an exception occurred, give the extensions an opportunity to
     # handle it
     except Exception as exc:
         if args.debug:
-            # Make sure we emit a proper traceback
+            # Make sure we emit a proper traceback, after the messages
+            # already emitted
+            args.ctxt.flush()
             traceback.print_exc(file=sys.stderr)
 
         # The exception is the result, from the point of view of the
         # extensions
-        result = exc
-
-    # Allow the extensions to handle the result
-    result = args.exts.finalize(args.ctxt, result)
+        result = args.exts.finalize(args.ctxt, exc)
+
+    else:
+        # Allow the extensions to handle the result of each test
+        for target in targets:
+            target.result = args.exts.finalize(target.ctxt, target.result)
+
+        # Aggregate the results
+        if len(targets) == 1:
+            result = targets[0].result
+        else:
+            failures = ['%s: %s' % (target.label, target.result)
+                        for target in targets if target.result]
+            result = None
+            if failures:
+                result = '%d of %d tests failed:\n%s' % (
+                    len(failures), len(targets), '\n'.join(failures))
 
     # If the final result is an exception, convert it to a string for
     # yielding back to cli_tools
     if isinstance(result, Exception):
         result = str(result)
 
+    # Make sure all the messages are written before cli_tools reports
+    # the result
+    args.ctxt.flush()
+
     # This line is covered, but coverage appears to be missing it for
     # some reason
     yield result  # pragma: no cover
+
+
+# The console script entry point was "timid.main:timid.console" before
+# run() took over the command line; keep it working, as run() accepts
+# a single test just as timid() did
+timid.console = run.console
@@ -13,9 +13,295 @@
 #    express or implied. See the License for the specific language
 #    governing permissions and limitations under the License.
 
+import collections
+import copy
+import glob
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+import six
+
+from timid import environment
+from timid import parallel
 from timid import steps
 
 
+def _glob(pattern):
+    """
+    Expand a glob pattern.  On Python 3.5 and later, the pattern "**"
+    matches any files and zero or more directories and
+    subdirectories.
+
+    :param pattern: The glob pattern.
+
+    :returns: A list of the matching paths.
+    """
+
+    if sys.version_info >= (3, 5):
+        return glob.glob(pattern, recursive=True)
+    return glob.glob(pattern)  # pragma: no cover
+
+
+class MatrixModifier(steps.Modifier):
+    """
+    A modifier that performs an action once for each combination of
+    the values of a set of template variables.  The base usage is::
+
+        - run: tox -e {{ python }}-{{ db }}
+          matrix:
+            python: [py27, py35]
+            db: [mysql, postgres]
+
+    This would perform the action four times, once for each
+    combination of the values of the "python" and "db" variables,
+    with the variables set accordingly.  More control over the
+    execution is available using the advanced syntax::
+
+        - run: tox -e {{ python }}-{{ db }}
+          matrix:
+            vars:
+              python: [py27, py35]
+              db: [mysql, postgres]
+            max-workers: 2
+            mode: fail-fast
+
+    The variants are performed concurrently.  The "max-workers"
+    element limits the number of variants that may execute at the
+    same time; it defaults to 4.  The "mode" element controls the
+    handling of variant failures: in the default "complete-all" mode,
+    all variants are performed regardless of failures, while in the
+    "fail-fast" mode, no further variants are started once one
+    fails.  Variants which were never started are
+    reported as skipped.
+
+    Each variant is performed in a copy of the context, so changes
+    the variants make to the template variables, the environment, or
+    the working directory do not affect each other or subsequent
+    steps.  The step is only parsed once, and its templates are
+    rendered with the variables of each variant.  Modifiers with a
+    higher priority than "matrix"--that is, all the other standard
+    modifiers--apply to each variant individually.  The result of the
+    step encapsulates the results of all the variants.
+    """
+
+    # Schema for the variables
+    _vars_schema = {
+        'type': 'object',
+        'additionalProperties': {
+            'type': 'array',
+            'minItems': 1,
+        },
+        'minProperties': 1,
+    }
+
+    # Set the priority, restriction, and schema
+    priority = 100
+    restriction = steps.Modifier.NORMAL
+    schema = {
+        'oneOf': [
+            _vars_schema,
+            {
+                'type': 'object',
+                'properties': {
+                    'vars': _vars_schema,
+                    'max-workers': {
+                        'type': 'integer',
+                        'minimum': 1,
+                    },
+                    'mode': {
+                        'type': 'string',
+                        'enum': [parallel.FAIL_FAST, parallel.COMPLETE_ALL],
+                    },
+                },
+                'required': ['vars'],
+                'additionalProperties': False,
+            },
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``MatrixModifier`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the modifier.
+        :param config: The configuration for the modifier.  This may
+                       be a scalar value (e.g., "run: command"), a
+                       list, or a dictionary.  If the configuration
+                       provided is invalid for the action, a
+                       ``ConfigError`` should be raised.
+        :param step_addr: The address of the step in the test
+                          configuration.  Should be passed to the
+                          ``ConfigError``.
+        """
+
+        # Perform superclass initialization
+        super(MatrixModifier, self).__init__(ctxt, name, config, step_addr)
+
+        # Convert the simple syntax
+        if not isinstance(config.get('vars'), dict):
+            config = {'vars': config}
+
+        # Extract the appropriate values
+        self.max_workers = config.get('max-workers', parallel.MAX_WORKERS)
+        self.fail_fast = (config.get('mode', parallel.COMPLETE_ALL) ==
+                          parallel.FAIL_FAST)
+
+        # Expand the variants; the variables are sorted by name, so
+        # the order of the variants is deterministic
+        names = sorted(config['vars'])
+        self.variants = [
+            collections.OrderedDict(six.moves.zip(names, values))
+            for values in itertools.product(
+                *[config['vars'][var] for var in names])
+        ]
+
+    @staticmethod
+    def label(variant):
+        """
+        Construct a label for a variant.
+
+        :param variant: The variant, a dictionary mapping variable
+                        names to values.
+
+        :returns: The label, a string.
+        """
+
+        return ', '.join('%s=%s' % item for item in variant.items())
+
+    def fork(self, ctxt, variant):
+        """
+        Construct the context for performing a variant.
+
+        :param ctxt: The context object.
+        :param variant: The variant, a dictionary mapping variable
+                        names to values.
+
+        :returns: A new context with the variables of the variant
+                  set.
+        """
+
+        label = self.label(variant)
+        new = ctxt.fork(label if not ctxt.label else
+                        '%s: %s' % (ctxt.label, label))
+        new.variables.update(variant)
+
+        return new
+
+    def _run_variant(self, ctxt, idx, action, modifiers, start):
+        """
+        Perform a single variant.  This is called in a worker thread.
+
+        :param ctxt: The context object.
+        :param idx: The index of the variant.
+        :param action: The action to perform.
+        :param modifiers: The list of modifiers for the action.
+        :param start: The index of the first modifier to call.
+
+        :returns: A ``StepResult`` object.
+        """
+
+        vctxt = self.fork(ctxt, self.variants[idx])
+        result = steps.Step.invoke(vctxt, action, modifiers, start)
+        self._report(ctxt, idx, result)
+
+        return result
+
+    def _report(self, ctxt, idx, result):
+        """
+        Emit the result of a variant.
+
+        :param ctxt: The context object.
+        :param idx: The index of the variant.
+        :param result: The ``StepResult`` of the variant.
+        """
+
+        ctxt.emit('    [%s]: `- Variant %s%s' %
+                  (self.label(self.variants[idx]),
+                   steps.states[result.state],
+                   ' (ignored)' if result.ignore else ''))
+
+    def _summarize(self, results):
+        """
+        Summarize the results of the variants.
+
+        :param results: A list of the ``StepResult`` objects for the
+                        variants, in order.  Variants which were never
+                        started must have a ``None`` result.
+
+        :returns: A ``StepResult`` object encapsulating the results of
+                  all the variants.
+        """
+
+        return parallel.summarize(
+            results, [self.label(variant) for variant in self.variants],
+            'variants')
+
+    def pre_call(self, ctxt, pre_mod, post_mod, action):
+        """
+        A modifier hook function.  This is called in priority order prior
+        to invoking the ``Action`` for the step.  This allows a
+        modifier to alter the context, or to take over subsequent
+        action invocation.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier in the list of modifiers that is
+                        applicable to the action.  This list is in
+                        priority order.
+        :param post_mod: A list of the modifiers following this
+                         modifier in the list of modifiers that is
+                         applicable to the action.  This list is in
+                         priority order.
+        :param action: The action that will be performed.
+
+        :returns: A ``None`` return value indicates that the modifier
+                  is taking no action.  A non-``None`` return value
+                  should consist of a ``StepResult`` object; this will
+                  suspend further ``pre_call()`` processing and
+                  proceed to the ``post_call()`` processing.  This
+                  implementation takes over invocation of the action,
+                  including the following modifiers, performing each
+                  variant concurrently, and returns a ``StepResult``
+                  encapsulating the results of the variants.
+        """
+
+        modifiers = list(pre_mod) + [self] + list(post_mod)
+        start = len(pre_mod) + 1
+
+        results = parallel.schedule(
+            lambda idx: self._run_variant(ctxt, idx, action, modifiers,
+                                          start),
+            len(self.variants), self.max_workers, self.fail_fast)
+        return self._summarize(results)
+
+    def pre_call_async(self, ctxt, pre_mod, post_mod, action):
+        """
+        The asynchronous variant of ``pre_call()``, used by the asyncio
+        engine.  The variants are performed concurrently as tasks on
+        the event loop.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier.
+        :param post_mod: A list of the modifiers following this
+                         modifier.
+        :param action: The action that will be performed.
+
+        :returns: A coroutine returning a ``StepResult`` object
+                  encapsulating the results of the variants.
+        """
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        return aio.run_matrix(ctxt, self, pre_mod, post_mod, action)
+
+
 class ConditionalModifier(steps.Modifier):
     """
     A modifier that controls whether an action should be performed.
@@ -93,6 +379,242 @@ class ConditionalModifier(steps.Modifier):
         return None
 
 
+class CacheModifier(steps.Modifier):
+    """
+    A modifier that skips an action whose inputs have not changed
+    since it last succeeded.  The base usage is::
+
+        - run: ./codegen.sh
+          cache: schema/*.json
+
+    Here the "run" action is performed only if it has not previously
+    succeeded with the same set of files matching "schema/*.json",
+    having the same contents.  More than one glob pattern may be
+    given as a list, and the template and environment variables the
+    action depends upon may also be declared, using the advanced
+    syntax::
+
+        - run: ./build.sh {{ target }}
+          cache:
+            inputs:
+            - src/**/*.c
+            - Makefile
+            env: [CC, CFLAGS]
+            vars: [target]
+
+    The action is also performed again if its configuration, after
+    rendering any templates, or the working directory changes.  Glob
+    patterns are interpreted relative to the working directory, and
+    may themselves be templates.  The records of successful actions,
+    and the digests of the input files, are stored in the "steps"
+    subdirectory of the cache directory; the digests are only
+    recomputed when a file's size or modification time changes.
+    """
+
+    # Set the priority, restriction, and schema
+    priority = 250
+    restriction = steps.Modifier.NORMAL
+    schema = {
+        'oneOf': [
+            {'type': 'string'},
+            {
+                'type': 'array',
+                'items': {'type': 'string'},
+            },
+            {
+                'type': 'object',
+                'properties': {
+                    'inputs': {
+                        'oneOf': [
+                            {'type': 'string'},
+                            {
+                                'type': 'array',
+                                'items': {'type': 'string'},
+                            },
+                        ],
+                    },
+                    'env': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                    },
+                    'vars': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                    },
+                },
+                'additionalProperties': False,
+            },
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``CacheModifier`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the modifier.
+        :param config: The configuration for the modifier.  This may
+                       be a scalar value (e.g., "run: command"), a
+                       list, or a dictionary.  If the configuration
+                       provided is invalid for the action, a
+                       ``ConfigError`` should be raised.
+        :param step_addr: The address of the step in the test
+                          configuration.  Should be passed to the
+                          ``ConfigError``.
+        """
+
+        # Perform superclass initialization
+        super(CacheModifier, self).__init__(ctxt, name, config, step_addr)
+
+        # Convert the simple syntax
+        if not isinstance(config, dict):
+            config = {'inputs': config}
+        inputs = config.get('inputs', [])
+        if isinstance(inputs, six.string_types):
+            inputs = [inputs]
+
+        # Save the inputs
+        self.inputs = [ctxt.template(pattern) for pattern in inputs]
+        self.env = config.get('env', [])
+        self.vars = config.get('vars', [])
+
+        # The fingerprints of the steps in progress, keyed by the ID
+        # of the context
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _render(self, ctxt, value):
+        """
+        Render all the templates in an action configuration.
+
+        :param ctxt: The context object.
+        :param value: The configuration.
+
+        :returns: The configuration, with all strings rendered as
+                  templates.
+        """
+
+        if isinstance(value, six.string_types):
+            return ctxt.template(value)(ctxt)
+        elif isinstance(value, dict):
+            return dict((k, self._render(ctxt, v)) for k, v in value.items())
+        elif isinstance(value, (list, tuple)):
+            return [self._render(ctxt, v) for v in value]
+
+        return value
+
+    def fingerprint(self, ctxt, action):
+        """
+        Compute the fingerprint of the step.
+
+        :param ctxt: The context object.
+        :param action: The action that will be performed.
+
+        :returns: The fingerprint, as a hex string.
+        """
+
+        # Compute the digests of the input files
+        cwd = ctxt.environment.cwd
+        patterns = [pattern(ctxt) for pattern in self.inputs]
+        files = {}
+        for pattern in patterns:
+            for fname in _glob(os.path.join(cwd, pattern)):
+                if os.path.isfile(fname):
+                    files[os.path.relpath(fname, cwd)] = (
+                        ctxt.stat_cache.digest(fname))
+        ctxt.stat_cache.save()
+
+        return ctxt.result_cache.fingerprint({
+            'action': action.name,
+            'config': self._render(ctxt, action.config),
+            'cwd': cwd,
+            'inputs': patterns,
+            'files': files,
+            'env': dict((n, ctxt.environment.get(n)) for n in self.env),
+            'vars': dict((n, ctxt.variables.get(n)) for n in self.vars),
+        })
+
+    def pre_call(self, ctxt, pre_mod, post_mod, action):
+        """
+        A modifier hook function.  This is called in priority order prior
+        to invoking the ``Action`` for the step.  This allows a
+        modifier to alter the context, or to take over subsequent
+        action invocation.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier in the list of modifiers that is
+                        applicable to the action.  This list is in
+                        priority order.
+        :param post_mod: A list of the modifiers following this
+                         modifier in the list of modifiers that is
+                         applicable to the action.  This list is in
+                         priority order.
+        :param action: The action that will be performed.
+
+        :returns: A ``None`` return value indicates that the modifier
+                  is taking no action.  A non-``None`` return value
+                  should consist of a ``StepResult`` object; this will
+                  suspend further ``pre_call()`` processing and
+                  proceed to the ``post_call()`` processing.  This
+                  implementation returns a ``StepResult`` with state
+                  ``SKIPPED`` if the action has previously succeeded
+                  with the same fingerprint.
+        """
+
+        # Compute the fingerprint; if the inputs can't be read, just
+        # perform the action
+        try:
+            fingerprint = self.fingerprint(ctxt, action)
+        except (IOError, OSError):
+            return None
+
+        # Has the action already succeeded?
+        if ctxt.result_cache.get(fingerprint) is not None:
+            return steps.StepResult(
+                state=steps.SKIPPED,
+                msg='Inputs unchanged since the last successful run')
+
+        # Remember the fingerprint for post_call()
+        with self._lock:
+            self._pending[id(ctxt)] = fingerprint
+
+        return None
+
+    def post_call(self, ctxt, result, action, post_mod, pre_mod):
+        """
+        A modifier hook function.  This is called in reverse-priority
+        order after invoking the ``Action`` for the step.  This allows
+        a modifier to inspect or alter the result of the step.
+
+        :param ctxt: The context object.
+        :param result: The result of the action.  This will be a
+                       ``StepResult`` object.
+        :param action: The action that was performed.
+        :param post_mod: A list of modifiers following this modifier
+                         in the list of modifiers that is applicable
+                         to the action.  This list is in priority
+                         order.
+        :param pre_mod: A list of modifiers preceding this modifier in
+                        the list of modifiers that is applicable to
+                        the action.  This list is in priority order.
+
+        :returns: The result for the action, optionally modified.  If
+                  the result is not modified, ``result`` must be
+                  returned unchanged.  This implementation records a
+                  successful result, and returns it unchanged.
+        """
+
+        with self._lock:
+            fingerprint = self._pending.pop(id(ctxt), None)
+
+        # Record the success
+        if fingerprint is not None and result.state == steps.SUCCESS:
+            ctxt.result_cache.put(fingerprint, step=str(self.step_addr))
+
+        return result
+
+
 class IgnoreErrorsModifier(steps.Modifier):
     """
     A modifier that causes an action failure to be ignored.  The base
@@ -106,7 +628,7 @@ class IgnoreErrorsModifier(steps.Modifier):
     """
 
     priority = 300
-    schema = {'type': 'bool'}
+    schema = {'type': 'boolean'}
 
     def post_call(self, ctxt, result, action, post_mod, pre_mod):
         """
@@ -137,3 +659,465 @@ class IgnoreErrorsModifier(steps.Modifier):
         result.ignore = self.config
 
         return result
+
+
+class RetryModifier(steps.Modifier):
+    """
+    A modifier that performs an action again if it fails.  The base
+    usage is::
+
+        - run: ./wait_for_service.sh
+          retry: 5
+
+    Here the action will be performed up to 5 times, until it
+    succeeds.  More control over the retries is available using the
+    advanced syntax::
+
+        - run: ./wait_for_service.sh
+          retry:
+            attempts: 5
+            delay: 0.5
+            backoff: 2
+            max-delay: 10
+            jitter: 0.5
+            retryable: result.returncode == 75
+
+    The "attempts" element gives the maximum number of times to
+    perform the action, including the first; it defaults to 3.  The
+    delay before each retry grows exponentially: it starts at "delay"
+    seconds (default 1), is multiplied by "backoff" (default 2) for
+    each subsequent retry, and is capped at "max-delay" seconds
+    (default 60).  To avoid retries from several steps or runs
+    occurring in lockstep, each delay is reduced by a random fraction
+    of up to "jitter" (default 0.5) of the delay; a "jitter" of 0
+    disables this.  If "retryable" is given, it is an expression
+    which is evaluated after each failed attempt, and the action is
+    only performed again if it is true; in addition to the template
+    variables, the expression may refer to "result", the
+    ``StepResult`` of the failed attempt, "state", the name of its
+    state (e.g., "FAILURE" or "ERROR"), and "attempt", the number of
+    the attempt.
+
+    The result of the step is the result of the last attempt, and
+    the results of all the attempts are available as its "results"
+    attribute.  Modifiers with a higher priority than "retry", such
+    as "timeout", apply to each attempt individually.
+    """
+
+    # Set the priority, restriction, and schema
+    priority = 400
+    restriction = steps.Modifier.NORMAL
+    schema = {
+        'oneOf': [
+            {
+                'type': 'integer',
+                'minimum': 1,
+            },
+            {
+                'type': 'object',
+                'properties': {
+                    'attempts': {
+                        'type': 'integer',
+                        'minimum': 1,
+                    },
+                    'delay': {
+                        'type': 'number',
+                        'minimum': 0,
+                    },
+                    'backoff': {
+                        'type': 'number',
+                        'minimum': 1,
+                    },
+                    'max-delay': {
+                        'type': 'number',
+                        'minimum': 0,
+                    },
+                    'jitter': {
+                        'type': 'number',
+                        'minimum': 0,
+                        'maximum': 1,
+                    },
+                    'retryable': {'type': 'string'},
+                },
+                'additionalProperties': False,
+            },
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``RetryModifier`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the modifier.
+        :param config: The configuration for the modifier.  This may
+                       be a scalar value (e.g., "run: command"), a
+                       list, or a dictionary.  If the configuration
+                       provided is invalid for the action, a
+                       ``ConfigError`` should be raised.
+        :param step_addr: The address of the step in the test
+                          configuration.  Should be passed to the
+                          ``ConfigError``.
+        """
+
+        # Perform superclass initialization
+        super(RetryModifier, self).__init__(ctxt, name, config, step_addr)
+
+        # Convert the simple syntax
+        if not isinstance(config, dict):
+            config = {'attempts': config}
+
+        # Extract the appropriate values
+        self.attempts = config.get('attempts', 3)
+        self.delay = config.get('delay', 1.0)
+        self.backoff = config.get('backoff', 2.0)
+        self.max_delay = config.get('max-delay', 60.0)
+        self.jitter = config.get('jitter', 0.5)
+        self.retryable = (ctxt.expression(config['retryable'])
+                          if 'retryable' in config else None)
+
+    def delays(self):
+        """
+        Compute the delays before each retry.
+
+        :returns: An iterator over the delays, in seconds.  The number
+                  of delays is one less than the number of attempts.
+        """
+
+        delay = self.delay
+        for _i in six.moves.range(self.attempts - 1):
+            yield min(delay, self.max_delay) * (
+                1.0 - self.jitter * random.random())
+            delay *= self.backoff
+
+    def should_retry(self, ctxt, result, attempt):
+        """
+        Determine whether to perform the action again.
+
+        :param ctxt: The context object.
+        :param result: The ``StepResult`` of the last attempt.
+        :param attempt: The number of the last attempt, starting at 1.
+
+        :returns: A ``True`` value if the action should be performed
+                  again, ``False`` otherwise.
+        """
+
+        # Don't retry successes
+        if result:
+            return False
+
+        # Is the failure retryable?
+        if self.retryable is not None:
+            return bool(self.retryable(
+                ctxt, result=result, state=steps.states[result.state],
+                attempt=attempt))
+
+        return True
+
+    def _retrying(self, ctxt, result, attempt, delay):
+        """
+        Emit a message announcing a retry.
+
+        :param ctxt: The context object.
+        :param result: The ``StepResult`` of the failed attempt.
+        :param attempt: The number of the failed attempt.
+        :param delay: The delay before the retry, in seconds.
+        """
+
+        ctxt.emit('    Attempt %d of %d failed: %s; retrying in %.2fs' %
+                  (attempt, self.attempts,
+                   result.msg or steps.states[result.state], delay))
+
+    def retries(self, ctxt, attempts):
+        """
+        Determine when to perform the action again.  This implements
+        the retry loop shared by ``pre_call()`` and the asyncio
+        engine; the caller waits for each delay, performs the action,
+        and appends the result to ``attempts``.
+
+        :param ctxt: The context object.
+        :param attempts: A list of the ``StepResult`` objects for the
+                         attempts so far, in order.
+
+        :returns: An iterator over the delays before each retry, in
+                  seconds.  The iteration stops once the action
+                  should no longer be retried.
+        """
+
+        for delay in self.delays():
+            if not self.should_retry(ctxt, attempts[-1], len(attempts)):
+                break
+
+            self._retrying(ctxt, attempts[-1], len(attempts), delay)
+            yield delay
+
+    def _summarize(self, attempts):
+        """
+        Summarize the results of the attempts.
+
+        :param attempts: A list of the ``StepResult`` objects for the
+                         attempts, in order.
+
+        :returns: A ``StepResult`` object.  This is a copy of the
+                  result of the last attempt, with the results of all
+                  the attempts in its ``results`` attribute.
+        """
+
+        result = copy.copy(attempts[-1])
+        result.results = attempts
+        if len(attempts) > 1 and not result:
+            result.msg = 'Failed after %d attempts: %s' % (
+                len(attempts), result.msg or steps.states[result.state])
+
+        return result
+
+    def pre_call(self, ctxt, pre_mod, post_mod, action):
+        """
+        A modifier hook function.  This is called in priority order prior
+        to invoking the ``Action`` for the step.  This allows a
+        modifier to alter the context, or to take over subsequent
+        action invocation.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier in the list of modifiers that is
+                        applicable to the action.  This list is in
+                        priority order.
+        :param post_mod: A list of the modifiers following this
+                         modifier in the list of modifiers that is
+                         applicable to the action.  This list is in
+                         priority order.
+        :param action: The action that will be performed.
+
+        :returns: A ``None`` return value indicates that the modifier
+                  is taking no action.  A non-``None`` return value
+                  should consist of a ``StepResult`` object; this will
+                  suspend further ``pre_call()`` processing and
+                  proceed to the ``post_call()`` processing.  This
+                  implementation takes over invocation of the action,
+                  including the following modifiers, performing it
+                  until it succeeds, and returns the summarized
+                  ``StepResult``.
+        """
+
+        modifiers = list(pre_mod) + [self] + list(post_mod)
+        start = len(pre_mod) + 1
+
+        attempts = [steps.Step.invoke(ctxt, action, modifiers, start)]
+        for delay in self.retries(ctxt, attempts):
+            time.sleep(delay)
+            attempts.append(steps.Step.invoke(ctxt, action, modifiers,
+                                              start))
+
+        return self._summarize(attempts)
+
+    def pre_call_async(self, ctxt, pre_mod, post_mod, action):
+        """
+        The asynchronous variant of ``pre_call()``, used by the asyncio
+        engine.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier.
+        :param post_mod: A list of the modifiers following this
+                         modifier.
+        :param action: The action that will be performed.
+
+        :returns: A coroutine returning the summarized ``StepResult``.
+        """
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        return aio.retry(ctxt, self, pre_mod, post_mod, action)
+
+
+class TimeoutModifier(steps.Modifier):
+    """
+    A modifier that limits the time an action may take.  The base
+    usage is::
+
+        - run: ./integration_tests.sh
+          timeout: 600
+
+    If the action has not completed within 600 seconds, the processes
+    it started are terminated, and the step fails.  More control over
+    the termination is available using the advanced syntax::
+
+        - run: ./integration_tests.sh
+          timeout:
+            seconds: 600
+            grace: 10
+
+    While the step executes, the processes it starts are started in a
+    new session, on systems which support it.  When the deadline
+    passes, each such process and all the processes it has started
+    are sent ``SIGTERM``; any still running after "grace" seconds
+    (default 5) are sent ``SIGKILL``.  The step is then reported as a
+    failure with a message indicating that it timed out.  Note that
+    only processes can be interrupted; an action which does not start
+    a process is allowed to complete, but still fails if the deadline
+    has passed.  When combined with the "retry" modifier, the timeout
+    applies to each attempt.
+    """
+
+    # Set the priority, restriction, and schema
+    priority = 500
+    restriction = steps.Modifier.NORMAL
+    schema = {
+        'oneOf': [
+            {
+                'type': 'number',
+                'minimum': 0,
+            },
+            {
+                'type': 'object',
+                'properties': {
+                    'seconds': {
+                        'type': 'number',
+                        'minimum': 0,
+                    },
+                    'grace': {
+                        'type': 'number',
+                        'minimum': 0,
+                    },
+                },
+                'required': ['seconds'],
+                'additionalProperties': False,
+            },
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``TimeoutModifier`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the modifier.
+        :param config: The configuration for the modifier.  This may
+                       be a scalar value (e.g., "run: command"), a
+                       list, or a dictionary.  If the configuration
+                       provided is invalid for the action, a
+                       ``ConfigError`` should be raised.
+        :param step_addr: The address of the step in the test
+                          configuration.  Should be passed to the
+                          ``ConfigError``.
+        """
+
+        # Perform superclass initialization
+        super(TimeoutModifier, self).__init__(ctxt, name, config,
+                                              step_addr)
+
+        # Convert the simple syntax
+        if not isinstance(config, dict):
+            config = {'seconds': config}
+
+        # Extract the appropriate values
+        self.seconds = config['seconds']
+        self.grace = config.get('grace', 5.0)
+
+    def _arm(self):
+        """
+        Start tracking the processes started by an invocation of the
+        action, and arm the deadline.
+
+        :returns: A tuple of the ``timid.environment.ProcessTracker``
+                  and the ``threading.Timer`` which terminates its
+                  processes when the deadline passes.
+        """
+
+        tracker = environment.ProcessTracker()
+        timer = threading.Timer(self.seconds, tracker.terminate,
+                                (self.grace,))
+        timer.daemon = True
+        timer.start()
+
+        return tracker, timer
+
+    def _disarm(self, tracker, timer, result):
+        """
+        Disarm the deadline of an invocation of the action.  If it has
+        already passed, waits for the processes to be terminated.
+
+        :param tracker: The ``timid.environment.ProcessTracker``
+                        returned by ``_arm()``.
+        :param timer: The ``threading.Timer`` returned by ``_arm()``.
+        :param result: The result of the action.
+
+        :returns: The result for the action: ``result``, unless the
+                  deadline passed, in which case a failure.
+        """
+
+        timer.cancel()
+        timer.join()
+
+        if tracker.signalled is None:
+            return result
+
+        return steps.StepResult(
+            state=steps.FAILURE,
+            msg='Timed out after %g seconds' % self.seconds,
+            returncode=result.returncode, output=result.output)
+
+    def pre_call(self, ctxt, pre_mod, post_mod, action):
+        """
+        A modifier hook function.  This is called in priority order prior
+        to invoking the ``Action`` for the step.  This allows a
+        modifier to alter the context, or to take over subsequent
+        action invocation.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier in the list of modifiers that is
+                        applicable to the action.  This list is in
+                        priority order.
+        :param post_mod: A list of the modifiers following this
+                         modifier in the list of modifiers that is
+                         applicable to the action.  This list is in
+                         priority order.
+        :param action: The action that will be performed.
+
+        :returns: A ``None`` return value indicates that the modifier
+                  is taking no action.  A non-``None`` return value
+                  should consist of a ``StepResult`` object; this will
+                  suspend further ``pre_call()`` processing and
+                  proceed to the ``post_call()`` processing.  This
+                  implementation takes over invocation of the action,
+                  including the following modifiers, through a view
+                  of the context which tracks only the processes the
+                  invocation starts, and returns the result, or a
+                  failure if the deadline passed.
+        """
+
+        modifiers = list(pre_mod) + [self] + list(post_mod)
+        start = len(pre_mod) + 1
+
+        tracker, timer = self._arm()
+        try:
+            result = steps.Step.invoke(ctxt.tracking(tracker), action,
+                                       modifiers, start)
+        except Exception:
+            timer.cancel()
+            raise
+
+        return self._disarm(tracker, timer, result)
+
+    def pre_call_async(self, ctxt, pre_mod, post_mod, action):
+        """
+        The asynchronous variant of ``pre_call()``, used by the asyncio
+        engine.
+
+        :param ctxt: The context object.
+        :param pre_mod: A list of the modifiers preceding this
+                        modifier.
+        :param post_mod: A list of the modifiers following this
+                         modifier.
+        :param action: The action that will be performed.
+
+        :returns: A coroutine returning the ``StepResult``.
+        """
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        return aio.timeout(ctxt, self, pre_mod, post_mod, action)
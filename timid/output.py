@@ -0,0 +1,594 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import os
+import re
+import sys
+
+import six
+
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    import selectors34 as selectors
+
+from timid import steps
+from timid import utils
+
+
+# The names of the captured streams
+STREAMS = ('stdout', 'stderr')
+
+# The default number of bytes of each stream to keep
+DEFAULT_SIZE = 64 * 1024
+
+# The number of bytes to read from a pipe at once
+CHUNK_SIZE = 64 * 1024
+
+
+class RingBuffer(object):
+    """
+    A fixed-size buffer retaining the last bytes written to it.  The
+    storage is allocated once, when the buffer is created, so the
+    memory used does not grow no matter how much data is written.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        """
+        Initialize a ``RingBuffer`` instance.
+
+        :param size: The maximum number of bytes to retain.  Defaults
+                     to ``DEFAULT_SIZE``.
+        """
+
+        self.size = size
+        self.total = 0
+
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._pos = 0
+
+    def __len__(self):
+        """
+        Return the number of bytes retained by the buffer.
+
+        :returns: The number of bytes retained.
+        """
+
+        return min(self.total, self.size)
+
+    def write(self, data):
+        """
+        Write data to the buffer, discarding the oldest data if the
+        buffer is full.
+
+        :param data: The data to write.  Must be a bytes-like object.
+        """
+
+        data = memoryview(data)
+        length = len(data)
+        self.total += length
+
+        # Only the tail of a large write will be retained
+        if length >= self.size:
+            self._view[:] = data[length - self.size:]
+            self._pos = 0
+            return
+
+        # Copy the data in, wrapping around the end of the buffer
+        end = self._pos + length
+        if end <= self.size:
+            self._view[self._pos:end] = data
+        else:
+            split = self.size - self._pos
+            self._view[self._pos:] = data[:split]
+            self._view[:length - split] = data[split:]
+        self._pos = end % self.size
+
+    def getvalue(self):
+        """
+        Retrieve the data retained by the buffer.
+
+        :returns: The last bytes written to the buffer, in order.
+        """
+
+        if self.total < self.size:
+            return bytes(self._view[:self._pos])
+
+        return bytes(self._view[self._pos:]) + bytes(self._view[:self._pos])
+
+    @property
+    def truncated(self):
+        """
+        Determine whether data has been discarded from the buffer.
+        """
+
+        return self.total > self.size
+
+
+class Scrubber(object):
+    """
+    Mask the values of sensitive variables in output.  The values are
+    compiled into a single Aho-Corasick automaton, so output is
+    scanned in time proportional to its length, no matter how many
+    values must be masked.  Each run of masked output is replaced by
+    the masking string of ``timid.utils.SensitiveDict``, naming the
+    variable whose value was found.
+    """
+
+    def __init__(self, masking=utils.SensitiveDict.masking):
+        """
+        Initialize a ``Scrubber`` instance.
+
+        :param masking: The format string used to mask a value.  It is
+                        formatted with the ``key`` of the variable.
+        """
+
+        self.masking = masking
+        self.builds = 0
+
+        # The values currently compiled into the automaton
+        self._values = frozenset()
+
+        # The dictionaries and their versions the values were last
+        # collected from
+        self._sources = ()
+
+        # The automaton: the transitions, failure links, depth, and
+        # the length and key of the longest value ending at each
+        # state
+        self._starts = None
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        self._length = [0]
+        self._key = [None]
+
+    def __bool__(self):
+        """
+        Determine whether the scrubber has any values to mask.
+
+        :returns: A ``True`` value if there are values to mask,
+                  ``False`` otherwise.
+        """
+
+        return bool(self._values)
+    __nonzero__ = __bool__
+
+    def update(self, *dicts):
+        """
+        Update the values to be masked.  The automaton is only rebuilt
+        if the values have changed.
+
+        :param dicts: One or more ``timid.utils.SensitiveDict``
+                      instances, such as the template variables and
+                      the environment.  The values of the sensitive
+                      keys of each are masked.
+
+        :returns: The ``Scrubber`` instance, for convenience.
+        """
+
+        # Skip the work if none of the dictionaries have changed
+        sources = tuple((data, data.version) for data in dicts)
+        if (len(sources) == len(self._sources) and
+                all(new[0] is old[0] and new[1] == old[1]
+                    for new, old in zip(sources, self._sources))):
+            return self
+        self._sources = sources
+
+        # Collect the values to mask
+        values = {}
+        for data in dicts:
+            for key in sorted(data.sensitive):
+                if key not in data:
+                    continue
+                value = six.text_type(data[key]).encode('utf-8')
+                if value:
+                    values.setdefault(value, key)
+
+        # Rebuild the automaton, if necessary
+        values = frozenset(values.items())
+        if values != self._values:
+            self._build(values)
+
+        return self
+
+    def _build(self, values):
+        """
+        Build the automaton.
+
+        :param values: A set of tuples of the value to mask, as bytes,
+                       and the name of the variable.
+        """
+
+        goto = [{}]
+        depth = [0]
+        length = [0]
+        key = [None]
+
+        # Build the trie of values
+        for value, name in sorted(values):
+            state = 0
+            for byte in bytearray(value):
+                nxt = goto[state].get(byte)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][byte] = nxt
+                    goto.append({})
+                    depth.append(depth[state] + 1)
+                    length.append(0)
+                    key.append(None)
+                state = nxt
+            length[state] = len(value)
+            key[state] = name
+
+        # Compute the failure links breadth-first; a state without a
+        # value of its own inherits the longest value ending at its
+        # failure state
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for byte, nxt in goto[state].items():
+                queue.append(nxt)
+                target = fail[state]
+                while target and byte not in goto[target]:
+                    target = fail[target]
+                target = goto[target].get(byte, 0)
+                fail[nxt] = target if target != nxt else 0
+                if not length[nxt]:
+                    length[nxt] = length[fail[nxt]]
+                    key[nxt] = key[fail[nxt]]
+
+        self._values = values
+        self._starts = re.compile(b'[' + b''.join(
+            re.escape(six.int2byte(byte)) for byte in sorted(goto[0])) + b']')
+        self._goto = goto
+        self._fail = fail
+        self._depth = depth
+        self._length = length
+        self._key = key
+        self.builds += 1
+
+    def stream(self):
+        """
+        Create a ``ScrubStream`` for scrubbing a stream of output using
+        the current values.
+
+        :returns: A ``ScrubStream`` instance.
+        """
+
+        return ScrubStream(self)
+
+    def scrub(self, data):
+        """
+        Scrub a complete piece of output.
+
+        :param data: The output, as bytes.
+
+        :returns: The scrubbed output, as bytes.
+        """
+
+        stream = self.stream()
+        return stream.feed(data) + stream.flush()
+
+
+class ScrubStream(object):
+    """
+    Scrub a stream of output which arrives in chunks.  A value split
+    across two chunks is still masked: the end of a chunk that could
+    be the start of a value is held back until the next chunk, or
+    until the stream is flushed.
+    """
+
+    def __init__(self, scrubber):
+        """
+        Initialize a ``ScrubStream`` instance.
+
+        :param scrubber: The ``Scrubber`` to use.  It must not be
+                         updated while the stream is in use.
+        """
+
+        self._scrubber = scrubber
+        self._state = 0
+
+        # The output not yet emitted, and the runs of it to be masked,
+        # as a list of tuples of the start and end index and the key
+        self._pending = bytearray()
+        self._runs = []
+
+        # Whether the last byte emitted was masked
+        self._in_mask = False
+
+    def feed(self, data):
+        """
+        Scrub a chunk of output.
+
+        :param data: The chunk of output, as bytes.
+
+        :returns: The scrubbed output which can be emitted, as bytes.
+                  This may be shorter or longer than ``data``.
+        """
+
+        scrubber = self._scrubber
+
+        # Nothing to mask
+        if not scrubber._values:
+            return bytes(data)
+
+        goto = scrubber._goto
+        fail = scrubber._fail
+        lengths = scrubber._length
+        keys = scrubber._key
+        starts = scrubber._starts
+        pending = self._pending
+        state = self._state
+
+        data = bytearray(data)
+        pos = 0
+        while pos < len(data):
+            # Skip quickly to the next byte which could begin a value
+            if not state:
+                match = starts.search(data, pos)
+                skip = match.start() if match else len(data)
+                pending += data[pos:skip]
+                pos = skip
+                if pos >= len(data):
+                    break
+
+            # Advance the automaton
+            byte = data[pos]
+            pos += 1
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            pending.append(byte)
+
+            # Mask the longest value ending here
+            length = lengths[state]
+            if length:
+                self._mask(len(pending) - length, len(pending), keys[state])
+
+        self._state = state
+
+        # Bytes before the current match candidate can be emitted
+        return self._emit(len(pending) - scrubber._depth[state])
+
+    def _mask(self, start, end, key):
+        """
+        Mask a range of the pending output.  Matches end at increasing
+        positions, so the range can only overlap the most recent runs;
+        overlapping and adjacent runs are merged, and the merged run
+        is named for the variable found at its start.
+
+        :param start: The index of the first pending byte to mask.
+        :param end: The index after the last pending byte to mask.
+        :param key: The name of the variable whose value was found.
+        """
+
+        runs = self._runs
+        while runs and start <= runs[-1][1]:
+            run_start, run_end, run_key = runs.pop()
+            if run_start <= start:
+                start, key = run_start, run_key
+            end = max(end, run_end)
+
+        runs.append((start, end, key))
+
+    def flush(self):
+        """
+        Flush the output held back waiting for more data.
+
+        :returns: The remaining scrubbed output, as bytes.
+        """
+
+        self._state = 0
+        return self._emit(len(self._pending))
+
+    def _emit(self, count):
+        """
+        Emit pending output.
+
+        :param count: The number of pending bytes to emit.
+
+        :returns: The scrubbed output, as bytes.
+        """
+
+        if not count:
+            return b''
+
+        pending = self._pending
+        runs = self._runs
+        result = bytearray()
+        in_mask = False
+
+        pos = 0
+        while runs and runs[0][0] < count:
+            start, end, key = runs[0]
+            result += pending[pos:start]
+
+            # Replace the run, unless it continues a run already
+            # replaced
+            if start or not self._in_mask:
+                result += self._scrubber.masking.format(
+                    key=key).encode('utf-8')
+
+            # Is the run complete?
+            if end <= count:
+                runs.pop(0)
+                pos = end
+                in_mask = end == count
+            else:
+                pos = count
+                in_mask = True
+                break
+        result += pending[pos:count]
+
+        # Discard the emitted output
+        del pending[:count]
+        self._runs = [(max(start - count, 0), end - count, key)
+                      for start, end, key in runs]
+        self._in_mask = in_mask
+
+        return bytes(result)
+
+
+class Capture(object):
+    """
+    Capture the output of an external process.  The last bytes written
+    to each of the process's output streams are retained in a
+    ``RingBuffer``, and the output may also be passed through to
+    timid's own output streams as it arrives.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, passthrough=True, scrubber=None):
+        """
+        Initialize a ``Capture`` instance.
+
+        :param size: The maximum number of bytes of each stream to
+                     retain.  Defaults to ``DEFAULT_SIZE``.  If 0, no
+                     output is retained; this may be used to mask the
+                     output passed through.
+        :param passthrough: If ``True``, the output is also written to
+                            the corresponding stream of timid.
+                            Defaults to ``True``.
+        :param scrubber: An optional ``Scrubber``.  If provided, the
+                         sensitive values it knows of are masked in
+                         the output, both when passed through and when
+                         retained.
+        """
+
+        self.buffers = {}
+        if size:
+            self.buffers = dict((name, RingBuffer(size)) for name in STREAMS)
+        self.passthrough = passthrough
+
+        # Set up the scrubbing of each stream
+        self._scrub = {}
+        if scrubber:
+            self._scrub = dict((name, scrubber.stream()) for name in STREAMS)
+
+    def feed(self, name, data):
+        """
+        Process output from the process.
+
+        :param name: The name of the stream the output was written
+                     to; either "stdout" or "stderr".
+        :param data: The output, as bytes.
+        """
+
+        # Mask sensitive values
+        if name in self._scrub:
+            data = self._scrub[name].feed(data)
+            if not data:
+                return
+
+        self._write(name, data)
+
+    def close(self, name):
+        """
+        Process the end of the output on a stream.  This flushes any
+        output held back by the scrubber.
+
+        :param name: The name of the stream; either "stdout" or
+                     "stderr".
+        """
+
+        if name in self._scrub:
+            data = self._scrub[name].flush()
+            if data:
+                self._write(name, data)
+
+    def _write(self, name, data):
+        """
+        Retain output, and pass it through if desired.
+
+        :param name: The name of the stream the output was written
+                     to.
+        :param data: The output, as bytes.
+        """
+
+        if name in self.buffers:
+            self.buffers[name].write(data)
+
+        if self.passthrough:
+            stream = getattr(sys, name)
+            stream = getattr(stream, 'buffer', stream)
+            stream.write(data)
+            stream.flush()
+
+    def pump(self, proc):
+        """
+        Read the output of a process until both its output streams are
+        closed.  The streams are read as data becomes available, so
+        neither can fill up and block the process.
+
+        :param proc: A ``subprocess.Popen`` instance with ``stdout``
+                     and ``stderr`` pipes.
+        """
+
+        selector = selectors.DefaultSelector()
+        try:
+            for name in STREAMS:
+                pipe = getattr(proc, name)
+                if pipe is not None:
+                    selector.register(pipe, selectors.EVENT_READ, name)
+
+            while selector.get_map():
+                for key, _events in selector.select():
+                    data = os.read(key.fd, CHUNK_SIZE)
+                    if data:
+                        self.feed(key.data, data)
+                    else:
+                        # End of file; stop watching the pipe
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        self.close(key.data)
+        finally:
+            selector.close()
+
+    def result(self, returncode):
+        """
+        Construct the result of the process.  If the process failed and
+        its output was not passed through, the message of the result
+        includes the tail of its standard error stream, or of its
+        standard output stream if nothing was written to standard
+        error.
+
+        :param returncode: The return code of the process.
+
+        :returns: A ``timid.steps.StepResult`` object.
+        """
+
+        msg = None
+        if returncode and not self.passthrough:
+            tail = self.buffers['stderr'] or self.buffers['stdout']
+            if tail:
+                msg = ('Command exited with status %d; output ends with:\n'
+                       '%s' % (returncode, tail.getvalue().decode(
+                           'utf-8', 'replace').rstrip()))
+
+        return steps.StepResult(returncode=returncode, msg=msg,
+                                output=self.output)
+
+    @property
+    def output(self):
+        """
+        Retrieve the captured output.  This is a dictionary mapping the
+        stream names to the last bytes written to the stream, suitable
+        for the ``output`` parameter of ``timid.steps.StepResult``.
+        """
+
+        return dict((name, buf.getvalue())
+                    for name, buf in self.buffers.items())
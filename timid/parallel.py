@@ -0,0 +1,340 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import threading
+
+from concurrent import futures
+import six
+
+from timid import extensions
+from timid import steps
+
+
+# Failure handling modes
+FAIL_FAST = 'fail-fast'
+COMPLETE_ALL = 'complete-all'
+
+# The default number of tasks which may execute at the same time;
+# tasks usually wait on processes, so this is not tied to the number
+# of CPUs
+MAX_WORKERS = 4
+
+
+def schedule(func, count, max_workers, fail_fast):
+    """
+    Perform a group of tasks concurrently in a thread pool.  This
+    implements the scheduling of the sub-steps of a "parallel" action
+    and of the variants of a "matrix" modifier.
+
+    :param func: A callable taking the index of a task.  It is
+                 called in a worker thread, and must return a
+                 ``timid.steps.StepResult`` object.
+    :param count: The number of tasks.
+    :param max_workers: The maximum number of tasks which may
+                        execute at the same time.
+    :param fail_fast: If ``True``, no further tasks are started once
+                      a task fails.
+
+    :returns: A list of the ``StepResult`` objects for the tasks, in
+              order.  Tasks which were never started have a ``None``
+              result.
+    """
+
+    results = [None] * count
+    pending = iter(range(count))
+    running = {}
+    failed = False
+
+    with futures.ThreadPoolExecutor(max_workers) as executor:
+        while True:
+            # Start as many tasks as the pool allows
+            if not (failed and fail_fast):
+                for idx in pending:
+                    running[executor.submit(func, idx)] = idx
+                    if len(running) >= max_workers:
+                        break
+
+            # Are we done?
+            if not running:
+                break
+
+            # Wait for a task to complete
+            done, _not_done = futures.wait(
+                running, return_when=futures.FIRST_COMPLETED)
+            for fut in done:
+                idx = running.pop(fut)
+                results[idx] = fut.result()
+                if not results[idx]:
+                    failed = True
+
+    return results
+
+
+def summarize(results, labels, noun):
+    """
+    Summarize the results of a group of tasks performed by
+    ``schedule()``.
+
+    :param results: A list of the ``StepResult`` objects for the
+                    tasks, in order.  Tasks which were never started
+                    must have a ``None`` result.
+    :param labels: A list of the labels identifying the tasks in the
+                   message describing the failures, in order.
+    :param noun: The plural noun describing the tasks in the message,
+                 e.g., "sub-steps".
+
+    :returns: A ``StepResult`` object encapsulating the results of
+              all the tasks.
+    """
+
+    # Tasks never started were skipped
+    for idx, result in enumerate(results):
+        if result is None:
+            results[idx] = steps.StepResult(
+                state=steps.SKIPPED,
+                msg='Skipped due to an earlier failure')
+
+    # Summarize the failures
+    failures = [
+        '%s: %s' % (label, result.msg or steps.states[result.state])
+        for label, result in six.moves.zip(labels, results)
+        if not result
+    ]
+    msg = None
+    if failures:
+        msg = '%d of %d %s failed (%s)' % (
+            len(failures), len(results), noun, '; '.join(failures))
+
+    # Ignored task failures do not fail the group
+    state = (max(r.state for r in results) if results
+             else steps.SUCCESS)
+    result = steps.StepResult(
+        state=state, msg=msg,
+        ignore=(True if state in (steps.FAILURE, steps.ERROR) and
+                not failures else None))
+
+    # Leave the ignore state unset unless every failure was ignored,
+    # so that an "ignore-errors" modifier can still set it; the task
+    # results are attached afterwards, so that the state is not
+    # inferred from them either
+    result.results = results
+    return result
+
+
+class ParallelAction(steps.Action):
+    """
+    An action for executing a group of steps concurrently.  The base
+    usage is::
+
+        - parallel:
+          - run: ./lint.sh
+          - run: ./unit_tests.sh
+          - run: ./build.sh
+
+    This action would execute the three sub-steps at the same time,
+    and would succeed only if all three succeed.  More control over
+    the execution is available using the advanced syntax::
+
+        - parallel:
+            max-workers: 2
+            mode: complete-all
+            steps:
+            - run: ./lint.sh
+            - run: ./unit_tests.sh
+            - run: ./build.sh
+
+    The "max-workers" element limits the number of sub-steps that may
+    execute at the same time; it defaults to 4.  The "mode" element
+    controls the handling of sub-step failures: in the default
+    "fail-fast" mode, no further sub-steps are started once a sub-step
+    fails, while in the "complete-all" mode, all sub-steps are
+    executed regardless of failures.  Sub-steps which were never
+    started are reported as skipped.
+
+    Sub-steps may use any action or modifier, including "include"
+    actions, whose steps become sub-steps of the group.  The extension
+    ``pre_step()`` and ``post_step()`` hooks are called for each
+    sub-step, with the index of the sub-step within the group; calls
+    to the hooks are serialized.  Note that all sub-steps share the
+    same context, so sub-steps which alter the template variables,
+    the environment, or the working directory affect each other in an
+    unpredictable order.
+    """
+
+    # Schema for validating the configuration
+    schema = {
+        'oneOf': [
+            {'type': 'array'},
+            {
+                'type': 'object',
+                'properties': {
+                    'steps': {'type': 'array'},
+                    'max-workers': {
+                        'type': 'integer',
+                        'minimum': 1,
+                    },
+                    'mode': {
+                        'type': 'string',
+                        'enum': [FAIL_FAST, COMPLETE_ALL],
+                    },
+                },
+                'required': ['steps'],
+                'additionalProperties': False,
+            },
+        ],
+    }
+
+    def __init__(self, ctxt, name, config, step_addr):
+        """
+        Initialize a ``ParallelAction`` instance.
+
+        :param ctxt: The context object.
+        :param name: The name of the action.
+        :param config: The configuration for the action.  This may be
+                       a scalar value (e.g., "run: command"), a list,
+                       or a dictionary.  If the configuration provided
+                       is invalid for the action, a ``ConfigError``
+                       should be raised.
+        :param step_addr: The address of the step in the test
+                          configuration.  Should be passed to the
+                          ``ConfigError``.
+        """
+
+        # Convert bare lists intelligently
+        if isinstance(config, list):
+            config = {'steps': config}
+
+        # Perform superclass initialization
+        super(ParallelAction, self).__init__(ctxt, name, config, step_addr)
+
+        # Extract the appropriate values
+        self.max_workers = config.get('max-workers', MAX_WORKERS)
+        self.fail_fast = config.get('mode', FAIL_FAST) == FAIL_FAST
+
+        # Parse the sub-steps
+        self.steps = []
+        for idx, step_conf in enumerate(config['steps']):
+            self.steps += steps.Step.parse_step(
+                ctxt, steps.StepAddress(step_addr.fname, idx, step_addr.key,
+                                        step_addr), step_conf)
+
+        # Serializes calls to the extensions and context messages
+        self._lock = threading.Lock()
+
+    def _run_step(self, ctxt, exts, idx, step):
+        """
+        Execute a single sub-step.  This is called in a worker thread.
+
+        :param ctxt: The context object.
+        :param exts: An instance of ``timid.extensions.ExtensionSet``
+                     describing the extensions to be called while
+                     processing the sub-step.
+        :param idx: The index of the sub-step within the group.
+        :param step: The ``timid.steps.Step`` to execute.
+
+        :returns: A ``StepResult`` object.
+        """
+
+        # Emit information about what we're doing, and run through
+        # extension hooks
+        with self._lock:
+            self._report(ctxt, idx, step)
+            if exts.pre_step(ctxt, step, idx):
+                result = steps.StepResult(state=steps.SKIPPED)
+                self._report(ctxt, idx, step, result)
+                return result
+
+        # Now execute the step
+        result = step(ctxt)
+
+        # Let the extensions process the result of the step, and emit
+        # the result
+        with self._lock:
+            exts.post_step(ctxt, step, idx, result)
+            self._report(ctxt, idx, step, result)
+
+        return result
+
+    def _report(self, ctxt, idx, step, result=None):
+        """
+        Emit the progress of a sub-step.
+
+        :param ctxt: The context object.
+        :param idx: The index of the sub-step within the group.
+        :param step: The ``timid.steps.Step``.
+        :param result: The ``StepResult`` of the sub-step.  If
+                       ``None``, the sub-step is starting.
+        """
+
+        if result is None:
+            ctxt.emit('[Sub-step %d]: %s . . .' % (idx, step.name),
+                      idx=idx, step=step)
+        else:
+            ctxt.emit('[Sub-step %d]: `- Step %s%s' %
+                      (idx, steps.states[result.state],
+                       ' (ignored)' if result.ignore else ''),
+                      idx=idx, step=step)
+
+    def __call__(self, ctxt):
+        """
+        Invoke the action.  This executes the sub-steps concurrently.
+
+        :param ctxt: The context object.
+
+        :returns: A ``StepResult`` object encapsulating the results of
+                  all the sub-steps.
+        """
+
+        # Select the extensions to call for each sub-step
+        exts = getattr(ctxt, 'extensions', None)
+        if exts is None:
+            exts = extensions.ExtensionSet()
+
+        results = schedule(
+            lambda idx: self._run_step(ctxt, exts, idx, self.steps[idx]),
+            len(self.steps), self.max_workers, self.fail_fast)
+
+        return self._summarize(results)
+
+    def call_async(self, ctxt):
+        """
+        Invoke the action using the asyncio engine.  This executes the
+        sub-steps concurrently as tasks on the event loop.
+
+        :param ctxt: The context object.
+
+        :returns: A coroutine returning a ``StepResult`` object
+                  encapsulating the results of all the sub-steps.
+        """
+
+        # Imported here, as the engine requires Python 3.5 or later
+        from timid import aio
+
+        return aio.run_parallel(ctxt, self)
+
+    def _summarize(self, results):
+        """
+        Summarize the results of the sub-steps.
+
+        :param results: A list of the ``StepResult`` objects for the
+                        sub-steps, in order.  Sub-steps which were
+                        never started must have a ``None`` result.
+
+        :returns: A ``StepResult`` object encapsulating the results of
+                  all the sub-steps.
+        """
+
+        return summarize(results, [step.name for step in self.steps],
+                         'sub-steps')
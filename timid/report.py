@@ -0,0 +1,488 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import io
+import json
+import re
+import threading
+from xml.sax import saxutils
+
+import six
+
+from timid import extensions
+from timid import steps
+from timid import utils
+
+
+# Characters which may not appear in an XML document, even escaped
+_xml_illegal = re.compile(u'[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd]')
+
+
+def _text(value):
+    """
+    Convert a message or captured output to text.
+
+    :param value: The value to convert; may be ``None``, bytes, or
+                  text.
+
+    :returns: The text, or ``None`` if ``value`` was ``None``.
+    """
+
+    if value is None:
+        return None
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8', 'replace')
+    return six.text_type(value)
+
+
+class StreamingReport(object):
+    """
+    Base class for reports which are written as the steps complete.
+    A report consists of a header, one record per step, and a
+    trailer.  After each record, the trailer is rewritten and the file
+    flushed, so that the file is a complete, valid report even if
+    ``timid`` is killed part way through.  Only the counts of the
+    results are kept in memory, so the memory used does not depend on
+    the number of steps.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize a ``StreamingReport`` instance.  The file is
+        truncated.
+
+        :param path: The path of the file to write.
+        """
+
+        self.path = path
+        self.counts = [0] * len(steps.states)
+        self.total = 0
+        self.duration = 0.0
+
+        self._file = io.open(path, 'wb')
+        self._lock = threading.Lock()
+
+        self._file.write(self._header())
+        self._body_end = self._file.tell()
+        self._finish()
+
+    def add(self, label, address, name, result, duration):
+        """
+        Add the result of a step to the report.
+
+        :param label: The label of the test the step is part of, or
+                      ``None``.
+        :param address: The address of the step, as a string.
+        :param name: The name of the step.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        :param duration: The time taken to execute the step, in
+                         seconds.
+        """
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            # An ignored failure did not fail the test
+            self.total += 1
+            if result.ignore and result.state >= steps.FAILURE:
+                self.counts[steps.SKIPPED] += 1
+            else:
+                self.counts[result.state] += 1
+            self.duration += duration
+
+            # Overwrite the trailer with the new record
+            self._file.seek(self._body_end)
+            self._file.write(self._record(
+                label, address, name, result, duration))
+            self._body_end = self._file.tell()
+            self._finish()
+
+    def _finish(self):
+        """
+        Write the trailer after the last record, update the header,
+        and flush the file.  Must be called with the lock held, or
+        from the constructor.
+        """
+
+        self._file.write(self._trailer())
+        self._file.truncate()
+        self._update_header()
+        self._file.flush()
+
+    def _update_header(self):
+        """
+        Update the header in place to reflect the records written so
+        far.  The default does nothing.
+        """
+
+        pass
+
+    def close(self):
+        """
+        Close the file.
+        """
+
+        with self._lock:
+            self._file.close()
+
+    def _header(self):
+        """
+        Obtain the header of the report.
+
+        :returns: The header, as bytes.
+        """
+
+        return b''
+
+    def _record(self, label, address, name, result, duration):
+        """
+        Obtain the record describing the result of one step.
+
+        :param label: The label of the test the step is part of, or
+                      ``None``.
+        :param address: The address of the step, as a string.
+        :param name: The name of the step.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        :param duration: The time taken to execute the step, in
+                         seconds.
+
+        :returns: The record, as bytes.
+        """
+
+        raise NotImplementedError()  # pragma: no cover
+
+    def _trailer(self):
+        """
+        Obtain the trailer of the report.
+
+        :returns: The trailer, as bytes.
+        """
+
+        return b''
+
+
+class JUnitReport(StreamingReport):
+    """
+    Write a report in the JUnit XML format understood by most
+    continuous integration servers.  Each step becomes a
+    ``<testcase>`` element of a single ``<testsuite>``, whose counts
+    are updated in place as the steps complete.
+    """
+
+    # The width of the opening ``<testsuite>`` tag; it is padded with
+    # spaces so that the counts may be rewritten in place
+    header_width = 160
+
+    # The XML declaration preceding the ``<testsuite>`` tag
+    prolog = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+
+    def _header(self):
+        """
+        Obtain the header of the report.
+
+        :returns: The header, as bytes.
+        """
+
+        return self.prolog + self._suite()
+
+    def _suite(self):
+        """
+        Obtain the opening ``<testsuite>`` tag, padded to
+        ``header_width``.
+
+        :returns: The tag, as bytes.
+        """
+
+        tag = ('<testsuite name="timid" tests="%d" failures="%d" '
+               'errors="%d" skipped="%d" time="%.3f"' %
+               (self.total, self.counts[steps.FAILURE],
+                self.counts[steps.ERROR], self.counts[steps.SKIPPED],
+                self.duration))
+        return (tag.ljust(self.header_width - 2) + '>\n').encode('ascii')
+
+    def _update_header(self):
+        """
+        Update the counts in the opening ``<testsuite>`` tag.
+        """
+
+        end = self._file.tell()
+        self._file.seek(len(self.prolog))
+        self._file.write(self._suite())
+        self._file.seek(end)
+
+    def _record(self, label, address, name, result, duration):
+        """
+        Obtain the ``<testcase>`` element describing the result of one
+        step.
+
+        :param label: The label of the test the step is part of, or
+                      ``None``.
+        :param address: The address of the step, as a string.
+        :param name: The name of the step.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        :param duration: The time taken to execute the step, in
+                         seconds.
+
+        :returns: The element, as bytes.
+        """
+
+        def attr(value):
+            return saxutils.quoteattr(_xml_illegal.sub(u'?', _text(value)))
+
+        def text(value):
+            return saxutils.escape(_xml_illegal.sub(u'?', _text(value)))
+
+        msg = result.msg or steps.states[result.state]
+        if result.ignore and result.state >= steps.FAILURE:
+            children = [u'<skipped message=%s/>' % attr('ignored: %s' % msg)]
+        elif result.state == steps.FAILURE:
+            children = [u'<failure message=%s/>' % attr(msg)]
+        elif result.state == steps.ERROR:
+            children = [u'<error message=%s/>' % attr(msg)]
+        elif result.state == steps.SKIPPED:
+            children = [u'<skipped/>']
+        else:
+            children = []
+
+        for stream, tag in (('stdout', 'system-out'),
+                            ('stderr', 'system-err')):
+            if result.output.get(stream):
+                children.append(u'<%s>%s</%s>' %
+                                (tag, text(result.output[stream]), tag))
+
+        record = u'  <testcase classname=%s name=%s time="%.3f"' % (
+            attr(label or 'timid'), attr('%s: %s' % (address, name)),
+            duration)
+        if children:
+            record += u'>\n%s\n  </testcase>\n' % u'\n'.join(
+                u'    %s' % child for child in children)
+        else:
+            record += u'/>\n'
+
+        return record.encode('utf-8')
+
+    def _trailer(self):
+        """
+        Obtain the trailer of the report.
+
+        :returns: The trailer, as bytes.
+        """
+
+        return b'</testsuite>\n'
+
+
+class TAPReport(StreamingReport):
+    """
+    Write a report in the Test Anything Protocol, version 13.  Each
+    step becomes a test point, and the plan is written as the trailer,
+    so that it always matches the number of test points.
+    """
+
+    def _header(self):
+        """
+        Obtain the header of the report.
+
+        :returns: The header, as bytes.
+        """
+
+        return b'TAP version 13\n'
+
+    def _record(self, label, address, name, result, duration):
+        """
+        Obtain the test point describing the result of one step.
+
+        :param label: The label of the test the step is part of, or
+                      ``None``.
+        :param address: The address of the step, as a string.
+        :param name: The name of the step.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        :param duration: The time taken to execute the step, in
+                         seconds.
+
+        :returns: The test point, as bytes.
+        """
+
+        desc = u'%s: %s' % (address, _text(name))
+        if label:
+            desc = u'%s: %s' % (_text(label), desc)
+        desc = u' '.join(desc.split()).replace(u'#', u'\\#')
+
+        if result.state >= steps.FAILURE:
+            record = u'not ok %d - %s' % (self.total, desc)
+            if result.ignore:
+                record += u' # TODO ignored'
+        elif result.state == steps.SKIPPED:
+            record = u'ok %d - %s # SKIP' % (self.total, desc)
+        else:
+            record = u'ok %d - %s' % (self.total, desc)
+
+        # Describe failures in a YAML diagnostic block; JSON strings
+        # are valid YAML
+        diag = [(u'duration_ms', u'%.3f' % (duration * 1000.0))]
+        if result.state >= steps.FAILURE:
+            diag.insert(0, (u'severity', u'fail' if result.state ==
+                            steps.FAILURE else u'error'))
+            if result.msg:
+                diag.insert(0, (u'message', json.dumps(_text(result.msg))))
+        record += u'\n  ---\n%s  ...\n' % u''.join(
+            u'  %s: %s\n' % item for item in diag)
+
+        return record.encode('utf-8')
+
+    def _trailer(self):
+        """
+        Obtain the trailer of the report.
+
+        :returns: The trailer, as bytes.
+        """
+
+        return ('1..%d\n' % self.total).encode('ascii')
+
+
+class ReportExtension(extensions.Extension):
+    """
+    An extension for writing machine-readable test reports.  The
+    ``--junit-xml`` option writes a JUnit XML report, and the ``--tap``
+    option a TAP report, of every step executed, including sub-steps
+    of "parallel" actions.  The reports are written as the steps
+    complete, so a run which is killed still leaves a valid partial
+    report.
+    """
+
+    # Run the step hooks after most other extensions, so that the
+    # result reported is the one the test sees
+    priority = 900
+
+    @classmethod
+    def prepare(cls, parser):
+        """
+        Called to prepare the extension.  Adds the report options to
+        the argument parser.
+
+        :param parser: The argument parser, an instance of
+                       ``argparse.ArgumentParser``.
+        """
+
+        parser.add_argument(
+            '--junit-xml',
+            default=None,
+            metavar='FILE',
+            help='Write a JUnit XML report of the steps executed to the '
+            'designated file.',
+        )
+        parser.add_argument(
+            '--tap',
+            default=None,
+            metavar='FILE',
+            help='Write a TAP report of the steps executed to the '
+            'designated file.',
+        )
+
+    @classmethod
+    def activate(cls, ctxt, args):
+        """
+        Called to determine whether to activate the extension.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param args: An instance of ``argparse.Namespace`` containing
+                     the result of processing command line arguments.
+
+        :returns: An instance of the extension class if a report was
+                  requested, ``None`` otherwise.
+        """
+
+        reports = []
+        if args.junit_xml:
+            reports.append(JUnitReport(args.junit_xml))
+        if args.tap:
+            reports.append(TAPReport(args.tap))
+
+        if not reports:
+            return None
+
+        return cls(reports)
+
+    def __init__(self, reports):
+        """
+        Initialize a ``ReportExtension`` instance.
+
+        :param reports: A list of ``StreamingReport`` instances.
+        """
+
+        self.reports = reports
+
+        # The start time of each step being executed
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def pre_step(self, ctxt, step, idx):
+        """
+        Called prior to executing a step.  Starts the timer.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param step: An instance of ``timid.steps.Step`` describing
+                     the step to be executed.
+        :param idx: The index of the step in the list of steps.
+
+        :returns: A ``None`` value, so that the step is executed.
+        """
+
+        with self._lock:
+            self._running[id(ctxt), id(step)] = utils.monotonic()
+
+        return None
+
+    def post_step(self, ctxt, step, idx, result):
+        """
+        Called after executing a step.  Adds the result of the step to
+        the reports.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param step: An instance of ``timid.steps.Step`` describing
+                     the step that was executed.
+        :param idx: The index of the step in the list of steps.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        """
+
+        end = utils.monotonic()
+        with self._lock:
+            start = self._running.pop((id(ctxt), id(step)), end)
+
+        for report in self.reports:
+            report.add(ctxt.label, str(step.step_addr), step.name,
+                       result, end - start)
+
+    def finalize(self, ctxt, result):
+        """
+        Called at the end of processing.  Closes the reports.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param result: The return value of the basic ``timid`` call,
+                       or an ``Exception`` instance if an exception
+                       was raised.
+
+        :returns: The ``result`` parameter, unchanged.
+        """
+
+        for report in self.reports:
+            report.close()
+
+        return result
@@ -19,7 +19,6 @@ import os
 import sys
 
 import six
-import yaml
 
 from timid import entry
 from timid import utils
@@ -66,21 +65,27 @@ class StepAddress(object):
     The "address" of a step.
     """
 
-    def __init__(self, fname, idx, key=None):
+    def __init__(self, fname, idx, key=None, parent=None):
         """
         Initialize a ``StepAddress`` instance.
 
         :param fname: The file name of the YAML file.
         :param idx: The index of the step within the file, or within
-                    the designated key of the file.
+                    the designated key of the file.  For a sub-step,
+                    this is the index of the sub-step within its
+                    parent step.
         :param key: A key within the file.  If the file consists of a
                     single list, this should be ``None`` (the
                     default).
+        :param parent: For a sub-step, such as a step in a step
+                       group or a step included into one, the address
+                       of the parent step.  Defaults to ``None``.
         """
 
         self.fname = fname
         self.idx = idx
         self.key = key
+        self.parent = parent
 
         # Cache for the string representation
         self._str = None
@@ -94,11 +99,20 @@ class StepAddress(object):
 
         # Build the string if necessary...
         if self._str is None:
-            if self.key is None:
-                self._str = '%s step %d' % (self.fname, self.idx + 1)
+            if (self.parent is not None and
+                    (self.fname, self.key) ==
+                    (self.parent.fname, self.parent.key)):
+                self._str = '%s sub-step %d' % (self.parent, self.idx + 1)
             else:
-                self._str = '%s[%s] step %d' % (self.fname, self.key,
-                                                self.idx + 1)
+                if self.key is None:
+                    self._str = '%s step %d' % (self.fname, self.idx + 1)
+                else:
+                    self._str = '%s[%s] step %d' % (self.fname, self.key,
+                                                    self.idx + 1)
+
+                # Steps included into a step group name the group
+                if self.parent is not None:
+                    self._str = '%s: %s' % (self.parent, self._str)
 
         return self._str
 
@@ -162,6 +176,11 @@ class Action(StepPart):
     A step *action*.  Actions are responsible for the actual operation
     performed by the test step.  Each step must have exactly one
     action.
+
+    An action may also provide a ``call_async()`` method, taking the
+    same arguments as ``__call__()`` and returning an awaitable, for
+    use by the asyncio engine (``timid.aio``).  Actions without one
+    are invoked in a worker thread by that engine.
     """
 
     # Specify as True to designate a "step" action, an action which
@@ -191,6 +210,11 @@ class Modifier(StepPart):
     """
     A step *modifier*.  Modifiers modify a step in some fashion, such
     as through repetition or applying a condition.
+
+    For use by the asyncio engine (``timid.aio``), a modifier may also
+    provide ``pre_call_async()`` and ``post_call_async()`` methods,
+    taking the same arguments as ``pre_call()`` and ``post_call()``
+    and returning awaitables.
     """
 
     # Value for "restriction" to indicate a modifier compatible only
@@ -350,7 +374,7 @@ class Step(object):
     }
 
     @classmethod
-    def parse_file(cls, ctxt, fname, key=None, step_addr=None):
+    def parse_file(cls, ctxt, fname, key=None, step_addr=None, parent=None):
         """
         Parse a YAML file containing test steps.
 
@@ -364,14 +388,132 @@ class Step(object):
         :param step_addr: The address of the step in the test
                           configuration.  This may be used in the case
                           of includes, for instance.
+        :param parent: For steps included into a step group, the
+                       address of the group step, which becomes the
+                       parent of the steps.  Defaults to ``None``.
+
+        :returns: A list of ``Step`` objects.
+        """
+
+        # Guard against include cycles
+        cycle = ctxt.parse_cache.enter(fname, key)
+        if cycle is not None:
+            raise ConfigError(
+                'Include cycle detected: %s' % ' -> '.join(cycle),
+                step_addr,
+            )
+
+        try:
+            # Has the file already been parsed during this run?  The
+            # steps are built anew, as the same file may be included
+            # at several places
+            step_data = ctxt.parse_cache.get(fname, key)
+            if step_data is not None:
+                return cls._build_steps(ctxt, fname, key, step_data, True,
+                                        parent)
+
+            return cls._parse_file(ctxt, fname, key, step_addr, parent)
+        finally:
+            ctxt.parse_cache.leave(fname, key)
+
+    @classmethod
+    def _parse_file(cls, ctxt, fname, key, step_addr, parent=None):
+        """
+        Read and parse a YAML file containing test steps.  This is the
+        implementation of ``parse_file()`` for files not in the parse
+        cache.
+
+        :param ctxt: The context object.
+        :param fname: The name of the file to parse.
+        :param key: An optional dictionary key, or ``None``.
+        :param step_addr: The address of the step in the test
+                          configuration, or ``None``.
+        :param parent: The address of the parent of the steps, or
+                       ``None``.
+
+        :returns: A list of ``Step`` objects.
+        """
+
+        # Read the file, noting its identity first so that a change
+        # while it is being read causes it to be read again later
+        ident = ctxt.parse_cache.identity(fname)
+        try:
+            with open(fname, 'rb') as f:
+                content = f.read()
+        except Exception as exc:
+            raise ConfigError(
+                'Failed to read file "%s": %s' % (fname, exc),
+                step_addr,
+            )
+
+        # Check for validated step data in the plan cache
+        digest = ctxt.plan_cache.digest(content, key)
+        step_data = ctxt.plan_cache.get(digest)
+        cached = step_data is not None
+
+        if not cached:
+            step_data = cls._load_steps(fname, content, key, step_addr)
+
+        # OK, assemble the step list
+        steps = cls._build_steps(ctxt, fname, key, step_data, cached,
+                                 parent)
+
+        # The step data is valid; cache it for next time
+        if not cached:
+            ctxt.plan_cache.put(digest, step_data)
+        ctxt.parse_cache.put(fname, key, step_data, ident)
+
+        return steps
+
+    @classmethod
+    def _build_steps(cls, ctxt, fname, key, step_data, validated,
+                     parent=None):
+        """
+        Build the ``Step`` objects for a list of step configurations.
+
+        :param ctxt: The context object.
+        :param fname: The name of the file containing the steps.
+        :param key: An optional dictionary key, or ``None``.
+        :param step_data: The list of step configurations.
+        :param validated: If ``True``, the step configurations have
+                          already been validated, and are not
+                          validated again.
+        :param parent: The address of the parent of the steps, or
+                       ``None``.
 
         :returns: A list of ``Step`` objects.
         """
 
-        # Load the YAML file
+        steps = []
+        with utils.skip_validation(validated):
+            for idx, step_conf in enumerate(step_data):
+                steps.extend(cls.parse_step(
+                    ctxt, StepAddress(fname, idx, key, parent), step_conf))
+
+        return steps
+
+    @staticmethod
+    def _load_steps(fname, content, key, step_addr):
+        """
+        Load the step data from the contents of a YAML file.
+
+        :param fname: The name of the file.
+        :param content: The contents of the file.
+        :param key: An optional dictionary key.  If specified, the
+                    file must be a YAML dictionary, and the referenced
+                    value will be interpreted as a list of steps.  If
+                    not provided, the file must be a YAML list, which
+                    will be interpreted as the list of steps.
+        :param step_addr: The address of the step in the test
+                          configuration.  This may be used in the case
+                          of includes, for instance.
+
+        :returns: The list of step configurations.
+        """
+
+        # Load the YAML data
         try:
-            with open(fname) as f:
-                step_data = yaml.load(f)
+            step_data = utils.yaml_load(content)
         except Exception as exc:
             raise ConfigError(
                 'Failed to read file "%s": %s' % (fname, exc),
@@ -400,13 +542,7 @@ class Step(object):
                 step_addr,
             )
 
-        # OK, assemble the step list and return it
-        steps = []
-        for idx, step_conf in enumerate(step_data):
-            steps.extend(cls.parse_step(
-                ctxt, StepAddress(fname, idx, key), step_conf))
-
-        return steps
+        return step_data
 
     @classmethod
     def parse_step(cls, ctxt, step_addr, step_conf):
@@ -525,7 +661,24 @@ class Step(object):
         # Step object so that we can take advantage of its handling of
         # modifiers.
         if action_item.cls.step_action:
-            return step(ctxt)
+            result = step(ctxt)
+
+            # The step converts exceptions, such as a configuration
+            # error in an included file, into a result; re-raise
+            # them, and treat a skipped step as including no steps
+            if isinstance(result, StepResult):
+                if result.exc_info is not None:
+                    six.reraise(*result.exc_info)
+                elif not result:
+                    raise ConfigError(
+                        'Bad step configuration: step action "%s" failed: '
+                        '%s' % (action_item.name,
+                                result.msg or states[result.state]),
+                        step_addr,
+                    )
+                return []
+
+            return result
 
         # Not a step action, return the step as a list of one element
         return [step]
@@ -561,11 +714,34 @@ class Step(object):
                   action, a list of zero or more ``Step`` objects.
         """
 
+        return self.invoke(ctxt, self.action, self.modifiers)
+
+    @staticmethod
+    def invoke(ctxt, action, modifiers, start=0):
+        """
+        Invoke an action through a list of modifiers.  This is the
+        implementation of ``__call__()``; it is also available to
+        modifiers which take over invocation of the action, such as
+        to invoke it several times.
+
+        :param ctxt: The context object.
+        :param action: The action to invoke.
+        :param modifiers: The list of modifiers for the action, in
+                          priority order.
+        :param start: The index of the first modifier to call.  The
+                      modifiers before it are passed to the others as
+                      preceding modifiers, but are not themselves
+                      called.  Defaults to 0.
+
+        :returns: A ``StepResult`` object, or if the action is a step
+                  action, a list of zero or more ``Step`` objects.
+        """
+
         # Begin by walking the modifiers
-        i = -1
-        for i in six.moves.range(len(self.modifiers)):
-            result = self.modifiers[i].pre_call(
-                ctxt, self.modifiers[:i], self.modifiers[i + 1:], self.action)
+        i = start - 1
+        for i in six.moves.range(start, len(modifiers)):
+            result = modifiers[i].pre_call(
+                ctxt, modifiers[:i], modifiers[i + 1:], action)
 
             # Did a modifier return a result?
             if result is not None:
@@ -574,7 +750,7 @@ class Step(object):
             # All modifiers have weighed in without returning a
             # result, so let's call the action
             try:
-                result = self.action(ctxt)
+                result = action(ctxt)
             except Exception:
                 # Wrap the exception in a StepResult instance
                 result = StepResult(exc_info=sys.exc_info())
@@ -585,10 +761,9 @@ class Step(object):
 
         # Now walk the modifiers in reverse order for result
         # processing
-        for j in six.moves.range(i, -1, -1):
-            result = self.modifiers[j].post_call(
-                ctxt, result, self.action, self.modifiers[j + 1:],
-                self.modifiers[:j])
+        for j in six.moves.range(i, start - 1, -1):
+            result = modifiers[j].post_call(
+                ctxt, result, action, modifiers[j + 1:], modifiers[:j])
 
         return result
 
@@ -599,7 +774,8 @@ class StepResult(object):
     """
 
     def __init__(self, state=None, msg=None, ignore=None,
-                 returncode=None, exc_info=None, results=None):
+                 returncode=None, exc_info=None, results=None,
+                 output=None):
         """
         Initialize a ``StepResult`` instance.
 
@@ -618,10 +794,15 @@ class StepResult(object):
                          ``state`` is inferred to be ERROR.
         :param results: Used when the ``StepResult`` is encapsulating
                         a list of other ``StepResult`` instances.
+        :param output: The captured output of an external process.
+                       This is a dictionary mapping the stream names,
+                       "stdout" and "stderr", to the last bytes the
+                       process wrote to that stream.
         """
 
-        # Save the result message
+        # Save the result message and the captured output
         self.msg = msg
+        self.output = output or {}
 
         # If an exception was recorded, store it and default the state
         # appropriately
@@ -780,8 +961,8 @@ class SensitiveDictAction(Action):
         for ftmpl in self.files:
             fpath = utils.canonicalize_path(self.dirname, ftmpl(ctxt))
             try:
-                with open(fpath) as f:
-                    var_data = yaml.load(f)
+                with open(fpath, 'rb') as f:
+                    var_data = utils.yaml_load(f)
             except Exception as exc:
                 # Ignore missing variable files
                 continue
@@ -845,6 +1026,11 @@ class IncludeAction(Action):
     subset, and are interpreted as in a Python range syntax; that is,
     for the example above, steps 2, 3, 4, 5, and 6 will be included,
     but not steps 0, 1, 7, etc.
+
+    Each file is read and validated only once per run, no matter how
+    many times it is included, unless it changes.  A file that
+    includes itself, directly or indirectly, results in a
+    ``ConfigError`` describing the chain of includes.
     """
 
     # This is a special "step" action, an action that returns a list
@@ -910,9 +1096,11 @@ class IncludeAction(Action):
         # Interpret the path
         path = utils.canonicalize_path(self.dirname, self.path(ctxt))
 
-        # Import the desired steps
+        # Import the desired steps; steps included into a step group
+        # are sub-steps of the group
         steps = Step.parse_file(
-            ctxt, path, self.key(ctxt), self.step_addr)
+            ctxt, path, self.key(ctxt), self.step_addr,
+            self.step_addr.parent)
 
         # Narrow the steps, if desired
         if self.start is not None or self.stop is not None:
@@ -0,0 +1,267 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the
+#    License. You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing,
+#    software distributed under the License is distributed on an "AS
+#    IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#    express or implied. See the License for the specific language
+#    governing permissions and limitations under the License.
+
+import json
+import threading
+
+from timid import extensions
+from timid import steps
+from timid import utils
+
+
+class StepTiming(object):
+    """
+    Record the time taken to execute one step.
+    """
+
+    def __init__(self, label, idx, step, start):
+        """
+        Initialize a ``StepTiming`` instance.
+
+        :param label: The label of the test the step is part of, or
+                      ``None``.
+        :param idx: The index of the step.
+        :param step: The ``timid.steps.Step`` being timed.
+        :param start: The value of the monotonic clock when the step
+                      began executing.
+        """
+
+        self.label = label
+        self.idx = idx
+        self.name = step.name
+        self.address = str(step.step_addr)
+        self.sub_step = step.step_addr.parent is not None
+        self.start = start
+        self.duration = None
+        self.state = None
+
+    def to_dict(self, origin):
+        """
+        Convert the timing into a form suitable for serializing to JSON.
+
+        :param origin: The value of the monotonic clock from which the
+                       start time is measured.
+
+        :returns: A dictionary describing the timing.
+        """
+
+        return {
+            'test': self.label,
+            'index': self.idx,
+            'name': self.name,
+            'address': self.address,
+            'state': steps.states[self.state] if self.state is not None
+            else None,
+            'start': self.start - origin,
+            'duration': self.duration,
+        }
+
+
+class TimingExtension(extensions.Extension):
+    """
+    An extension for reporting where the time goes.  When activated
+    with the ``--timing`` option, each step is timed, and at the end
+    of each test a table of the slowest steps is emitted, along with
+    the time taken to read the test steps.  The ``--timing-json``
+    option writes the timing of every step to a file, for use by
+    other tools.
+    """
+
+    # Run the step hooks after all other extensions, so that the time
+    # they take is not attributed to the step
+    priority = 1000
+
+    @classmethod
+    def prepare(cls, parser):
+        """
+        Called to prepare the extension.  Adds the timing options to
+        the argument parser.
+
+        :param parser: The argument parser, an instance of
+                       ``argparse.ArgumentParser``.
+        """
+
+        parser.add_argument(
+            '--timing',
+            default=None,
+            type=int,
+            const=10,
+            nargs='?',
+            metavar='N',
+            help='Time each step, and report the N slowest steps at the '
+            'end of the test.  N defaults to %(const)s.',
+        )
+        parser.add_argument(
+            '--timing-json',
+            default=None,
+            metavar='FILE',
+            help='Time each step, and write the timing of every step to '
+            'the designated file as JSON.',
+        )
+
+    @classmethod
+    def activate(cls, ctxt, args):
+        """
+        Called to determine whether to activate the extension.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param args: An instance of ``argparse.Namespace`` containing
+                     the result of processing command line arguments.
+
+        :returns: An instance of the extension class if timing was
+                  requested, ``None`` otherwise.
+        """
+
+        if args.timing is None and args.timing_json is None:
+            return None
+
+        return cls(args.timing or 0, args.timing_json)
+
+    def __init__(self, limit, json_file=None):
+        """
+        Initialize a ``TimingExtension`` instance.
+
+        :param limit: The number of slowest steps to report.  If 0, no
+                      table is emitted.
+        :param json_file: The name of a file to write the timing of
+                          every step to.  Optional.
+        """
+
+        self.limit = limit
+        self.json_file = json_file
+        self.origin = utils.monotonic()
+
+        # The timing of each step, and of reading the test steps, for
+        # each test; keyed by the context
+        self.timings = {}
+        self.phases = {}
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def pre_step(self, ctxt, step, idx):
+        """
+        Called prior to executing a step.  Starts the timer.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param step: An instance of ``timid.steps.Step`` describing
+                     the step to be executed.
+        :param idx: The index of the step in the list of steps.
+
+        :returns: A ``None`` value, so that the step is executed.
+        """
+
+        timing = StepTiming(ctxt.label, idx, step, utils.monotonic())
+        with self._lock:
+            self._running[id(ctxt), id(step)] = timing
+            self.timings.setdefault(ctxt, []).append(timing)
+
+        return None
+
+    def post_step(self, ctxt, step, idx, result):
+        """
+        Called after executing a step.  Stops the timer.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param step: An instance of ``timid.steps.Step`` describing
+                     the step that was executed.
+        :param idx: The index of the step in the list of steps.
+        :param result: An instance of ``timid.steps.StepResult``
+                       describing the result of executing the step.
+        """
+
+        end = utils.monotonic()
+        with self._lock:
+            timing = self._running.pop((id(ctxt), id(step)), None)
+        if timing is not None:
+            timing.duration = end - timing.start
+            timing.state = result.state
+
+    def finalize(self, ctxt, result):
+        """
+        Called at the end of processing.  Emits the table of the
+        slowest steps, and writes the JSON file.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param result: The return value of the basic ``timid`` call,
+                       or an ``Exception`` instance if an exception
+                       was raised.
+
+        :returns: The ``result`` parameter, unchanged.
+        """
+
+        timings = [t for t in self.timings.get(ctxt, [])
+                   if t.duration is not None]
+        self.phases[ctxt] = dict(getattr(ctxt, 'timings', None) or {})
+
+        # Emit the table of the slowest steps
+        if self.limit:
+            self._emit_table(ctxt, timings)
+
+        # Write the timing of every step
+        if self.json_file:
+            self._write_json()
+
+        return result
+
+    def _emit_table(self, ctxt, timings):
+        """
+        Emit the table of the slowest steps.
+
+        :param ctxt: An instance of ``timid.context.Context``.
+        :param timings: A list of the ``StepTiming`` objects for the
+                        test.
+        """
+
+        phases = self.phases[ctxt]
+        ctxt.emit('Timing: %d steps in %.3fs; parse %.3fs, read_steps '
+                  '%.3fs' % (len([t for t in timings if not t.sub_step]),
+                             sum(t.duration for t in timings
+                                 if not t.sub_step),
+                             phases.get('parse', 0.0),
+                             phases.get('read_steps', 0.0)))
+
+        slowest = sorted(timings, key=lambda t: t.duration,
+                         reverse=True)[:self.limit]
+        if not slowest:
+            return
+
+        ctxt.emit('Slowest %d steps:' % len(slowest))
+        for timing in slowest:
+            ctxt.emit('  %9.3fs  %-7s  %s (%s)' %
+                      (timing.duration, steps.states[timing.state],
+                       timing.name, timing.address))
+
+    def _write_json(self):
+        """
+        Write the timing of every step to the JSON file.  The file is
+        rewritten at the end of each test, so that it describes all the
+        tests completed so far.
+        """
+
+        tests = []
+        for ctxt, phases in self.phases.items():
+            tests.append({
+                'test': ctxt.label,
+                'parse': phases.get('parse'),
+                'read_steps': phases.get('read_steps'),
+                'steps': [t.to_dict(self.origin)
+                          for t in self.timings.get(ctxt, [])
+                          if t.duration is not None],
+            })
+        tests.sort(key=lambda t: t['test'] or '')
+
+        utils.atomic_write(self.json_file, json.dumps(
+            {'version': 1, 'tests': tests}, indent=2,
+            sort_keys=True).encode('utf-8'))
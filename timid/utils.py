@@ -14,16 +14,50 @@
 #    governing permissions and limitations under the License.
 
 import collections
+import contextlib
 import itertools
 import os
+import tempfile
+import threading
+import time
 
 import jsonschema
 import six
+import yaml
+
+# Use the libyaml-based loader if it is available
+try:
+    _YAMLLoader = yaml.CSafeLoader
+except AttributeError:  # pragma: no cover
+    _YAMLLoader = yaml.SafeLoader
 
 
 # An object to represent an "unset" value
 unset = object()
 
+# Thread-local state used to suppress schema validation of
+# configuration that is already known to be valid
+_validation = threading.local()
+
+# Python expressions testing whether the value of the variable "v"
+# definitely has the designated JSONSchema type
+_type_checks = {
+    'array': 'isinstance({v}, list)',
+    'boolean': 'isinstance({v}, bool)',
+    'integer': '(isinstance({v}, integer_types) and '
+               'not isinstance({v}, bool))',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, number_types) and '
+              'not isinstance({v}, bool))',
+    'object': 'isinstance({v}, dict)',
+    'string': 'isinstance({v}, string_types)',
+}
+
+# Schema keywords that do not affect validation
+_annotations = set([
+    '$schema', 'title', 'description', 'default', 'examples',
+])
+
 
 def canonicalize_path(cwd, path):
     """
@@ -43,6 +77,294 @@ def canonicalize_path(cwd, path):
     return os.path.abspath(path)
 
 
+def yaml_load(stream):
+    """
+    Load YAML data.  This uses PyYAML's safe loader, preferring the
+    much faster libyaml-based implementation if it is available.  Both
+    implementations report the line and column of any syntax error in
+    the exception message.
+
+    :param stream: The YAML data to load.  This may be a byte string,
+                   a text string, or an open file object.
+
+    :returns: The loaded data.
+    """
+
+    return yaml.load(stream, Loader=_YAMLLoader)
+
+
+def ensure_dir(path):
+    """
+    Ensure that a directory exists, creating it and any missing parent
+    directories if necessary.
+
+    :param path: The path of the directory.
+    """
+
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Someone else may have created it in the meantime
+            if not os.path.isdir(path):
+                raise
+
+
+# A monotonic clock for timing; Python 2 lacks time.monotonic()
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+def atomic_write(path, data):
+    """
+    Atomically write data to a file.  The data is first written to a
+    temporary file in the same directory, which is then renamed over
+    the target; concurrent readers will thus see either the old
+    contents or the new contents, but never a partial write.  The
+    directory containing the file is created if necessary.
+
+    :param path: The path of the file to write.
+    :param data: The data to write, as a byte string.
+    """
+
+    # Make sure the directory exists
+    dirname = os.path.dirname(path) or os.curdir
+    ensure_dir(dirname)
+
+    # Write the data to a temporary file
+    fd, tmpname = tempfile.mkstemp(
+        dir=dirname, prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        # Move it into place
+        os.rename(tmpname, path)
+    except Exception:
+        # Clean up the temporary file
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+def default_cache_dir():
+    """
+    Determine the default directory for timid's persistent caches.
+    This is the value of the ``TIMID_CACHE_DIR`` environment variable,
+    if set; otherwise, it is the "timid" directory within the
+    ``XDG_CACHE_HOME`` directory, which defaults to "~/.cache".
+
+    :returns: The path to the cache directory.
+    """
+
+    # Explicit configuration wins
+    cache_dir = os.environ.get('TIMID_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+
+    # Follow the XDG base directory specification
+    base = (os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'timid')
+
+
+class LayeredDict(collections.MutableMapping):
+    """
+    A dictionary which records only its changes on top of a frozen
+    parent mapping.  Keys set in the dictionary shadow those of the
+    parent, and keys deleted from it are recorded as "tombstones" that
+    hide those of the parent.  A ``LayeredDict`` may itself be frozen
+    and serve as the parent of other ``LayeredDict`` instances,
+    allowing copies to be made without copying the data.
+    """
+
+    # The number of layers beyond which freezing a dictionary merges
+    # its layers, to bound the cost of looking up keys
+    max_depth = 32
+
+    def __init__(self, parent=None, data=None):
+        """
+        Initialize a new ``LayeredDict`` instance.
+
+        :param parent: An optional mapping containing the inherited
+                       data.  This mapping must not be modified while
+                       the ``LayeredDict`` is in use.
+        :param data: An optional dictionary containing the data set
+                     on top of the parent.  This dictionary is used
+                     directly, not copied.
+        """
+
+        self._parent = parent
+        self._data = {} if data is None else data
+        self._deleted = set()
+        self._frozen = False
+
+        # The number of layers, for bounding the lookup cost
+        self._depth = getattr(parent, '_depth', 0) + 1
+
+        # Cache of the merged data
+        self._flat = None
+
+    def __repr__(self):
+        """
+        Obtain a representation of a ``LayeredDict`` instance.
+
+        :returns: A representation of the merged data.
+        """
+
+        return repr(self.flatten())
+
+    def __len__(self):
+        """
+        Obtain the length of a ``LayeredDict`` instance.
+
+        :returns: The number of keys in the dictionary.
+        """
+
+        return len(self.flatten())
+
+    def __contains__(self, key):
+        """
+        Check if a key is present in the dictionary.
+
+        :param key: The key to check.
+
+        :returns: A ``True`` value if the key is present, ``False``
+                  otherwise.
+        """
+
+        if key in self._data:
+            return True
+        elif self._parent is None or key in self._deleted:
+            return False
+
+        return key in self._parent
+
+    def __getitem__(self, key):
+        """
+        Retrieve the value of a key.
+
+        :param key: The key to retrieve the value of.
+
+        :returns: The value of the key.
+        """
+
+        if key in self._data:
+            return self._data[key]
+        elif self._parent is None or key in self._deleted:
+            raise KeyError(key)
+
+        return self._parent[key]
+
+    def __setitem__(self, key, value):
+        """
+        Set the value of a key.
+
+        :param key: The key to set the value of.
+        :param value: The value to set the key to.
+        """
+
+        if self._frozen:
+            raise TypeError('cannot modify a frozen LayeredDict')
+
+        self._data[key] = value
+        self._deleted.discard(key)
+        self._flat = None
+
+    def __delitem__(self, key):
+        """
+        Delete the value of a key.
+
+        :param key: The key to delete.
+        """
+
+        if self._frozen:
+            raise TypeError('cannot modify a frozen LayeredDict')
+        elif key not in self:
+            raise KeyError(key)
+
+        self._data.pop(key, None)
+        if self._parent is not None and key in self._parent:
+            self._deleted.add(key)
+        self._flat = None
+
+    def __iter__(self):
+        """
+        Iterate over the dictionary.
+
+        :returns: An iterator over the keys in the dictionary.
+        """
+
+        for key in self._data:
+            yield key
+
+        if self._parent is not None:
+            for key in self._parent:
+                if key not in self._data and key not in self._deleted:
+                    yield key
+
+    def flatten(self):
+        """
+        Retrieve the merged data as a plain dictionary.  The
+        dictionary is cached until the ``LayeredDict`` is next
+        modified, and must not be modified by the caller.
+
+        :returns: A dictionary containing the merged data.
+        """
+
+        if self._flat is None:
+            if self._parent is None:
+                flat = self._data.copy()
+            else:
+                flat = dict(self._parent.flatten()
+                            if isinstance(self._parent, LayeredDict)
+                            else self._parent)
+                for key in self._deleted:
+                    flat.pop(key, None)
+                flat.update(self._data)
+            self._flat = flat
+
+        return self._flat
+
+    def freeze(self):
+        """
+        Freeze the dictionary, preventing further modification.  This
+        is used to share the data as the parent of new
+        ``LayeredDict`` instances.
+
+        :returns: A frozen mapping containing the same data.  This
+                  may be the parent, if the ``LayeredDict`` contains
+                  no changes, or a merged ``LayeredDict``, if the
+                  ``LayeredDict`` has too many layers.
+        """
+
+        if self._parent is not None and not self._data and not self._deleted:
+            return self._parent
+        elif self._depth > self.max_depth:
+            merged = self.__class__(data=self.flatten().copy())
+            merged._frozen = True
+            return merged
+
+        self._frozen = True
+        return self
+
+    def copy(self):
+        """
+        Copy the dictionary.  The copy shares the parent mapping, and
+        copies only the changes recorded on top of it; unlike
+        ``freeze()``, this leaves the dictionary itself untouched, so
+        it may be copied while another thread modifies it.
+
+        :returns: A new ``LayeredDict`` containing the same data.
+        """
+
+        new = self.__class__(self._parent, dict(self._data))
+        new._deleted = set(self._deleted)
+
+        return new
+
+
 class SensitiveDict(collections.MutableMapping):
     """
     A dictionary containing some keys which contain sensitive data.
@@ -61,9 +383,13 @@ class SensitiveDict(collections.MutableMapping):
         """
 
         # Save the data and the sensitive set
-        self._data = data or {}
+        self._data = {} if data is None else data
         self._sensitive = sensitive or set()
 
+        # A counter incremented whenever the data or the sensitive
+        # set changes, so that values derived from them may be cached
+        self._version = 0
+
         # Initialize the demand-allocated 'masked' property
         self._masked = None
 
@@ -105,6 +431,7 @@ class SensitiveDict(collections.MutableMapping):
         """
 
         self._data[key] = value
+        self._version += 1
 
     def __delitem__(self, key):
         """
@@ -114,6 +441,7 @@ class SensitiveDict(collections.MutableMapping):
         """
 
         del self._data[key]
+        self._version += 1
 
     def __iter__(self):
         """
@@ -142,6 +470,18 @@ class SensitiveDict(collections.MutableMapping):
         """
 
         self._sensitive.add(key)
+        self._version += 1
+
+    @property
+    def version(self):
+        """
+        Retrieve the version of the dictionary.  This is a counter
+        which increases whenever a key is set or deleted, or a key is
+        declared sensitive, so consumers may cache values derived from
+        the dictionary until it changes.
+        """
+
+        return self._version
 
     @property
     def sensitive(self):
@@ -183,6 +523,12 @@ class MaskedDict(collections.Mapping):
 
         self._parent = parent
 
+        # The sensitive set and the masked snapshot, cached until the
+        # version of the parent changes
+        self._version = None
+        self._sensitive = frozenset()
+        self._snapshot = None
+
     def __enter__(self):
         """
         Called upon entry to a context manager.
@@ -216,7 +562,7 @@ class MaskedDict(collections.Mapping):
         :returns: The string form of the ``MaskedDict`` instance.
         """
 
-        return six.text_type(dict(self))
+        return six.text_type(self.snapshot)
 
     def __len__(self):
         """
@@ -245,7 +591,7 @@ class MaskedDict(collections.Mapping):
             raise KeyError(key)
 
         # Apply masking
-        if key in self._parent.sensitive:
+        if key in self.sensitive:
             return self._parent.masking.format(key=key)
 
         # OK, just stringify the value
@@ -260,6 +606,18 @@ class MaskedDict(collections.Mapping):
 
         return iter(self._parent)
 
+    def _refresh(self):
+        """
+        Discard the cached sensitive set and snapshot if the parent has
+        changed since they were computed.
+        """
+
+        version = self._parent.version
+        if version != self._version:
+            self._sensitive = self._parent.sensitive
+            self._snapshot = None
+            self._version = version
+
     @property
     def sensitive(self):
         """
@@ -268,7 +626,35 @@ class MaskedDict(collections.Mapping):
         modifications will not affect the set.
         """
 
-        return self._parent.sensitive
+        self._refresh()
+        return self._sensitive
+
+    @property
+    def version(self):
+        """
+        Retrieve the version of the parent ``SensitiveDict``.
+        """
+
+        return self._parent.version
+
+    @property
+    def snapshot(self):
+        """
+        Retrieve a dictionary of all the keys, with appropriate masking
+        applied.  The dictionary is cached until the parent changes,
+        and must not be modified.
+        """
+
+        self._refresh()
+        if self._snapshot is None:
+            masking = self._parent.masking
+            self._snapshot = dict(
+                (key, masking.format(key=key) if key in self._sensitive
+                 else self._parent[key])
+                for key in self._parent
+            )
+
+        return self._snapshot
 
     @property
     def masked(self):
@@ -282,6 +668,409 @@ class MaskedDict(collections.Mapping):
         return self
 
 
+class OrderedSet(collections.MutableSet):
+    """
+    A set which remembers the order in which its items were added.
+    Adding, discarding, and checking for membership take constant
+    time, and iteration follows insertion order, so the set
+    serializes the same way in every process regardless of hash
+    randomization.
+    """
+
+    def __init__(self, iterable=()):
+        """
+        Initialize a new ``OrderedSet`` instance.
+
+        :param iterable: An optional iterable of the initial items.
+        """
+
+        self._items = collections.OrderedDict.fromkeys(iterable)
+
+    def __repr__(self):
+        """
+        Obtain a representation of an ``OrderedSet`` instance.
+
+        :returns: A representation of the set.
+        """
+
+        return '%s(%r)' % (self.__class__.__name__, list(self._items))
+
+    def __len__(self):
+        """
+        Obtain the length of an ``OrderedSet`` instance.
+
+        :returns: The number of items in the set.
+        """
+
+        return len(self._items)
+
+    def __contains__(self, item):
+        """
+        Check if an item is a member of the set.
+
+        :param item: The item to check.
+
+        :returns: A ``True`` value if the item is a member, ``False``
+                  otherwise.
+        """
+
+        return item in self._items
+
+    def __iter__(self):
+        """
+        Iterate over the set in insertion order.
+
+        :returns: An iterator over the items.
+        """
+
+        return iter(self._items)
+
+    def add(self, item):
+        """
+        Add an item to the set.  An item already in the set keeps its
+        position.
+
+        :param item: The item to add.
+        """
+
+        self._items[item] = None
+
+    def discard(self, item):
+        """
+        Discard an item from the set.
+
+        :param item: The item to discard.
+        """
+
+        self._items.pop(item, None)
+
+    def copy(self):
+        """
+        Retrieve a copy of the set.
+        """
+
+        return self.__class__(self._items)
+
+
+class _SchemaCompiler(object):
+    """
+    A helper class to generate Python code for a simple JSONSchema.
+    The generated code is conservative: if it returns ``True``, the
+    instance is definitely valid, but a ``False`` result only means
+    that the full validator must be consulted.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ``_SchemaCompiler`` instance.
+        """
+
+        # Counter for allocating variable names
+        self._counter = 0
+
+        # Constants referenced by the generated code
+        self.namespace = {
+            'integer_types': six.integer_types,
+            'number_types': six.integer_types + (float,),
+            'string_types': six.string_types,
+        }
+
+    def _name(self, prefix):
+        """
+        Allocate a new name for a variable or constant.
+
+        :param prefix: The prefix for the name.
+
+        :returns: The new name.
+        """
+
+        self._counter += 1
+        return '%s%d' % (prefix, self._counter)
+
+    @staticmethod
+    def _types(schema):
+        """
+        Retrieve the set of types allowed by a schema.
+
+        :param schema: The schema.
+
+        :returns: A set of type names, or ``None`` if the schema does
+                  not restrict the type.  For a schema combining
+                  alternatives with "oneOf" or "anyOf", this is the
+                  union of the types allowed by the alternatives.
+        """
+
+        if not isinstance(schema, dict):
+            return None
+
+        types = schema.get('type')
+        if types is None:
+            # Infer the types from the alternatives, if any
+            for keyword in ('oneOf', 'anyOf'):
+                subschemas = schema.get(keyword)
+                if subschemas and isinstance(subschemas, list):
+                    types = set()
+                    for subschema in subschemas:
+                        subtypes = _SchemaCompiler._types(subschema)
+                        if subtypes is None:
+                            return None
+                        types |= subtypes
+                    return types
+
+            return None
+        elif isinstance(types, six.string_types):
+            types = set([types])
+        else:
+            types = set(types)
+
+        # An integer is also a number
+        if 'number' in types:
+            types.add('integer')
+
+        return types
+
+    def expr(self, schema, var):
+        """
+        Generate a Python expression that tests an instance against a
+        schema.
+
+        :param schema: The schema.
+        :param var: A Python expression evaluating to the instance.
+
+        :returns: The Python expression, or ``None`` if the schema
+                  uses features that are not supported.
+        """
+
+        if not isinstance(schema, dict):
+            return None
+
+        clauses = []
+        for keyword in schema:
+            if keyword in _annotations:
+                continue
+            elif keyword not in ('type', 'properties', 'required',
+                                 'additionalProperties', 'items', 'oneOf',
+                                 'anyOf', 'allOf', 'minimum', 'maximum'):
+                return None
+
+        # Check the type
+        if 'type' in schema:
+            types = schema['type']
+            if isinstance(types, six.string_types):
+                types = [types]
+            if (not types or
+                    any(t not in _type_checks for t in types)):
+                return None
+            checks = [_type_checks[t].format(v=var) for t in types]
+            clauses.append(checks[0] if len(checks) == 1 else
+                           '(%s)' % ' or '.join(checks))
+
+        # Check the object keywords
+        obj_clauses = []
+        props = schema.get('properties', {})
+        if not isinstance(props, dict):
+            return None
+        for prop, subschema in sorted(props.items()):
+            subexpr = self.expr(subschema, '%s[%r]' % (var, prop))
+            if subexpr is None:
+                return None
+            obj_clauses.append('(%r not in %s or %s)' % (prop, var, subexpr))
+        for prop in schema.get('required', []):
+            obj_clauses.append('%r in %s' % (prop, var))
+        if 'additionalProperties' in schema:
+            addl = schema['additionalProperties']
+            known = self._name('c')
+            self.namespace[known] = frozenset(props)
+            if addl is False:
+                obj_clauses.append('%s.issuperset(%s)' % (known, var))
+            elif addl is not True:
+                key = self._name('k')
+                subexpr = self.expr(addl, '%s[%s]' % (var, key))
+                if subexpr is None:
+                    return None
+                obj_clauses.append('all(%s for %s in %s if %s not in %s)' %
+                                   (subexpr, key, var, key, known))
+        if obj_clauses:
+            if self._types(schema) == set(['object']):
+                # Type has already been checked
+                clauses.append(' and '.join(obj_clauses))
+            else:
+                clauses.append('(not isinstance(%s, dict) or (%s))' %
+                               (var, ' and '.join(obj_clauses)))
+
+        # Check the array keywords
+        if 'items' in schema:
+            item = self._name('v')
+            subexpr = self.expr(schema['items'], item)
+            if subexpr is None:
+                return None
+            if self._types(schema) == set(['array']):
+                # Type has already been checked
+                clauses.append('all(%s for %s in %s)' % (subexpr, item, var))
+            else:
+                clauses.append('(not isinstance(%s, list) or '
+                               'all(%s for %s in %s))' %
+                               (var, subexpr, item, var))
+
+        # Check the numeric keywords
+        num_clauses = []
+        for keyword, op in (('minimum', '>='), ('maximum', '<=')):
+            if keyword not in schema:
+                continue
+
+            limit = schema[keyword]
+            if (not isinstance(limit, six.integer_types + (float,)) or
+                    isinstance(limit, bool)):
+                return None
+            num_clauses.append('%s %s %r' % (var, op, limit))
+        if num_clauses:
+            types = self._types(schema)
+            if types and types <= set(['integer', 'number']):
+                # Type has already been checked
+                clauses.append(' and '.join(num_clauses))
+            else:
+                clauses.append('(not %s or (%s))' %
+                               (_type_checks['number'].format(v=var),
+                                ' and '.join(num_clauses)))
+
+        # Handle the combining keywords
+        for keyword, joiner in (('anyOf', ' or '), ('oneOf', ' or '),
+                                ('allOf', ' and ')):
+            if keyword not in schema:
+                continue
+
+            subschemas = schema[keyword]
+            if not subschemas or not isinstance(subschemas, list):
+                return None
+
+            # A "oneOf" is only equivalent to an "anyOf" if the
+            # alternatives cannot overlap
+            if keyword == 'oneOf':
+                seen = set()
+                for subschema in subschemas:
+                    types = self._types(subschema)
+                    if types is None or types & seen:
+                        return None
+                    seen |= types
+
+            subexprs = [self.expr(sub, var) for sub in subschemas]
+            if None in subexprs:
+                return None
+            clauses.append('(%s)' % joiner.join(subexprs))
+
+        return ' and '.join(clauses) if clauses else 'True'
+
+
+def compile_schema(schema):
+    """
+    Generate a Python function to validate instances against a simple
+    JSONSchema, such as those typically used by actions and modifiers.
+    The generated function is conservative: it returns ``True`` if
+    the instance is definitely valid, and ``False`` if the full
+    JSONSchema validator must be consulted to determine the validity
+    of the instance (and to produce an error message).
+
+    :param schema: The schema.
+
+    :returns: A function taking one argument--the instance--and
+              returning a boolean.  If the schema uses features not
+              supported by the code generator, ``None`` is returned.
+    """
+
+    compiler = _SchemaCompiler()
+    expr = compiler.expr(schema, 'v0')
+    if expr is None:
+        return None
+
+    # Build and compile the function
+    source = 'def validate(v0):\n    return %s\n' % expr
+    namespace = dict(compiler.namespace)
+    six.exec_(compile(source, '<schema>', 'exec'), namespace)
+
+    func = namespace['validate']
+    func.source = source
+    return func
+
+
+class SchemaRegistry(object):
+    """
+    A registry of compiled JSONSchema validators.  The first time a
+    schema is used, it is checked against the metaschema and a
+    validator is built for it; subsequent validations against the same
+    schema object reuse that validator.  Schemas are tracked by
+    identity, so this is intended for long-lived schemas, such as the
+    ``schema`` class attributes of actions and modifiers.
+    """
+
+    def __init__(self, codegen=True):
+        """
+        Initialize a ``SchemaRegistry`` instance.
+
+        :param codegen: If ``True`` (the default), simple schemas will
+                        additionally be compiled into Python functions
+                        using ``compile_schema()``, which are used to
+                        quickly accept valid instances.
+        """
+
+        self.codegen = codegen
+
+        # The compiled validators, keyed by schema ID
+        self._validators = {}
+
+    def register(self, schema):
+        """
+        Register a schema.  The schema is checked against the
+        metaschema and compiled.  Registering an already registered
+        schema has no effect.
+
+        :param schema: The schema to register.
+
+        :returns: A tuple of the schema, the validator, and the
+                  generated validation function, if any.
+        """
+
+        compiled = self._validators.get(id(schema))
+
+        # Compile the schema if needed; note that we also keep a
+        # reference to the schema so its ID cannot be reused
+        if compiled is None or compiled[0] is not schema:
+            cls = jsonschema.validators.validator_for(schema)
+            cls.check_schema(schema)
+            compiled = (schema, cls(schema),
+                        compile_schema(schema) if self.codegen else None)
+            self._validators[id(schema)] = compiled
+
+        return compiled
+
+    def validate(self, instance, schema):
+        """
+        Validate an instance against a schema.  This is equivalent to
+        ``jsonschema.validate()``, but uses the compiled validator for
+        the schema.
+
+        :param instance: The object to validate.
+        :param schema: The schema to validate against.
+        """
+
+        _schema, validator, func = self.register(schema)
+
+        # Try the fast path first
+        if func is not None and func(instance):
+            return
+
+        # Use the full validator
+        error = jsonschema.exceptions.best_match(
+            validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+# The schema registry; the code generator may be disabled by setting
+# the TIMID_SCHEMA_CODEGEN environment variable to "0"
+validators = SchemaRegistry(
+    codegen=os.environ.get('TIMID_SCHEMA_CODEGEN', '1') != '0')
+
+
 def schema_validate(instance, schema, exc_class, *prefix, **kwargs):
     """
     Schema validation helper.  Performs JSONSchema validation.  If a
@@ -301,9 +1090,14 @@ def schema_validate(instance, schema, exc_class, *prefix, **kwargs):
                    constructor.
     """
 
+    # Skip validation if the configuration is already known to be
+    # valid
+    if getattr(_validation, 'skip', False):
+        return
+
     try:
         # Do the validation
-        jsonschema.validate(instance, schema)
+        validators.validate(instance, schema)
     except jsonschema.ValidationError as exc:
         # Assemble the path
         path = '/'.join((a if isinstance(a, six.string_types) else '[%d]' % a)
@@ -316,6 +1110,31 @@ def schema_validate(instance, schema, exc_class, *prefix, **kwargs):
         raise exc_class(message, **kwargs)
 
 
+@contextlib.contextmanager
+def skip_validation(skip=True):
+    """
+    A context manager that controls ``schema_validate()``.  Within the
+    context, if ``skip`` is ``True``, ``schema_validate()`` will
+    perform no validation; this is used when processing configuration
+    that is already known to be valid, such as configuration retrieved
+    from a cache.  The setting applies only to the calling thread, and
+    the prior setting is restored on exit, so that contexts may be
+    nested.
+
+    :param skip: If ``True`` (the default), schema validation is
+                 skipped within the context.  If ``False``, schema
+                 validation is performed within the context, even if
+                 an enclosing context disabled it.
+    """
+
+    prev = getattr(_validation, 'skip', False)
+    _validation.skip = skip
+    try:
+        yield
+    finally:
+        _validation.skip = prev
+
+
 def iter_prio_dict(prio_dict):
     """
     Iterate over a priority dictionary.  A priority dictionary is a